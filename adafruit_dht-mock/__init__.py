@@ -7,6 +7,8 @@ __status__  = "development"
 __version__ = "0.1"
 __date__    = "2021/11/29"
 import random
+import time
+from id_mock_timing import dht_read
 
 AM2302:str = 'AM2302'
 __adafruit_dht_humidity: float = round(random.uniform(0.0, 25.4), 2)
@@ -14,10 +16,18 @@ __adafruit_dht_temperature: float = round(random.uniform(-10.5, 39.5), 2)
 
 
 def read(sensor, pin) -> ():
+    # Like the driver, a failed read returns None values
+    if not dht_read():
+        return (None, None)
     return (globals()['__adafruit_dht_humidity'],  globals()['__adafruit_dht_temperature'])
 
-def read_retry(sensor, pin) -> ():
-    return (globals()['__adafruit_dht_humidity'],  globals()['__adafruit_dht_temperature'])
+def read_retry(sensor, pin, retries: int=15, delay_seconds: float=2) -> ():
+    for i in range(retries):
+        humidity, temperature = read(sensor, pin)
+        if humidity is not None and temperature is not None:
+            return (humidity, temperature)
+        time.sleep(delay_seconds)
+    return (None, None)
 
 def set_humidity(humidity: float) -> None:
     globals()['__adafruit_dht_humidity'] = humidity
@@ -4,81 +4,214 @@
 import datetime
 import importlib
 import logging
+import math
+import rpyc
+import struct
 import threading
 from abc import ABC
-from id_function_invokers import FunctionProvider, FunctionProviderService
+from typing import Any, Dict
+from id_function_invokers import FunctionProvider, FunctionProviderService, TRACE
+from id_schema import Arg, Choice, Float, Int, Value
+from id_sensor_watch import DeltaWatch, RateWatch, SensorWatcher, ThresholdWatch
+from id_snapshot import UNKNOWN, pack_snapshot, unpack_snapshot
 
 _PIN_ERROR_MSG: str = 'Pin must be a valid number in range 0 to 31.'
+_QUANTITIES: tuple = ('humidity', 'temperature')
+_QUANTITY_ERROR_MSG: str = 'Quantity must be one of: %s.' % ', '.join(_QUANTITIES)
+_THRESHOLD_ERROR_MSG: str = 'Threshold must be a valid number.'
+_HYSTERESIS_ERROR_MSG: str = 'Hysteresis must be a valid number greater than or equal to 0.'
+_RATE_ERROR_MSG: str = 'Rate must be a valid number greater than 0.'
+_DELTA_ERROR_MSG: str = 'Delta must be a valid number greater than or equal to 0.'
+_QUANTITY: Arg = Choice('quantity', _QUANTITIES, _QUANTITY_ERROR_MSG)
+_SNAPSHOT_ERROR_MSG: str = 'Invalid snapshot section: %s'
+# Sections of the snapshots, see id_snapshot
+_PIN_SECTION: int = 1
+_SAMPLE_SECTION: int = 2
+# Humidity, temperature and age in seconds of the last sample, NaN if not available
+_SAMPLE: struct.Struct = struct.Struct('<ddd')
 _MODULE: str = 'Adafruit_DHT'
 _MOCK_MODULE: str = 'adafruit_dht-mock'
-_TRACE: bool = False
+
+
+def describe_snapshot(snapshot: bytes) -> dict:
+    """Return the states of a snapshot as plain values for the dashboards, see id_web_gateway"""
+    sections: dict = unpack_snapshot(Am2302FunctionProvider.__name__, snapshot)
+    pin: bytes = sections.get(_PIN_SECTION)
+    sample: bytes = sections.get(_SAMPLE_SECTION)
+    humidity, temperature, _ = _SAMPLE.unpack(sample) if sample and len(sample) == _SAMPLE.size else (math.nan,) * 3
+    # The age of the sample is not described so that the description only changes with the sample
+    return {
+        'pin': pin[0] if pin and pin[0] != UNKNOWN else None,
+        'humidity': None if math.isnan(humidity) else round(humidity, 2),
+        'temperature': None if math.isnan(temperature) else round(temperature, 2)
+    }
 
 
 class Am2302FunctionProvider(FunctionProvider):
+    _SESSION_METHODS: dict = {
+        'setup': ('setup', 0, None),
+        'watch_threshold': ('watch_threshold', 3, None),
+        'watch_rate': ('watch_rate', 2, None),
+        'watch_delta': ('watch_delta', 2, None),
+        'restore': ('restore', 0, None)
+    }
+    _SESSION_RESETS: dict = {'restore': ('setup',)}
+    # The watches notify the samples of the server, see id_sensor_watch, a None function removes the watch
+    _SCHEMAS: dict = {
+        'setup': (Int('pin', 0, 31, _PIN_ERROR_MSG),),
+        # Notify the crossings of the threshold, the function is invoked with (quantity, 'above' or 'below', value)
+        'watch_threshold': (_QUANTITY, Float('threshold', message=_THRESHOLD_ERROR_MSG),
+                            Float('hysteresis', 0, None, _HYSTERESIS_ERROR_MSG), Value('function')),
+        # Notify the changes reaching the given rate per minute between two samples, the function is invoked with
+        # (quantity, 'rising' or 'falling', value)
+        'watch_rate': (_QUANTITY, Float('rate', 0, None, _RATE_ERROR_MSG), Value('function')),
+        # Notify the samples differing from the last notified value by at least the given delta, the function is
+        # invoked with (quantity, 'changed', value)
+        'watch_delta': (_QUANTITY, Float('delta', 0, None, _DELTA_ERROR_MSG), Value('function'))
+    }
+    # A read of the sensor lasts up to seconds, the concurrent reads share it
+    _COALESCED_METHODS: dict = {'humidity': 0, 'temperature': 0}
+    _INVALIDATIONS: dict = {'setup': ('humidity', 'temperature'), 'restore': ('humidity', 'temperature')}
 
     def __init__(self, parent_logger: logging.Logger):
         super().__init__(parent_logger)
 
-    def setup(self, pin: int) -> float:
-        pass
-
     def humidity(self) -> float:
         pass
 
     def temperature(self) -> float:
         pass
 
+    def snapshot(self) -> bytes:
+        """Return the pin of the sensor and its last sample with its age, see id_snapshot"""
+        pass
+
+    def restore(self, snapshot) -> bool:
+        """Apply the pin of a snapshot, the sample is informative as the sensor cannot be written"""
+        pass
+
 
 class __AbstractAm2302FunctionProviderService(ABC, FunctionProviderService):
+    _SCHEMAS: dict = Am2302FunctionProvider._SCHEMAS
+    _COALESCED_METHODS: dict = Am2302FunctionProvider._COALESCED_METHODS
+    _INVALIDATIONS: dict = Am2302FunctionProvider._INVALIDATIONS
 
     def __init__(self, parent_logger: logging.Logger, module_name: str):
         super().__init__(parent_logger)
-        parent_logger.debug('Importing: %s' % module_name)
+        self._logger.debug('Importing: %s', module_name)
         self.__module = importlib.import_module(module_name)
         self.__read_lock = threading.Lock()
         self.__read_date = -1
         self.__device = None
         self.__pin = None
+        # Each connection is served by its own thread of the server
+        self.__local: threading.local = threading.local()
+        self.__watcher: SensorWatcher = SensorWatcher(self._logger, self.__sample)
 
     def finalize(self) -> None:
-        pass
+        self.__watcher.stop()
+
+    def on_connect(self, conn: rpyc.Connection) -> None:
+        super().on_connect(conn)
+        self.__local.connection = conn
+
+    def on_disconnect(self, conn: rpyc.Connection) -> None:
+        super().on_disconnect(conn)
+        self.__watcher.unregister_connection(conn)
 
     def exposed_setup(self, pin: int) -> float:
         self.__pin = pin
-        self._logger.debug('Using pin: %s', str(self.__pin))
+        self._logger.debug('Using pin: %s', self.__pin)
         self.__device = getattr(self.__module, 'AM2302')
-        self._logger.debug('Using device: %s', str(self.__device))
+        self._logger.debug('Using device: %s', self.__device)
 
     def __read(self, retry: bool=True):
         with self.__read_lock:
             if self.__read_date == -1 or (datetime.datetime.now() - self.__read_date).total_seconds() >= 2:
-                self._logger.debug('reading')
+                if TRACE:
+                    self._logger.debug('reading')
                 if retry:
                     self.__humidity, self.__temperature = getattr(self.__module, 'read_retry')(self.__device, self.__pin)
                 else:
                     self.__humidity, self.__temperature = getattr(self.__module, 'read')(self.__device, self.__pin)
                 self.__read_date = datetime.datetime.now()
 
+    def __sample(self) -> Dict[str, float]:
+        if self.__device is None:
+            return dict()
+        self.__read()
+        return {'humidity': self.__humidity, 'temperature': self.__temperature}
+
+    def __watch(self, key: tuple, function: Any, factory) -> None:
+        # The local calls use no connection
+        self.__watcher.register(getattr(self.__local, 'connection', None), key, None if function is None else factory())
+
     def exposed_humidity(self) -> float:
-        if _TRACE:
+        if TRACE:
             self._logger.debug('read_humidity')
         self.__read()
-        if _TRACE:
-            self._logger.debug('humidity: %s', str(self.__humidity))
+        if TRACE:
+            self._logger.debug('humidity: %s', self.__humidity)
         if self.__humidity:
             return round(self.__humidity, 2)
         return None
 
     def exposed_temperature(self) -> float:
-        if _TRACE:
+        if TRACE:
             self._logger.debug('read_temperature')
         self.__read()
-        if _TRACE:
-            self._logger.debug('temperature: %s', str(self.__temperature))
+        if TRACE:
+            self._logger.debug('temperature: %s', self.__temperature)
         if self.__temperature:
             return round(self.__temperature, 2)
         return None
 
+    def exposed_snapshot(self) -> bytes:
+        if TRACE:
+            self._logger.debug('snapshot')
+        # The read in progress is not awaited, its sample is the next one
+        read_date = self.__read_date
+        if read_date == -1:
+            sample: tuple = (math.nan, math.nan, math.nan)
+        else:
+            sample = (math.nan if self.__humidity is None else self.__humidity,
+                      math.nan if self.__temperature is None else self.__temperature,
+                      (datetime.datetime.now() - read_date).total_seconds())
+        return pack_snapshot(Am2302FunctionProvider.__name__, {
+            _PIN_SECTION: bytes((UNKNOWN if self.__pin is None else self.__pin,)),
+            _SAMPLE_SECTION: _SAMPLE.pack(*sample)
+        })
+
+    def exposed_restore(self, snapshot) -> bool:
+        sections: dict = unpack_snapshot(Am2302FunctionProvider.__name__, snapshot)
+        self._logger.debug('restore of %s sections', len(sections))
+        pin: bytes = sections.get(_PIN_SECTION)
+        if pin is not None and len(pin) != 1:
+            raise ValueError(_SNAPSHOT_ERROR_MSG % _PIN_SECTION)
+        if pin and pin[0] != UNKNOWN:
+            self.exposed_setup(pin[0])
+        # Always return a non None value for RPC unmarshalling
+        return True
+
+    def exposed_watch_threshold(self, quantity: str, threshold: float, hysteresis: float, function: Any) -> bool:
+        self._logger.debug('watch_threshold for %s: %s with hysteresis: %s', quantity, threshold, hysteresis)
+        self.__watch(('watch_threshold', quantity, threshold, hysteresis), function,
+                     lambda: ThresholdWatch(quantity, function, float(threshold), float(hysteresis)))
+        # Always return a non None value for RPC unmarshalling
+        return True
+
+    def exposed_watch_rate(self, quantity: str, rate: float, function: Any) -> bool:
+        self._logger.debug('watch_rate for %s: %s', quantity, rate)
+        self.__watch(('watch_rate', quantity, rate), function, lambda: RateWatch(quantity, function, float(rate)))
+        # Always return a non None value for RPC unmarshalling
+        return True
+
+    def exposed_watch_delta(self, quantity: str, delta: float, function: Any) -> bool:
+        self._logger.debug('watch_delta for %s: %s', quantity, delta)
+        self.__watch(('watch_delta', quantity, delta), function, lambda: DeltaWatch(quantity, function, float(delta)))
+        # Always return a non None value for RPC unmarshalling
+        return True
+
 
 class Am2302FunctionProviderServiceMock(__AbstractAm2302FunctionProviderService):
 
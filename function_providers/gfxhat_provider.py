@@ -1,18 +1,37 @@
 # -*- coding: utf-8 -*-
 # GFX Hat by Pimoroni functions provider
+import array
 import importlib
 import logging
 import rpyc
+import struct
 import sys
+import threading
 import traceback
 from abc import ABC
-from typing import Any
-from id_function_invokers import FunctionProvider, FunctionProviderService
+from typing import Any, Callable, Dict, Iterable
+from id_buffer_utils import is_netref
+from id_callback_utils import EventBatcher
+from id_frame_buffer import FrameStreamRenderer, LayeredFrameBuffer
+from id_function_invokers import FunctionProvider, FunctionProviderService, FunctionProviderStub, TRACE
+from id_schema import Arg, Bool, Int, Value
+from id_shared_memory import is_shared_reference, resolve_shared_reference
+from id_snapshot import UNKNOWN, pack_snapshot, unpack_snapshot
+from id_tracing import span
 
 _PIN_ERROR_MSG: str = 'Pin must be a valid GPIO number in range 0 to 31.'
 _PIXEL_ERROR_MSG: str = 'Pixel must be a valid number in range 0 to 5.'
+_LED_ERROR_MSG: str = 'Led must be a valid number in range 0 to 5.'
+_ALL_LEDS: bytes = bytes(range(6))
 _COLOR_ERROR_MSG: str = 'Color must be a valid number in range 0 to 255.'
 _RATE_ERROR_MSG: str = 'Rate must be a valid number in range 35 to 560.'
+_BUTTON_ERROR_MSG: str = 'Button must be a valid number in range 0 to 5.'
+_LCD_X: Arg = Int('x', 0, 127, _PIXEL_ERROR_MSG)
+_LCD_Y: Arg = Int('y', 0, 63, _PIXEL_ERROR_MSG)
+_BACKLIGHT_X: Arg = Int('x', 0, 5, _PIXEL_ERROR_MSG)
+_LED: Arg = Int('led', 0, 5, _LED_ERROR_MSG)
+_BUTTON: Arg = Int('button', 0, 5, _BUTTON_ERROR_MSG)
+_COLOR: tuple = (Int('r', 0, 255, _COLOR_ERROR_MSG), Int('g', 0, 255, _COLOR_ERROR_MSG), Int('b', 0, 255, _COLOR_ERROR_MSG))
 _CALLBACK_ERROR_MSG: str = "Function callback must be a valid string with the global function name or <module name> and function name separated by '.'"
 _CALLBACK_NOT_FOUND_MSG: str = "Function callback not found: %s"
 _MODULE: str = 'gfxhat'
@@ -21,10 +40,78 @@ _LCD: str = '.lcd'
 _BACKLIGHT: str = '.backlight'
 _TOUCH: str = '.touch'
 _FONTS: str = '.fonts'
-_TRACE: bool = False
+_SNAPSHOT_ERROR_MSG: str = 'Invalid snapshot section: %s'
+# Sections of the snapshots, see id_snapshot
+_LCD_SECTION: int = 1
+_BACKLIGHT_SECTION: int = 2
+_LEDS_SECTION: int = 3
+_TOUCH_SECTION: int = 4
+# Repeat enabled (UNKNOWN if not set), repeat rate (0 if not set) and high sensitivity of the touch controller
+_TOUCH_CONFIG: struct.Struct = struct.Struct('<BHB')
+
+
+def describe_snapshot(snapshot: bytes) -> dict:
+    """Return the states of a snapshot as plain values for the dashboards, see id_web_gateway"""
+    sections: dict = unpack_snapshot(GfxHatFunctionProvider.__name__, snapshot)
+    frame: bytes = sections.get(_LCD_SECTION, b'')
+    backlight: bytes = sections.get(_BACKLIGHT_SECTION, b'')
+    config: bytes = sections.get(_TOUCH_SECTION)
+    repeat, rate, sensitivity = _TOUCH_CONFIG.unpack(config) if config and len(config) == _TOUCH_CONFIG.size else (UNKNOWN, 0, 0)
+    width: int = _LCD_X.maximum + 1
+    return {
+        # Rows of pixels packed using one bit per pixel, the most significant bit first
+        'lcd': {'width': width, 'height': len(frame) * 8 // width, 'pixels': frame},
+        'backlight': [list(backlight[i:i + 3]) for i in range(0, len(backlight), 3)],
+        'leds': [bool(v) for v in sections.get(_LEDS_SECTION, b'')],
+        'touch': {'repeat': None if repeat == UNKNOWN else bool(repeat), 'repeat_rate': rate or None,
+                  'high_sensitivity': bool(sensitivity)}
+    }
 
 
 class GfxHatFunctionProvider(FunctionProvider):
+    _SESSION_METHODS: dict = {
+        'lcd_set_pixel': ('lcd', 2, None),
+        'lcd_set_pixels': ('lcd', 2, 'lcd_set_pixel'),
+        'lcd_show': ('lcd_show', 0, None),
+        'backlight_setup': ('backlight_setup', 0, None),
+        'backlight_set_all': ('backlight', 0, None),
+        'backlight_set_pixel': ('backlight', 1, None),
+        'backlight_set_pixels': ('backlight', 1, 'backlight_set_pixel'),
+        'backlight_show': ('backlight_show', 0, None),
+        'touch_setup': ('touch_setup', 0, None),
+        'touch_high_sensitivity': ('touch_sensitivity', 0, None),
+        'touch_enable_repeat': ('touch_repeat', 0, None),
+        'touch_set_repeat_rate': ('touch_repeat_rate', 0, None),
+        'touch_on': ('touch', 1, None),
+        'touch_on_events': ('touch', 1, None),
+        'touch_set_led': ('touch_led', 1, None),
+        'touch_set_leds': ('touch_led', 1, 'touch_set_led'),
+        'restore': ('restore', 0, None)
+    }
+    _SESSION_RESETS: dict = {
+        'lcd_clear': ('lcd',),
+        'backlight_clear': ('backlight',),
+        'backlight_set_all': ('backlight',),
+        'restore': ('lcd', 'backlight', 'touch_led', 'touch_repeat', 'touch_repeat_rate')
+    }
+    # The coordinates and the LEDs of the methods accepting sequences can be passed as tuples or packed as bytes
+    _SCHEMAS: dict = {
+        'lcd_set_pixel': (_LCD_X, _LCD_Y, Bool('state')),
+        'lcd_set_pixels': (_LCD_X.many('x_tuple'), _LCD_Y.many('y_tuple'), Bool('state')),
+        'backlight_set_pixel': (_BACKLIGHT_X,) + _COLOR,
+        'backlight_set_pixels': (_BACKLIGHT_X.many('x_tuple'),) + _COLOR,
+        'backlight_set_all': _COLOR,
+        # The function is invoked with (channel, event) for each event
+        'touch_on': (_BUTTON, Value('function')),
+        # The function is invoked with a tuple of (timestamp, channel, event) for each batch of events
+        'touch_on_events': (_BUTTON, Value('function')),
+        'touch_set_led': (_LED, Bool('state')),
+        'touch_set_leds': (_LED.many('led_tuple'), Bool('state')),
+        'touch_get_name': (Int('index', 0, 5, _BUTTON_ERROR_MSG),),
+        'touch_set_repeat_rate': (Int('rate', 35, 560, _RATE_ERROR_MSG),)
+    }
+    # Constant values of the device
+    _COALESCED_METHODS: dict = {'lcd_dimensions': 60.0, 'touch_get_name': 60.0}
 
     def __init__(self, parent_logger: logging.Logger):
         super().__init__(parent_logger)
@@ -41,22 +128,21 @@ class GfxHatFunctionProvider(FunctionProvider):
     def lcd_show(self) -> bool:
         pass
 
-    def lcd_set_pixel(self, x: int, y: int, state: bool) -> bool:
+    def lcd_push_frame(self, frame) -> bool:
+        """
+        Push a frame in the stream of the client, only the latest pending frame is displayed, see LcdFrameStream.
+        The frame is packed using one bit per pixel (most significant bit first) or one byte per pixel, row by row.
+        """
         pass
 
-    def lcd_set_pixels(self, x_tuple, y_tuple, state: bool) -> bool:
-        pass
-    
-    def exposed_backlight_clear(self) -> bool:
-        pass
-
-    def backlight_set_pixel(self, x: int, r: int, g: int, b: int) -> bool:
+    def lcd_stream_stats(self) -> tuple:
+        """Return the numbers of pushed, rendered and dropped frames and the achieved frame rate"""
         pass
 
-    def backlight_set_pixels(self, x_tuple, r: int, g: int, b: int) -> bool:
+    def lcd_stream_close(self) -> bool:
         pass
-
-    def backlight_set_all(self, r: int, g: int, b: int) -> bool:
+    
+    def backlight_clear(self) -> bool:
         pass
 
     def backlight_show(self) -> bool:
@@ -65,49 +151,117 @@ class GfxHatFunctionProvider(FunctionProvider):
     def backlight_setup(self) -> bool:
         pass
 
-    def touch_on(self, button: int, function: Any) -> bool:
-        pass
-
     def touch_setup(self) -> bool:
         pass
 
-    def touch_set_led(self, led: int, state: bool) -> bool:
+    def touch_enable_repeat(self, flag: bool) -> bool:
         pass
 
-    def touch_set_leds(self, led_tuple, state: bool) -> bool:
+    def touch_high_sensitivity(self) -> bool:
         pass
 
-    def touch_enable_repeat(self, flag: bool) -> bool:
+    def snapshot(self) -> bytes:
+        """
+        Return the state of the device in a single call: the displayed LCD frame (1 bit per pixel), the backlight
+        colors, the touch LEDs and the repeat and sensitivity of the touch controller, see id_snapshot.
+        """
         pass
 
-    def touch_get_name(self, index: int) -> str:
+    def restore(self, snapshot) -> bool:
+        """Apply the state of a snapshot, the LCD frame is displayed in the layer of the client"""
         pass
 
-    def touch_high_sensitivity(self) -> bool:
-        pass
 
-    def touch_set_repeat_rate(self, rate: int) -> bool:
-        pass
+class LcdFrameStream(object):
+    """
+    Channel of a client pushing frames to the LCD without waiting for the reply of each frame.
+    Usage: with LcdFrameStream(provider) as stream: stream.send(frames)
+    """
+
+    def __init__(self, provider: GfxHatFunctionProvider):
+        self.__provider: GfxHatFunctionProvider = provider
+        self.__last: Any = None
+
+    def push(self, frame) -> None:
+        """Push a frame, the error of a previous frame is raised if any"""
+        last: Any = self.__last
+        if last is not None and last.ready and last.error:
+            self.__last = None
+            # Raises the remote error
+            last.value
+        frame = FunctionProviderStub._pack(frame)
+        if isinstance(self.__provider, FunctionProviderStub):
+            # The method is resolved on each push as the stub may have reconnected
+            push: Callable = rpyc.async_(self.__provider._get_method('lcd_push_frame'))
+            self.__last = push(frame)
+        else:
+            self.__provider.lcd_push_frame(frame)
+
+    def send(self, frames: Iterable) -> int:
+        """
+        Push the frames produced by the given iterable or generator.
+        :param frames: the frames
+        :return: the number of frames
+        """
+        count: int = 0
+        for frame in frames:
+            self.push(frame)
+            count += 1
+        return count
+
+    def get_stats(self) -> dict:
+        return dict(zip(('pushed', 'rendered', 'dropped', 'fps'), self.__provider.lcd_stream_stats()))
+
+    def close(self) -> None:
+        self.__provider.lcd_stream_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
 
 class __AbstractGfxHatFunctionProviderService(ABC, FunctionProviderService):
+    _SCHEMAS: dict = GfxHatFunctionProvider._SCHEMAS
+    _COALESCED_METHODS: dict = GfxHatFunctionProvider._COALESCED_METHODS
 
     def __init__(self, parent_logger: logging.Logger, module_name: str):
         super().__init__(parent_logger)
-        parent_logger.debug('Importing: %s' % module_name)
+        self._logger.debug('Importing: %s', module_name)
         self.__module = importlib.import_module(module_name)
         self.__lcd_module = importlib.import_module(module_name + _LCD)
         self.__backlight_module = importlib.import_module(module_name + _BACKLIGHT)
         self.__touch_module = importlib.import_module(module_name + _TOUCH)
         self.__font_module = importlib.import_module(module_name + _FONTS)
-        self.__lcd_cleared: bool = True
         self.__backlight_cleared: bool = True
+        # States set by the clients, kept for the snapshots as the drivers cannot read them back
+        self.__backlight: bytearray = bytearray(18)
+        self.__leds: bytearray = bytearray(6)
+        # Connections which last set the LEDs and the pixels of the backlight, only they are reset at their teardown
+        self.__led_owners: list = [None] * 6
+        self.__backlight_owners: list = [None] * 6
+        # Connections having a callback by button, the driver accepts a single handler per button
+        self.__touch_owners: Dict[int, set] = dict()
+        self.__touch_lock: threading.Lock = threading.Lock()
+        self.__touch_config: list = [UNKNOWN, 0, 0]
+        # Each connection draws in its own layer of the frame buffer, see id_frame_buffer
+        self.__frames: LayeredFrameBuffer = LayeredFrameBuffer(self._logger, getattr(self.__lcd_module, 'dimensions')(),
+                                                               getattr(self.__lcd_module, 'set_pixel'), getattr(self.__lcd_module, 'show'))
+        self.__streams: FrameStreamRenderer = FrameStreamRenderer(self._logger, self.__frames)
+        # Each connection is served by its own thread of the server
+        self.__local: threading.local = threading.local()
+        # Touch events are coalesced and delivered by a dedicated thread
+        self.__touch_events: EventBatcher = EventBatcher(self._logger)
 
     def finalize(self) -> None:
+        # Callbacks are released first so no event is delivered while the device is reset
+        self.__touch_events.stop()
         try:
+            f = getattr(self.__touch_module, 'on')
             for x in range(6):
-                self.exposed_touch_on(x, None)
-                self.exposed_touch_set_led(x, False)
+                f(x, None)
+            self.exposed_touch_set_leds(_ALL_LEDS, False)
         except Exception as ex:
             _, _, exc_traceback = sys.exc_info()
             traceback.print_tb(exc_traceback, limit=6, file=sys.stderr)
@@ -120,14 +274,43 @@ class __AbstractGfxHatFunctionProviderService(ABC, FunctionProviderService):
                 _, _, exc_traceback = sys.exc_info()
                 traceback.print_tb(exc_traceback, limit=6, file=sys.stderr)
                 self._logger.error(ex)
-        if not self.__lcd_cleared:
-            try:
-                self.exposed_lcd_clear()
-                self.exposed_lcd_show()
-            except Exception as ex:
-                _, _, exc_traceback = sys.exc_info()
-                traceback.print_tb(exc_traceback, limit=6, file=sys.stderr)
-                self._logger.error(ex)
+        try:
+            self.__streams.stop()
+            self.__frames.reset()
+        except Exception as ex:
+            _, _, exc_traceback = sys.exc_info()
+            traceback.print_tb(exc_traceback, limit=6, file=sys.stderr)
+            self._logger.error(ex)
+
+    def __get_layer(self) -> Any:
+        # The local calls use the base layer
+        return getattr(self.__local, 'connection', None)
+
+    def _reset_owned(self, conn: rpyc.Connection) -> None:
+        """Switch off the LEDs and the pixels of the backlight last set by the given connection"""
+        leds: list = [x for x in range(6) if self.__led_owners[x] is conn]
+        pixels: list = [x for x in range(6) if self.__backlight_owners[x] is conn]
+        self._logger.debug('Resetting %s LEDs and %s backlight pixels of %s', len(leds), len(pixels), conn)
+        for x in leds:
+            self.exposed_touch_set_led(x, False)
+            self.__led_owners[x] = None
+        if pixels:
+            for x in pixels:
+                self.exposed_backlight_set_pixel(x, 0, 0, 0)
+                self.__backlight_owners[x] = None
+            self.exposed_backlight_show()
+
+    def _release_lcd_layer(self, conn: rpyc.Connection, keep: bool) -> None:
+        """Remove the layer of the given connection, its pixels are kept on the display if keep is true"""
+        self.__frames.release(conn, keep)
+
+    def _release_session(self, conn: rpyc.Connection, successor: rpyc.Connection) -> None:
+        # The replay drew the layer of the successor, the LEDs and the backlight keep their state for the session
+        for owners in (self.__led_owners, self.__backlight_owners):
+            for x in range(6):
+                if owners[x] is conn:
+                    owners[x] = successor
+        self._release_lcd_layer(conn, False)
 
     def exposed_lcd_font(self, name: str) -> Any:
         self._logger.debug('lcd_font using name: %s', name)
@@ -136,59 +319,66 @@ class __AbstractGfxHatFunctionProviderService(ABC, FunctionProviderService):
         return result
 
     def exposed_lcd_dimensions(self) -> ():
-        self._logger.debug('lcd_dimensions')
+        if TRACE:
+            self._logger.debug('lcd_dimensions')
         result = getattr(self.__lcd_module, 'dimensions')()
-        self._logger.debug(result)
+        if TRACE:
+            self._logger.debug(result)
         return result
 
     def exposed_lcd_clear(self) -> bool:
-        self._logger.debug('lcd_clear')
-        getattr(self.__lcd_module, 'clear')()
-        self.__lcd_cleared = True
+        if TRACE:
+            self._logger.debug('lcd_clear')
+        self.__frames.clear(self.__get_layer())
         # Always return a non None value for RPC unmarshalling
         return True
 
     def exposed_lcd_show(self) -> bool:
-        self._logger.debug('lcd_show')
-        getattr(self.__lcd_module, 'show')()
-        self.__lcd_cleared = False
+        if TRACE:
+            self._logger.debug('lcd_show')
+        self.__frames.show(self.__get_layer())
         # Always return a non None value for RPC unmarshalling
         return True
 
     def exposed_lcd_set_pixel(self, x: int, y: int, state: bool) -> bool:
-        if _TRACE:
-            self._logger.debug('lcd_set_pixel: %s,%s with value: %s', str(x), str(y), str(state))
-        if x < 0 or x > 127:
-            raise ValueError(_PIXEL_ERROR_MSG)
-        if y < 0 or y > 63:
-            raise ValueError(_PIXEL_ERROR_MSG)
+        if TRACE:
+            self._logger.debug('lcd_set_pixel: %s,%s with value: %s', x, y, state)
         v: int = 0
         if state:
             v = 1
-        getattr(self.__lcd_module, 'set_pixel')(x, y, v)
+        self.__frames.set_pixel(self.__get_layer(), x, y, v)
         # Always return a non None value for RPC unmarshalling
         return True
 
-    def exposed_lcd_set_pixels(self, x_tuple, y_tuple, state: bool) -> bool:
-        self._logger.debug('lcd_set_pixels: %s for values: %s', state, str(len(x_tuple)))
-        f = getattr(self.__lcd_module, 'set_pixel')
-        v: int = 0
-        if state:
-            v = 1
-        i: int = 0
-        for x in x_tuple:
-            if x < 0 or x > 127:
-                raise ValueError(_PIXEL_ERROR_MSG)
-            y = y_tuple[i]
-            if y < 0 or y > 63:
-                raise ValueError(_PIXEL_ERROR_MSG)
-            f(x, y, v)
-            i = i + 1
+    def exposed_lcd_set_pixels(self, xs: array.array, ys: array.array, state: bool) -> bool:
+        if TRACE:
+            self._logger.debug('lcd_set_pixels: %s for values: %s', state, len(xs))
+        with span('backend'):
+            self.__frames.set_pixels(self.__get_layer(), xs, ys, state)
+        # Always return a non None value for RPC unmarshalling
+        return True
+
+    def exposed_lcd_push_frame(self, frame) -> bool:
+        if is_netref(frame):
+            raise TypeError('Frame is a remote reference, pass bytes instead.')
+        if is_shared_reference(frame):
+            frame = resolve_shared_reference(frame)
+        self.__streams.push(self.__get_layer(), frame)
+        # Always return a non None value for RPC unmarshalling
+        return True
+
+    def exposed_lcd_stream_stats(self) -> tuple:
+        return self.__streams.get_stats(self.__get_layer())
+
+    def exposed_lcd_stream_close(self) -> bool:
+        self._logger.debug('lcd_stream_close')
+        self.__streams.close(self.__get_layer())
         # Always return a non None value for RPC unmarshalling
         return True
 
     def exposed_backlight_clear(self) -> bool:
-        self._logger.debug('backlight_clear')
+        if TRACE:
+            self._logger.debug('backlight_clear')
         for x in range(6):
             self.exposed_backlight_set_pixel(x, 0, 0, 0)
         self.__backlight_cleared = True
@@ -196,39 +386,39 @@ class __AbstractGfxHatFunctionProviderService(ABC, FunctionProviderService):
         return True
 
     def exposed_backlight_set_pixel(self, x: int, r: int, g: int, b: int) -> bool:
-        if _TRACE:
-            self._logger.debug('backlight_set_pixel: %s with color: %s,%s,%s', str(x), str(r), str(g), str(b))
-        if x < 0 or x > 5:
-            raise ValueError(_PIXEL_ERROR_MSG)
-        if r < 0 or r > 255 or g < 0 or g > 255 or b < 0 or b > 255:
-            raise ValueError(_COLOR_ERROR_MSG)
+        if TRACE:
+            self._logger.debug('backlight_set_pixel: %s with color: %s,%s,%s', x, r, g, b)
         getattr(self.__backlight_module, 'set_pixel')(x, r, g, b)
+        self.__backlight[x * 3:x * 3 + 3] = bytes((r, g, b))
+        self.__backlight_owners[x] = self.__get_layer()
         # Always return a non None value for RPC unmarshalling
         return True
 
-    def exposed_backlight_set_pixels(self, x_tuple, r: int, g: int, b: int) -> bool:
-        self._logger.debug('backlight_set_pixels: %s,%s,%s for values: %s', r, g, b, str(len(x_tuple)))
+    def exposed_backlight_set_pixels(self, xs: array.array, r: int, g: int, b: int) -> bool:
+        if TRACE:
+            self._logger.debug('backlight_set_pixels: %s,%s,%s for values: %s', r, g, b, len(xs))
         f = getattr(self.__backlight_module, 'set_pixel')
-        for x in x_tuple:
-            if x < 0 or x > 5:
-                raise ValueError(_PIXEL_ERROR_MSG)
-            if r < 0 or r > 255 or g < 0 or g > 255 or b < 0 or b > 255:
-                raise ValueError(_COLOR_ERROR_MSG)
+        color: bytes = bytes((r, g, b))
+        owner: Any = self.__get_layer()
+        for x in xs:
             f(x, r, g, b)
+            self.__backlight[x * 3:x * 3 + 3] = color
+            self.__backlight_owners[x] = owner
         # Always return a non None value for RPC unmarshalling
         return True
 
     def exposed_backlight_set_all(self, r: int, g: int, b: int) -> bool:
-        if _TRACE:
-            self._logger.debug('backlight_set_all with color: %s,%s,%s', str(r), str(g), str(b))
-        if r < 0 or r > 255 or g < 0 or g > 255 or b < 0 or b > 255:
-            raise ValueError(_COLOR_ERROR_MSG)
+        if TRACE:
+            self._logger.debug('backlight_set_all with color: %s,%s,%s', r, g, b)
         getattr(self.__backlight_module, 'set_all')(r, g, b)
+        self.__backlight[:] = bytes((r, g, b)) * 6
+        self.__backlight_owners[:] = [self.__get_layer()] * 6
         # Always return a non None value for RPC unmarshalling
         return True
 
     def exposed_backlight_show(self) -> bool:
-        self._logger.debug('backlight_show')
+        if TRACE:
+            self._logger.debug('backlight_show')
         getattr(self.__backlight_module, 'show')()
         self.__backlight_cleared = False
         # Always return a non None value for RPC unmarshalling
@@ -240,9 +430,64 @@ class __AbstractGfxHatFunctionProviderService(ABC, FunctionProviderService):
         # Always return a non None value for RPC unmarshalling
         return True
 
+    def on_connect(self, conn: rpyc.Connection) -> None:
+        super().on_connect(conn)
+        self.__local.connection = conn
+
+    def on_disconnect(self, conn: rpyc.Connection) -> None:
+        super().on_disconnect(conn)
+        # The callbacks cannot be invoked anymore, they are removed without waiting for the teardown of the session
+        self.__touch_events.unregister_connection(conn)
+        with self.__touch_lock:
+            for button in [b for b, c in self.__touch_owners.items() if conn in c]:
+                self.__touch_release(button, conn)
+        self.__streams.close(conn)
+
+    def __touch_release(self, button: int, conn: Any) -> None:
+        owners: set = self.__touch_owners.get(button)
+        if owners is None:
+            return
+        owners.discard(conn)
+        if not owners:
+            del self.__touch_owners[button]
+            getattr(self.__touch_module, 'on')(button, None)
+
+    def __touch_register(self, button: int, function: Any, batched: bool) -> None:
+        conn: Any = self.__get_layer()
+        # Each connection has its own callback for a button
+        self.__touch_events.register((conn, button), function, batched)
+        with self.__touch_lock:
+            if function is None:
+                self.__touch_release(button, conn)
+                return
+            owners: set = self.__touch_owners.get(button)
+            if owners is not None:
+                owners.add(conn)
+                return
+            owners = {conn}
+            self.__touch_owners[button] = owners
+            events: EventBatcher = self.__touch_events
+
+            def handler(*args):
+                # The driver passes an event having the channel and event attributes
+                if len(args) == 1:
+                    channel, event = getattr(args[0], 'channel'), getattr(args[0], 'event')
+                else:
+                    channel, event = args[0], args[1]
+                for owner in tuple(owners):
+                    events.add((owner, button), channel, event)
+
+            getattr(self.__touch_module, 'on')(button, handler)
+
     def exposed_touch_on(self, button: int, function: Any) -> bool:
-        self._logger.debug('touch_on for button: %s', str(button))
-        getattr(self.__touch_module, 'on')(button, function)
+        self._logger.debug('touch_on for button: %s', button)
+        self.__touch_register(button, function, False)
+        # Always return a non None value for RPC unmarshalling
+        return True
+
+    def exposed_touch_on_events(self, button: int, function: Any) -> bool:
+        self._logger.debug('touch_on_events for button: %s', button)
+        self.__touch_register(button, function, True)
         # Always return a non None value for RPC unmarshalling
         return True
 
@@ -253,49 +498,116 @@ class __AbstractGfxHatFunctionProviderService(ABC, FunctionProviderService):
         return True
 
     def exposed_touch_set_led(self, led: int, state: bool) -> bool:
-        if _TRACE:
-            self._logger.debug('touch_set_led for led: %s with value: %s', str(led), str(state))
+        if TRACE:
+            self._logger.debug('touch_set_led for led: %s with value: %s', led, state)
         v: int = 0
         if state:
             v = 1
         getattr(self.__touch_module, 'set_led')(led, v)
+        self.__leds[led] = v
+        self.__led_owners[led] = self.__get_layer()
         # Always return a non None value for RPC unmarshalling
         return True
 
-    def exposed_touch_set_leds(self, led_tuple, state: bool) -> bool:
-        self._logger.debug('touch_set_leds: %s for values: %s', state, str(len(led_tuple)))
+    def exposed_touch_set_leds(self, leds: array.array, state: bool) -> bool:
+        if TRACE:
+            self._logger.debug('touch_set_leds: %s for values: %s', state, len(leds))
         f = getattr(self.__touch_module, 'set_led')
         v: int = 0
         if state:
             v = 1
-        for led in led_tuple:
+        owner: Any = self.__get_layer()
+        for led in leds:
             f(led, v)
+            self.__leds[led] = v
+            self.__led_owners[led] = owner
         # Always return a non None value for RPC unmarshalling
         return True
 
     def exposed_touch_enable_repeat(self, flag: bool) -> bool:
-        self._logger.debug('touch_enable_repeat with value: %s', str(flag))
+        self._logger.debug('touch_enable_repeat with value: %s', flag)
         getattr(self.__touch_module, 'enable_repeat')(flag)
+        self.__touch_config[0] = 1 if flag else 0
         # Always return a non None value for RPC unmarshalling
         return True
 
     def exposed_touch_get_name(self, index: int) -> str:
-        self._logger.debug('touch_get_name with value: %s', str(index))
-        result = getattr(self.__touch_module, 'enable_repeat')(index)
-        self._logger.debug(result)
+        if TRACE:
+            self._logger.debug('touch_get_name with value: %s', index)
+        result = getattr(self.__touch_module, 'get_name')(index)
+        if TRACE:
+            self._logger.debug(result)
         return result
 
     def exposed_touch_high_sensitivity(self) -> bool:
         self._logger.debug('touch_high_sensitivity')
         getattr(self.__touch_module, 'high_sensitivity')()
+        self.__touch_config[2] = 1
         # Always return a non None value for RPC unmarshalling
         return True
 
     def exposed_touch_set_repeat_rate(self, rate: int) -> bool:
-        self._logger.debug('touch_set_repeat_rate with value: %s', str(rate))
-        if rate < 35 or rate > 560:
-            raise ValueError(_RATE_ERROR_MSG)
+        self._logger.debug('touch_set_repeat_rate with value: %s', rate)
         getattr(self.__touch_module, 'set_repeat_rate')(rate)
+        self.__touch_config[1] = int(rate)
+        # Always return a non None value for RPC unmarshalling
+        return True
+
+    def exposed_snapshot(self) -> bytes:
+        if TRACE:
+            self._logger.debug('snapshot')
+        return pack_snapshot(GfxHatFunctionProvider.__name__, {
+            _LCD_SECTION: self.__frames.get_frame(),
+            _BACKLIGHT_SECTION: bytes(self.__backlight),
+            _LEDS_SECTION: bytes(self.__leds),
+            _TOUCH_SECTION: _TOUCH_CONFIG.pack(*self.__touch_config)
+        })
+
+    def exposed_restore(self, snapshot) -> bool:
+        sections: dict = unpack_snapshot(GfxHatFunctionProvider.__name__, snapshot)
+        self._logger.debug('restore of %s sections', len(sections))
+        # The whole snapshot is decoded and validated before the device is changed
+        frame: bytes = sections.get(_LCD_SECTION)
+        pixels: bytes = None if frame is None else self.__frames.decode_frame(frame)
+        backlight: bytes = sections.get(_BACKLIGHT_SECTION)
+        if backlight is not None and len(backlight) != len(self.__backlight):
+            raise ValueError(_SNAPSHOT_ERROR_MSG % _BACKLIGHT_SECTION)
+        leds: bytes = sections.get(_LEDS_SECTION)
+        if leds is not None and (len(leds) != len(self.__leds) or max(leds) > 1):
+            raise ValueError(_SNAPSHOT_ERROR_MSG % _LEDS_SECTION)
+        config: bytes = sections.get(_TOUCH_SECTION)
+        if config is not None:
+            if len(config) != _TOUCH_CONFIG.size:
+                raise ValueError(_SNAPSHOT_ERROR_MSG % _TOUCH_SECTION)
+            repeat, rate, sensitivity = _TOUCH_CONFIG.unpack(config)
+            if rate and not 35 <= rate <= 560:
+                raise ValueError(_RATE_ERROR_MSG)
+        with span('backend'):
+            if pixels is not None:
+                layer: Any = self.__get_layer()
+                self.__frames.set_frame(layer, pixels)
+                self.__frames.show(layer)
+            if backlight is not None:
+                f = getattr(self.__backlight_module, 'set_pixel')
+                for x in range(6):
+                    f(x, backlight[x * 3], backlight[x * 3 + 1], backlight[x * 3 + 2])
+                getattr(self.__backlight_module, 'show')()
+                self.__backlight[:] = backlight
+                self.__backlight_owners[:] = [self.__get_layer()] * 6
+                self.__backlight_cleared = False
+            if leds is not None:
+                f = getattr(self.__touch_module, 'set_led')
+                for led, state in enumerate(leds):
+                    f(led, state)
+                self.__leds[:] = leds
+                self.__led_owners[:] = [self.__get_layer()] * 6
+            if config is not None:
+                if repeat != UNKNOWN:
+                    self.exposed_touch_enable_repeat(bool(repeat))
+                if rate:
+                    self.exposed_touch_set_repeat_rate(rate)
+                if sensitivity and not self.__touch_config[2]:
+                    self.exposed_touch_high_sensitivity()
         # Always return a non None value for RPC unmarshalling
         return True
 
@@ -305,82 +617,28 @@ class GfxHatFunctionProviderServiceMock(__AbstractGfxHatFunctionProviderService)
     def __init__(self, parent_logger: logging.Logger):
         super().__init__(parent_logger, _MOCK_MODULE)
 
+    def on_disconnect(self, conn: rpyc.Connection) -> None:
+        super().on_disconnect(conn)
+        # The drawing of the client stays visible like on a display without session teardown
+        self._release_lcd_layer(conn, True)
 
-class GfxHatFunctionProviderService(__AbstractGfxHatFunctionProviderService):
 
-    class __TouchOnCallback(object):
-
-        def __init__(self, logger: logging.Logger, button: int, f):
-            self.__logger = logger
-            self.__button: int = button
-            self.__callback = rpyc.async_(f)
-
-        def call(self, *args):
-            if self.__callback:
-                try:
-                    self.__logger.debug('Invoking callback for button: %s with args: %s' % (str(self.__button), str(args)))
-                    event = args[0]
-                    self.__callback(getattr(event, 'channel'), getattr(event, 'event'))
-                except Exception as ex:
-                    _, _, exc_traceback = sys.exc_info()
-                    traceback.print_tb(exc_traceback, limit=6, file=sys.stderr)
-                    self.à_logger.error(ex)
-            else:
-                self.__logger.warn('Callback is disconnected for button: %s' % str(self.__button))
-
-        def disconnect(self) -> None:
-            self.__logger.debug('Disconnecting callback for button: %s' % str(self.__button))
-            self.__callback = None
-
-        def get_button(self) -> int:
-            return self.__button
+class GfxHatFunctionProviderService(__AbstractGfxHatFunctionProviderService):
 
     def __init__(self, parent_logger: logging.Logger):
         super().__init__(parent_logger, _MODULE)
-        self.__touch_on_callback: dict[int, self.__TouchOnCallback] = dict()
 
-    def finalize(self) -> None:
-        for v in self.__touch_on_callback.values():
-            v.disconnect()
-        super().finalize()
-
-    def on_disconnect(self, conn: rpyc.Connection) -> None:
-        super().on_disconnect(conn)
-        for v in self.__touch_on_callback.values():
-            v.disconnect()
+    def _teardown_session(self, conn: rpyc.Connection) -> None:
+        # The LEDs and the backlight set by the other clients are kept, the callbacks were removed at the disconnection
         try:
-            for x in range(6):
-                self.exposed_touch_set_led(x, False)
-                self.exposed_touch_on(x, None)
+            self._reset_owned(conn)
         except Exception as ex:
             _, _, exc_traceback = sys.exc_info()
             traceback.print_tb(exc_traceback, limit=6, file=sys.stderr)
             self._logger.error(ex)
         try:
-            self.exposed_backlight_clear()
-            self.exposed_backlight_show()
-        except Exception as ex:
-            _, _, exc_traceback = sys.exc_info()
-            traceback.print_tb(exc_traceback, limit=6, file=sys.stderr)
-            self._logger.error(ex)
-        try:
-            self.exposed_lcd_clear()
-            self.exposed_lcd_show()
+            self._release_lcd_layer(conn, False)
         except Exception as ex:
             _, _, exc_traceback = sys.exc_info()
             traceback.print_tb(exc_traceback, limit=6, file=sys.stderr)
             self._logger.error(ex)
-
-    def exposed_touch_on(self, button: int, function: Any) -> bool:
-        from id_function_invokers import FunctionInvokers
-        f = function
-        if FunctionInvokers.is_server():
-            self._logger.debug('Using async callback function')
-            if f is None:
-                if button in self.__touch_on_callback:
-                    self.__touch_on_callback[button].disconnect()
-            else:
-                cb = self.__TouchOnCallback(self._logger, button, rpyc.async_(f))
-                self.__touch_on_callback[button] = cb
-                f = cb.call
-        return super().exposed_touch_on(button, f)
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+# Scripts functions provider
+# Executes restricted scripts calling the other providers of the server, so that a multi-step logic runs next to the
+# hardware without a round trip per step, see id_script for the language and the budget of a script.
+# The provider is exposed only when enabled by the ID_SCRIPTS environment variable set to 1.
+import array
+import inspect
+import itertools
+import logging
+import os
+import rpyc
+import threading
+from abc import ABC
+from typing import Any, Callable, Dict
+from id_buffer_utils import is_netref
+from id_classes_utils import subclasses_of
+from id_function_invokers import FunctionProvider, FunctionProviderService, IllegalInvocationException, TRACE
+from id_schema import Int, get_batch_names
+from id_script import CANCELLED, Script, ScriptCancelled, ScriptError, export_value
+
+# Set to 1 to expose the provider
+ENABLED: bool = os.environ.get('ID_SCRIPTS', '0') != '0'
+# Maximum number of scripts executed at the same time
+MAX_RUNNING: int = int(os.environ.get('ID_SCRIPT_MAX_RUNNING', '8'))
+# Maximum number of events returned by execute()
+MAX_EVENTS: int = 1024
+EVENT: str = 'event'
+RESULT: str = 'result'
+ERROR: str = 'error'
+_SUFFIX: str = 'FunctionProvider'
+_SCRIPT_ID_ERROR_MSG: str = 'Script identifier must be a valid number greater than 0.'
+_VARIABLES_ERROR_MSG: str = 'Variables must be passed as a tuple of (name, value) pairs.'
+_RUNNING_ERROR_MSG: str = 'Too many scripts running: %s'
+_PROVIDER_ERROR_MSG: str = 'Provider %s is not available'
+_EVENTS_ERROR_MSG: str = 'more than %s events, use run() to stream them' % MAX_EVENTS
+
+
+class ScriptFunctionProvider(FunctionProvider):
+    _ENABLED: bool = ENABLED
+    _SCHEMAS: dict = {
+        # Cancel the given script, return false if it is not running
+        'cancel': (Int('script_id', 1, None, _SCRIPT_ID_ERROR_MSG),)
+    }
+
+    def __init__(self, parent_logger: logging.Logger):
+        super().__init__(parent_logger)
+
+    def providers(self) -> tuple:
+        """Return the tuples (alias, methods) of the providers callable by the scripts"""
+        pass
+
+    def validate(self, source: str) -> bool:
+        """Check the given script without executing it, ValueError is raised with the line of the first error"""
+        pass
+
+    def execute(self, source: str, variables: tuple=None) -> tuple:
+        """
+        Execute the given script and wait for its completion.
+        The variables are (name, value) pairs, the values being numbers, strings, bytes, booleans, None or tuples.
+        :return: the tuple (result, events), the events being the tuples of values passed to emit()
+        """
+        pass
+
+    def run(self, source: str, variables: tuple=None, function: Any=None) -> int:
+        """
+        Start the given script and return its identifier without waiting for its completion.
+        The function is invoked with (script_id, 'event', values) for each event, then with (script_id, 'result', value),
+        (script_id, 'error', message) or (script_id, 'cancelled', None). The scripts of a client are cancelled when it
+        disconnects.
+        """
+        pass
+
+    def scripts(self) -> tuple:
+        """Return the tuples (script_id, state, steps, calls, elapsed) of the running scripts"""
+        pass
+
+
+class _Execution(object):
+    """Script running in its own thread"""
+    __slots__ = ('script_id', 'script', 'connection', 'thread')
+
+    def __init__(self, script_id: int, script: Script, connection: Any):
+        self.script_id: int = script_id
+        self.script: Script = script
+        self.connection: Any = connection
+        self.thread: threading.Thread = None
+
+
+def _import_value(value: Any) -> Any:
+    """Return the result of a provider as a value of the scripts"""
+    if isinstance(value, array.array):
+        return tuple(value)
+    if isinstance(value, (bytearray, memoryview)):
+        return bytes(value)
+    return export_value(value)
+
+
+def _get_methods(provider_class: type) -> frozenset:
+    """Return the public methods of the given abstract provider, except the ones registering a callback"""
+    result: set = set()
+    for klass in provider_class.__mro__:
+        if klass is FunctionProvider or klass is object:
+            break
+        for name, value in vars(klass).items():
+            if callable(value) and not name.startswith('_') and 'function' not in inspect.signature(value).parameters:
+                result.add(name)
+    schemas: dict = {n: s for n, s in provider_class._SCHEMAS.items() if n in result}
+    return frozenset(result.union(get_batch_names(schemas)))
+
+
+class __AbstractScriptFunctionProviderService(ABC, FunctionProviderService):
+    _SCHEMAS: dict = ScriptFunctionProvider._SCHEMAS
+
+    def __init__(self, parent_logger: logging.Logger):
+        super().__init__(parent_logger)
+        # Methods by alias, resolved on the first use as the other services may not be instantiated yet
+        self.__providers: Dict[str, frozenset] = None
+        self.__names: Dict[str, str] = dict()
+        self.__executions: Dict[int, _Execution] = dict()
+        self.__lock: threading.Lock = threading.Lock()
+        self.__ids = itertools.count(1)
+        # Each connection is served by its own thread of the server
+        self.__local: threading.local = threading.local()
+
+    def finalize(self) -> None:
+        with self.__lock:
+            executions: list = list(self.__executions.values())
+        for execution in executions:
+            execution.script.cancel()
+        for execution in executions:
+            if execution.thread is not None:
+                execution.thread.join()
+
+    def on_connect(self, conn: rpyc.Connection) -> None:
+        super().on_connect(conn)
+        self.__local.connection = conn
+
+    def on_disconnect(self, conn: rpyc.Connection) -> None:
+        super().on_disconnect(conn)
+        with self.__lock:
+            for execution in self.__executions.values():
+                if execution.connection is conn:
+                    self._logger.debug('Cancelling script %s of disconnected client', execution.script_id)
+                    execution.script.cancel()
+
+    def __get_providers(self) -> Dict[str, frozenset]:
+        if self.__providers is None:
+            providers: Dict[str, frozenset] = dict()
+            for subclass in subclasses_of(FunctionProvider):
+                name: str = subclass.__name__
+                if name == ScriptFunctionProvider.__name__ or not name.endswith(_SUFFIX):
+                    continue
+                alias: str = name[:-len(_SUFFIX)].lower()
+                self.__names[alias] = name
+                providers[alias] = _get_methods(subclass)
+            self.__providers = providers
+        return self.__providers
+
+    def __invoke(self, alias: str, method: str, args: tuple) -> Any:
+        # The module of the invokers imports the providers, its class is available once they are imported
+        from id_function_invokers import FunctionInvokers
+        service: FunctionProviderService = FunctionInvokers.get_service(self.__names[alias])
+        if service is None:
+            raise ScriptError(_PROVIDER_ERROR_MSG % alias)
+        if TRACE:
+            self._logger.debug('Script call %s.%s%s', alias, method, args)
+        # Same path as the remote calls: validation, coalescing, drain and profiling
+        return _import_value(service._rpyc_getattr(method)(*args))
+
+    def __create(self, source: str, variables: Any, emit: Callable[[tuple], None]) -> Script:
+        if is_netref(variables):
+            raise TypeError(_VARIABLES_ERROR_MSG)
+        values: dict = dict()
+        if isinstance(variables, dict):
+            variables = variables.items()
+        for pair in variables or ():
+            if is_netref(pair) or not isinstance(pair, (tuple, list)) or len(pair) != 2:
+                raise TypeError(_VARIABLES_ERROR_MSG)
+            values[pair[0]] = pair[1]
+        return Script(source, self.__get_providers(), self.__invoke, emit, values)
+
+    def __register(self, script: Script, connection: Any) -> _Execution:
+        with self.__lock:
+            if len(self.__executions) >= MAX_RUNNING:
+                raise IllegalInvocationException(_RUNNING_ERROR_MSG % len(self.__executions))
+            execution: _Execution = _Execution(next(self.__ids), script, connection)
+            self.__executions[execution.script_id] = execution
+        return execution
+
+    def exposed_providers(self) -> tuple:
+        return tuple((a, tuple(sorted(m))) for a, m in sorted(self.__get_providers().items()))
+
+    def exposed_validate(self, source: str) -> bool:
+        Script(source, self.__get_providers(), self.__invoke, lambda event: None)
+        # Always return a non None value for RPC unmarshalling
+        return True
+
+    def exposed_execute(self, source: str, variables: tuple=None) -> tuple:
+        events: list = list()
+
+        def emit(event: tuple) -> None:
+            if len(events) >= MAX_EVENTS:
+                raise ScriptError(_EVENTS_ERROR_MSG)
+            events.append(event)
+
+        script: Script = self.__create(source, variables, emit)
+        execution: _Execution = self.__register(script, getattr(self.__local, 'connection', None))
+        self._logger.debug('Executing script %s', execution.script_id)
+        try:
+            result: Any = script.run()
+        finally:
+            with self.__lock:
+                del self.__executions[execution.script_id]
+        self._logger.debug('Script %s done in %s steps', execution.script_id, script.steps)
+        return result, tuple(events)
+
+    def exposed_run(self, source: str, variables: tuple=None, function: Any=None) -> int:
+        # Remote callbacks are invoked without waiting for their completion
+        invoker: Callable = rpyc.async_(function) if is_netref(function) else function
+        holder: list = list()
+
+        def notify(kind: str, value: Any) -> None:
+            if invoker is None:
+                return
+            try:
+                invoker(holder[0], kind, value)
+            except Exception as ex:
+                # The client is gone, its scripts are cancelled when the disconnection is handled
+                self._logger.warning('Notification %s of script %s not delivered: %s', kind, holder[0], ex)
+
+        script: Script = self.__create(source, variables, lambda event: notify(EVENT, event))
+        execution: _Execution = self.__register(script, getattr(self.__local, 'connection', None))
+        holder.append(execution.script_id)
+
+        def target() -> None:
+            try:
+                result: Any = script.run()
+                self._logger.debug('Script %s done in %s steps', execution.script_id, script.steps)
+                notify(RESULT, result)
+            except ScriptCancelled:
+                self._logger.debug('Script %s cancelled', execution.script_id)
+                notify(CANCELLED, None)
+            except ScriptError as ex:
+                self._logger.debug('Script %s failed: %s', execution.script_id, ex)
+                notify(ERROR, str(ex))
+            finally:
+                with self.__lock:
+                    del self.__executions[execution.script_id]
+
+        self._logger.debug('Running script %s', execution.script_id)
+        execution.thread = threading.Thread(target=target, name='Script-%s' % execution.script_id, daemon=True)
+        execution.thread.start()
+        return execution.script_id
+
+    def exposed_cancel(self, script_id: int) -> bool:
+        with self.__lock:
+            execution: _Execution = self.__executions.get(script_id)
+        if execution is None:
+            return False
+        self._logger.debug('Cancelling script %s', script_id)
+        execution.script.cancel()
+        return True
+
+    def exposed_scripts(self) -> tuple:
+        with self.__lock:
+            executions: list = list(self.__executions.values())
+        return tuple((e.script_id, e.script.state, e.script.steps, e.script.calls, round(e.script.get_elapsed(), 3))
+                     for e in executions)
+
+
+class ScriptFunctionProviderServiceMock(__AbstractScriptFunctionProviderService):
+
+    def __init__(self, parent_logger: logging.Logger):
+        super().__init__(parent_logger)
+
+
+class ScriptFunctionProviderService(__AbstractScriptFunctionProviderService):
+
+    def __init__(self, parent_logger: logging.Logger):
+        super().__init__(parent_logger)
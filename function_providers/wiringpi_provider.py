@@ -1,22 +1,133 @@
 # -*- coding: utf-8 -*-
 # WiringPi functions provider
+import array
 import importlib
 import logging
+import struct
 import sys
 import traceback
 from abc import ABC
-from id_function_invokers import FunctionProvider, FunctionProviderService
-from typing import List
+from id_buffer_utils import as_array, check_range, is_buffer
+from id_function_invokers import FunctionProvider, FunctionProviderService, TRACE
+from id_schema import Arg, Int, Value
+from id_snapshot import UNKNOWN, pack_snapshot, unpack_snapshot
+from id_soft_pwm import SoftPwmEngine, check_frequency, DUTY_RANGE
+from id_tracing import span
+from typing import Dict, List
 
 _PIN_ERROR_MSG: str = 'Pin must be a valid number in range 0 to 31.'
+_DUTY_ERROR_MSG: str = 'Duty must be a valid number in range 0 to %s.' % DUTY_RANGE
+_PULL_ERROR_MSG: str = 'Pull mode must be 0 (off), 1 (down) or 2 (up).'
+_PWM_ERROR_MSG: str = 'PWM value must be a valid number in range 0 to 4095.'
+_SETUP_ERROR_MSG: str = 'WiringPi must be set up before restoring the pins.'
+_SNAPSHOT_ERROR_MSG: str = 'Invalid snapshot section: %s'
+_OUTPUT_MODE: int = 1
+_PIN_COUNT: int = 32
+_SETUP_FUNCTIONS: tuple = ('wiringPiSetup', 'wiringPiSetupSys', 'wiringPiSetupGpio')
+_PWM_FUNCTIONS: tuple = ('pwmSetMode', 'pwmSetRange', 'pwmSetClock')
+# Sections of the snapshots, see id_snapshot
+_SETUP_SECTION: int = 1
+_MODES_SECTION: int = 2
+_PULLS_SECTION: int = 3
+_LEVELS_SECTION: int = 4
+_PWM_CONFIG_SECTION: int = 5
+_PWM_VALUES_SECTION: int = 6
+_SOFT_PWM_SECTION: int = 7
+# Mode, range and clock of the hardware PWM, -1 if not set
+_PWM_CONFIG: struct.Struct = struct.Struct('<iii')
+_PWM_VALUE: struct.Struct = struct.Struct('<BH')
+_SOFT_PWM_CHANNEL: struct.Struct = struct.Struct('<BdB')
+_PIN: Arg = Int('pin', 0, 31, _PIN_ERROR_MSG)
+_DUTY: Arg = Int('duty', 0, DUTY_RANGE, _DUTY_ERROR_MSG)
 _MODULE: str = 'wiringpi'
 _MOCK_MODULE: str = 'wiringpi-mock'
-_TRACE: bool = False
 
 ListOfFloats = List[float]
 
 
+def _pack_pairs(values: Dict[int, int]) -> bytes:
+    return bytes(b for pair in sorted(values.items()) for b in pair)
+
+
+def _unpack_pairs(payload: bytes, tag: int) -> dict:
+    if len(payload) % 2:
+        raise ValueError(_SNAPSHOT_ERROR_MSG % tag)
+    return dict(zip(payload[0::2], payload[1::2]))
+
+
+def _unpack_all(record: struct.Struct, payload: bytes, tag: int) -> tuple:
+    if len(payload) % record.size:
+        raise ValueError(_SNAPSHOT_ERROR_MSG % tag)
+    return tuple(record.iter_unpack(payload))
+
+
+def describe_snapshot(snapshot: bytes) -> dict:
+    """Return the states of a snapshot as plain values for the dashboards, see id_web_gateway"""
+    sections: Dict[int, bytes] = unpack_snapshot(WiringPiFunctionProvider.__name__, snapshot)
+    setup: bytes = sections.get(_SETUP_SECTION, b'')
+    config: tuple = _unpack_all(_PWM_CONFIG, sections.get(_PWM_CONFIG_SECTION, b''), _PWM_CONFIG_SECTION)
+    return {
+        'setup': _SETUP_FUNCTIONS[setup[0] - 1] if setup and 0 < setup[0] <= len(_SETUP_FUNCTIONS) else None,
+        'modes': _unpack_pairs(sections.get(_MODES_SECTION, b''), _MODES_SECTION),
+        'pulls': _unpack_pairs(sections.get(_PULLS_SECTION, b''), _PULLS_SECTION),
+        'levels': [None if v == UNKNOWN else v for v in sections.get(_LEVELS_SECTION, b'')],
+        'pwm': dict(zip(('mode', 'range', 'clock'), (None if v < 0 else v for v in (config[0] if config else (-1, -1, -1))))),
+        'pwm_values': dict(_unpack_all(_PWM_VALUE, sections.get(_PWM_VALUES_SECTION, b''), _PWM_VALUES_SECTION)),
+        'soft_pwm': [list(c) for c in _unpack_all(_SOFT_PWM_CHANNEL, sections.get(_SOFT_PWM_SECTION, b''), _SOFT_PWM_SECTION)]
+    }
+
+
 class WiringPiFunctionProvider(FunctionProvider):
+    _SESSION_METHODS: dict = {
+        'wiringPiSetup': ('setup', 0, None),
+        'wiringPiSetupSys': ('setup', 0, None),
+        'wiringPiSetupGpio': ('setup', 0, None),
+        'pinMode': ('mode', 1, None),
+        'pullUpDnControl': ('pull', 1, None),
+        'digitalWrite': ('level', 1, None),
+        'digitalWrites': ('level', 1, 'digitalWrite'),
+        'pwmSetMode': ('pwm_mode', 0, None),
+        'pwmSetRange': ('pwm_range', 0, None),
+        'pwmSetClock': ('pwm_clock', 0, None),
+        'pwmWrite': ('level', 1, None),
+        'softPwmSet': ('soft_pwm', 1, None),
+        'softPwmStop': ('soft_pwm', 1, None),
+        'softPwmWrite': ('soft_pwm_duty', 1, None),
+        'softPwmWrites': ('soft_pwm_duty', 1, 'softPwmWrite'),
+        'restore': ('restore', 0, None)
+    }
+    # A restore defines the state of all the pins
+    _SESSION_RESETS: dict = {'restore': ('mode', 'pull', 'level', 'pwm_mode', 'pwm_range', 'pwm_clock', 'soft_pwm', 'soft_pwm_duty')}
+    # digitalReads validates its pins as the values are returned using the form of its argument
+    _SCHEMAS: dict = {
+        'pinMode': (_PIN, Value('mode')),
+        'pullUpDnControl': (_PIN, Int('mode', 0, 2, _PULL_ERROR_MSG)),
+        'digitalWrite': (_PIN, Value('value')),
+        # The pins can be passed as a tuple or packed as bytes
+        'digitalWrites': (_PIN.many('pins_tuple'), Value('value')),
+        'digitalRead': (_PIN,),
+        'pwmSetMode': (Value('mode'),),
+        'pwmSetRange': (Value('value'),),
+        'pwmSetClock': (Value('divisor'),),
+        # Write the value of the hardware PWM of the pin, the pin must use the PWM output mode (2)
+        'pwmWrite': (_PIN, Int('value', 0, 4095, _PWM_ERROR_MSG)),
+        # Drive the pin, set to the output mode, using the software PWM of the server with the frequency in Hz and the
+        # duty cycle in range 0 (always low) to 255 (always high), a new cycle starts immediately
+        'softPwmSet': (_PIN, Value('frequency'), _DUTY),
+        # Update the duty cycle from the next cycle, a pin without software PWM uses the default frequency
+        'softPwmWrite': (_PIN, _DUTY),
+        # Update the duty cycles of several pins in one call, the pins and the duties being passed as tuples or packed
+        # as bytes, or a single duty for all the pins
+        'softPwmWrites': (_PIN.many('pins_tuple'), _DUTY.many('duties_tuple')),
+        # Stop the software PWM of the pin and write a low level
+        'softPwmStop': (_PIN,)
+    }
+    # The levels change without calls so the concurrent reads only share the read in progress, the calls changing the
+    # levels stop the sharing of the reads started before them
+    _COALESCED_METHODS: dict = {'digitalRead': 0, 'digitalReads': 0}
+    _INVALIDATIONS: dict = {name: ('digitalRead', 'digitalReads') for name in (
+        'wiringPiSetup', 'wiringPiSetupSys', 'wiringPiSetupGpio', 'pinMode', 'pullUpDnControl', 'digitalWrite',
+        'digitalWrites', 'pwmWrite', 'softPwmSet', 'softPwmWrite', 'softPwmWrites', 'softPwmStop', 'restore')}
 
     def __init__(self, parent_logger: logging.Logger):
         super().__init__(parent_logger)
@@ -31,37 +142,66 @@ class WiringPiFunctionProvider(FunctionProvider):
     def wiringPiSetupGpio(self) -> bool:
         pass
 
-    def pinMode(self, pin: int, mode: int) -> bool:
-        pass
-
-    def digitalWrite(self, pin: int, value: float) -> bool:
+    def digitalReads(self, pins_tuple) -> tuple:
+        """The pins can be passed as a tuple or packed as bytes, the values are returned using the same form"""
         pass
 
-    def digitalWrites(self, pins_tuple, value: float) -> bool:
+    def softPwmChannels(self) -> tuple:
+        """Return the tuples (pin, frequency, duty) of the pins driven by the software PWM"""
         pass
 
-    def digitalRead(self, pin: int) -> float:
+    def snapshot(self) -> bytes:
+        """
+        Return the state of the pins in a single call: setup, modes and pulls set by the clients, levels of all the
+        pins, hardware and software PWM, see id_snapshot.
+        """
         pass
 
-    def digitalReads(self, pins_tuple) -> ListOfFloats:
+    def restore(self, snapshot) -> bool:
+        """Apply the state of a snapshot, the software PWM channels missing from the snapshot are stopped"""
         pass
 
 
 class __AbstractWiringPiFunctionProviderMock(ABC, FunctionProviderService):
 
+    _SCHEMAS: dict = WiringPiFunctionProvider._SCHEMAS
+    _COALESCED_METHODS: dict = WiringPiFunctionProvider._COALESCED_METHODS
+    _INVALIDATIONS: dict = WiringPiFunctionProvider._INVALIDATIONS
+
     def __init__(self, parent_logger: logging.Logger, module_name: str):
         super().__init__(parent_logger)
-        parent_logger.debug('Importing: %s' % module_name)
+        self._logger.debug('Importing: %s', module_name)
         self.__module = importlib.import_module(module_name)
         self.__initialized: bool = False
+        self.__setup: int = 0
+        # Pins configured or written by the clients, the only ones reset by finalize
+        self.__used_pins: set = set()
+        # Modes, pulls and hardware PWM values by pin, kept for the snapshots
+        self.__modes: Dict[int, int] = dict()
+        self.__pulls: Dict[int, int] = dict()
+        self.__pwm_values: Dict[int, int] = dict()
+        self.__pwm_config: list = [-1, -1, -1]
+        self.__soft_pwm: SoftPwmEngine = SoftPwmEngine(self._logger, getattr(self.__module, 'digitalWrite'))
 
     def finalize(self) -> None:
         self._logger.debug('Finalizing...')
+        self.__soft_pwm.stop()
         if self.__initialized:
             try:
-                for pin in range(0, 31):
-                    self.exposed_digitalWrite(pin, 0)
-                    self.exposed_pinMode(pin, 0)
+                write = getattr(self.__module, 'digitalWrite')
+                mode = getattr(self.__module, 'pinMode')
+                pull = getattr(self.__module, 'pullUpDnControl')
+                for pin in sorted(self.__pwm_values):
+                    getattr(self.__module, 'pwmWrite')(pin, 0)
+                for pin in sorted(self.__used_pins):
+                    write(pin, 0)
+                    mode(pin, 0)
+                for pin in sorted(self.__pulls):
+                    pull(pin, 0)
+                self.__used_pins.clear()
+                self.__modes.clear()
+                self.__pulls.clear()
+                self.__pwm_values.clear()
             except Exception as ex:
                 _, _, exc_traceback = sys.exc_info()
                 traceback.print_tb(exc_traceback, limit=6, file=sys.stderr)
@@ -70,6 +210,7 @@ class __AbstractWiringPiFunctionProviderMock(ABC, FunctionProviderService):
     def exposed_wiringPiSetup(self) -> bool:
         self._logger.debug('wiringPiSetup')
         self.__initialized: bool = True
+        self.__setup = 1
         getattr(self.__module, 'wiringPiSetup')()
         # Always return a non None value for RPC unmarshalling
         return True
@@ -77,6 +218,7 @@ class __AbstractWiringPiFunctionProviderMock(ABC, FunctionProviderService):
     def exposed_wiringPiSetupSys(self) -> bool:
         self._logger.debug('wiringPiSetupSys')
         self.__initialized: bool = True
+        self.__setup = 2
         getattr(self.__module, 'wiringPiSetupSys')()
         # Always return a non None value for RPC unmarshalling
         return True
@@ -84,56 +226,223 @@ class __AbstractWiringPiFunctionProviderMock(ABC, FunctionProviderService):
     def exposed_wiringPiSetupGpio(self) -> bool:
         self._logger.debug('wiringPiSetupGpio')
         self.__initialized: bool = True
+        self.__setup = 3
         getattr(self.__module, 'wiringPiSetupGpio')()
         # Always return a non None value for RPC unmarshalling
         return True
 
     def exposed_pinMode(self, pin: int, mode: int) -> bool:
-        self._logger.debug('pinMode for pin: %s and mode: %s', str(pin), str(mode))
-        if pin is None or int(pin) < 0 or int(pin) > 31:
-            raise ValueError(_PIN_ERROR_MSG)
+        if TRACE:
+            self._logger.debug('pinMode for pin: %s and mode: %s', pin, mode)
+        # The pin is not driven by the soft PWM anymore, its thread would overwrite the level
+        self.__soft_pwm.remove(int(pin))
         getattr(self.__module, 'pinMode')(pin, mode)
+        self.__used_pins.add(int(pin))
+        self.__modes[int(pin)] = int(mode)
         # Always return a non None value for RPC unmarshalling
         return True
 
     def exposed_digitalWrite(self, pin: int, value: float) -> bool:
-        if _TRACE:
-            self._logger.debug('digitalWrite for pin: %s and value: %s', str(pin), str(value))
-        if pin is None or int(pin) < 0 or int(pin) > 31:
-            raise ValueError(_PIN_ERROR_MSG)
+        if TRACE:
+            self._logger.debug('digitalWrite for pin: %s and value: %s', pin, value)
+        self.__soft_pwm.remove(int(pin))
         getattr(self.__module, 'digitalWrite')(pin, value)
+        self.__used_pins.add(int(pin))
         # Always return a non None value for RPC unmarshalling
         return True
 
-    def exposed_digitalWrites(self, pins_tuple, value: float) -> bool:
-        self._logger.debug('digitalWrites: %s for pins: %s', value, str(len(pins_tuple)))
+    def exposed_digitalWrites(self, pins: array.array, value: float) -> bool:
+        if TRACE:
+            self._logger.debug('digitalWrites: %s for pins: %s', value, len(pins))
         f = getattr(self.__module, 'digitalWrite')
-        for pin in pins_tuple:
-            if pin is None or int(pin) < 0 or int(pin) > 31:
-                raise ValueError(_PIN_ERROR_MSG)
-            f(pin, value)
+        with span('backend'):
+            for pin in pins:
+                if self.__soft_pwm.is_driven(pin):
+                    self.__soft_pwm.remove(pin)
+                f(pin, value)
+        self.__used_pins.update(pins)
+        # Always return a non None value for RPC unmarshalling
+        return True
+
+    def exposed_pullUpDnControl(self, pin: int, mode: int) -> bool:
+        if TRACE:
+            self._logger.debug('pullUpDnControl for pin: %s and mode: %s', pin, mode)
+        getattr(self.__module, 'pullUpDnControl')(pin, mode)
+        self.__pulls[int(pin)] = int(mode)
+        # Always return a non None value for RPC unmarshalling
+        return True
+
+    def exposed_pwmSetMode(self, mode: int) -> bool:
+        self._logger.debug('pwmSetMode: %s', mode)
+        getattr(self.__module, 'pwmSetMode')(mode)
+        self.__pwm_config[0] = int(mode)
+        # Always return a non None value for RPC unmarshalling
+        return True
+
+    def exposed_pwmSetRange(self, value: int) -> bool:
+        self._logger.debug('pwmSetRange: %s', value)
+        getattr(self.__module, 'pwmSetRange')(value)
+        self.__pwm_config[1] = int(value)
+        # Always return a non None value for RPC unmarshalling
+        return True
+
+    def exposed_pwmSetClock(self, divisor: int) -> bool:
+        self._logger.debug('pwmSetClock: %s', divisor)
+        getattr(self.__module, 'pwmSetClock')(divisor)
+        self.__pwm_config[2] = int(divisor)
+        # Always return a non None value for RPC unmarshalling
+        return True
+
+    def exposed_pwmWrite(self, pin: int, value: int) -> bool:
+        if TRACE:
+            self._logger.debug('pwmWrite for pin: %s and value: %s', pin, value)
+        getattr(self.__module, 'pwmWrite')(pin, value)
+        self.__used_pins.add(int(pin))
+        self.__pwm_values[int(pin)] = int(value)
+        # Always return a non None value for RPC unmarshalling
+        return True
+
+    def exposed_softPwmSet(self, pin: int, frequency: float, duty: int) -> bool:
+        self._logger.debug('softPwmSet for pin: %s, frequency: %s and duty: %s', pin, frequency, duty)
+        # The frequency is validated by the engine before the pin is configured
+        check_frequency(frequency)
+        getattr(self.__module, 'pinMode')(pin, _OUTPUT_MODE)
+        self.__used_pins.add(int(pin))
+        self.__modes[int(pin)] = _OUTPUT_MODE
+        self.__soft_pwm.set(int(pin), frequency, int(duty))
+        # Always return a non None value for RPC unmarshalling
+        return True
+
+    def exposed_softPwmWrite(self, pin: int, duty: int) -> bool:
+        if TRACE:
+            self._logger.debug('softPwmWrite for pin: %s and duty: %s', pin, duty)
+        return self.exposed_softPwmWrites((pin,), (duty,))
+
+    def exposed_softPwmWrites(self, pins: array.array, duties: array.array) -> bool:
+        if TRACE:
+            self._logger.debug('softPwmWrites for pins: %s', len(pins))
+        with span('backend'):
+            mode = getattr(self.__module, 'pinMode')
+            for pin in pins:
+                if not self.__soft_pwm.is_driven(pin):
+                    mode(pin, _OUTPUT_MODE)
+                    self.__modes[pin] = _OUTPUT_MODE
+            self.__used_pins.update(pins)
+            self.__soft_pwm.set_duties(pins, duties)
         # Always return a non None value for RPC unmarshalling
         return True
 
+    def exposed_softPwmStop(self, pin: int) -> bool:
+        self._logger.debug('softPwmStop for pin: %s', pin)
+        self.__soft_pwm.remove(int(pin))
+        # Always return a non None value for RPC unmarshalling
+        return True
+
+    def exposed_softPwmChannels(self) -> tuple:
+        return self.__soft_pwm.get_channels()
+
     def exposed_digitalRead(self, pin: int) -> float:
-        if _TRACE:
-            self._logger.debug('digitalRead for pin: %s', str(pin))
-        if pin is None or int(pin) < 0 or int(pin) > 31:
-            raise ValueError(_PIN_ERROR_MSG)
+        if TRACE:
+            self._logger.debug('digitalRead for pin: %s', pin)
         result = getattr(self.__module, 'digitalRead')(pin)
-        if _TRACE:
+        if TRACE:
             self._logger.debug(result)
         return result
 
-    def exposed_digitalReads(self, pins_tuple) -> ListOfFloats:
-        self._logger.debug('digitalReads pins: %s', str(len(pins_tuple)))
-        r: ListOfFloats = list()
+    def exposed_digitalReads(self, pins_tuple) -> tuple:
+        with span('validation'):
+            pins: array.array = as_array(pins_tuple, 'pins_tuple', _PIN_ERROR_MSG)
+            if TRACE:
+                self._logger.debug('digitalReads pins: %s', len(pins))
+            check_range(pins, 0, 31, _PIN_ERROR_MSG)
         f = getattr(self.__module, 'digitalRead')
-        for pin in pins_tuple:
-            if pin is None or int(pin) < 0 or int(pin) > 31:
-                raise ValueError(_PIN_ERROR_MSG)
-            r.append(f(pin))
-        return r
+        with span('backend'):
+            if is_buffer(pins_tuple):
+                # Unreadable pins are reported as low
+                return array.array('B', [f(pin) or 0 for pin in pins]).tobytes()
+            # A tuple is returned by value, a list would be returned as a remote reference
+            return tuple(f(pin) for pin in pins)
+
+    def exposed_snapshot(self) -> bytes:
+        if TRACE:
+            self._logger.debug('snapshot')
+        levels: bytearray = bytearray([UNKNOWN]) * _PIN_COUNT
+        if self.__initialized:
+            f = getattr(self.__module, 'digitalRead')
+            with span('backend'):
+                for pin in range(_PIN_COUNT):
+                    value = f(pin)
+                    if value is not None:
+                        levels[pin] = 1 if value else 0
+        return pack_snapshot(WiringPiFunctionProvider.__name__, {
+            _SETUP_SECTION: bytes((self.__setup,)),
+            _MODES_SECTION: _pack_pairs(self.__modes),
+            _PULLS_SECTION: _pack_pairs(self.__pulls),
+            _LEVELS_SECTION: bytes(levels),
+            _PWM_CONFIG_SECTION: _PWM_CONFIG.pack(*self.__pwm_config),
+            _PWM_VALUES_SECTION: b''.join(_PWM_VALUE.pack(p, v) for p, v in sorted(self.__pwm_values.items())),
+            _SOFT_PWM_SECTION: b''.join(_SOFT_PWM_CHANNEL.pack(*c) for c in self.__soft_pwm.get_channels())
+        })
+
+    def exposed_restore(self, snapshot) -> bool:
+        sections: Dict[int, bytes] = unpack_snapshot(WiringPiFunctionProvider.__name__, snapshot)
+        self._logger.debug('restore of %s sections', len(sections))
+        # The whole snapshot is decoded and validated before the pins are changed
+        setup: bytes = sections.get(_SETUP_SECTION, b'')
+        modes: dict = _unpack_pairs(sections.get(_MODES_SECTION, b''), _MODES_SECTION)
+        pulls: dict = _unpack_pairs(sections.get(_PULLS_SECTION, b''), _PULLS_SECTION)
+        levels: bytes = sections.get(_LEVELS_SECTION, b'')
+        config: tuple = _unpack_all(_PWM_CONFIG, sections.get(_PWM_CONFIG_SECTION, b''), _PWM_CONFIG_SECTION)
+        pwm_values: tuple = _unpack_all(_PWM_VALUE, sections.get(_PWM_VALUES_SECTION, b''), _PWM_VALUES_SECTION)
+        channels: tuple = _unpack_all(_SOFT_PWM_CHANNEL, sections.get(_SOFT_PWM_SECTION, b''), _SOFT_PWM_SECTION)
+        if any(v > 4095 for _, v in pwm_values):
+            raise ValueError(_PWM_ERROR_MSG)
+        for frequency, duty in ((c[1], c[2]) for c in channels):
+            check_frequency(frequency)
+            if duty > DUTY_RANGE:
+                raise ValueError(_DUTY_ERROR_MSG)
+        if any(p >= _PIN_COUNT for p in list(modes) + list(pulls) + [v[0] for v in pwm_values + channels]):
+            raise ValueError(_PIN_ERROR_MSG)
+        if not self.__initialized and setup and 0 < setup[0] <= len(_SETUP_FUNCTIONS):
+            getattr(self, 'exposed_' + _SETUP_FUNCTIONS[setup[0] - 1])()
+        if not self.__initialized:
+            raise ValueError(_SETUP_ERROR_MSG)
+        with span('backend'):
+            for i, value in enumerate(config[0] if config else ()):
+                if value >= 0:
+                    getattr(self.__module, _PWM_FUNCTIONS[i])(value)
+                    self.__pwm_config[i] = value
+            driven: set = {c[0] for c in channels}
+            for pin, _, _ in self.__soft_pwm.get_channels():
+                if pin not in driven:
+                    self.__soft_pwm.remove(pin)
+            f = getattr(self.__module, 'pinMode')
+            for pin, mode in modes.items():
+                f(pin, mode)
+                self.__modes[pin] = mode
+            f = getattr(self.__module, 'pullUpDnControl')
+            for pin, mode in pulls.items():
+                f(pin, mode)
+                self.__pulls[pin] = mode
+            f = getattr(self.__module, 'digitalWrite')
+            for pin, mode in modes.items():
+                if mode == _OUTPUT_MODE and pin < len(levels) and levels[pin] != UNKNOWN and pin not in driven:
+                    f(pin, levels[pin])
+            f = getattr(self.__module, 'pwmWrite')
+            for pin, value in pwm_values:
+                f(pin, value)
+                self.__pwm_values[pin] = value
+            f = getattr(self.__module, 'pinMode')
+            for pin, frequency, duty in channels:
+                if not self.__soft_pwm.is_driven(pin):
+                    f(pin, _OUTPUT_MODE)
+                    self.__modes[pin] = _OUTPUT_MODE
+                self.__soft_pwm.set(pin, frequency, duty)
+            self.__used_pins.update(modes)
+            self.__used_pins.update(driven)
+            self.__used_pins.update(v[0] for v in pwm_values)
+        # Always return a non None value for RPC unmarshalling
+        return True
 
 
 class WiringPiFunctionProviderServiceMock(__AbstractWiringPiFunctionProviderMock):
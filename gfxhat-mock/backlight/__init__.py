@@ -6,6 +6,7 @@ __status__  = "development"
 __version__ = "0.1"
 __date__    = "2021/11/29"
 from typing import Any, List
+from id_mock_timing import i2c_transfer
 from .. import __lcd_dimensions
 
 ListOfTuple = List[tuple]
@@ -28,6 +29,8 @@ def clear() -> None:
     globals()['__backlight_visible'] = False
     
 def show() -> None:
+    # Register address, the values of the 18 channels and the update register
+    i2c_transfer(1 + len(__backlight_pixels) * 3 + 2)
     globals()['__backlight_visible'] = True
 
 def setup() -> None:
@@ -7,6 +7,7 @@ __version__ = "0.1"
 __date__    = "2021/11/29"
 import pygame
 from typing import Any, List
+from id_mock_timing import LCD_HEADLESS, spi_transfer
 from .. import __lcd_dimensions, __lcd_screen, __lcd_scale
 
 ListOfBool = List[bool]
@@ -26,6 +27,11 @@ def dimensions() -> ():
 def clear() -> None:
     print('LCD clear')
     globals()['__lcd_visible'] = False
+    for column in __lcd_pixels:
+        for y in range(len(column)):
+            column[y] = False
+    if not LCD_HEADLESS:
+        init_screen().fill((0, 0, 0))
 
 def init_screen() -> Any:
     if globals()['__lcd_screen'] is None:
@@ -38,12 +44,22 @@ def init_screen() -> Any:
     return globals()['__lcd_screen']
 
 def show() -> None:
+    # The buffer is sent one page of 8 rows at a time, each page is preceded by 3 command bytes
+    pages: int = __lcd_dimensions[1] // 8
+    spi_transfer(__lcd_dimensions[0] * pages + 3 * pages)
     globals()['__lcd_visible'] = True
+    if LCD_HEADLESS:
+        return
     init_screen()
     pygame.display.flip()
 
+def get_pixel(x: int, y: int) -> bool:
+    return __lcd_pixels[x][y]
+
 def set_pixel(x: int, y: int, state: bool) -> None:
     __lcd_pixels[x][y] = state
+    if LCD_HEADLESS:
+        return
     screen = init_screen()
     if state:
         for i in range(x * __lcd_scale, x * __lcd_scale + __lcd_scale):
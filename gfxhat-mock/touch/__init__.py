@@ -6,6 +6,7 @@ __status__  = "development"
 __version__ = "0.1"
 __date__    = "2021/11/29"
 from typing import Any, List
+from id_mock_timing import TouchInjector, i2c_transfer
 
 ListOfBool = List[bool]
 ListOfStr = List[str]
@@ -18,16 +19,22 @@ __touch_repeat_rate: int = 0
 __touch_repeat_enabled: bool = False
 __touch_high_sensitivity_enabled: bool = False
 __touch_callbacks = list()
+# Injection of touches when a rate is configured, see id_mock_timing
+__touch_injector: TouchInjector = TouchInjector(lambda: list(__touch_callbacks))
 
 def on(button: int, function: Any) -> None:
     while button >= len(__touch_callbacks):
         __touch_callbacks.append(None)
     __touch_callbacks[button] = function
+    if function is not None:
+        __touch_injector.start()
 
 def setup() -> None:
     pass
 
 def set_led(led: int, state: bool) -> None:
+    # Register address and value
+    i2c_transfer(2)
     while led >= len(__touch_leds):
         __touch_leds.append(False)
     __touch_leds[led] = state
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+# utilities for benchmarks and load generators
+import math
+import os
+import pathlib
+import random
+import socket
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List
+
+ListOfFloats = List[float]
+DictOfStats = Dict[str, float]
+
+ROOT_DIR: str = str(pathlib.Path(__file__).parent)
+RPC_SERVER_SCRIPT: str = ROOT_DIR + os.sep + 'tests' + os.sep + 'rpc_server.py'
+RPC_WEB_GATEWAY_SCRIPT: str = ROOT_DIR + os.sep + 'tests' + os.sep + 'rpc_web_gateway.py'
+LOOPBACK: str = '127.0.0.1'
+# The registry uses its port, the services use the following ones
+_PORTS_PER_SERVER: int = 16
+
+
+def percentile(sorted_samples: ListOfFloats, ratio: float) -> float:
+    """
+    Return the percentile of the given sorted samples using the nearest rank method.
+    :param sorted_samples: the sorted samples
+    :param ratio: the percentile as a ratio between 0 and 1
+    :return: the value
+    """
+    if not sorted_samples:
+        return 0.0
+    rank: int = math.ceil(ratio * len(sorted_samples))
+    return sorted_samples[max(0, min(len(sorted_samples), rank) - 1)]
+
+
+def summarize(samples: ListOfFloats, elapsed: float=None) -> DictOfStats:
+    """
+    Return the statistics of the given latencies.
+    :param samples: the latencies in seconds
+    :param elapsed: the wall clock duration in seconds, the sum of the latencies if not specified
+    :return: the statistics, latencies are expressed in microseconds
+    """
+    ordered: ListOfFloats = sorted(samples)
+    total: float = elapsed if elapsed is not None else sum(ordered)
+    count: int = len(ordered)
+    return {
+        'count': count,
+        'elapsed_s': round(total, 6),
+        'calls_per_sec': round(count / total, 2) if total > 0 else 0.0,
+        'min_us': round(ordered[0] * 1e6, 2) if count else 0.0,
+        'mean_us': round(sum(ordered) / count * 1e6, 2) if count else 0.0,
+        'p50_us': round(percentile(ordered, 0.5) * 1e6, 2),
+        'p99_us': round(percentile(ordered, 0.99) * 1e6, 2),
+        'max_us': round(ordered[-1] * 1e6, 2) if count else 0.0
+    }
+
+
+def count_requests(connection, function: Callable, iterations: int) -> float:
+    """
+    Return the average number of requests sent on the given rpyc connection by the given function.
+    :param connection: the rpyc connection
+    :param function: the function
+    :param iterations: the number of invocations
+    :return: the number of requests per invocation
+    """
+    # Each request, including the asynchronous release of remote references, consumes a sequence number
+    counter = getattr(connection, '_seqcounter')
+    first: int = next(counter)
+    for _ in range(iterations):
+        function()
+    return round((next(counter) - first - 1) / iterations, 2)
+
+
+def is_port_free(port: int, host: str=LOOPBACK) -> bool:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        try:
+            s.bind((host, port))
+            return True
+        except OSError:
+            return False
+
+
+def find_free_port(host: str=LOOPBACK) -> int:
+    """
+    Return a port followed by enough free ports for a registry and its services.
+    :param host: the host
+    :return: the port of the registry
+    """
+    for _ in range(100):
+        port: int = random.randrange(20000, 60000 - _PORTS_PER_SERVER)
+        if all(is_port_free(p, host) for p in range(port, port + _PORTS_PER_SERVER)):
+            return port
+    raise OSError('No free range of ports found')
+
+
+def wait_for_port(port: int, host: str=LOOPBACK, timeout: float=30) -> None:
+    deadline: float = time.monotonic() + timeout
+    while True:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise TimeoutError('Server not listening at %s:%s' % (host, port))
+            time.sleep(0.1)
+
+
+def start_loopback_server(port: int, host: str=LOOPBACK, timeout: float=30) -> subprocess.Popen:
+    """
+    Start tests/rpc_server.py in a child process using the mock modules and wait for its registry.
+    :param port: the port of the registry
+    :param host: the listening address
+    :param timeout: the maximum delay to wait for the registry
+    :return: the process
+    """
+    env: dict = dict(os.environ)
+    env['PYTHONPATH'] = ROOT_DIR + os.pathsep + env.get('PYTHONPATH', '')
+    # Headless rendering for the LCD mock, the cost of the display is given by the timing model
+    env.setdefault('SDL_VIDEODRIVER', 'dummy')
+    env.setdefault('ID_MOCK_LCD_HEADLESS', '1')
+    process: subprocess.Popen = subprocess.Popen([sys.executable, RPC_SERVER_SCRIPT, host, str(port)], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port, host, timeout)
+    except Exception:
+        stop_loopback_server(process)
+        raise
+    return process
+
+
+def start_loopback_web_gateway(port: int, registry_port: int, host: str=LOOPBACK, timeout: float=30) -> subprocess.Popen:
+    """
+    Start tests/rpc_web_gateway.py in a child process connected to the given registry and wait for its port.
+    :param port: the port of the web gateway
+    :param registry_port: the port of the registry, see start_loopback_server
+    :param host: the listening address and the address of the registry
+    :param timeout: the maximum delay to wait for the web gateway
+    :return: the process, stopped using stop_loopback_server
+    """
+    env: dict = dict(os.environ)
+    env['PYTHONPATH'] = ROOT_DIR + os.pathsep + env.get('PYTHONPATH', '')
+    process: subprocess.Popen = subprocess.Popen([sys.executable, RPC_WEB_GATEWAY_SCRIPT, host, str(port), host, str(registry_port)], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port, host, timeout)
+    except Exception:
+        stop_loopback_server(process)
+        raise
+    return process
+
+
+def stop_loopback_server(process: subprocess.Popen, timeout: float=10) -> None:
+    if process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
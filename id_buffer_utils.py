@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# utilities for the bulk arguments of the providers
+# Sequences can be passed as tuples or packed using bytes, bytearray, memoryview or array.array.
+# Packed values use the native byte order of array.tobytes().
+# Clients running on the same host can also pass a reference to a payload written in shared memory, see id_shared_memory.
+import array
+from rpyc.core.netref import BaseNetref
+from typing import Any
+from id_shared_memory import is_shared_reference, resolve_shared_reference
+
+_NETREF_ERROR_MSG: str = 'Argument %s is a remote reference and would be read one element per request, pass a tuple, bytes or array.tobytes() instead.'
+_LENGTH_ERROR_MSG: str = 'Arguments %s and %s must have the same length.'
+
+BUFFER_TYPES: tuple = (bytes, bytearray, memoryview, array.array)
+_FLOAT_TYPECODES: str = 'fd'
+
+
+def is_netref(value: Any) -> bool:
+    return isinstance(value, BaseNetref)
+
+
+def is_buffer(value: Any) -> bool:
+    """
+    Return true if the given value is a packed sequence.
+    :param value: the value
+    :return: true if packed
+    """
+    return not is_netref(value) and (isinstance(value, BUFFER_TYPES) or is_shared_reference(value))
+
+
+def as_array(value: Any, name: str, error_message: str, typecode: str='B') -> array.array:
+    """
+    Decode the given sequence in a single pass.
+    Memoryviews over typed buffers are copied as raw bytes when their format is the type code, the other ones are
+    converted value by value. Floats given for an integer type code are truncated.
+    :param value: the tuple or the packed sequence
+    :param name: the name of the argument used in the error messages
+    :param error_message: the message of the error raised if a value cannot be represented using the type code
+    :param typecode: the type code of the values, 'B' or 'H'
+    :return: the values
+    """
+    if is_netref(value):
+        raise TypeError(_NETREF_ERROR_MSG % name)
+    if is_shared_reference(value):
+        value = resolve_shared_reference(value)
+    if isinstance(value, array.array) and value.typecode == typecode:
+        return value
+    result: array.array = array.array(typecode)
+    if isinstance(value, memoryview) and value.format not in ('B', typecode):
+        # Views over other types such as array('b') are checked like the tuples
+        value = value.tolist()
+    try:
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            # Raises ValueError if the length is not a multiple of the size of the values
+            result.frombytes(value)
+            return result
+        return array.array(typecode, value)
+    except TypeError:
+        if typecode in _FLOAT_TYPECODES:
+            raise ValueError(error_message)
+    except (OverflowError, ValueError):
+        raise ValueError(error_message)
+    # Integer values may be given as floats, they are truncated as the single values checked by int()
+    try:
+        return array.array(typecode, [int(v) if isinstance(v, float) else v for v in value])
+    except (OverflowError, TypeError, ValueError):
+        raise ValueError(error_message)
+
+
+def check_range(values: array.array, minimum: int, maximum: int, error_message: str) -> None:
+    if values and (min(values) < minimum or max(values) > maximum):
+        raise ValueError(error_message)
+
+
+def check_same_length(first: array.array, second: array.array, first_name: str, second_name: str) -> None:
+    if len(first) != len(second):
+        raise ValueError(_LENGTH_ERROR_MSG % (first_name, second_name))
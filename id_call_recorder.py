@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+# Recording and replay of the calls made on the providers
+# A recording starts with a header followed by records:
+#  - name record: type (0), index and length of the UTF-8 name followed by the name
+#  - call record: type (1), offset since the start of the recording, duration, success flag,
+#    indexes of the provider and method names, length of the arguments followed by the arguments encoded using brine:
+#    the tuple (positional arguments, keyword arguments as (name, value) pairs), the positional arguments only in the
+#    recordings of version 1
+import concurrent.futures
+import logging
+import struct
+import threading
+import time
+import traceback
+from rpyc.core import brine
+from typing import Any, Callable, Dict, Iterator, List
+from id_benchmark_utils import summarize
+from id_classes_utils import subclasses_of
+from id_logging_utils import TRACE, get_child_logger
+
+_MAGIC: bytes = b'IDRC'
+_FORMAT_VERSION: int = 2
+_FORMAT_VERSIONS: tuple = (1, 2)
+_HEADER: struct.Struct = struct.Struct('<4sB')
+_NAME_RECORD: struct.Struct = struct.Struct('<BHH')
+_CALL_RECORD: struct.Struct = struct.Struct('<Bdf?HHI')
+_NAME_TYPE: int = 0
+_CALL_TYPE: int = 1
+_FORMAT_ERROR_MSG: str = 'Not a recording of calls: %s'
+
+DictOfInt = Dict[str, int]
+ListOfFloats = List[float]
+
+
+def _dumpable(value: Any) -> Any:
+    # Lists are sent as tuples, values which cannot be replayed (callbacks, proxies) are replaced by None
+    if isinstance(value, (list, tuple)):
+        return tuple(_dumpable(v) for v in value)
+    if isinstance(value, (bytearray, memoryview)):
+        return bytes(value)
+    if brine.dumpable(value):
+        return value
+    return None
+
+
+class RecordedCall(object):
+    __slots__ = ['offset', 'duration', 'succeeded', 'provider', 'method', 'args', 'kwargs']
+
+    def __init__(self, offset: float, duration: float, succeeded: bool, provider: str, method: str, args: tuple, kwargs: dict=None):
+        self.offset: float = offset
+        self.duration: float = duration
+        self.succeeded: bool = succeeded
+        self.provider: str = provider
+        self.method: str = method
+        self.args: tuple = args
+        self.kwargs: dict = kwargs or dict()
+
+    def __repr__(self):
+        if self.kwargs:
+            return '%s.%s%s%s at %.6fs' % (self.provider, self.method, self.args, self.kwargs, self.offset)
+        return '%s.%s%s at %.6fs' % (self.provider, self.method, self.args, self.offset)
+
+
+class CallRecorder(object):
+
+    def __init__(self, path: str):
+        self.__file = open(path, 'wb')
+        self.__file.write(_HEADER.pack(_MAGIC, _FORMAT_VERSION))
+        self.__lock: threading.Lock = threading.Lock()
+        self.__names: DictOfInt = dict()
+        self.__start: float = time.monotonic()
+
+    def __name_index(self, name: str) -> int:
+        # Must be called with the lock held
+        index: int = self.__names.get(name)
+        if index is None:
+            index = len(self.__names)
+            self.__names[name] = index
+            data: bytes = name.encode('utf-8')
+            self.__file.write(_NAME_RECORD.pack(_NAME_TYPE, index, len(data)))
+            self.__file.write(data)
+        return index
+
+    def record(self, start: float, duration: float, succeeded: bool, provider: str, method: str, args: tuple, kwargs: dict=None) -> None:
+        data: bytes = brine.dump((_dumpable(args), tuple((k, _dumpable(v)) for k, v in sorted((kwargs or dict()).items()))))
+        with self.__lock:
+            if self.__file.closed:
+                return
+            provider_index: int = self.__name_index(provider)
+            method_index: int = self.__name_index(method)
+            self.__file.write(_CALL_RECORD.pack(_CALL_TYPE, start - self.__start, duration, succeeded, provider_index, method_index, len(data)))
+            self.__file.write(data)
+
+    def wrap(self, provider: Any, name: str) -> Any:
+        """Returns a proxy recording the calls made on the given provider"""
+        return RecordingProxy(self, provider, name)
+
+    def close(self) -> None:
+        with self.__lock:
+            if not self.__file.closed:
+                self.__file.close()
+
+
+class RecordingProxy(object):
+
+    def __init__(self, recorder: CallRecorder, provider: Any, name: str):
+        self.__recorder: CallRecorder = recorder
+        self.__provider = provider
+        self.__name: str = name
+
+    def __getattr__(self, name: str) -> Callable:
+        method = getattr(self.__provider, name)
+        recorder: CallRecorder = self.__recorder
+        provider_name: str = self.__name
+
+        def recorded(*args, **kwargs):
+            start: float = time.monotonic()
+            succeeded: bool = False
+            try:
+                result = method(*args, **kwargs)
+                succeeded = True
+                return result
+            finally:
+                recorder.record(start, time.monotonic() - start, succeeded, provider_name, name, args, kwargs)
+
+        return recorded
+
+
+def read_calls(path: str) -> Iterator[RecordedCall]:
+    """
+    Read the calls of the given recording.
+    :param path: the path of the recording
+    :return: the calls, ordered by offset
+    """
+    names: list = list()
+    with open(path, 'rb') as f:
+        header: bytes = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            raise ValueError(_FORMAT_ERROR_MSG % path)
+        magic, version = _HEADER.unpack(header)
+        if magic != _MAGIC or version not in _FORMAT_VERSIONS:
+            raise ValueError(_FORMAT_ERROR_MSG % path)
+        while True:
+            record_type: bytes = f.read(1)
+            if not record_type:
+                return
+            if record_type[0] == _NAME_TYPE:
+                _, index, length = _NAME_RECORD.unpack(record_type + f.read(_NAME_RECORD.size - 1))
+                names.append(f.read(length).decode('utf-8'))
+            elif record_type[0] == _CALL_TYPE:
+                _, offset, duration, succeeded, provider_index, method_index, length = _CALL_RECORD.unpack(record_type + f.read(_CALL_RECORD.size - 1))
+                data: Any = brine.load(f.read(length))
+                if version == 1:
+                    yield RecordedCall(offset, duration, succeeded, names[provider_index], names[method_index], data)
+                else:
+                    yield RecordedCall(offset, duration, succeeded, names[provider_index], names[method_index], data[0], dict(data[1]))
+            else:
+                raise ValueError(_FORMAT_ERROR_MSG % path)
+
+
+class CallReplayer(object):
+    """Replays a recording using concurrent clients, each client obtains its providers using the given factory"""
+
+    def __init__(self, parent_logger: logging.Logger, calls: List[RecordedCall], provider_factory: Callable[[int, str], Any]):
+        self.__logger = get_child_logger(parent_logger, self.__class__.__name__)
+        self.__calls: List[RecordedCall] = calls
+        self.__provider_factory = provider_factory
+
+    def __replay(self, client: int, speed: float) -> tuple:
+        providers: dict = dict()
+        latencies: ListOfFloats = list()
+        errors: DictOfInt = dict()
+        start: float = time.monotonic()
+        for call in self.__calls:
+            if speed > 0:
+                delay: float = start + call.offset / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            t: float = time.monotonic()
+            try:
+                provider = providers.get(call.provider)
+                if provider is None:
+                    provider = self.__provider_factory(client, call.provider)
+                    providers[call.provider] = provider
+                getattr(provider, call.method)(*call.args, **call.kwargs)
+            except Exception as ex:
+                key: str = '%s.%s: %s' % (call.provider, call.method, ex.__class__.__name__)
+                errors[key] = errors.get(key, 0) + 1
+                if TRACE:
+                    self.__logger.debug('Client %s failed to replay %s', client, call, exc_info=True)
+            latencies.append(time.monotonic() - t)
+        return latencies, errors
+
+    def replay(self, clients: int=1, speed: float=1.0) -> dict:
+        """
+        Replay the calls.
+        :param clients: the number of concurrent clients
+        :param speed: the speed factor relative to the recording, 0 to replay as fast as possible
+        :return: the throughput, the latency distribution and the errors
+        """
+        self.__logger.info('Replaying %s calls with %s clients at speed %s', len(self.__calls), clients, speed)
+        latencies: ListOfFloats = list()
+        errors: DictOfInt = dict()
+        start: float = time.monotonic()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=clients) as executor:
+            futures = [executor.submit(self.__replay, client, speed) for client in range(clients)]
+            for future in futures:
+                try:
+                    client_latencies, client_errors = future.result()
+                except Exception as ex:
+                    traceback.print_exc()
+                    self.__logger.error(ex)
+                    continue
+                latencies.extend(client_latencies)
+                for k, v in client_errors.items():
+                    errors[k] = errors.get(k, 0) + v
+        result: dict = summarize(latencies, time.monotonic() - start)
+        result['clients'] = clients
+        result['speed'] = speed
+        result['errors'] = errors
+        return result
+
+
+def find_provider_class(name: str) -> type:
+    from id_function_invokers import FunctionProvider
+    for subclass in subclasses_of(FunctionProvider):
+        if subclass.__name__ == name:
+            return subclass
+    raise ValueError('Provider not found: %s' % name)
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+# Delivery of the events of the providers to the callbacks of the clients
+# On the server, EventBatcher coalesces the events of each callback and delivers them from its own thread,
+# one message per batch when the callback accepts batches.
+# On the client, CallbackDispatcher executes the callbacks on a pool of workers so the thread serving the
+# connection is never blocked by a slow callback.
+import collections
+import logging
+import os
+import threading
+import time
+import rpyc
+from typing import Any, Callable, Deque, Dict, List
+from id_buffer_utils import is_netref
+from id_logging_utils import TRACE, get_child_logger
+
+# Delay in seconds used to coalesce the events before their delivery
+BATCH_INTERVAL: float = float(os.environ.get('ID_EVENT_BATCH_INTERVAL', '0.02'))
+# Events repeated while a button is held, only the last one is kept when they are not consumed yet
+REPEAT_EVENT: str = 'held'
+DROP_OLDEST: str = 'drop_oldest'
+DROP_NEWEST: str = 'drop_newest'
+DEFAULT_WORKERS: int = 2
+DEFAULT_QUEUE_SIZE: int = 256
+
+ListOfEvents = List[tuple]
+
+
+def _merge_event(events: Any, event: tuple, key_indexes: tuple, event_index: int) -> bool:
+    """
+    Replace the pending repeat event of the same channel by the given one.
+    :param events: the pending events
+    :param event: the new event
+    :param key_indexes: the indexes of the values identifying the channel in the events
+    :param event_index: the index of the event type in the events
+    :return: true if merged
+    """
+    if event[event_index] != REPEAT_EVENT:
+        return False
+    for i in range(len(events) - 1, -1, -1):
+        pending: tuple = events[i]
+        if all(pending[k] == event[k] for k in key_indexes):
+            if pending[event_index] == REPEAT_EVENT:
+                events[i] = event
+                return True
+            return False
+    return False
+
+
+class _BatchTarget(object):
+
+    def __init__(self, callback: Any, batched: bool):
+        self.callback: Any = callback
+        # Remote callbacks are invoked without waiting for their completion
+        self.invoker: Callable = rpyc.async_(callback) if is_netref(callback) else callback
+        self.connection: Any = object.__getattribute__(callback, '____conn__') if is_netref(callback) else None
+        self.batched: bool = batched
+        self.events: ListOfEvents = list()
+        self.first_time: float = 0
+
+
+class EventBatcher(object):
+    """
+    Coalesces the events of the registered callbacks during BATCH_INTERVAL.
+    A batched callback receives a tuple of (timestamp, channel, event) per batch, the other ones are invoked
+    with (channel, event) for each event. Repeat events of the same channel are merged while pending.
+    """
+
+    def __init__(self, parent_logger: logging.Logger, interval: float=BATCH_INTERVAL):
+        self.__logger: logging.Logger = get_child_logger(parent_logger, self.__class__.__name__)
+        self.__interval: float = interval
+        self.__targets: Dict[Any, _BatchTarget] = dict()
+        self.__condition: threading.Condition = threading.Condition()
+        self.__thread: threading.Thread = None
+        self.__pending: int = 0
+        self.__active: bool = False
+
+    def register(self, key: Any, callback: Any, batched: bool=False) -> None:
+        """
+        Register the callback associated to the given key, replacing the previous one.
+        :param key: the key, the button for example
+        :param callback: the callback or None to unregister
+        :param batched: true if the callback accepts batches
+        """
+        with self.__condition:
+            if callback is None:
+                self.__targets.pop(key, None)
+                return
+            self.__targets[key] = _BatchTarget(callback, batched)
+            self.__active = True
+            if self.__thread is None or not self.__thread.is_alive():
+                self.__thread = threading.Thread(target=self.__run, name=self.__class__.__name__, daemon=True)
+                self.__thread.start()
+
+    def unregister_connection(self, connection: Any) -> None:
+        """Unregister the callbacks of the given client connection"""
+        with self.__condition:
+            for key in [k for k, v in self.__targets.items() if v.connection is connection]:
+                self.__logger.debug('Disconnecting callback: %s', key)
+                del self.__targets[key]
+
+    def clear(self) -> None:
+        with self.__condition:
+            self.__targets.clear()
+
+    def add(self, key: Any, channel: Any, event: Any) -> None:
+        """Add an event for the callback associated to the given key"""
+        with self.__condition:
+            target: _BatchTarget = self.__targets.get(key)
+            if target is None:
+                return
+            timestamped: tuple = (time.time(), channel, event)
+            if _merge_event(target.events, timestamped, (1,), 2):
+                return
+            if not target.events:
+                target.first_time = time.monotonic()
+            target.events.append(timestamped)
+            self.__pending += 1
+            self.__condition.notify()
+
+    def __run(self) -> None:
+        while True:
+            batches: list = list()
+            with self.__condition:
+                while self.__active and self.__pending == 0:
+                    self.__condition.wait()
+                if not self.__active:
+                    return
+                first_times: list = [t.first_time for t in self.__targets.values() if t.events]
+                if not first_times:
+                    # The callbacks having pending events were unregistered
+                    self.__pending = 0
+                    continue
+                delay: float = min(first_times) + self.__interval - time.monotonic()
+                if delay > 0:
+                    # Events received during the delay are part of the same batch
+                    self.__condition.wait(delay)
+                    if not self.__active:
+                        return
+                for target in self.__targets.values():
+                    if target.events:
+                        batches.append((target, tuple(target.events)))
+                        target.events = list()
+                self.__pending = 0
+            for target, events in batches:
+                self.__deliver(target, events)
+
+    def __deliver(self, target: _BatchTarget, events: tuple) -> None:
+        try:
+            if TRACE:
+                self.__logger.debug('Delivering %s events', len(events))
+            if target.batched:
+                target.invoker(events)
+            else:
+                for _, channel, event in events:
+                    target.invoker(channel, event)
+        except Exception as ex:
+            self.__logger.error('Events not delivered: %s', ex)
+
+    def stop(self) -> None:
+        with self.__condition:
+            self.__active = False
+            self.__targets.clear()
+            self.__condition.notify_all()
+
+
+class CallbackDispatcher(object):
+    """
+    Executes the callbacks of a client on a pool of workers using a bounded queue.
+    Usage: provider.touch_on(button, dispatcher.wrap(handler)) or provider.touch_on_events(button, dispatcher.wrap(handler)),
+    the handler is always invoked with (channel, event).
+    """
+
+    def __init__(self, parent_logger: logging.Logger, workers: int=DEFAULT_WORKERS, queue_size: int=DEFAULT_QUEUE_SIZE, policy: str=DROP_OLDEST, merge_repeats: bool=True):
+        """
+        :param parent_logger: the logger
+        :param workers: the number of threads executing the callbacks
+        :param queue_size: the maximum number of pending events
+        :param policy: DROP_OLDEST or DROP_NEWEST, applied when the queue is full
+        :param merge_repeats: true to keep only the last pending repeat event of a channel
+        """
+        if policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError('Invalid policy: %s' % policy)
+        self.__logger: logging.Logger = get_child_logger(parent_logger, self.__class__.__name__)
+        self.__queue_size: int = queue_size
+        self.__policy: str = policy
+        self.__merge_repeats: bool = merge_repeats
+        # Entries are (handler, channel, event)
+        self.__queue: Deque[tuple] = collections.deque()
+        self.__condition: threading.Condition = threading.Condition()
+        self.__active: bool = True
+        self.dropped: int = 0
+        self.merged: int = 0
+        self.__workers: list = list()
+        for i in range(max(1, workers)):
+            worker: threading.Thread = threading.Thread(target=self.__run, name='%s-%s' % (self.__class__.__name__, i), daemon=True)
+            worker.start()
+            self.__workers.append(worker)
+
+    def wrap(self, handler: Callable) -> Callable:
+        """
+        Return the callback to register on the provider, it only queues the events.
+        :param handler: the function invoked with (channel, event)
+        :return: the callback accepting a single event or a batch of events
+        """
+
+        def receive(*args) -> None:
+            if len(args) == 1:
+                # Batch of (timestamp, channel, event)
+                for _, channel, event in args[0]:
+                    self.__put(handler, channel, event)
+            else:
+                self.__put(handler, args[0], args[1])
+
+        return receive
+
+    def __put(self, handler: Callable, channel: Any, event: Any) -> None:
+        entry: tuple = (handler, channel, event)
+        with self.__condition:
+            if not self.__active:
+                return
+            if self.__merge_repeats and _merge_event(self.__queue, entry, (0, 1), 2):
+                self.merged += 1
+                return
+            if len(self.__queue) >= self.__queue_size:
+                self.dropped += 1
+                if self.__policy == DROP_NEWEST:
+                    return
+                self.__queue.popleft()
+            self.__queue.append(entry)
+            self.__condition.notify()
+
+    def __run(self) -> None:
+        while True:
+            with self.__condition:
+                while self.__active and not self.__queue:
+                    self.__condition.wait()
+                if not self.__active:
+                    return
+                handler, channel, event = self.__queue.popleft()
+            try:
+                handler(channel, event)
+            except Exception as ex:
+                self.__logger.error('Callback failed for channel %s and event %s: %s', channel, event, ex)
+
+    def get_pending(self) -> int:
+        return len(self.__queue)
+
+    def close(self, timeout: float=1.0) -> None:
+        with self.__condition:
+            self.__active = False
+            self.__queue.clear()
+            self.__condition.notify_all()
+        for worker in self.__workers:
+            worker.join(timeout)
+        self.__workers.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+# Coalescing of the concurrent identical calls of the idempotent methods of a service
+# The abstract provider declares the idempotent methods in _COALESCED_METHODS: method name -> time to live in seconds,
+# and the mutating methods in _INVALIDATIONS: method name -> names of the coalesced methods depending on its effects.
+# Its services refer to the same declarations, see apply_coalescing.
+# A call having the same method and arguments as a call in progress waits for it and shares its result or its error,
+# so the backend work and the logging are done once. When its time to live is not 0, the result is also kept for
+# the following calls during this time.
+# A call of a mutating method discards the results kept for the methods it invalidates and the calls in progress of
+# these methods are no longer shared, their results are not kept either.
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable
+from id_buffer_utils import is_netref
+from id_tracing import QUEUE_SPAN, span
+
+# Set to 0 to execute all the calls
+COALESCING: bool = os.environ.get('ID_COALESCING', '1') != '0'
+# Number of results kept above which the expired ones are discarded
+MAX_RESULTS: int = 1024
+# Marker of the wrapped methods so that an inherited method is not wrapped twice
+_COALESCING_ATTR: str = '_coalescing'
+
+
+class _Flight(object):
+    """Call in progress shared by the identical calls"""
+    __slots__ = ('event', 'generation', 'result', 'error')
+
+    def __init__(self, generation: int):
+        self.event: threading.Event = threading.Event()
+        self.generation: int = generation
+        self.result: Any = None
+        self.error: BaseException = None
+
+
+class SingleFlight(object):
+
+    def __init__(self, ttls: Dict[str, float]):
+        """
+        :param ttls: the time to live of the results by method name, 0 to share the calls in progress only
+        """
+        self.__ttls: Dict[str, float] = ttls
+        self.__lock: threading.Lock = threading.Lock()
+        self.__flights: Dict[tuple, _Flight] = dict()
+        # Results (expiry, result) by call
+        self.__results: Dict[tuple, tuple] = dict()
+        # Incremented by the invalidation of a method
+        self.__generations: Dict[str, int] = dict()
+        # Numbers of executed calls, of calls sharing a call in progress and of calls using a kept result
+        self.executed: int = 0
+        self.shared: int = 0
+        self.hits: int = 0
+
+    def call(self, name: str, args: tuple, function: Callable[[], Any]) -> Any:
+        """
+        Execute the call of the given method or share the identical call in progress.
+        :param name: the name of the method
+        :param args: the arguments identifying the call
+        :param function: the function executing the call
+        :return: the result
+        """
+        key: tuple = (name,) + args
+        try:
+            hash(key)
+        except TypeError:
+            return function()
+        leader: bool = False
+        with self.__lock:
+            entry: tuple = self.__results.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self.hits += 1
+                    return entry[1]
+                del self.__results[key]
+            flight: _Flight = self.__flights.get(key)
+            if flight is None:
+                flight = _Flight(self.__generations.get(name, 0))
+                self.__flights[key] = flight
+                leader = True
+                self.executed += 1
+            else:
+                self.shared += 1
+        if not leader:
+            with span(QUEUE_SPAN):
+                flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = function()
+        except BaseException as ex:
+            flight.error = ex
+            raise
+        finally:
+            with self.__lock:
+                if self.__flights.get(key) is flight:
+                    del self.__flights[key]
+                ttl: float = self.__ttls.get(name, 0)
+                if flight.error is None and ttl > 0 and self.__generations.get(name, 0) == flight.generation:
+                    if len(self.__results) >= MAX_RESULTS:
+                        self.__discard_expired()
+                    self.__results[key] = (time.monotonic() + ttl, flight.result)
+            flight.event.set()
+        return flight.result
+
+    def invalidate(self, names: Iterable[str]=None) -> None:
+        """Discard the results of the given methods, all if not specified, and stop sharing their calls in progress"""
+        with self.__lock:
+            names = set(self.__ttls) if names is None else set(names)
+            for name in names:
+                self.__generations[name] = self.__generations.get(name, 0) + 1
+            for key in [k for k in self.__results if k[0] in names]:
+                del self.__results[key]
+            for key in [k for k in self.__flights if k[0] in names]:
+                del self.__flights[key]
+
+    def __discard_expired(self) -> None:
+        now: float = time.monotonic()
+        for key in [k for k, e in self.__results.items() if e[0] <= now]:
+            del self.__results[key]
+        if len(self.__results) >= MAX_RESULTS:
+            self.__results.clear()
+
+
+def _make_coalesced(name: str, method: Callable) -> Callable:
+
+    def coalesced(self, *args, **kwargs):
+        flights: SingleFlight = self._single_flight
+        # Remote references would be compared using requests
+        if flights is None or kwargs or any(is_netref(a) for a in args):
+            return method(self, *args, **kwargs)
+        return flights.call(name, args, lambda: method(self, *args))
+
+    coalesced.__name__ = method.__name__
+    coalesced.__doc__ = method.__doc__
+    coalesced.__wrapped__ = getattr(method, '__wrapped__', method)
+    setattr(coalesced, _COALESCING_ATTR, True)
+    return coalesced
+
+
+def _make_invalidating(names: tuple, method: Callable) -> Callable:
+
+    def invalidating(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            flights: SingleFlight = self._single_flight
+            if flights is not None:
+                flights.invalidate(names)
+
+    invalidating.__name__ = method.__name__
+    invalidating.__doc__ = method.__doc__
+    invalidating.__wrapped__ = getattr(method, '__wrapped__', method)
+    setattr(invalidating, _COALESCING_ATTR, True)
+    return invalidating
+
+
+def apply_coalescing(cls: type, ttls: Dict[str, float], invalidations: Dict[str, tuple], prefix: str='exposed_') -> None:
+    """
+    Wrap the exposed methods of the given service class declared as coalesced or invalidating others.
+    The batch variants of the invalidating methods invalidate the same methods, see id_schema.
+    :param cls: the class of the service
+    :param ttls: the time to live of the results by coalesced method
+    :param invalidations: the coalesced methods by invalidating method
+    :param prefix: the prefix of the exposed methods
+    """
+    for name in ttls:
+        method: Callable = cls.__dict__.get(prefix + name)
+        if method is not None and not getattr(method, _COALESCING_ATTR, False):
+            setattr(cls, prefix + name, _make_coalesced(name, method))
+    for name, names in invalidations.items():
+        for attribute in (prefix + name, prefix + name + '_many'):
+            method = cls.__dict__.get(attribute)
+            if method is not None and not getattr(method, _COALESCING_ATTR, False):
+                setattr(cls, attribute, _make_invalidating(tuple(names), method))
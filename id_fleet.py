@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+# Client of many remote invokers, used to drive a fleet of devices from a single process
+import concurrent.futures
+import logging
+import threading
+import time
+import rpyc
+from typing import Any, Dict, Iterable, List, Set
+from id_function_invokers import CLIENT_CONFIG, DEFAULT_PORT, Connection, FunctionProviderStub
+from id_logging_utils import TRACE, get_child_logger
+from id_resilience import HEARTBEAT_TIMEOUT, CallTimeoutException, CircuitBreaker, CircuitOpenException, HeartbeatMonitor, is_transport_failure
+
+DEFAULT_FLEET_TIMEOUT: float = 5.0
+MAX_CONNECT_WORKERS: int = 32
+
+DictOfValues = Dict[str, Any]
+DictOfErrors = Dict[str, BaseException]
+SetOfStr = Set[str]
+
+
+class FleetTimeoutException(Exception):
+    """Raised for a host which did not reply before the deadline"""
+    pass
+
+
+class FleetResult(object):
+    """Results of a group operation, by host"""
+
+    def __init__(self):
+        self.values: DictOfValues = dict()
+        self.errors: DictOfErrors = dict()
+
+    def get_timed_out(self) -> SetOfStr:
+        return set(k for k, v in self.errors.items() if isinstance(v, FleetTimeoutException))
+
+    def is_complete(self) -> bool:
+        return not self.errors
+
+    def __repr__(self):
+        return '%s(values=%s, errors=%s)' % (self.__class__.__name__, self.values, self.errors)
+
+
+class _HostSession(object):
+    """Connections to the registry and to the providers of a host, kept open between the operations"""
+
+    def __init__(self, logger: logging.Logger, host: str, port: int):
+        self.__logger: logging.Logger = logger
+        self.host: str = host
+        self.port: int = port
+        self.__registry: rpyc.Connection = None
+        self.__connections: dict = dict()
+        self.__stubs: dict = dict()
+        self.__lock: threading.RLock = threading.RLock()
+        self.breaker: CircuitBreaker = CircuitBreaker(logger, '%s:%s' % (host, port))
+
+    def __connect(self, name: str) -> Connection:
+        with self.__lock:
+            previous: Connection = self.__connections.pop(name, None)
+            if previous:
+                previous.close()
+            if self.__registry is None or self.__registry.closed:
+                self.__logger.debug('Connecting proxy to remote registry at %s:%s', self.host, self.port)
+                self.__registry = rpyc.connect(self.host, self.port, config=CLIENT_CONFIG)
+            port: int = self.__registry.root.get_service_port(name)
+            if port <= 0:
+                raise LookupError('Provider not found %s on %s' % (name, self.host))
+            self.__logger.debug('Connecting proxy %s at %s:%s', name, self.host, port)
+            result: Connection = Connection(rpyc.connect(self.host, port, config=CLIENT_CONFIG), set_thread=True)
+            self.__connections[name] = result
+            return result
+
+    def get_stub(self, provider_class: type) -> FunctionProviderStub:
+        name: str = provider_class.__name__
+        with self.__lock:
+            stub: FunctionProviderStub = self.__stubs.get(name)
+            if stub is None:
+                stub = FunctionProviderStub._create(provider_class, lambda: self.__connect(name), self.breaker)
+                self.__stubs[name] = stub
+            return stub
+
+    def probe(self) -> None:
+        """Ping the connections of the host, reconnecting its registry if needed"""
+        with self.__lock:
+            if self.__registry is None or self.__registry.closed:
+                self.__registry = rpyc.connect(self.host, self.port, config=CLIENT_CONFIG)
+            registry: rpyc.Connection = self.__registry
+            connections: list = list(self.__connections.values())
+        try:
+            registry.ping(timeout=HEARTBEAT_TIMEOUT)
+        except Exception:
+            registry.close()
+            raise
+        for connection in connections:
+            if not connection.is_closed():
+                try:
+                    connection.ping()
+                except Exception:
+                    connection.close()
+                    raise
+
+    def close(self) -> None:
+        with self.__lock:
+            for connection in self.__connections.values():
+                connection.close()
+            self.__connections.clear()
+            self.__stubs.clear()
+            if self.__registry and not self.__registry.closed:
+                self.__registry.close()
+            self.__registry = None
+
+
+class FleetClient(object):
+    """
+    Client of the registries of many hosts, unlike FunctionInvokers it is not a singleton.
+    The hosts are given as 'host' or 'host:port'.
+    """
+
+    def __init__(self, parent_logger: logging.Logger, hosts: Iterable[str], port: int=DEFAULT_PORT, timeout: float=DEFAULT_FLEET_TIMEOUT):
+        self.__logger = get_child_logger(parent_logger, self.__class__.__name__)
+        self.__timeout: float = timeout
+        self.__sessions: Dict[str, _HostSession] = dict()
+        # Dead hosts are detected by the heartbeat and skipped until they answer again
+        self.__monitor: HeartbeatMonitor = HeartbeatMonitor(parent_logger)
+        for host in hosts:
+            self.add_host(host, port)
+        self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_CONNECT_WORKERS, thread_name_prefix='FleetConnect')
+
+    def add_host(self, host: str, port: int=DEFAULT_PORT) -> None:
+        name: str = host
+        if ':' in host:
+            host, port = host.rsplit(':', 1)
+            port = int(port)
+        if name not in self.__sessions:
+            session: _HostSession = _HostSession(self.__logger, host, port)
+            self.__sessions[name] = session
+            self.__monitor.add(name, session.breaker, session.probe)
+
+    def get_hosts(self) -> List[str]:
+        return list(self.__sessions.keys())
+
+    def get_provider(self, host: str, provider_class: type) -> Any:
+        """
+        Return the stub of a provider of a host.
+        :param host: the host as given to the client
+        :param provider_class: the abstract class of the provider
+        :return: the stub
+        """
+        return self.__sessions[host].get_stub(provider_class)
+
+    def __call(self, provider_class: type, method: str, args_by_host: Dict[str, tuple], timeout: float) -> FleetResult:
+        result: FleetResult = FleetResult()
+        deadline: float = time.monotonic() + (self.__timeout if timeout is None else timeout)
+        stubs: dict = dict()
+        for host in args_by_host.keys():
+            session: _HostSession = self.__sessions[host]
+            if session.breaker.is_open():
+                result.errors[host] = CircuitOpenException('Host unreachable: %s' % host)
+            else:
+                stubs[host] = session.get_stub(provider_class)
+        # Resolution of the remote methods, connecting the hosts concurrently when needed
+        futures: dict = dict((self.__executor.submit(stub._get_method, method), host) for host, stub in stubs.items())
+        done, not_done = concurrent.futures.wait(futures.keys(), timeout=max(0.0, deadline - time.monotonic()))
+        for future in not_done:
+            host: str = futures[future]
+            self.__sessions[host].breaker.record_failure()
+            result.errors[host] = FleetTimeoutException('Connection timed out')
+        # All the requests are sent before waiting for the first reply
+        pending: dict = dict()
+        for future in done:
+            host: str = futures[future]
+            try:
+                future.result()
+            except Exception as ex:
+                if is_transport_failure(ex):
+                    self.__sessions[host].breaker.record_failure()
+                result.errors[host] = ex
+                continue
+            try:
+                pending[host] = stubs[host]._call_async(method, *args_by_host[host])
+            except Exception as ex:
+                self.__record_error(result, host, ex)
+        for host, wait in pending.items():
+            try:
+                result.values[host] = wait(max(0.0, deadline - time.monotonic()))
+            except Exception as ex:
+                self.__record_error(result, host, ex)
+        if TRACE:
+            self.__logger.debug('%s.%s on %s hosts: %s', provider_class.__name__, method, len(args_by_host), result)
+        return result
+
+    def __record_error(self, result: FleetResult, host: str, ex: Exception) -> None:
+        # The failures of the connection are recorded by the stub, a slow host does not count as one
+        if isinstance(ex, CallTimeoutException):
+            ex = FleetTimeoutException('Request timed out')
+        result.errors[host] = ex
+
+    def is_reachable(self, host: str) -> bool:
+        return not self.__sessions[host].breaker.is_open()
+
+    def broadcast(self, provider_class: type, method: str, *args, hosts: Iterable[str]=None, timeout: float=None) -> FleetResult:
+        """
+        Invoke the same method with the same arguments on all the hosts concurrently.
+        :param provider_class: the abstract class of the provider
+        :param method: the name of the method
+        :param args: the arguments
+        :param hosts: the hosts, all the hosts if not specified
+        :param timeout: the deadline in seconds for each host, the default timeout of the client if not specified
+        :return: the values and errors by host, a host not answering before the deadline is reported as timed out
+        """
+        if hosts is None:
+            hosts = self.__sessions.keys()
+        return self.__call(provider_class, method, dict((h, args) for h in hosts), timeout)
+
+    def gather(self, provider_class: type, method: str, *args, hosts: Iterable[str]=None, timeout: float=None) -> FleetResult:
+        """Collect the values returned by a read method of all the hosts, see broadcast"""
+        return self.broadcast(provider_class, method, *args, hosts=hosts, timeout=timeout)
+
+    def scatter(self, provider_class: type, method: str, args_by_host: Dict[str, tuple], timeout: float=None) -> FleetResult:
+        """Invoke the same method with specific arguments for each host, see broadcast"""
+        return self.__call(provider_class, method, args_by_host, timeout)
+
+    def close(self) -> None:
+        self.__monitor.stop()
+        self.__executor.shutdown(wait=False)
+        for session in self.__sessions.values():
+            try:
+                session.close()
+            except Exception as ex:
+                self.__logger.error(ex)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+# Double buffered and layered frame buffer of a monochrome display
+# Each client draws in the back buffer of its own layer, show() swaps it atomically with the front buffer of the
+# layer so the other clients never see a partially drawn frame. The front buffers are composed from the first layer
+# to the last one, a transparent pixel lets the lower layers visible.
+# The refresh of the display is limited to a maximum frame rate, the shows requested during a frame period are
+# coalesced in a single transfer and only the changed pixels are written to the driver.
+# FrameStreamRenderer displays the frames pushed continuously by the clients, only the latest pending frame of each
+# client is kept so the throughput is bound by the display and not by the latency of the requests.
+import collections
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, Iterable
+from id_logging_utils import TRACE, get_child_logger
+
+# Maximum number of transfers per second to the display, 0 to refresh synchronously on each show
+LCD_MAX_FPS: float = float(os.environ.get('ID_LCD_MAX_FPS', '30'))
+TRANSPARENT: int = 0
+OFF: int = 1
+ON: int = 2
+# Mask of the opaque pixels
+_OPAQUE_TABLE: bytes = bytes([0] + [255] * 255)
+# Transparent pixels are off on the display
+_DISPLAY_TABLE: bytes = bytes([OFF] + list(range(1, 256)))
+# Pixels of the frames using one byte per pixel, any non zero value is on
+_FRAME_TABLE: bytes = bytes([OFF] + [ON] * 255)
+# Pixels of the 8 bits of each byte of the frames using one bit per pixel, most significant bit first
+_UNPACK_TABLE: tuple = tuple(bytes(ON if b & (0x80 >> i) else OFF for i in range(8)) for b in range(256))
+# Digits of the pixels on the display, used to pack a frame using one bit per pixel
+_BIT_TABLE: bytes = bytes(ord('1') if b == ON else ord('0') for b in range(256))
+_FRAME_ERROR_MSG: str = 'Frame must have %s bytes (1 bit per pixel) or %s bytes (1 byte per pixel), row by row: %s'
+# Number of frames used to compute the frame rate of a stream
+FPS_WINDOW: int = 30
+
+
+def pack_frame(pixels: Iterable[Any]) -> bytes:
+    """
+    Pack the given pixels using one bit per pixel, most significant bit first.
+    :param pixels: the states of the pixels row by row, the number of pixels must be a multiple of 8
+    :return: the frame
+    """
+    result: bytearray = bytearray()
+    value: int = 0
+    for i, pixel in enumerate(pixels):
+        value = (value << 1) | (1 if pixel else 0)
+        if i % 8 == 7:
+            result.append(value)
+            value = 0
+    return bytes(result)
+
+
+class _Layer(object):
+    __slots__ = ('back', 'front')
+
+    def __init__(self, size: int):
+        self.back: bytearray = bytearray(size)
+        self.front: bytes = bytes(size)
+
+
+class LayeredFrameBuffer(object):
+
+    def __init__(self, parent_logger: logging.Logger, dimensions: tuple, set_pixel: Callable[[int, int, int], Any], show: Callable[[], Any], max_fps: float=LCD_MAX_FPS):
+        """
+        :param parent_logger: the logger
+        :param dimensions: the width and height of the display
+        :param set_pixel: the function of the driver writing a pixel
+        :param show: the function of the driver transferring the pixels to the display
+        :param max_fps: the maximum number of transfers per second, 0 to refresh on each show
+        """
+        self.__logger: logging.Logger = get_child_logger(parent_logger, self.__class__.__name__)
+        self.__width: int = dimensions[0]
+        self.__height: int = dimensions[1]
+        self.__size: int = self.__width * self.__height
+        self.__set_pixel: Callable[[int, int, int], Any] = set_pixel
+        self.__show: Callable[[], Any] = show
+        self.__period: float = 1.0 / max_fps if max_fps > 0 else 0
+        # Layers by key in the order of composition, the key None is the base layer
+        self.__layers: Dict[Any, _Layer] = dict()
+        # Pixels transferred to the display
+        self.__displayed: bytes = bytes([OFF]) * self.__size
+        self.__condition: threading.Condition = threading.Condition()
+        self.__refresh_lock: threading.Lock = threading.Lock()
+        self.__dirty: bool = False
+        self.__last_refresh: float = 0
+        self.__thread: threading.Thread = None
+        self.__active: bool = True
+        self.shows: int = 0
+        self.transfers: int = 0
+
+    def __get_layer(self, key: Any) -> _Layer:
+        layer: _Layer = self.__layers.get(key)
+        if layer is None:
+            with self.__condition:
+                layer = self.__layers.get(key)
+                if layer is None:
+                    layer = _Layer(self.__size)
+                    self.__layers[key] = layer
+        return layer
+
+    def set_pixel(self, key: Any, x: int, y: int, state: bool) -> None:
+        self.__get_layer(key).back[y * self.__width + x] = ON if state else OFF
+
+    def set_pixels(self, key: Any, xs, ys, state: bool) -> None:
+        back: bytearray = self.__get_layer(key).back
+        width: int = self.__width
+        value: int = ON if state else OFF
+        for x, y in zip(xs, ys):
+            back[y * width + x] = value
+
+    def get_dimensions(self) -> tuple:
+        return self.__width, self.__height
+
+    def get_period(self) -> float:
+        return self.__period
+
+    def decode_frame(self, frame: Any) -> bytes:
+        """Return the pixels of a frame packed using one bit or one byte per pixel"""
+        length: int = len(frame)
+        if length * 8 == self.__size:
+            return b''.join(map(_UNPACK_TABLE.__getitem__, frame))
+        if length == self.__size:
+            return bytes(frame).translate(_FRAME_TABLE)
+        raise ValueError(_FRAME_ERROR_MSG % (self.__size // 8, self.__size, length))
+
+    def set_frame(self, key: Any, pixels: bytes) -> None:
+        """Replace the back and front buffers of the layer by the given decoded frame, see refresh"""
+        layer: _Layer = self.__get_layer(key)
+        with self.__condition:
+            layer.back[:] = pixels
+            layer.front = pixels
+
+    def get_frame(self) -> bytes:
+        """Return the composed front buffers packed using one bit per pixel, see pack_frame"""
+        with self.__condition:
+            fronts: tuple = tuple(layer.front for layer in self.__layers.values())
+        if not fronts:
+            return bytes(self.__size // 8)
+        return int(self.__compose(fronts).translate(_BIT_TABLE), 2).to_bytes(self.__size // 8, 'big')
+
+    def clear(self, key: Any) -> None:
+        """Clear the back buffer of the layer, its pixels are transparent"""
+        layer: _Layer = self.__get_layer(key)
+        layer.back[:] = bytes(self.__size)
+
+    def show(self, key: Any) -> None:
+        """Swap the buffers of the layer and request the refresh of the display"""
+        layer: _Layer = self.__get_layer(key)
+        with self.__condition:
+            # The back buffer keeps the drawing, the next frame is drawn incrementally like on the display
+            layer.front = bytes(layer.back)
+            self.shows += 1
+            self.__request_refresh()
+        if self.__period <= 0:
+            self.refresh()
+
+    def release(self, key: Any, keep: bool=False) -> None:
+        """
+        Remove the layer of a client.
+        :param key: the key of the layer
+        :param keep: true to keep its visible pixels in the base layer
+        """
+        with self.__condition:
+            layer: _Layer = self.__layers.pop(key, None)
+            if layer is None:
+                return
+            if keep and key is not None:
+                base: _Layer = self.__get_layer(None)
+                base.front = self.__compose((base.front, layer.front))
+                base.back[:] = base.front
+            self.__request_refresh()
+        if self.__period <= 0:
+            self.refresh()
+
+    def __request_refresh(self) -> None:
+        # Called with the condition acquired, the caller refreshes the display itself without frame rate limit
+        self.__dirty = True
+        if self.__period <= 0:
+            return
+        if self.__thread is None or not self.__thread.is_alive():
+            self.__thread = threading.Thread(target=self.__run, name=self.__class__.__name__, daemon=True)
+            self.__thread.start()
+        self.__condition.notify()
+
+    def __compose(self, fronts: tuple) -> bytes:
+        if len(fronts) == 1:
+            return fronts[0]
+        result: int = 0
+        for front in fronts:
+            value: int = int.from_bytes(front, 'big')
+            mask: int = int.from_bytes(front.translate(_OPAQUE_TABLE), 'big')
+            result = (result & ~mask) | value
+        return result.to_bytes(self.__size, 'big')
+
+    def refresh(self) -> None:
+        """Transfer the composed front buffers to the display if they changed"""
+        with self.__refresh_lock:
+            with self.__condition:
+                self.__dirty = False
+                fronts: tuple = tuple(layer.front for layer in self.__layers.values())
+            frame: bytes = self.__compose(fronts).translate(_DISPLAY_TABLE) if fronts else bytes([OFF]) * self.__size
+            displayed: bytes = self.__displayed
+            self.__last_refresh = time.monotonic()
+            if frame == displayed:
+                return
+            width: int = self.__width
+            set_pixel: Callable[[int, int, int], Any] = self.__set_pixel
+            changed: int = 0
+            for i, (value, previous) in enumerate(zip(frame, displayed)):
+                if value != previous:
+                    set_pixel(i % width, i // width, 1 if value == ON else 0)
+                    changed += 1
+            self.__show()
+            self.__displayed = frame
+            self.transfers += 1
+            if TRACE:
+                self.__logger.debug('Transfer of %s changed pixels', changed)
+
+    def __run(self) -> None:
+        while True:
+            with self.__condition:
+                while self.__active and not self.__dirty:
+                    self.__condition.wait()
+                if not self.__active:
+                    return
+                delay: float = self.__last_refresh + self.__period - time.monotonic()
+            if delay > 0:
+                # The shows requested during the frame period are coalesced
+                time.sleep(delay)
+            try:
+                self.refresh()
+            except Exception as ex:
+                self.__logger.error('Refresh failed: %s', ex)
+
+    def is_blank(self) -> bool:
+        return self.__displayed.count(ON) == 0
+
+    def reset(self) -> None:
+        """Remove all the layers, stop the refresh thread and blank the display synchronously"""
+        with self.__condition:
+            self.__active = False
+            self.__layers.clear()
+            self.__condition.notify_all()
+        if self.__thread:
+            self.__thread.join(1.0)
+        self.refresh()
+
+
+class _Stream(object):
+    __slots__ = ('pending', 'pushed', 'rendered', 'dropped', 'times')
+
+    def __init__(self):
+        self.pending: Any = None
+        self.pushed: int = 0
+        self.rendered: int = 0
+        self.dropped: int = 0
+        self.times: Deque[float] = collections.deque(maxlen=FPS_WINDOW)
+
+
+class FrameStreamRenderer(object):
+    """Thread displaying the latest frame pushed by each client, the older pending frames are dropped"""
+
+    def __init__(self, parent_logger: logging.Logger, frame_buffer: LayeredFrameBuffer):
+        self.__logger: logging.Logger = get_child_logger(parent_logger, self.__class__.__name__)
+        self.__frame_buffer: LayeredFrameBuffer = frame_buffer
+        self.__streams: Dict[Any, _Stream] = dict()
+        self.__condition: threading.Condition = threading.Condition()
+        self.__pending: int = 0
+        self.__thread: threading.Thread = None
+        self.__active: bool = True
+
+    def push(self, key: Any, frame: Any) -> None:
+        """
+        Push a frame in the stream of the given layer.
+        :param key: the key of the layer
+        :param frame: the frame packed using one bit or one byte per pixel, row by row
+        """
+        width, height = self.__frame_buffer.get_dimensions()
+        if len(frame) not in (width * height // 8, width * height):
+            raise ValueError(_FRAME_ERROR_MSG % (width * height // 8, width * height, len(frame)))
+        with self.__condition:
+            if not self.__active:
+                return
+            stream: _Stream = self.__streams.get(key)
+            if stream is None:
+                stream = _Stream()
+                self.__streams[key] = stream
+            stream.pushed += 1
+            if stream.pending is None:
+                self.__pending += 1
+            else:
+                stream.dropped += 1
+            # Frames are decoded when rendered, the dropped ones cost nothing
+            stream.pending = bytes(frame)
+            if self.__thread is None or not self.__thread.is_alive():
+                self.__thread = threading.Thread(target=self.__run, name=self.__class__.__name__, daemon=True)
+                self.__thread.start()
+            self.__condition.notify()
+
+    def get_stats(self, key: Any) -> tuple:
+        """Return the numbers of pushed, rendered and dropped frames and the frame rate of the stream"""
+        with self.__condition:
+            stream: _Stream = self.__streams.get(key)
+            if stream is None:
+                return 0, 0, 0, 0.0
+            times: Deque[float] = stream.times
+            fps: float = (len(times) - 1) / (times[-1] - times[0]) if len(times) > 1 and times[-1] > times[0] else 0.0
+            return stream.pushed, stream.rendered, stream.dropped, fps
+
+    def close(self, key: Any) -> None:
+        with self.__condition:
+            stream: _Stream = self.__streams.pop(key, None)
+            if stream is not None and stream.pending is not None:
+                self.__pending -= 1
+
+    def __run(self) -> None:
+        period: float = self.__frame_buffer.get_period()
+        while True:
+            with self.__condition:
+                while self.__active and self.__pending == 0:
+                    self.__condition.wait()
+                if not self.__active:
+                    return
+                frames: list = list()
+                for key, stream in self.__streams.items():
+                    if stream.pending is not None:
+                        frames.append((key, stream, stream.pending))
+                        stream.pending = None
+                self.__pending = 0
+            start: float = time.monotonic()
+            try:
+                decoded: list = [(key, stream, self.__frame_buffer.decode_frame(frame)) for key, stream, frame in frames]
+                with self.__condition:
+                    # A stream closed meanwhile may have its layer released, writing its frame would create it again
+                    for key, stream, pixels in decoded:
+                        if self.__streams.get(key) is stream:
+                            self.__frame_buffer.set_frame(key, pixels)
+                self.__frame_buffer.refresh()
+            except Exception as ex:
+                self.__logger.error('Frames not rendered: %s', ex)
+            now: float = time.monotonic()
+            with self.__condition:
+                for key, stream, frame in frames:
+                    stream.rendered += 1
+                    stream.times.append(now)
+            # The frames pushed while waiting for the next frame period replace each other
+            delay: float = start + period - now
+            if delay > 0:
+                time.sleep(delay)
+
+    def stop(self) -> None:
+        with self.__condition:
+            self.__active = False
+            self.__streams.clear()
+            self.__condition.notify_all()
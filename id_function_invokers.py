@@ -1,19 +1,32 @@
 #! /usr/bin/python3
 # -*- coding: utf-8 -*-
 # Remote invoker
+import array
 import atexit
+import inspect
 import logging
 import os
 import pathlib
 import platform
 import rpyc
+import secrets
 import signal
 import sys
 import threading
+import time
 import traceback
-from typing import Dict, TypeVar, Generic
+from typing import Any, Callable, Dict, TypeVar, Generic
+from rpyc.utils.factory import unix_connect
 from rpyc.utils.server import ThreadedServer
 from id_classes_utils import subclasses_of, import_files_of_dir
+from id_coalescing import COALESCING, SingleFlight, apply_coalescing
+from id_logging_utils import TRACE, get_child_logger
+from id_profiler import PROFILER, SAMPLING
+from id_schema import add_batch_session_methods, apply_schemas, get_batch_names, make_abstract_method
+from id_session import SESSION_JOURNAL, SessionJournal
+from id_shared_memory import bind_connection
+from id_tracing import NO_SPAN, QUEUE_SPAN, continue_trace, end_traced_call, get_context, get_current, get_spans, span, start_span
+from id_resilience import CALL_TIMEOUT, HEARTBEAT_TIMEOUT, CallTimeoutException, CircuitBreaker, HeartbeatMonitor, get_call_timeout, is_transport_failure
 from abc import abstractmethod
 
 VERSION: str = '1.0'
@@ -22,6 +35,24 @@ _AN_ERROR_OCCURRED_MSG: str = 'An error occurred: %s'
 RPC_TIMEOUT: int = 300
 ALLOW_PUBLIC_ATTRS: bool = True
 ALLOW_PICKLE: bool = True
+CLIENT_CONFIG: dict = {'sync_request_timeout': RPC_TIMEOUT, 'allow_public_attrs': ALLOW_PUBLIC_ATTRS, 'allow_pickle': ALLOW_PICKLE}
+REGISTRY_SOCKET_NAME: str = 'registry'
+# Separator of the alias of the device and the name of the provider in a gateway, see id_gateway
+NAMESPACE_SEPARATOR: str = '.'
+# Path of the file recording the calls of the providers, see id_call_recorder
+RECORD_CALLS_PATH: str = os.environ.get('ID_RECORD_CALLS')
+# Delay in seconds before the teardown of the session of a disconnected client, a client restoring its session
+# during this delay resumes it without side effects on the hardware
+SESSION_GRACE_PERIOD: float = float(os.environ.get('ID_SESSION_GRACE_PERIOD', '0'))
+# Maximum delay in seconds of the shutdown, including the drain of the calls in progress and the finalization of the providers
+STOP_TIMEOUT: float = float(os.environ.get('ID_STOP_TIMEOUT', '10'))
+_EXPOSED_PREFIX: str = 'exposed_'
+_SAFE_ATTRS: frozenset = frozenset(rpyc.core.protocol.DEFAULT_CONFIG['safe_attrs'])
+_STOPPING_MSG: str = 'Service is stopping: %s'
+# Method receiving the calls of the traced clients, see id_tracing
+TRACED_METHOD: str = 'traced'
+# Token of a connection whose session was resumed by another connection before its disconnection
+_RESUMED: object = object()
 
 
 class IllegalInvocationException(Exception):
@@ -30,29 +61,207 @@ class IllegalInvocationException(Exception):
 
 
 class FunctionProvider(object):
+    # Methods defining the state of a session, replayed by the client after a reconnection, see id_session
+    _SESSION_METHODS: dict = dict()
+    _SESSION_RESETS: dict = dict()
+    # Arguments of the methods, declaring the methods of the provider and used by the services to validate the calls and
+    # generate the batch variants, see id_schema
+    _SCHEMAS: dict = dict()
+    # Idempotent methods whose concurrent identical calls share one execution: name -> time to live of the results, and
+    # methods invalidating them: name -> names of the idempotent methods, see id_coalescing
+    _COALESCED_METHODS: dict = dict()
+    _INVALIDATIONS: dict = dict()
+    # False if the services of the provider are not instantiated by the servers and the local invokers, the providers
+    # exposed on demand only set it from their configuration
+    _ENABLED: bool = True
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if '_SCHEMAS' in cls.__dict__:
+            for name, schema in cls._SCHEMAS.items():
+                if name not in cls.__dict__:
+                    setattr(cls, name, make_abstract_method(name, schema))
+            if '_SESSION_METHODS' not in cls.__dict__:
+                cls._SESSION_METHODS = dict(cls._SESSION_METHODS)
+            add_batch_session_methods(cls._SESSION_METHODS, cls._SCHEMAS)
 
     def __init__(self, parent_logger: logging.Logger):
-        self._logger = logging.getLogger(self.__class__.__name__)
-        for handler in parent_logger.handlers:
-            self._logger.addHandler(handler)
-        self._logger.setLevel(parent_logger.level)
+        self._logger = get_child_logger(parent_logger, self.__class__.__name__)
         self._logger.debug('Function provider %s initialized', self.__class__.__name__)
 
 
 class FunctionProviderService(rpyc.Service):
+    # Schemas of the provider, the exposed methods are wrapped by their validators, see id_schema
+    _SCHEMAS: dict = dict()
+    # Coalesced and invalidating methods of the provider, the identical calls share the validation too, see id_coalescing
+    _COALESCED_METHODS: dict = dict()
+    _INVALIDATIONS: dict = dict()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        apply_schemas(cls, cls._SCHEMAS)
+        apply_coalescing(cls, cls._COALESCED_METHODS, cls._INVALIDATIONS)
 
     def __init__(self, parent_logger: logging.Logger):
-        self._logger = logging.getLogger(self.__class__.__name__)
-        for handler in parent_logger.handlers:
-            self._logger.addHandler(handler)
-        self._logger.setLevel(parent_logger.level)
+        self._logger = get_child_logger(parent_logger, self.__class__.__name__)
+        # Tokens of the sessions by connection and pending teardowns by token, a reconnected client presents the
+        # token of its session to resume it
+        self.__tokens: Dict[rpyc.Connection, str] = dict()
+        self.__teardowns: Dict[Any, threading.Timer] = dict()
+        self.__teardowns_lock: threading.Lock = threading.Lock()
+        # Each connection is served by its own thread of the server
+        self.__local: threading.local = threading.local()
+        # Calls in progress, new calls are refused while draining
+        self.__calls: int = 0
+        self.__calls_condition: threading.Condition = threading.Condition()
+        self.__draining: bool = False
+        self._single_flight: SingleFlight = SingleFlight(self._COALESCED_METHODS) if COALESCING and self._COALESCED_METHODS else None
         self._logger.debug('Function provider service %s initialized', self.__class__.__name__)
 
+    def _rpyc_getattr(self, name: str) -> Any:
+        exposed_name: str = name if name.startswith(_EXPOSED_PREFIX) else _EXPOSED_PREFIX + name
+        try:
+            value: Any = getattr(self, exposed_name)
+        except AttributeError:
+            if name in _SAFE_ATTRS:
+                return getattr(self, name)
+            raise AttributeError('cannot access %r' % name)
+        return self._wrap_exposed(exposed_name[len(_EXPOSED_PREFIX):], value)
+
+    def _wrap_exposed(self, name: str, value: Any) -> Any:
+        """Return the function invoked by the clients for the given exposed attribute, all the remote calls go through _invoke"""
+        if not callable(value):
+            return value
+
+        def call(*args, **kwargs):
+            return self._invoke(name, value, args, kwargs)
+
+        call.__name__ = name
+        return call
+
+    def _invoke(self, name: str, method: Callable, args: tuple, kwargs: dict) -> Any:
+        with span(QUEUE_SPAN):
+            with self.__calls_condition:
+                if self.__draining:
+                    raise IllegalInvocationException(_STOPPING_MSG % self.__class__.__name__)
+                self.__calls += 1
+        try:
+            if PROFILER.is_active():
+                return PROFILER.invoke(self.__class__.__name__ + '.' + name, method, args, kwargs)
+            return method(*args, **kwargs)
+        finally:
+            with self.__calls_condition:
+                self.__calls -= 1
+                if self.__calls == 0:
+                    self.__calls_condition.notify_all()
+
+    def drain(self, timeout: float) -> bool:
+        """
+        Refuse the new connections and calls, then wait for the completion of the calls in progress.
+        :param timeout: the maximum delay in seconds
+        :return: true if no call is in progress
+        """
+        with self.__calls_condition:
+            self.__draining = True
+            return self.__calls_condition.wait_for(lambda: self.__calls == 0, max(0.0, timeout))
+
     def on_connect(self, conn: rpyc.Connection) -> None:
-        self._logger.debug("Connection from client: %s" % conn)
+        self._logger.debug("Connection from client: %s", conn)
+        bind_connection(conn)
+        self.__local.connection = conn
+        if self.__draining:
+            raise IllegalInvocationException(_STOPPING_MSG % self.__class__.__name__)
 
     def on_disconnect(self, conn: rpyc.Connection) -> None:
-        self._logger.debug("Disconnection of client: %s" % conn)
+        self._logger.debug("Disconnection of client: %s", conn)
+        with self.__teardowns_lock:
+            # The sessions without token cannot be resumed, they are keyed by their connection
+            key: Any = self.__tokens.pop(conn, conn)
+        if key is _RESUMED:
+            return
+        if SESSION_GRACE_PERIOD <= 0:
+            self._teardown_session(conn)
+            return
+        timer: threading.Timer = threading.Timer(SESSION_GRACE_PERIOD, self.__teardown, (key, conn))
+        timer.daemon = True
+        with self.__teardowns_lock:
+            self.__teardowns[key] = timer
+        timer.start()
+
+    def __teardown(self, key: Any, conn: rpyc.Connection) -> None:
+        with self.__teardowns_lock:
+            if self.__teardowns.get(key) is not threading.current_thread():
+                # The session was resumed
+                return
+            del self.__teardowns[key]
+        self._teardown_session(conn)
+
+    def _teardown_session(self, conn: rpyc.Connection) -> None:
+        """Release the state of the session of a disconnected client, called after the grace period"""
+        pass
+
+    def _release_session(self, conn: rpyc.Connection, successor: rpyc.Connection) -> None:
+        """
+        Release the state of the previous connection of a resumed session without resetting the device, called after
+        the replay of the session on its new connection.
+        :param conn: the previous connection
+        :param successor: the connection continuing the session
+        """
+        pass
+
+    def exposed_open_session(self) -> str:
+        """
+        Return the token of the session of the calling connection, presented to restore_session after a reconnection.
+        :return: the token
+        """
+        token: str = secrets.token_hex(16)
+        with self.__teardowns_lock:
+            self.__tokens[self.__local.connection] = token
+        return token
+
+    def exposed_restore_session(self, calls: tuple, token: str=None) -> int:
+        """
+        Apply the state of a session in a single request, the pending teardown of the session having the given token is
+        cancelled and the session continues on the calling connection.
+        :param calls: the tuples (method, args), see id_session.SessionJournal
+        :param token: the token returned by open_session on the previous connection
+        :return: the number of calls
+        """
+        # The local calls have no connection
+        conn: rpyc.Connection = getattr(self.__local, 'connection', None)
+        previous: list = list()
+        if token is not None:
+            with self.__teardowns_lock:
+                timer: threading.Timer = self.__teardowns.pop(token, None)
+                if timer is not None:
+                    timer.cancel()
+                    previous.append(timer.args[1])
+                for other in [c for c, t in self.__tokens.items() if t == token and c is not conn]:
+                    # The disconnection of the previous connection is not handled yet
+                    self.__tokens[other] = _RESUMED
+                    previous.append(other)
+                self.__tokens[conn] = token
+        self._logger.debug('Restoring session using %s calls', len(calls))
+        # Same path as the calls of the client: validation, drain and profiling
+        for name, args in calls:
+            self._rpyc_getattr(name)(*args)
+        for other in previous:
+            self._release_session(other, conn)
+        return len(calls)
+
+    def exposed_traced(self, context: tuple, name: str, args: tuple, kwargs: tuple=()) -> Any:
+        """
+        Execute a call of a traced client, the spans of the server are part of the trace of the client.
+        :param context: the trace id, the span id of the client and the time of the sending in nanoseconds
+        :param name: the name of the method
+        :param args: the arguments
+        :param kwargs: the (name, value) pairs of the keyword arguments
+        :return: the result of the method and the duration of the dispatch in nanoseconds, see id_tracing.end_traced_call
+        """
+        started: int = time.monotonic_ns()
+        with continue_trace(self.__class__.__name__ + '.' + name, context):
+            result: Any = self._rpyc_getattr(name)(*args, **dict(kwargs))
+        return result, time.monotonic_ns() - started
 
     @abstractmethod
     def finalize(self) -> None:
@@ -84,9 +293,8 @@ class FunctionProviderServiceProxy(object):
         object.__setattr__(self, FunctionProviderServiceProxy._OBJ, obj)
 
     def __getattribute__(self, name):
-        if name.startswith(FunctionProviderServiceProxy._EXPOSED_PREFIX):
-            return getattr(object.__getattribute__(self, FunctionProviderServiceProxy._OBJ), name)
-        return getattr(object.__getattribute__(self, FunctionProviderServiceProxy._OBJ), FunctionProviderServiceProxy._EXPOSED_PREFIX + name)
+        # The local calls go through the same path as the remote ones: validation, drain and profiling
+        return object.__getattribute__(self, FunctionProviderServiceProxy._OBJ)._rpyc_getattr(name)
 
     def __delattr__(self, name):
         if name.startswith(FunctionProviderServiceProxy._EXPOSED_PREFIX):
@@ -149,25 +357,243 @@ class Connection(object):
         return self.__thread
     
     def is_closed(self) -> bool:
-        return (self.__connection is None or self.__connection.closed) and (self.__thread is None or self.__thread.is_alive())
-    
+        return self.__connection is None or self.__connection.closed
+
+    def ping(self, timeout: float=HEARTBEAT_TIMEOUT) -> None:
+        connection: rpyc.Connection = self.__connection
+        if connection is None:
+            raise EOFError('Connection closed')
+        connection.ping(timeout=timeout)
+
     def close(self) -> None:
+        # The serving thread must be stopped before the connection to avoid an error in the thread
         try:
-            if self.__connection and not self.__connection.closed:
-                self.__connection.close()
-            self.__connection = None
+            if self.__thread and getattr(self.__thread, '_active', False):
+                self.__thread.stop()
+            self.__thread = None
         except Exception:
             _, _, exc_traceback = sys.exc_info()
             traceback.print_tb(exc_traceback, limit=6, file=sys.stderr)
         try:
-            if self.__thread and not self.__thread.is_alive():
-                self.__thread.stop()
-            self.__thread = None
+            if self.__connection and not self.__connection.closed:
+                self.__connection.close()
+            self.__connection = None
         except Exception:
             _, _, exc_traceback = sys.exc_info()
             traceback.print_tb(exc_traceback, limit=6, file=sys.stderr)
 
 
+class FunctionProviderStub(object):
+    """
+    Client side stub of a remote provider, the remote methods are resolved once per connection.
+    The calls are bounded by the timeout of the stub and the deadline of the calling thread, see id_resilience.
+    The state defined by the calls is restored in a single request after a reconnection, see id_session.
+    """
+    _EXPOSED_PREFIX: str = 'exposed_'
+    # Signatures of the methods declared by the abstract provider, set by the stub classes
+    _SIGNATURES: dict = dict()
+    __stub_classes: dict = dict()
+    __stub_classes_lock: threading.Lock = threading.Lock()
+
+    def __init__(self, name: str, connector: Callable[[], Connection], breaker: CircuitBreaker=None, timeout: float=CALL_TIMEOUT, journal: SessionJournal=None):
+        self.__name: str = name
+        self.__connector: Callable[[], Connection] = connector
+        self.__breaker: CircuitBreaker = breaker
+        self.__timeout: float = timeout
+        self.__journal: SessionJournal = journal
+        self.__connection: Connection = None
+        self.__token: str = None
+        self.__methods: dict = dict()
+        self.__lock: threading.Lock = threading.Lock()
+
+    def _set_timeout(self, timeout: float) -> None:
+        """Set the timeout in seconds of the calls, None to use the timeout of the connection"""
+        self.__timeout = timeout
+
+    def _get_connection(self) -> Connection:
+        connection: Connection = self.__connection
+        if connection is None or connection.is_closed():
+            with self.__lock:
+                connection = self.__connection
+                if connection is None or connection.is_closed():
+                    # The references of the previous connection are no more valid
+                    reconnection: bool = connection is not None
+                    connection = self.__connector()
+                    self.__methods = dict()
+                    if self.__journal is not None:
+                        root: Any = connection.get_connection().root
+                        if reconnection and self.__token is not None:
+                            # The state is restored in a single request, the callbacks are passed using the new connection
+                            root.restore_session(tuple(self.__journal.get_calls()), self.__token)
+                        else:
+                            self.__token = root.open_session()
+                    self.__connection = connection
+        return connection
+
+    def _get_method(self, name: str) -> Callable:
+        connection: Connection = self._get_connection()
+        methods: dict = self.__methods
+        method = methods.get(name)
+        if method is None:
+            method = getattr(connection.get_connection().root, FunctionProviderStub._EXPOSED_PREFIX + name)
+            methods[name] = method
+        return method
+
+    @classmethod
+    def _bind(cls, name: str, args: Any, kwargs: dict) -> list:
+        """Return the positional arguments of a call, the session journal replays the calls using positional arguments"""
+        signature: inspect.Signature = cls._SIGNATURES.get(name)
+        if signature is None:
+            raise TypeError('%s() got unexpected keyword arguments: %s' % (name, ', '.join(kwargs)))
+        bound: inspect.BoundArguments = signature.bind(None, *args, **kwargs)
+        bound.apply_defaults()
+        return list(bound.args[1:])
+
+    def _invoke(self, name: str, args: list, kwargs: dict=None) -> Any:
+        timeout: float = get_call_timeout(self.__timeout)
+        return self._invoke_async(name, args, kwargs, timeout is None)(timeout)
+
+    def _invoke_async(self, name: str, args: list, kwargs: dict=None, synchronous: bool=False) -> Callable[[float], Any]:
+        """
+        Send a call without waiting for its reply, so that the calls of many stubs are sent before the first reply is
+        awaited, see id_fleet. The circuit breaker, the trace and the session journal are handled when the reply is read.
+        :param name: the name of the method
+        :param args: the packed arguments
+        :param kwargs: the packed keyword arguments
+        :param synchronous: true to wait for the reply using the timeout of the connection
+        :return: the function returning the result, its argument is the delay in seconds before CallTimeoutException
+        is raised, None to wait without limit
+        """
+        breaker: CircuitBreaker = self.__breaker
+        if breaker is not None:
+            breaker.check()
+        recorded: bool = self.__journal is not None and self.__journal.is_recorded(name)
+        if recorded and kwargs:
+            args = self._bind(name, args, kwargs)
+            kwargs = None
+        context: tuple = None
+        started: int = 0
+        try:
+            current = get_current()
+            if current is None:
+                method: Callable = self._get_method(name)
+                call_args: Any = args
+                call_kwargs: dict = kwargs or {}
+            else:
+                # The trace context is passed with the call
+                method = self._get_method(TRACED_METHOD)
+                context = get_context(current)
+                call_args = (context, name, tuple(args), tuple(kwargs.items()) if kwargs else ())
+                call_kwargs = {}
+                started = time.monotonic_ns()
+            if synchronous:
+                reply: Any = method(*call_args, **call_kwargs)
+            else:
+                reply = rpyc.async_(method)(*call_args, **call_kwargs)
+        except Exception as ex:
+            self.__raise_failure(name, ex, None)
+
+        def wait(timeout: float) -> Any:
+            try:
+                result: Any = reply
+                if not synchronous:
+                    if timeout is not None:
+                        reply.set_expiry(timeout)
+                    result = reply.value
+                if context is not None:
+                    result = end_traced_call(context, started, result)
+            except Exception as ex:
+                self.__raise_failure(name, ex, timeout)
+            if breaker is not None:
+                breaker.record_success()
+            if recorded:
+                self.__journal.record(name, args)
+            return result
+
+        return wait
+
+    def _call_async(self, name: str, *args, **kwargs) -> Callable[[float], Any]:
+        """Send a call with the arguments packed like by the methods of the stub, see _invoke_async"""
+        pack = FunctionProviderStub._pack
+        return self._invoke_async(name, [pack(a) for a in args], {k: pack(v) for k, v in kwargs.items()})
+
+    def __raise_failure(self, name: str, ex: Exception, timeout: float) -> None:
+        # A slow call does not count as a failure of the connection
+        if isinstance(ex, rpyc.AsyncResultTimeout) and timeout is not None:
+            raise CallTimeoutException('Call of %s.%s timed out after %ss' % (self.__name, name, timeout))
+        if self.__breaker is not None and is_transport_failure(ex):
+            self.__breaker.record_failure()
+        raise ex
+
+    def __getattr__(self, name: str) -> Any:
+        # Methods not declared by the abstract provider, such as the ones of a newer server, are resolved remotely
+        if name.startswith('_'):
+            raise AttributeError(name)
+        self._get_method(name)
+        return self._make_method(name).__get__(self)
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, self.__name)
+
+    @staticmethod
+    def _pack(value: Any) -> Any:
+        # Mutable and buffer objects would be passed as remote references
+        if isinstance(value, (array.array, memoryview, bytearray)):
+            return value.tobytes() if not isinstance(value, bytearray) else bytes(value)
+        if isinstance(value, list):
+            return tuple(value)
+        return value
+
+    @staticmethod
+    def _make_method(method_name: str) -> Callable:
+        pack = FunctionProviderStub._pack
+
+        def method(self, *args, **kwargs):
+            root = start_span(method_name)
+            if root is NO_SPAN:
+                return self._invoke(method_name, [pack(a) for a in args], {k: pack(v) for k, v in kwargs.items()})
+            with root:
+                with span('encode'):
+                    packed: list = [pack(a) for a in args]
+                    packed_kwargs: dict = {k: pack(v) for k, v in kwargs.items()}
+                return self._invoke(method_name, packed, packed_kwargs)
+
+        method.__name__ = method_name
+        return method
+
+    @classmethod
+    def _create_stub_class(cls, provider_class: type) -> type:
+        """Creates the stub class declaring the public methods of the given abstract provider"""
+        with cls.__stub_classes_lock:
+            result: type = cls.__stub_classes.get(provider_class.__name__)
+            if result:
+                return result
+
+            make_method: Callable = cls._make_method
+            namespace: dict = dict()
+            signatures: dict = dict()
+            for klass in provider_class.__mro__:
+                if klass is FunctionProvider or klass is object:
+                    break
+                for name, value in vars(klass).items():
+                    if callable(value) and not name.startswith('_') and name not in namespace:
+                        namespace[name] = make_method(name)
+                        signatures[name] = inspect.signature(value)
+            # Batch variants generated from the schemas
+            for name in get_batch_names(provider_class._SCHEMAS):
+                if name not in namespace:
+                    namespace[name] = make_method(name)
+            namespace['_SIGNATURES'] = signatures
+            result = type(provider_class.__name__ + 'Stub', (cls,), namespace)
+            cls.__stub_classes[provider_class.__name__] = result
+            return result
+
+    @classmethod
+    def _create(cls, provider_class: type, connector: Callable[[], Connection], breaker: CircuitBreaker=None, timeout: float=CALL_TIMEOUT):
+        journal: SessionJournal = SessionJournal(provider_class) if SESSION_JOURNAL and provider_class._SESSION_METHODS else None
+        return cls._create_stub_class(provider_class)(provider_class.__name__, connector, breaker, timeout, journal)
+
+
 import_files_of_dir(str(pathlib.Path(__file__).parent) + os.sep + 'function_providers')
 
 T = TypeVar('T', bound=FunctionProvider)
@@ -179,56 +605,116 @@ def is_raspberry_pi() -> bool:
     return platform.machine() in ('armv7l', 'armv6l')
 
 
+def get_socket_path(socket_dir: str, name: str) -> str:
+    return socket_dir + os.sep + name + '.sock'
+
+
+def create_unix_server(service: rpyc.Service, path: str, protocol_config: dict) -> ThreadedServer:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # A socket file left by a previous process prevents the bind
+    if os.path.exists(path):
+        os.remove(path)
+    return ThreadedServer(service, socket_path=path, protocol_config=protocol_config)
+
+
+def close_unix_server(server: ThreadedServer) -> None:
+    server.close()
+    if os.path.exists(server.port):
+        os.remove(server.port)
+
+
 class RpcRegistryService(rpyc.Service):
 
-    def __init__(self, parent_logger: logging.Logger, host: str, port: int, services: dict):
-        self.__logger = logging.getLogger(self.__class__.__name__)
-        for handler in parent_logger.handlers:
-            self.__logger.addHandler(handler)
-        self.__logger.setLevel(parent_logger.level)
+    def __init__(self, parent_logger: logging.Logger, host: str, port: int, services: dict, socket_dir: str=None):
+        self.__logger = get_child_logger(parent_logger, self.__class__.__name__)
         self.__services: DictOfThreadedServer = dict()
+        # Services also available using unix domain sockets for the clients running on the same host
+        self.__local_services: DictOfThreadedServer = dict()
         current_port: int = port + 1
         for k, v in services.items():
             current_port = current_port + 1
-            self.__logger.debug('Creating service %s at %s:%s' % (k, host, current_port))
+            self.__logger.debug('Creating service %s at %s:%s', k, host, current_port)
             self.__services[k] = ThreadedServer(v, port=current_port, protocol_config={'allow_public_attrs': False})
+            if socket_dir:
+                path: str = get_socket_path(socket_dir, k)
+                self.__logger.debug('Creating service %s at %s', k, path)
+                self.__local_services[k] = create_unix_server(v, path, {'allow_public_attrs': False})
 
     def exposed_get_service_port(self, name: str) -> int:
-        self.__logger.debug('Retrieving port of service %s' % name)
+        if TRACE:
+            self.__logger.debug('Retrieving port of service %s', name)
         if name in self.__services:
             server: ThreadedServer = self.__services[name]
             if server:
                 if not server.active:
-                    self.__logger.debug('Starting service %s at %s:%s' % (name, server.host, server.port))
+                    self.__logger.debug('Starting service %s at %s:%s', name, server.host, server.port)
                     server._start_in_thread()
-                self.__logger.debug('Port is %s' % server.port)
+                if TRACE:
+                    self.__logger.debug('Port is %s', server.port)
                 return server.port
         self.__logger.debug('Service not available')
         return -1
 
+    def exposed_get_service_names(self) -> tuple:
+        return tuple(self.__services.keys())
+
+    def exposed_start_profiler(self, mode: str=SAMPLING, methods: tuple=None, interval: float=None) -> bool:
+        """Start the profiling of the calls of the providers, see id_profiler"""
+        self.__logger.info('Starting %s profiling', mode)
+        PROFILER.start(mode, methods, interval)
+        # Always return a non None value for RPC unmarshalling
+        return True
+
+    def exposed_get_profile(self) -> tuple:
+        """Return the results of the profiling in progress or of the last one"""
+        return PROFILER.get_results()
+
+    def exposed_get_spans(self, clear: bool=False) -> tuple:
+        """Return the spans recorded by the server, see id_tracing"""
+        return get_spans(clear)
+
+    def exposed_stop_profiler(self) -> tuple:
+        self.__logger.info('Stopping profiling')
+        return PROFILER.stop()
+
+    def exposed_get_service_path(self, name: str) -> str:
+        if TRACE:
+            self.__logger.debug('Retrieving socket path of service %s', name)
+        server: ThreadedServer = self.__local_services.get(name)
+        if server:
+            if not server.active:
+                self.__logger.debug('Starting service %s at %s', name, server.port)
+                server._start_in_thread()
+            return server.port
+        self.__logger.debug('Service not available')
+        return None
+
     def start(self) -> None:
         self.__logger.debug('Starting all services')
         for k, v in self.__services.items():
             if v.active:
-                self.__logger.debug('Service %s already started' % k)
+                self.__logger.debug('Service %s already started', k)
             else:
-                self.__logger.debug('Starting service %s at %s:%s' % (k, v.host, v.port))
+                self.__logger.debug('Starting service %s at %s:%s', k, v.host, v.port)
                 v.start()
 
     def stop(self) -> None:
         self.__logger.debug('Stopping all services')
         for k, v in self.__services.items():
             if v.active:
-                self.__logger.debug('Stopping service %s at %s:%s' % (k, v.host, v.port))
+                self.__logger.debug('Stopping service %s at %s:%s', k, v.host, v.port)
                 v.close()
             else:
-                self.__logger.debug('Service %s already stopped' % k)
+                self.__logger.debug('Service %s already stopped', k)
+        for k, v in self.__local_services.items():
+            self.__logger.debug('Stopping service %s at %s', k, v.port)
+            close_unix_server(v)
 
     def on_connect(self, conn: rpyc.Connection) -> None:
-        self.__logger.debug("Connection from client: %s" % conn)
+        self.__logger.debug("Connection from client: %s", conn)
 
     def on_disconnect(self, conn: rpyc.Connection) -> None:
-        self.__logger.debug("Disconnection of client: %s" % conn)
+        self.__logger.debug("Disconnection of client: %s", conn)
 
 
 class FunctionInvokers(object):
@@ -236,61 +722,94 @@ class FunctionInvokers(object):
     __providers: dict = dict()
     __registry: RpcRegistryService = None
     __connections: DictOfConnection = None
+    __stubs: dict = dict()
     __initialize_lock: threading.Lock = threading.Lock()
-    __get_lock: threading.Lock = threading.Lock()
+    __get_lock: threading.RLock = threading.RLock()
     __server: ThreadedServer = None
+    __local_server: ThreadedServer = None
     __client: rpyc.Connection = None
     __host: str = None
     __port: int = None
+    __socket_dir: str = None
     __mock: bool = False
+    __recorder = None
+    __gateway = None
+    __breaker: CircuitBreaker = None
+    __monitor: HeartbeatMonitor = None
+    __call_timeout: float = CALL_TIMEOUT
+    __timeouts: dict = dict()
+    __stop_lock: threading.Lock = threading.Lock()
+    __stopped: bool = False
+    __stop_deadline: float = None
 
     @staticmethod
-    def initialize(parent_logger: logging.Logger, host: str=None, port: int=DEFAULT_PORT, server: bool=False):
+    def initialize(parent_logger: logging.Logger, host: str=None, port: int=DEFAULT_PORT, server: bool=False, socket_dir: str=None, devices: Dict[str, str]=None):
         with FunctionInvokers.__initialize_lock:
             if not FunctionInvokers.__logger:
-                FunctionInvokers.__logger = logging.getLogger(FunctionInvokers.__name__)
-                for handler in parent_logger.handlers:
-                    FunctionInvokers.__logger.addHandler(handler)
-                FunctionInvokers.__logger.setLevel(parent_logger.level)
+                FunctionInvokers.__logger = get_child_logger(parent_logger, FunctionInvokers.__name__)
                 # If host is specified, the RPC services and proxies must be created
                 # Otherwise the providers will be used
+                # If the directory of the sockets is specified, the server also listens on unix domain sockets
+                # and the client uses them instead of TCP
+                # If devices are specified, the server is a gateway exposing the providers of the devices, see id_gateway
                 FunctionInvokers.__host = host
                 FunctionInvokers.__port = port
+                FunctionInvokers.__socket_dir = socket_dir
                 FunctionInvokers.__mock = not is_raspberry_pi()
-                if host:
-                    if server:
-                        # Server
+                if RECORD_CALLS_PATH and not server:
+                    from id_call_recorder import CallRecorder
+                    FunctionInvokers.__logger.info('Recording calls to: %s', RECORD_CALLS_PATH)
+                    FunctionInvokers.__recorder = CallRecorder(RECORD_CALLS_PATH)
+                if host or (socket_dir and not server):
+                    if server and devices:
+                        # Gateway
+                        from id_gateway import create_gateway_services
+                        FunctionInvokers.__logger.info('Creating gateway for devices: %s', devices)
+                        FunctionInvokers.__gateway, services = create_gateway_services(parent_logger, devices, port)
+                        FunctionInvokers.__providers.update(services)
+                    elif server:
+                        # Server, the isolated providers run in their own process, see id_isolation
                         try:
+                            from id_isolation import IsolatedProviderService, is_isolated
                             for subclass in subclasses_of(FunctionProvider):
-                                if subclass.__name__ in FunctionInvokers.__providers:
+                                if subclass.__name__ in FunctionInvokers.__providers or not subclass._ENABLED:
                                     continue
                                 class_name: str = subclass.__name__ + 'Service'
                                 if FunctionInvokers.__mock:
                                     class_name = subclass.__name__ + 'ServiceMock'
                                 the_class = getattr(sys.modules[subclass.__module__], class_name)
+                                if is_isolated(subclass.__name__):
+                                    FunctionInvokers.__logger.info('Instantiating: %s in a worker process for provider: %s', the_class.__name__, subclass.__name__)
+                                    FunctionInvokers.__providers[subclass.__name__] = IsolatedProviderService(parent_logger, subclass, the_class, socket_dir)
+                                    continue
                                 FunctionInvokers.__logger.info('Instantiating: %s for provider: %s', the_class.__name__, subclass.__name__)
                                 FunctionInvokers.__providers[subclass.__name__] = the_class(parent_logger)
                         except Exception as ex:
                             _, _, exc_traceback = sys.exc_info()
                             traceback.print_tb(exc_traceback, limit=6, file=sys.stderr)
                             FunctionInvokers.__logger.error(ex)
+                    if server:
                         FunctionInvokers.__logger.debug('Creating registry')
                         # Build RPC service associated to providers
-                        FunctionInvokers.__registry = RpcRegistryService(parent_logger, host, port, FunctionInvokers.__providers)
+                        FunctionInvokers.__registry = RpcRegistryService(parent_logger, host, port, FunctionInvokers.__providers, socket_dir)
                         # Build RPC server
                         FunctionInvokers.__server = ThreadedServer(FunctionInvokers.__registry, port=port, protocol_config={'allow_public_attrs': ALLOW_PUBLIC_ATTRS, 'allow_pickle':ALLOW_PICKLE})
+                        if socket_dir:
+                            FunctionInvokers.__local_server = create_unix_server(FunctionInvokers.__registry, get_socket_path(socket_dir, REGISTRY_SOCKET_NAME), {'allow_public_attrs': ALLOW_PUBLIC_ATTRS, 'allow_pickle':ALLOW_PICKLE})
                     else:
-                        # Client
-                        FunctionInvokers.__logger.debug('Connecting proxy to remote registry at %s:%s' % (host, port))
-                        # Get RPC proxy associated to service
-                        FunctionInvokers.__client = rpyc.connect(host, port, config={'sync_request_timeout': RPC_TIMEOUT, 'allow_public_attrs': ALLOW_PUBLIC_ATTRS, 'allow_pickle':ALLOW_PICKLE})
-                        FunctionInvokers.__registry = FunctionInvokers.__client.root
+                        # Client, using unix domain sockets if the directory is specified
                         FunctionInvokers.__connections = dict()
+                        address: str = socket_dir if socket_dir and not host else '%s:%s' % (host, port)
+                        FunctionInvokers.__breaker = CircuitBreaker(parent_logger, address)
+                        FunctionInvokers.__connect_registry()
+                        # Dead links are detected by the heartbeat, an unreachable host is probed in the background
+                        FunctionInvokers.__monitor = HeartbeatMonitor(parent_logger)
+                        FunctionInvokers.__monitor.add(address, FunctionInvokers.__breaker, FunctionInvokers.__probe)
                 else:
                     # Local
                     try:
                         for subclass in subclasses_of(FunctionProvider):
-                            if subclass.__name__ in FunctionInvokers.__providers:
+                            if subclass.__name__ in FunctionInvokers.__providers or not subclass._ENABLED:
                                 continue
                             class_name: str = subclass.__name__ + 'Service'
                             if FunctionInvokers.__mock:
@@ -310,7 +829,7 @@ class FunctionInvokers(object):
 
     @staticmethod
     def is_local() -> bool:
-        return FunctionInvokers.__host is None or len(FunctionInvokers.__host) == 0
+        return (FunctionInvokers.__host is None or len(FunctionInvokers.__host) == 0) and not FunctionInvokers.__socket_dir
 
     @staticmethod
     def is_server() -> bool:
@@ -325,30 +844,202 @@ class FunctionInvokers(object):
         return FunctionInvokers.__port
 
     @staticmethod
-    def get_provider(value: Generic[T]) -> T:
-        FunctionInvokers.__logger.debug('Searching provider %s' % value.__name__)
+    def set_recorder(recorder) -> None:
+        """Records the calls made on the providers returned after this invocation, see id_call_recorder.CallRecorder"""
+        FunctionInvokers.__recorder = recorder
+
+    @staticmethod
+    def set_call_timeout(timeout: float, value: Generic[T]=None, namespace: str=None) -> None:
+        """
+        Set the timeout of the remote calls, a shorter deadline can be used for a block of calls, see id_resilience.deadline.
+        :param timeout: the timeout in seconds, None to use the timeout of the connection
+        :param value: the abstract class of the provider, all the providers if not specified
+        :param namespace: the alias of the device when connected to a gateway
+        """
+        with FunctionInvokers.__get_lock:
+            if value is None:
+                FunctionInvokers.__call_timeout = timeout
+                FunctionInvokers.__timeouts.clear()
+                for stub in FunctionInvokers.__stubs.values():
+                    stub._set_timeout(timeout)
+                return
+            name: str = namespace + NAMESPACE_SEPARATOR + value.__name__ if namespace else value.__name__
+            FunctionInvokers.__timeouts[name] = timeout
+            stub: FunctionProviderStub = FunctionInvokers.__stubs.get(name)
+            if stub:
+                stub._set_timeout(timeout)
+
+    @staticmethod
+    def is_reachable() -> bool:
+        """Return false if the remote host is known to be unreachable, the calls then fail immediately"""
+        return FunctionInvokers.__breaker is None or not FunctionInvokers.__breaker.is_open()
+
+    @staticmethod
+    def get_service(name: str) -> FunctionProviderService:
+        """
+        Return the service instantiated by this process for the given provider, used by the services calling others.
+        :param name: the name of the abstract class of the provider
+        :return: the service or None if not instantiated, on a client
+        """
+        return FunctionInvokers.__providers.get(name)
+
+    @staticmethod
+    def get_service_names() -> tuple:
+        """Return the names of the services of the registry, the providers of a gateway are prefixed by the alias of their device"""
+        if FunctionInvokers.is_local():
+            return tuple(FunctionInvokers.__providers.keys())
+        with FunctionInvokers.__get_lock:
+            FunctionInvokers.__connect_registry()
+            return tuple(FunctionInvokers.__registry.get_service_names())
+
+    @staticmethod
+    def start_profiler(mode: str=SAMPLING, methods: tuple=None, interval: float=None) -> None:
+        """
+        Start the profiling of the calls of the providers of the server, or of the local providers.
+        :param mode: id_profiler.SAMPLING or id_profiler.DETERMINISTIC
+        :param methods: the names of the methods profiled deterministically ('Provider.method' or 'method'), all if not specified
+        :param interval: the delay in seconds between two samples
+        """
+        if FunctionInvokers.is_local() or FunctionInvokers.is_server():
+            PROFILER.start(mode, methods, interval)
+            return
+        with FunctionInvokers.__get_lock:
+            FunctionInvokers.__connect_registry()
+            FunctionInvokers.__registry.start_profiler(mode, tuple(methods) if methods else None, interval)
+
+    @staticmethod
+    def get_spans(clear: bool=False) -> tuple:
+        """Return the spans recorded by this process and by the server, see id_tracing"""
+        if FunctionInvokers.is_local() or FunctionInvokers.is_server():
+            return get_spans(clear)
+        with FunctionInvokers.__get_lock:
+            FunctionInvokers.__connect_registry()
+            return get_spans(clear) + tuple(FunctionInvokers.__registry.get_spans(clear))
+
+    @staticmethod
+    def stop_profiler() -> dict:
+        """Stop the profiling and return its results, see id_profiler"""
+        if FunctionInvokers.is_local() or FunctionInvokers.is_server():
+            return dict(PROFILER.stop())
+        with FunctionInvokers.__get_lock:
+            FunctionInvokers.__connect_registry()
+            return dict(FunctionInvokers.__registry.stop_profiler())
+
+    @staticmethod
+    def get_provider(value: Generic[T], namespace: str=None) -> T:
+        """
+        Return the provider of the given class.
+        :param value: the abstract class of the provider
+        :param namespace: the alias of the device when connected to a gateway, see id_gateway
+        :return: the provider or None if not available
+        """
+        result = FunctionInvokers.__get_provider(value, namespace)
+        if result is not None and FunctionInvokers.__recorder:
+            return FunctionInvokers.__recorder.wrap(result, value.__name__)
+        return result
+
+    @staticmethod
+    def __get_provider(value: Generic[T], namespace: str=None) -> T:
+        if TRACE:
+            FunctionInvokers.__logger.debug('Searching provider %s in namespace %s', value.__name__, namespace)
         with FunctionInvokers.__get_lock:
             if FunctionInvokers.is_local():
-                FunctionInvokers.__logger.debug('Retrieving local invoker %s' % value.__name__)
-                provider = FunctionInvokers.__providers[value.__name__]
+                if TRACE:
+                    FunctionInvokers.__logger.debug('Retrieving local invoker %s', value.__name__)
+                provider = FunctionInvokers.__providers.get(value.__name__)
                 if provider:
                     return FunctionProviderServiceProxy(provider)
-                FunctionInvokers.__logger.warning('Provider not found %s' % value.__name__)
+                FunctionInvokers.__logger.warning('Provider not found %s', value.__name__)
                 return None
             else:
-                if value.__name__ in FunctionInvokers.__connections:
-                    FunctionInvokers.__logger.debug('Retrieving proxy %s' % value.__name__)
-                    return FunctionInvokers.__connections[value.__name__].get_connection().root
-                # Client
-                port: int = FunctionInvokers.__registry.get_service_port(value.__name__)
-                if port <= 0:
-                    FunctionInvokers.__logger.warning('Provider not found %s' % value.__name__)
+                name: str = namespace + NAMESPACE_SEPARATOR + value.__name__ if namespace else value.__name__
+                stub: FunctionProviderStub = FunctionInvokers.__stubs.get(name)
+                if stub:
+                    if TRACE:
+                        FunctionInvokers.__logger.debug('Retrieving proxy %s', name)
+                    return stub
+                # Client, the stub reconnects using the same function if its connection is closed
+                FunctionInvokers.__breaker.check()
+                timeout: float = FunctionInvokers.__timeouts.get(name, FunctionInvokers.__call_timeout)
+                stub = FunctionProviderStub._create(value, lambda: FunctionInvokers.__connect(name), FunctionInvokers.__breaker, timeout)
+                try:
+                    stub._get_connection()
+                except LookupError:
+                    FunctionInvokers.__logger.warning('Provider not found %s', name)
                     return None
-                FunctionInvokers.__logger.debug(
-                    'Connecting proxy %s at %s:%s' % (value.__name__, FunctionInvokers.__host, port))
-                c = rpyc.connect(FunctionInvokers.__host, port, config={"sync_request_timeout": RPC_TIMEOUT, 'allow_public_attrs': ALLOW_PUBLIC_ATTRS, 'allow_pickle':ALLOW_PICKLE})
-                FunctionInvokers.__connections[value.__name__] = Connection(c, set_thread=True)
-                return c.root
+                FunctionInvokers.__stubs[name] = stub
+                return stub
+
+    @staticmethod
+    def __open_registry() -> rpyc.Connection:
+        if FunctionInvokers.__socket_dir:
+            path: str = get_socket_path(FunctionInvokers.__socket_dir, REGISTRY_SOCKET_NAME)
+            FunctionInvokers.__logger.debug('Connecting proxy to local registry at %s', path)
+            return unix_connect(path, config=CLIENT_CONFIG)
+        FunctionInvokers.__logger.debug('Connecting proxy to remote registry at %s:%s', FunctionInvokers.__host, FunctionInvokers.__port)
+        return rpyc.connect(FunctionInvokers.__host, FunctionInvokers.__port, config=CLIENT_CONFIG)
+
+    @staticmethod
+    def __connect_registry() -> None:
+        if FunctionInvokers.__client and not FunctionInvokers.__client.closed:
+            return
+        FunctionInvokers.__client = FunctionInvokers.__open_registry()
+        FunctionInvokers.__registry = FunctionInvokers.__client.root
+
+    @staticmethod
+    def __probe() -> None:
+        with FunctionInvokers.__get_lock:
+            client: rpyc.Connection = FunctionInvokers.__client
+            connections: list = list(FunctionInvokers.__connections.items())
+        if client is None or client.closed:
+            # The connection may wait for the timeout of an unreachable host, the callers are not blocked meanwhile
+            client = FunctionInvokers.__open_registry()
+            registry: Any = client.root
+            with FunctionInvokers.__get_lock:
+                if FunctionInvokers.__client and not FunctionInvokers.__client.closed:
+                    # Reconnected by a caller meanwhile
+                    client.close()
+                    client = FunctionInvokers.__client
+                else:
+                    FunctionInvokers.__client = client
+                    FunctionInvokers.__registry = registry
+        try:
+            client.ping(timeout=HEARTBEAT_TIMEOUT)
+        except Exception:
+            client.close()
+            raise
+        for name, connection in connections:
+            if not connection.is_closed():
+                try:
+                    connection.ping()
+                except Exception:
+                    # The stub reconnects on its next call once the host is reachable
+                    FunctionInvokers.__logger.warning('Connection of %s lost', name)
+                    connection.close()
+                    raise
+
+    @staticmethod
+    def __connect(name: str) -> Connection:
+        with FunctionInvokers.__get_lock:
+            previous: Connection = FunctionInvokers.__connections.pop(name, None)
+            if previous:
+                previous.close()
+            FunctionInvokers.__connect_registry()
+            if FunctionInvokers.__socket_dir:
+                path: str = FunctionInvokers.__registry.get_service_path(name)
+                if not path:
+                    raise LookupError('Provider not found %s' % name)
+                FunctionInvokers.__logger.debug('Connecting proxy %s at %s', name, path)
+                c = unix_connect(path, config=CLIENT_CONFIG)
+            else:
+                port: int = FunctionInvokers.__registry.get_service_port(name)
+                if port <= 0:
+                    raise LookupError('Provider not found %s' % name)
+                FunctionInvokers.__logger.debug('Connecting proxy %s at %s:%s', name, FunctionInvokers.__host, port)
+                c = rpyc.connect(FunctionInvokers.__host, port, config=CLIENT_CONFIG)
+            result: Connection = Connection(c, set_thread=True)
+            FunctionInvokers.__connections[name] = result
+            return result
 
     @staticmethod
     def get_version() -> str:
@@ -357,26 +1048,78 @@ class FunctionInvokers(object):
     @staticmethod
     def start() -> None:
         if FunctionInvokers.__server:
+            if FunctionInvokers.__local_server and not FunctionInvokers.__local_server.active:
+                FunctionInvokers.__logger.debug('Starting registry at %s', FunctionInvokers.__local_server.port)
+                FunctionInvokers.__local_server._start_in_thread()
             if not FunctionInvokers.__server.active:
-                FunctionInvokers.__logger.debug('Starting registry at %s:%s' % (FunctionInvokers.__host, FunctionInvokers.__port))
+                FunctionInvokers.__logger.debug('Starting registry at %s:%s', FunctionInvokers.__host, FunctionInvokers.__port)
                 FunctionInvokers.__server.start()
         else:
             raise IllegalInvocationException('Cannot start server, not configured as a server')
 
     @staticmethod
-    def stop() -> None:
+    def __finalize(name: str, provider: FunctionProviderService) -> None:
         try:
-            if FunctionInvokers.__registry:
-                FunctionInvokers.__registry.stop()
+            FunctionInvokers.__logger.debug('Closing provider %s', name)
+            provider.finalize()
+        except Exception as ex:
+            _, _, exc_traceback = sys.exc_info()
+            traceback.print_tb(exc_traceback, limit=6, file=sys.stderr)
+            FunctionInvokers.__logger.error('Provider %s not finalized: %s', name, ex)
+
+    @staticmethod
+    def __finalize_all(deadline: float) -> None:
+        # The providers drive distinct devices, they are finalized concurrently
+        threads: list = list()
+        for k, v in FunctionInvokers.__providers.items():
+            thread: threading.Thread = threading.Thread(target=FunctionInvokers.__finalize, args=(k, v), name='Finalize-' + k, daemon=True)
+            thread.start()
+            threads.append((k, thread))
+        for k, thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+            if thread.is_alive():
+                FunctionInvokers.__logger.warning('Provider %s not finalized before the deadline', k)
+
+    @staticmethod
+    def __drain(deadline: float) -> None:
+        # New connections and calls are refused on all the services before waiting for the calls in progress
+        for v in FunctionInvokers.__providers.values():
+            v.drain(0)
+        for k, v in FunctionInvokers.__providers.items():
+            if not v.drain(deadline - time.monotonic()):
+                FunctionInvokers.__logger.warning('Calls still in progress on provider %s', k)
+
+    @staticmethod
+    def get_stop_timeout() -> float:
+        """Return the remaining delay of the shutdown in progress, STOP_TIMEOUT if the invokers are not stopping"""
+        deadline: float = FunctionInvokers.__stop_deadline
+        return STOP_TIMEOUT if deadline is None else max(0.0, deadline - time.monotonic())
+
+    @staticmethod
+    def stop(*args) -> None:
+        """Stop the invokers, also used as the handler of SIGINT and SIGTERM, the delay is bounded by STOP_TIMEOUT"""
+        with FunctionInvokers.__stop_lock:
+            if FunctionInvokers.__stopped:
+                return
+            FunctionInvokers.__stopped = True
+        deadline: float = time.monotonic() + STOP_TIMEOUT
+        FunctionInvokers.__stop_deadline = deadline
+        if FunctionInvokers.__monitor:
+            FunctionInvokers.__monitor.stop()
+        try:
+            if FunctionInvokers.__server:
+                FunctionInvokers.__logger.debug('Draining services')
+                FunctionInvokers.__drain(deadline)
         except Exception as ex:
             _, _, exc_traceback = sys.exc_info()
             traceback.print_tb(exc_traceback, limit=6, file=sys.stderr)
             FunctionInvokers.__logger.error(ex)
+        if FunctionInvokers.__providers:
+            FunctionInvokers.__finalize_all(deadline)
         try:
-            if FunctionInvokers.__providers:
-                for k, v in FunctionInvokers.__providers.items():
-                    FunctionInvokers.__logger.debug('Closing provider %s' % k)
-                    v.finalize()
+            # On the client side, the registry is a proxy of the remote one
+            if FunctionInvokers.__registry and FunctionInvokers.__server:
+                FunctionInvokers.__registry.stop()
         except Exception as ex:
             _, _, exc_traceback = sys.exc_info()
             traceback.print_tb(exc_traceback, limit=6, file=sys.stderr)
@@ -385,7 +1128,7 @@ class FunctionInvokers(object):
             if FunctionInvokers.__connections:
                 for k, v in FunctionInvokers.__connections.items():
                     if not v.is_closed():
-                        FunctionInvokers.__logger.debug('Closing proxy %s' % k)
+                        FunctionInvokers.__logger.debug('Closing proxy %s', k)
                         v.close()
         except Exception as ex:
             _, _, exc_traceback = sys.exc_info()
@@ -399,10 +1142,28 @@ class FunctionInvokers(object):
             _, _, exc_traceback = sys.exc_info()
             traceback.print_tb(exc_traceback, limit=6, file=sys.stderr)
             FunctionInvokers.__logger.error(ex)
+        try:
+            if FunctionInvokers.__recorder:
+                FunctionInvokers.__logger.debug('Closing recorder')
+                FunctionInvokers.__recorder.close()
+        except Exception as ex:
+            _, _, exc_traceback = sys.exc_info()
+            traceback.print_tb(exc_traceback, limit=6, file=sys.stderr)
+            FunctionInvokers.__logger.error(ex)
         try:
             if FunctionInvokers.__server:
                 FunctionInvokers.__logger.debug('Stopping registry')
                 FunctionInvokers.__server.active = False
+            if FunctionInvokers.__local_server:
+                close_unix_server(FunctionInvokers.__local_server)
+        except Exception as ex:
+            _, _, exc_traceback = sys.exc_info()
+            traceback.print_tb(exc_traceback, limit=6, file=sys.stderr)
+            FunctionInvokers.__logger.error(ex)
+        try:
+            if FunctionInvokers.__gateway:
+                FunctionInvokers.__logger.debug('Closing connections to the devices')
+                FunctionInvokers.__gateway.close()
         except Exception as ex:
             _, _, exc_traceback = sys.exc_info()
             traceback.print_tb(exc_traceback, limit=6, file=sys.stderr)
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+# Gateway exposing the providers of many devices through a single registry
+# The providers of a device are registered as '<alias>.<provider class name>', the clients use
+# FunctionInvokers.get_provider(provider_class, namespace=alias).
+# The gateway keeps one connection per device and provider, caches the idempotent reads for a short time
+# and forwards the events of a single subscription on the device to all the subscribed clients.
+# The reads cached and the calls discarding them are the ones declared by the providers for the coalescing, see
+# id_coalescing.
+import logging
+import os
+import threading
+import rpyc
+from typing import Any, Callable, Dict, List
+from id_buffer_utils import is_netref
+from id_coalescing import SingleFlight
+from id_fleet import FleetClient
+from id_function_invokers import DEFAULT_PORT, NAMESPACE_SEPARATOR, TRACED_METHOD, FunctionProvider, FunctionProviderService, FunctionProviderStub
+from id_classes_utils import subclasses_of
+from id_logging_utils import TRACE
+from id_schema import MANY_SUFFIX
+
+_EXPOSED_PREFIX: str = 'exposed_'
+_NOT_EXPOSED_MSG: str = 'Method not available: %s'
+
+# Time to live in seconds of the results of the reads which the providers only share while they are in progress
+CACHE_TTL: float = float(os.environ.get('ID_GATEWAY_CACHE_TTL', '0.05'))
+# Methods registering a callback, by provider and method, with the index of the callback in the arguments
+# The other arguments identify the subscription
+SUBSCRIPTION_METHODS: Dict[str, Dict[str, int]] = {
+    'Am2302FunctionProvider': {'watch_threshold': 3, 'watch_rate': 2, 'watch_delta': 2},
+    'GfxHatFunctionProvider': {'touch_on': 1, 'touch_on_events': 1}
+}
+
+DictOfServices = Dict[str, FunctionProviderService]
+
+
+def get_namespaced_name(namespace: str, name: str) -> str:
+    return namespace + NAMESPACE_SEPARATOR + name if namespace else name
+
+
+class _Subscription(object):
+    """Single subscription on the device forwarding the events to the callbacks of the clients"""
+
+    def __init__(self, logger: logging.Logger, key: tuple):
+        self.__logger: logging.Logger = logger
+        self.__key: tuple = key
+        # Callbacks by connection of the client
+        self.__callbacks: dict = dict()
+
+    def is_empty(self) -> bool:
+        return not self.__callbacks
+
+    def add(self, connection: rpyc.Connection, callback: Any) -> None:
+        self.__callbacks[connection] = rpyc.async_(callback)
+
+    def remove(self, connection: rpyc.Connection) -> bool:
+        return self.__callbacks.pop(connection, None) is not None
+
+    def dispatch(self, *args) -> None:
+        if TRACE:
+            self.__logger.debug('Dispatching event %s with args: %s to %s clients', self.__key, args, len(self.__callbacks))
+        for connection, callback in list(self.__callbacks.items()):
+            try:
+                callback(*args)
+            except Exception as ex:
+                # The client is gone, its subscription is removed when the disconnection is handled
+                self.__logger.warning('Event %s not delivered to %s: %s', self.__key, connection, ex)
+
+
+class GatewayProviderService(FunctionProviderService):
+    """Service forwarding the calls to the provider of a device"""
+
+    def __init__(self, parent_logger: logging.Logger, provider_class: type, stub_factory: Callable[[], FunctionProviderStub]):
+        super().__init__(parent_logger)
+        self.__provider_name: str = provider_class.__name__
+        self.__stub_factory: Callable[[], FunctionProviderStub] = stub_factory
+        self.__ttls: Dict[str, float] = {k: v or CACHE_TTL for k, v in provider_class._COALESCED_METHODS.items()}
+        self.__invalidations: Dict[str, tuple] = provider_class._INVALIDATIONS
+        self.__subscription_methods: Dict[str, int] = SUBSCRIPTION_METHODS.get(self.__provider_name, dict())
+        # A read started before a call invalidating it is not cached, the calls of the other methods keep the results
+        self.__cache: SingleFlight = SingleFlight(self.__ttls)
+        self.__subscriptions: dict = dict()
+        self.__lock: threading.Lock = threading.Lock()
+        # Each connection is served by its own thread of the server
+        self.__local: threading.local = threading.local()
+        # Methods are resolved once, the clients resolve them once per connection
+        self.__methods: Dict[str, Callable] = dict()
+        self.__stub_class: type = FunctionProviderStub._create_stub_class(provider_class)
+        for name in vars(self.__stub_class).keys():
+            if name.startswith('_'):
+                continue
+            if name in self.__subscription_methods:
+                self.__methods[name] = self.__make_subscription(name)
+            elif name in self.__ttls:
+                self.__methods[name] = self.__make_cached(name)
+            else:
+                self.__methods[name] = self.__make_forward(name)
+        self.__methods['open_session'] = self.exposed_open_session
+        self.__methods['restore_session'] = self.__restore_session
+        self.__methods[TRACED_METHOD] = self.exposed_traced
+
+    def _rpyc_getattr(self, name: str) -> Any:
+        if name.startswith(_EXPOSED_PREFIX):
+            name = name[len(_EXPOSED_PREFIX):]
+        method: Callable = self.__methods.get(name)
+        if method is None:
+            raise AttributeError(_NOT_EXPOSED_MSG % name)
+        return self._wrap_exposed(name, method)
+
+    def __restore_session(self, calls: tuple, token: str=None) -> int:
+        # The subscriptions of the client are registered again through the gateway, which keeps no other state
+        for name, args in calls:
+            self._rpyc_getattr(name)(*args)
+        return len(calls)
+
+    def __make_forward(self, name: str) -> Callable:
+        # The batch variants invalidate the same reads, see id_schema
+        names: tuple = self.__invalidations.get(name[:-len(MANY_SUFFIX)] if name.endswith(MANY_SUFFIX) else name)
+        if not names:
+            return lambda *args, **kwargs: getattr(self.__stub_factory(), name)(*args, **kwargs)
+
+        def forward(*args, **kwargs) -> Any:
+            try:
+                return getattr(self.__stub_factory(), name)(*args, **kwargs)
+            finally:
+                # The cached reads may depend on the state modified by this call
+                self.__cache.invalidate(names)
+
+        return forward
+
+    def __make_cached(self, name: str) -> Callable:
+
+        def cached(*args, **kwargs) -> Any:
+            # Remote references would be compared using requests
+            if kwargs or any(is_netref(a) for a in args):
+                return getattr(self.__stub_factory(), name)(*args, **kwargs)
+            return self.__cache.call(name, args, lambda: getattr(self.__stub_factory(), name)(*args))
+
+        return cached
+
+    def __make_subscription(self, name: str) -> Callable:
+        index: int = self.__subscription_methods[name]
+
+        def subscribe(*args, **kwargs) -> Any:
+            if kwargs:
+                # The callback and the key of the subscription are positional arguments
+                args = tuple(self.__stub_class._bind(name, args, kwargs))
+            callback: Any = args[index]
+            key: tuple = (name,) + args[:index] + args[index + 1:]
+            connection: rpyc.Connection = getattr(self.__local, 'connection', None)
+            with self.__lock:
+                subscription: _Subscription = self.__subscriptions.get(key)
+                if callback is None:
+                    if subscription and subscription.remove(connection) and subscription.is_empty():
+                        del self.__subscriptions[key]
+                        self.__unsubscribe(key)
+                    return True
+                if subscription is None:
+                    subscription = _Subscription(self._logger, key)
+                    upstream_args: list = list(args)
+                    upstream_args[index] = subscription.dispatch
+                    self._logger.debug('Subscribing %s on %s', key, self.__provider_name)
+                    getattr(self.__stub_factory(), name)(*upstream_args)
+                    self.__subscriptions[key] = subscription
+                subscription.add(connection, callback)
+            return True
+
+        return subscribe
+
+    def __unsubscribe(self, key: tuple) -> None:
+        index: int = self.__subscription_methods[key[0]]
+        upstream_args: list = list(key[1:])
+        upstream_args.insert(index, None)
+        self._logger.debug('Unsubscribing %s on %s', key, self.__provider_name)
+        getattr(self.__stub_factory(), key[0])(*upstream_args)
+
+    def on_connect(self, conn: rpyc.Connection) -> None:
+        super().on_connect(conn)
+        self.__local.connection = conn
+
+    def on_disconnect(self, conn: rpyc.Connection) -> None:
+        super().on_disconnect(conn)
+        with self.__lock:
+            for key, subscription in list(self.__subscriptions.items()):
+                if subscription.remove(conn) and subscription.is_empty():
+                    del self.__subscriptions[key]
+                    try:
+                        self.__unsubscribe(key)
+                    except Exception as ex:
+                        self._logger.error(ex)
+
+    def finalize(self) -> None:
+        with self.__lock:
+            for key in list(self.__subscriptions.keys()):
+                try:
+                    self.__unsubscribe(key)
+                except Exception as ex:
+                    self._logger.error(ex)
+            self.__subscriptions.clear()
+        self.__cache.invalidate()
+
+
+def parse_devices(values: List[str]) -> Dict[str, str]:
+    """
+    Parse the devices given as 'alias=host' or 'alias=host:port'.
+    :param values: the values
+    :return: the addresses by alias
+    """
+    result: Dict[str, str] = dict()
+    for value in values:
+        alias, _, address = value.partition('=')
+        if not alias or not address or NAMESPACE_SEPARATOR in alias:
+            raise ValueError('Invalid device, expected alias=host[:port]: %s' % value)
+        result[alias] = address
+    return result
+
+
+def create_gateway_services(parent_logger: logging.Logger, devices: Dict[str, str], port: int=DEFAULT_PORT) -> (FleetClient, DictOfServices):
+    """
+    Create the services forwarding the calls to the providers of the given devices.
+    :param parent_logger: the logger
+    :param devices: the addresses ('host' or 'host:port') by alias
+    :param port: the default port of the registries of the devices
+    :return: the client of the devices, to close when the gateway stops, and the services by namespaced name
+    """
+    fleet: FleetClient = FleetClient(parent_logger, devices.values(), port)
+    services: DictOfServices = dict()
+    for alias, address in devices.items():
+        for subclass in subclasses_of(FunctionProvider):
+            # The connection to the device is established on the first call
+            stub_factory = (lambda a, c: lambda: fleet.get_provider(a, c))(address, subclass)
+            services[get_namespaced_name(alias, subclass.__name__)] = GatewayProviderService(parent_logger, subclass, stub_factory)
+    return fleet, services
@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+# Providers running in their own worker process, so the CPU bound work of a provider (rendering, rasterization,
+# decoding) does not block the other ones through the GIL and a crash does not stop the registry.
+# The registry exposes a proxy service forwarding the calls to the worker over a unix domain socket. Each client
+# connection has its own connection to the worker, so the sessions are handled by the worker as if the client
+# was directly connected. The large bulk buffers are copied in shared memory and passed by reference.
+# The supervisor restarts a worker which exited, the clients of the previous worker are disconnected so they
+# restore their session on the new one, see id_session.
+# Set ID_ISOLATED_PROVIDERS to a comma separated list of provider names, or '*' for all the providers of the server.
+import importlib
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import rpyc
+from typing import Any, Callable, Dict
+from rpyc.utils.factory import unix_connect
+from id_buffer_utils import is_buffer
+from id_function_invokers import CLIENT_CONFIG, STOP_TIMEOUT, TRACED_METHOD, Connection, FunctionInvokers, FunctionProviderService, FunctionProviderStub, close_unix_server, create_unix_server, get_socket_path
+from id_logging_utils import get_child_logger
+from id_resilience import is_transport_failure
+from id_shared_memory import SharedMemoryRing, check_shared_reference, is_shared_reference
+from id_tracing import end_traced_call, get_context, get_current
+
+ISOLATED_PROVIDERS: frozenset = frozenset(v.strip() for v in os.environ.get('ID_ISOLATED_PROVIDERS', '').split(',') if v.strip())
+# Minimum size in bytes of the buffers passed to the workers using shared memory
+SHM_THRESHOLD: int = int(os.environ.get('ID_SHM_THRESHOLD', '4096'))
+# Maximum delay in seconds of the start of a worker
+START_TIMEOUT: float = float(os.environ.get('ID_WORKER_START_TIMEOUT', '10'))
+SUPERVISE_INTERVAL: float = 1.0
+RESTART_DELAY: float = 0.5
+MAX_RESTART_DELAY: float = 30.0
+_EXPOSED_PREFIX: str = 'exposed_'
+_NOT_EXPOSED_MSG: str = 'Method not available: %s'
+_WORKER_DOWN_MSG: str = 'Worker of %s not available'
+# Prefix of the lines of the error stream of a worker transporting a log record
+_RECORD_MARKER: str = '\x1e'
+
+__supervisor = None
+__supervisor_lock: threading.Lock = threading.Lock()
+
+
+def is_isolated(name: str) -> bool:
+    return '*' in ISOLATED_PROVIDERS or name in ISOLATED_PROVIDERS
+
+
+class _RecordPipeHandler(logging.Handler):
+    """Handler of the worker writing the records on the error stream, they are logged by the registry process"""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            message: str = record.getMessage()
+            if record.exc_info:
+                message = message + '\n' + logging.Formatter().formatException(record.exc_info)
+            sys.stderr.write(_RECORD_MARKER + json.dumps([record.levelno, record.name, message]) + '\n')
+            sys.stderr.flush()
+        except Exception:
+            self.handleError(record)
+
+
+class ProviderWorker(object):
+    """Process hosting the service of a provider"""
+
+    def __init__(self, parent_logger: logging.Logger, name: str, service_class: type, path: str):
+        self.__logger: logging.Logger = get_child_logger(parent_logger, self.__class__.__name__)
+        self.__parent_logger: logging.Logger = parent_logger
+        self.__name: str = name
+        self.__service_class: type = service_class
+        self.__path: str = path
+        self.__process: subprocess.Popen = None
+        self.__lock: threading.Lock = threading.Lock()
+        self.__started_at: float = 0
+        self.__failures: int = 0
+        self.__next_start: float = None
+        self.__stopped: bool = False
+
+    def get_name(self) -> str:
+        return self.__name
+
+    def get_path(self) -> str:
+        return self.__path
+
+    def is_alive(self) -> bool:
+        process: subprocess.Popen = self.__process
+        return process is not None and process.poll() is None
+
+    def start(self) -> None:
+        with self.__lock:
+            if self.is_alive():
+                return
+            if os.path.exists(self.__path):
+                os.remove(self.__path)
+            env: dict = dict(os.environ)
+            # The worker imports the modules of the providers and mocks like this process
+            env['PYTHONPATH'] = os.pathsep.join(p for p in sys.path if p)
+            args: list = [sys.executable, os.path.abspath(__file__), self.__parent_logger.name, self.__service_class.__module__,
+                          self.__service_class.__name__, self.__path, str(self.__parent_logger.getEffectiveLevel())]
+            self.__logger.info('Starting worker of %s', self.__name)
+            # The registry writes the delay allowed for the stop on the input of the worker
+            self.__process = subprocess.Popen(args, env=env, stdin=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            self.__started_at = time.monotonic()
+            threading.Thread(target=self.__read_records, args=(self.__process,), name='Worker-' + self.__name, daemon=True).start()
+            self.__wait_ready()
+
+    def __wait_ready(self) -> None:
+        deadline: float = time.monotonic() + START_TIMEOUT
+        while time.monotonic() < deadline:
+            if not self.is_alive():
+                raise ConnectionError(_WORKER_DOWN_MSG % self.__name)
+            if os.path.exists(self.__path):
+                try:
+                    unix_connect(self.__path, config=CLIENT_CONFIG).close()
+                    self.__logger.debug('Worker of %s listening at %s', self.__name, self.__path)
+                    return
+                except OSError:
+                    pass
+            time.sleep(0.05)
+        raise TimeoutError(_WORKER_DOWN_MSG % self.__name)
+
+    def __read_records(self, process: subprocess.Popen) -> None:
+        for line in process.stderr:
+            if line.startswith(_RECORD_MARKER):
+                try:
+                    level, name, message = json.loads(line[len(_RECORD_MARKER):])
+                    logging.getLogger(name).log(level, message)
+                    continue
+                except ValueError:
+                    pass
+            # Tracebacks and messages printed by the modules
+            self.__logger.info('%s: %s', self.__name, line.rstrip())
+
+    def supervise(self) -> None:
+        """Restart the process if it exited, the delay doubles for each crash occurring shortly after a start"""
+        if self.__stopped or self.is_alive() or self.__process is None:
+            return
+        now: float = time.monotonic()
+        if self.__next_start is None:
+            if now - self.__started_at > MAX_RESTART_DELAY:
+                self.__failures = 0
+            delay: float = min(MAX_RESTART_DELAY, RESTART_DELAY * (2 ** self.__failures - 1))
+            self.__failures += 1
+            self.__logger.warning('Worker of %s exited with code %s, restarting in %ss', self.__name, self.__process.returncode, delay)
+            self.__next_start = now + delay
+        if now >= self.__next_start:
+            self.__next_start = None
+            try:
+                self.start()
+            except Exception as ex:
+                self.__logger.error('Worker of %s not restarted: %s', self.__name, ex)
+
+    def stop(self, timeout: float=None) -> None:
+        """
+        Ask the worker to drain and finalize its provider, the process is killed after the given delay.
+        :param timeout: the delay in seconds, the remaining delay of the shutdown of the invokers if not specified
+        """
+        if timeout is None:
+            timeout = FunctionInvokers.get_stop_timeout()
+        self.__stopped = True
+        with self.__lock:
+            process: subprocess.Popen = self.__process
+            if process is None:
+                return
+            if process.poll() is None:
+                self.__logger.debug('Stopping worker of %s in %ss', self.__name, round(timeout, 3))
+                try:
+                    process.stdin.write('%s\n' % timeout)
+                    process.stdin.close()
+                except OSError:
+                    process.terminate()
+                try:
+                    process.wait(timeout)
+                except subprocess.TimeoutExpired:
+                    self.__logger.warning('Worker of %s not stopped in time, killing it', self.__name)
+                    process.kill()
+                    process.wait()
+            if os.path.exists(self.__path):
+                os.remove(self.__path)
+
+
+class WorkerSupervisor(object):
+    """Single thread restarting the workers which exited"""
+
+    def __init__(self, parent_logger: logging.Logger, interval: float=SUPERVISE_INTERVAL):
+        self.__logger: logging.Logger = get_child_logger(parent_logger, self.__class__.__name__)
+        self.__interval: float = interval
+        self.__workers: Dict[str, ProviderWorker] = dict()
+        self.__condition: threading.Condition = threading.Condition()
+        self.__thread: threading.Thread = None
+
+    def add(self, worker: ProviderWorker) -> None:
+        with self.__condition:
+            self.__workers[worker.get_name()] = worker
+            if self.__thread is None or not self.__thread.is_alive():
+                self.__thread = threading.Thread(target=self.__run, name=self.__class__.__name__, daemon=True)
+                self.__thread.start()
+
+    def remove(self, worker: ProviderWorker) -> None:
+        with self.__condition:
+            self.__workers.pop(worker.get_name(), None)
+            self.__condition.notify_all()
+
+    def __run(self) -> None:
+        while True:
+            with self.__condition:
+                self.__condition.wait(self.__interval)
+                if not self.__workers:
+                    return
+                workers: list = list(self.__workers.values())
+            for worker in workers:
+                try:
+                    worker.supervise()
+                except Exception as ex:
+                    self.__logger.error(ex)
+
+
+def _get_supervisor(parent_logger: logging.Logger) -> WorkerSupervisor:
+    global __supervisor
+    with __supervisor_lock:
+        if __supervisor is None:
+            __supervisor = WorkerSupervisor(parent_logger)
+        return __supervisor
+
+
+class IsolatedProviderService(FunctionProviderService):
+    """Service of the registry forwarding the calls to the service of a provider running in a worker process"""
+
+    def __init__(self, parent_logger: logging.Logger, provider_class: type, service_class: type, socket_dir: str=None):
+        super().__init__(parent_logger)
+        self.__provider_name: str = provider_class.__name__
+        path: str = get_socket_path(socket_dir or tempfile.gettempdir(), 'worker-%s-%s' % (os.getpid(), self.__provider_name))
+        self.__worker: ProviderWorker = ProviderWorker(parent_logger, self.__provider_name, service_class, path)
+        self.__supervisor: WorkerSupervisor = _get_supervisor(parent_logger)
+        # The connections to the worker by connection of the client
+        self.__connections: Dict[rpyc.Connection, Connection] = dict()
+        self.__lock: threading.Lock = threading.Lock()
+        # Rings of the payloads passed to the worker using shared memory, by connection of the client
+        self.__rings: Dict[rpyc.Connection, SharedMemoryRing] = dict()
+        # Each connection is served by its own thread of the server
+        self.__local: threading.local = threading.local()
+        self.__methods: Dict[str, Callable] = dict()
+        for name in vars(FunctionProviderStub._create_stub_class(provider_class)).keys():
+            if not name.startswith('_'):
+                self.__methods[name] = self.__make_forward(name)
+        self.__methods['open_session'] = self.__make_forward('open_session')
+        self.__methods['restore_session'] = self.__make_forward('restore_session')
+        self.__methods[TRACED_METHOD] = self.exposed_traced
+        try:
+            self.__worker.start()
+        except Exception as ex:
+            # The supervisor starts it again
+            self._logger.error('Worker of %s not started: %s', self.__provider_name, ex)
+        self.__supervisor.add(self.__worker)
+
+    def _rpyc_getattr(self, name: str) -> Any:
+        if name.startswith(_EXPOSED_PREFIX):
+            name = name[len(_EXPOSED_PREFIX):]
+        method: Callable = self.__methods.get(name)
+        if method is None:
+            raise AttributeError(_NOT_EXPOSED_MSG % name)
+        return self._wrap_exposed(name, method)
+
+    def __pack_value(self, conn: rpyc.Connection, value: Any) -> Any:
+        if is_shared_reference(value):
+            # The worker trusts the registry, the reference is checked for the client
+            check_shared_reference(value)
+        elif is_buffer(value) and memoryview(value).nbytes >= SHM_THRESHOLD:
+            # Each client has its own ring, its calls are served one at a time so a payload is consumed by the worker
+            # before the next call of the client reuses the ring
+            ring: SharedMemoryRing = self.__rings.get(conn)
+            if ring is None:
+                ring = SharedMemoryRing()
+                with self.__lock:
+                    self.__rings[conn] = ring
+            return ring.put(value)
+        return value
+
+    def __make_forward(self, name: str) -> Callable:
+
+        def forward(*args, **kwargs) -> Any:
+            conn: rpyc.Connection = getattr(self.__local, 'connection', None)
+            connection: Connection = self.__connections.get(conn)
+            try:
+                if connection is None or connection.is_closed():
+                    raise EOFError(_WORKER_DOWN_MSG % self.__provider_name)
+                packed: tuple = tuple(self.__pack_value(conn, a) for a in args)
+                packed_kwargs: dict = {k: self.__pack_value(conn, v) for k, v in kwargs.items()}
+                current = get_current()
+                if current is not None:
+                    # The worker records its spans in the same trace, in its ring buffer and its trace file
+                    context: tuple = get_context(current)
+                    started: int = time.monotonic_ns()
+                    reply: tuple = getattr(connection.get_connection().root, TRACED_METHOD)(context, name, packed, tuple(packed_kwargs.items()))
+                    return end_traced_call(context, started, reply)
+                return getattr(connection.get_connection().root, name)(*packed, **packed_kwargs)
+            except Exception as ex:
+                if is_transport_failure(ex):
+                    # The worker crashed, the client reconnects and restores its session on the new worker
+                    self._logger.warning('Worker of %s lost, disconnecting the client', self.__provider_name)
+                    self.__local.connection.close()
+                raise
+
+        return forward
+
+    def on_connect(self, conn: rpyc.Connection) -> None:
+        super().on_connect(conn)
+        if not self.__worker.is_alive():
+            raise ConnectionError(_WORKER_DOWN_MSG % self.__provider_name)
+        # The worker serves the callbacks of the client through this connection
+        connection: Connection = Connection(unix_connect(self.__worker.get_path(), config=CLIENT_CONFIG), set_thread=True)
+        with self.__lock:
+            self.__connections[conn] = connection
+        self.__local.connection = conn
+
+    def on_disconnect(self, conn: rpyc.Connection) -> None:
+        super().on_disconnect(conn)
+        with self.__lock:
+            connection: Connection = self.__connections.pop(conn, None)
+            ring: SharedMemoryRing = self.__rings.pop(conn, None)
+        # The worker tears down the session of the client
+        if connection:
+            connection.close()
+        if ring:
+            ring.close()
+
+    def finalize(self) -> None:
+        self.__supervisor.remove(self.__worker)
+        with self.__lock:
+            connections: list = list(self.__connections.values())
+            self.__connections.clear()
+            rings: list = list(self.__rings.values())
+            self.__rings.clear()
+        for connection in connections:
+            connection.close()
+        self.__worker.stop()
+        for ring in rings:
+            ring.close()
+
+
+def _run_worker(logger_name: str, module_name: str, class_name: str, path: str, level: int) -> int:
+    logger: logging.Logger = logging.getLogger(logger_name)
+    logger.setLevel(level)
+    logger.addHandler(_RecordPipeHandler())
+    logger.propagate = False
+    stopping: threading.Event = threading.Event()
+    timeouts: list = [STOP_TIMEOUT]
+
+    def read_stop() -> None:
+        # The registry writes the remaining delay of its shutdown, the input is closed if the registry exits
+        line: str = sys.stdin.readline()
+        try:
+            timeouts[0] = min(STOP_TIMEOUT, float(line))
+        except ValueError:
+            pass
+        stopping.set()
+
+    # Only the registry stops the worker, an interruption of the terminal is handled by the registry
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *args: stopping.set())
+    threading.Thread(target=read_stop, name='Stop', daemon=True).start()
+    service: FunctionProviderService = getattr(importlib.import_module(module_name), class_name)(logger)
+    server = create_unix_server(service, path, {'allow_public_attrs': False})
+    threading.Thread(target=server.start, name=class_name, daemon=True).start()
+    parent: int = os.getppid()
+    # The worker also stops if the registry process exits without stopping it
+    while not stopping.wait(SUPERVISE_INTERVAL) and os.getppid() == parent:
+        pass
+    if not service.drain(timeouts[0]):
+        logger.warning('Calls still in progress on %s', class_name)
+    service.finalize()
+    close_unix_server(server)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(_run_worker(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4], int(sys.argv[5])))
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# utilities for logging
+import atexit
+import logging
+import os
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict
+
+# Trace switch evaluated once at import time, hot paths test this constant instead of building log records
+TRACE: bool = os.environ.get('ID_TRACE', '').lower() in ('1', 'true', 'yes', 'on')
+LOG_QUEUE_SIZE: int = 10000
+
+DictOfListeners = Dict[str, QueueListener]
+
+_EXCEPTION_FORMATTER: logging.Formatter = logging.Formatter()
+__listeners: DictOfListeners = dict()
+__listeners_lock: threading.Lock = threading.Lock()
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Queue handler leaving the formatting of the messages to the listener thread"""
+
+    def __init__(self, records_queue: queue.Queue):
+        super().__init__(records_queue)
+        self.dropped: int = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only the traceback must be rendered while the frames are still available
+        if record.exc_info and not record.exc_text:
+            record.exc_text = _EXCEPTION_FORMATTER.formatException(record.exc_info)
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Never block the calling thread, the record is lost
+            self.dropped = self.dropped + 1
+
+
+def get_child_logger(parent_logger: logging.Logger, name: str) -> logging.Logger:
+    """
+    Return the logger of a component, propagating its records to the parent logger.
+    :param parent_logger: the parent logger
+    :param name: the name of the component
+    :return: the logger
+    """
+    if parent_logger is None:
+        return logging.getLogger(name)
+    return parent_logger.getChild(name)
+
+
+def start_async_logging(logger: logging.Logger, size: int=LOG_QUEUE_SIZE) -> QueueListener:
+    """
+    Move the handlers of the given logger behind a queue served by a listener thread.
+    :param logger: the logger
+    :param size: the maximum number of pending records
+    :return: the listener
+    """
+    with __listeners_lock:
+        listener: QueueListener = __listeners.get(logger.name)
+        if listener:
+            return listener
+        handlers = [h for h in logger.handlers if not isinstance(h, QueueHandler)]
+        for handler in handlers:
+            logger.removeHandler(handler)
+        records_queue: queue.Queue = queue.Queue(size)
+        logger.addHandler(DeferredQueueHandler(records_queue))
+        listener = QueueListener(records_queue, *handlers, respect_handler_level=True)
+        listener.start()
+        __listeners[logger.name] = listener
+        return listener
+
+
+def stop_async_logging() -> None:
+    """
+    Flush the pending records and stop the listener threads.
+    :return:
+    """
+    with __listeners_lock:
+        for listener in __listeners.values():
+            try:
+                listener.stop()
+            except Exception:
+                pass
+        __listeners.clear()
+
+
+atexit.register(stop_async_logging)
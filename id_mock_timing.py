@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+# Timing model of the mock modules so that a server using the mocks behaves like one using the hardware
+# The model is configured by the environment, the values of the profile (ID_MOCK_PROFILE) are used for the settings
+# not specified. The default profile has no latency.
+# GPIO: duration of each call of the WiringPi functions (ID_MOCK_GPIO_LATENCY)
+# DHT: duration of a read of the sensor (ID_MOCK_DHT_READ_TIME) and ratio of the reads failing (ID_MOCK_DHT_FAILURE_RATE),
+#   read_retry waits between its attempts like the driver
+# SPI: duration of the transfer of one byte of the LCD (ID_MOCK_SPI_BYTE_TIME), a frame is sent by show()
+# I2C: duration of the transfer of one byte of the backlight and touch controllers (ID_MOCK_I2C_BYTE_TIME)
+# Touch: rate of the touches (press and release) injected on the buttons having a handler, per second (ID_MOCK_TOUCH_RATE)
+# LCD: the pixels are only kept in memory when headless (ID_MOCK_LCD_HEADLESS), pygame is used otherwise
+# The random values use ID_MOCK_SEED when specified so that the runs are reproducible.
+# The delays shorter than BUSY_WAIT_THRESHOLD are busy waits holding the interpreter like the calls of the drivers,
+# the longer ones are sleeps.
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict
+
+BUSY_WAIT_THRESHOLD: float = 0.001
+PROFILES: Dict[str, dict] = {
+    'none': {'gpio_latency': 0, 'dht_read_time': 0, 'dht_failure_rate': 0, 'spi_byte_time': 0, 'i2c_byte_time': 0},
+    # Raspberry Pi 3 using the Python bindings, SPI at 1 MHz and I2C at 100 kHz
+    'pi': {'gpio_latency': 0.000008, 'dht_read_time': 2.0, 'dht_failure_rate': 0.3, 'spi_byte_time': 0.000008,
+           'i2c_byte_time': 0.00009}
+}
+TOUCH_EVENTS: tuple = ('press', 'release')
+_PROFILE_ERROR_MSG: str = 'Invalid mock profile: %s, expected one of: %s'
+
+_profile_name: str = os.environ.get('ID_MOCK_PROFILE', 'none')
+if _profile_name not in PROFILES:
+    raise ValueError(_PROFILE_ERROR_MSG % (_profile_name, ', '.join(PROFILES)))
+_profile: dict = PROFILES[_profile_name]
+
+
+def _setting(name: str) -> float:
+    return float(os.environ.get('ID_MOCK_' + name.upper(), _profile[name]))
+
+
+GPIO_LATENCY: float = _setting('gpio_latency')
+DHT_READ_TIME: float = _setting('dht_read_time')
+DHT_FAILURE_RATE: float = _setting('dht_failure_rate')
+SPI_BYTE_TIME: float = _setting('spi_byte_time')
+I2C_BYTE_TIME: float = _setting('i2c_byte_time')
+TOUCH_RATE: float = float(os.environ.get('ID_MOCK_TOUCH_RATE', '0'))
+LCD_HEADLESS: bool = os.environ.get('ID_MOCK_LCD_HEADLESS', '').lower() in ('1', 'true', 'yes', 'on')
+SEED: str = os.environ.get('ID_MOCK_SEED')
+
+RANDOM: random.Random = random.Random(SEED)
+_random_lock: threading.Lock = threading.Lock()
+
+
+def wait(delay: float) -> None:
+    if delay <= 0:
+        return
+    if delay >= BUSY_WAIT_THRESHOLD:
+        time.sleep(delay)
+        return
+    deadline: float = time.perf_counter() + delay
+    while time.perf_counter() < deadline:
+        pass
+
+
+def gpio_call() -> None:
+    wait(GPIO_LATENCY)
+
+
+def spi_transfer(count: int) -> None:
+    wait(SPI_BYTE_TIME * count)
+
+
+def i2c_transfer(count: int) -> None:
+    wait(I2C_BYTE_TIME * count)
+
+
+def dht_read() -> bool:
+    """Wait for the duration of a read of the sensor and return false if the read fails"""
+    wait(DHT_READ_TIME)
+    if DHT_FAILURE_RATE <= 0:
+        return True
+    with _random_lock:
+        return RANDOM.random() >= DHT_FAILURE_RATE
+
+
+class TouchEvent(object):
+    """Event passed to the handlers like the driver"""
+    __slots__ = ('channel', 'event')
+
+    def __init__(self, channel: int, event: str):
+        self.channel: int = channel
+        self.event: str = event
+
+
+class TouchInjector(object):
+    """Thread injecting touches at the given rate on random buttons having a handler"""
+
+    def __init__(self, get_handlers: Callable[[], list], rate: float=TOUCH_RATE):
+        self.__get_handlers: Callable[[], list] = get_handlers
+        self.__rate: float = rate
+        self.__stopping: threading.Event = threading.Event()
+        self.__thread: threading.Thread = None
+        self.injected: int = 0
+
+    def start(self) -> None:
+        if self.__rate <= 0 or self.__thread is not None:
+            return
+        self.__stopping.clear()
+        self.__thread = threading.Thread(target=self.__run, name=self.__class__.__name__, daemon=True)
+        self.__thread.start()
+
+    def stop(self) -> None:
+        thread: threading.Thread = self.__thread
+        self.__thread = None
+        if thread is not None:
+            self.__stopping.set()
+            thread.join()
+
+    def __run(self) -> None:
+        period: float = 1.0 / self.__rate
+        deadline: float = time.monotonic()
+        while True:
+            deadline += period
+            if self.__stopping.wait(max(0.0, deadline - time.monotonic())):
+                return
+            handlers: list = [(i, h) for i, h in enumerate(self.__get_handlers()) if h is not None]
+            if not handlers:
+                continue
+            with _random_lock:
+                channel, handler = RANDOM.choice(handlers)
+            self.injected += 1
+            for event in TOUCH_EVENTS:
+                try:
+                    handler(TouchEvent(channel, event))
+                except Exception:
+                    # The driver ignores the errors of the handlers
+                    pass
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+# Profiling of a running server, started and stopped remotely using the registry
+# SAMPLING: a thread samples the stacks of all the threads using sys._current_frames(), the stacks of the threads
+#   executing a call are attributed to the exposed method, the other threads are only sampled at their top frame.
+#   The interval is increased when the sampling exceeds MAX_OVERHEAD of the elapsed time.
+# DETERMINISTIC: the calls of the given exposed methods are profiled using cProfile, the statistics are aggregated
+#   by method.
+# The results are returned as a tuple of (key, value) pairs, use dict() on the client side. The stacks use the
+# collapsed format of the flame graph tools and the statistics use the marshal format of pstats, see load_stats.
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict
+
+SAMPLING: str = 'sampling'
+DETERMINISTIC: str = 'deterministic'
+# Delay in seconds between two samples
+SAMPLING_INTERVAL: float = float(os.environ.get('ID_PROFILE_INTERVAL', '0.01'))
+# Maximum ratio of the elapsed time spent sampling
+MAX_OVERHEAD: float = 0.01
+MAX_DEPTH: int = 64
+REPORT_LINES: int = 20
+NO_CALL: str = '(no call)'
+_MODE_ERROR_MSG: str = 'Invalid profiling mode: %s'
+
+
+def load_stats(data: bytes) -> pstats.Stats:
+    """
+    Load the statistics returned by a deterministic profiling.
+    :param data: the statistics of a method
+    :return: the statistics, print_stats() can be used for example
+    """
+    result: pstats.Stats = pstats.Stats()
+    result.stats = marshal.loads(data)
+    result.get_top_level_stats()
+    return result
+
+
+class CallProfiler(object):
+    """Profiler of the calls of the services, only one profiling can be in progress"""
+
+    def __init__(self):
+        self.__lock: threading.Lock = threading.Lock()
+        self.__mode: str = None
+        self.__methods: frozenset = None
+        # Exposed method being executed by thread
+        self.__calls: Dict[int, str] = dict()
+        self.__stacks: Dict[str, int] = dict()
+        self.__samples: Dict[str, int] = dict()
+        self.__stats: Dict[str, pstats.Stats] = dict()
+        self.__counts: Dict[str, int] = dict()
+        self.__skipped: int = 0
+        self.__labels: Dict[Any, str] = dict()
+        self.__interval: float = SAMPLING_INTERVAL
+        self.__started_at: float = 0
+        self.__sampling_time: float = 0
+        self.__stopping: threading.Event = threading.Event()
+        self.__thread: threading.Thread = None
+
+    def is_active(self) -> bool:
+        return self.__mode is not None
+
+    def start(self, mode: str=SAMPLING, methods: tuple=None, interval: float=None) -> None:
+        """
+        Start a profiling, the previous results are discarded.
+        :param mode: SAMPLING or DETERMINISTIC
+        :param methods: the names of the profiled methods ('Provider.method' or 'method'), all if not specified
+        :param interval: the delay between two samples
+        """
+        if mode not in (SAMPLING, DETERMINISTIC):
+            raise ValueError(_MODE_ERROR_MSG % mode)
+        with self.__lock:
+            if self.__mode is not None:
+                raise ValueError('Profiling already in progress: %s' % self.__mode)
+            self.__methods = frozenset(methods) if methods else None
+            self.__stacks = dict()
+            self.__samples = dict()
+            self.__stats = dict()
+            self.__counts = dict()
+            self.__skipped = 0
+            self.__interval = interval if interval else SAMPLING_INTERVAL
+            self.__started_at = time.monotonic()
+            self.__sampling_time = 0
+            self.__mode = mode
+            if mode == SAMPLING:
+                self.__stopping.clear()
+                self.__thread = threading.Thread(target=self.__run, name=self.__class__.__name__, daemon=True)
+                self.__thread.start()
+
+    def stop(self) -> tuple:
+        """Stop the profiling and return its results"""
+        with self.__lock:
+            mode: str = self.__mode
+            self.__mode = None
+            thread: threading.Thread = self.__thread
+            self.__thread = None
+        if thread:
+            self.__stopping.set()
+            thread.join()
+        return self.get_results(mode)
+
+    def invoke(self, name: str, method: Callable, args: tuple, kwargs: dict) -> Any:
+        """Execute the given call of an exposed method, named 'Provider.method'"""
+        mode: str = self.__mode
+        if mode == SAMPLING:
+            ident: int = threading.get_ident()
+            calls: Dict[int, str] = self.__calls
+            previous: str = calls.get(ident)
+            calls[ident] = name
+            try:
+                return method(*args, **kwargs)
+            finally:
+                if previous is None:
+                    calls.pop(ident, None)
+                else:
+                    calls[ident] = previous
+        if mode == DETERMINISTIC and self.__is_profiled(name):
+            profile: cProfile.Profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Another profiler is active in this thread
+                self.__skipped += 1
+                return method(*args, **kwargs)
+            try:
+                return method(*args, **kwargs)
+            finally:
+                profile.disable()
+                self.__add_stats(name, profile)
+        return method(*args, **kwargs)
+
+    def __is_profiled(self, name: str) -> bool:
+        methods: frozenset = self.__methods
+        return methods is None or name in methods or name[name.rfind('.') + 1:] in methods
+
+    def __add_stats(self, name: str, profile: cProfile.Profile) -> None:
+        stats: pstats.Stats = pstats.Stats(profile)
+        with self.__lock:
+            self.__counts[name] = self.__counts.get(name, 0) + 1
+            previous: pstats.Stats = self.__stats.get(name)
+            if previous is None:
+                self.__stats[name] = stats
+            else:
+                previous.add(stats)
+
+    def __get_label(self, code: Any) -> str:
+        label: str = self.__labels.get(code)
+        if label is None:
+            label = '%s (%s:%s)' % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+            self.__labels[code] = label
+        return label
+
+    def __run(self) -> None:
+        own: int = threading.get_ident()
+        while not self.__stopping.wait(self.__interval):
+            start: float = time.perf_counter()
+            calls: Dict[int, str] = self.__calls
+            stacks: Dict[str, int] = self.__stacks
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                name: str = calls.get(ident)
+                if name is None:
+                    key: str = NO_CALL + ';' + self.__get_label(frame.f_code)
+                else:
+                    labels: list = list()
+                    # The frames of the server above the call are not part of the stack
+                    while frame is not None and frame.f_code is not _INVOKE_CODE and len(labels) < MAX_DEPTH:
+                        labels.append(self.__get_label(frame.f_code))
+                        frame = frame.f_back
+                    labels.append(name)
+                    key = ';'.join(reversed(labels))
+                    self.__samples[name] = self.__samples.get(name, 0) + 1
+                stacks[key] = stacks.get(key, 0) + 1
+            del frame
+            self.__sampling_time += time.perf_counter() - start
+            if self.__sampling_time > MAX_OVERHEAD * (time.monotonic() - self.__started_at) and self.__interval < 1.0:
+                self.__interval = self.__interval * 2
+
+    def get_results(self, mode: str=None) -> tuple:
+        """Return the results of the current or last profiling"""
+        mode = mode or self.__mode
+        elapsed: float = time.monotonic() - self.__started_at
+        if mode == SAMPLING:
+            collapsed: str = '\n'.join('%s %s' % (k, v) for k, v in sorted(dict(self.__stacks).items()))
+            return (('mode', mode), ('elapsed', elapsed), ('interval', self.__interval),
+                    ('overhead', self.__sampling_time / elapsed if elapsed > 0 else 0.0),
+                    ('samples', tuple(sorted(dict(self.__samples).items(), key=lambda i: -i[1]))), ('collapsed', collapsed))
+        with self.__lock:
+            stats: Dict[str, pstats.Stats] = dict(self.__stats)
+            counts: tuple = tuple(sorted(self.__counts.items(), key=lambda i: -i[1]))
+        report: io.StringIO = io.StringIO()
+        for name, value in stats.items():
+            report.write('%s\n' % name)
+            value.stream = report
+            value.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(REPORT_LINES)
+        return (('mode', mode), ('elapsed', elapsed), ('calls', counts), ('skipped', self.__skipped),
+                ('stats', tuple((k, marshal.dumps(v.stats)) for k, v in stats.items())), ('report', report.getvalue()))
+
+
+_INVOKE_CODE: Any = CallProfiler.invoke.__code__
+PROFILER: CallProfiler = CallProfiler()
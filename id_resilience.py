@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+# Deadlines, heartbeats and circuit breakers of the client connections
+# A call is bounded by the deadline of the calling thread (see deadline) and by the timeout of its provider.
+# The heartbeat pings the pooled connections, a host which does not answer opens its circuit breaker so the
+# calls fail immediately until a background probe succeeds.
+import contextlib
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterator
+from id_logging_utils import get_child_logger
+
+# Interval in seconds between two heartbeats or probes of a host
+HEARTBEAT_INTERVAL: float = float(os.environ.get('ID_HEARTBEAT_INTERVAL', '5'))
+# Maximum delay in seconds of the echo of a heartbeat
+HEARTBEAT_TIMEOUT: float = float(os.environ.get('ID_HEARTBEAT_TIMEOUT', '2'))
+# Number of consecutive transport failures opening the circuit breaker
+FAILURE_THRESHOLD: int = int(os.environ.get('ID_FAILURE_THRESHOLD', '3'))
+# Number of consecutive failed heartbeats opening the circuit breaker
+HEARTBEAT_FAILURE_THRESHOLD: int = int(os.environ.get('ID_HEARTBEAT_FAILURE_THRESHOLD', '3'))
+# Default timeout in seconds of the calls, the timeout of the connection is used if not specified
+CALL_TIMEOUT: float = float(os.environ['ID_CALL_TIMEOUT']) if os.environ.get('ID_CALL_TIMEOUT') else None
+
+__local: threading.local = threading.local()
+
+
+class CallTimeoutException(TimeoutError):
+    """Raised when the deadline of a call expires"""
+    pass
+
+
+class CircuitOpenException(ConnectionError):
+    """Raised without any network access when the host is known to be unreachable"""
+    pass
+
+
+def is_transport_failure(ex: BaseException) -> bool:
+    """
+    Return true if the given exception is caused by the connection and not raised by the remote provider.
+    Timeouts are not failures of the connection, the call may only be slow.
+    """
+    return isinstance(ex, (EOFError, ConnectionError)) and not hasattr(ex, '_remote_tb')
+
+
+@contextlib.contextmanager
+def deadline(seconds: float) -> Iterator[None]:
+    """
+    Bound the remote calls of the current thread, nested deadlines cannot extend the enclosing one.
+    Usage: with deadline(0.5): provider.digitalRead(0)
+    :param seconds: the delay
+    """
+    previous: float = getattr(__local, 'deadline', None)
+    value: float = time.monotonic() + seconds
+    __local.deadline = value if previous is None else min(previous, value)
+    try:
+        yield
+    finally:
+        __local.deadline = previous
+
+
+def get_call_timeout(timeout: float=None) -> float:
+    """
+    Return the delay allowed for a call.
+    :param timeout: the timeout of the provider
+    :return: the delay in seconds or None if the call is not bounded
+    """
+    value: float = getattr(__local, 'deadline', None)
+    if value is None:
+        return timeout
+    remaining: float = value - time.monotonic()
+    if remaining <= 0:
+        raise CallTimeoutException('Deadline expired')
+    return remaining if timeout is None else min(remaining, timeout)
+
+
+class CircuitBreaker(object):
+    """State of the connectivity of a host"""
+
+    def __init__(self, parent_logger: logging.Logger, name: str, failure_threshold: int=FAILURE_THRESHOLD, heartbeat_failure_threshold: int=HEARTBEAT_FAILURE_THRESHOLD):
+        self.__logger: logging.Logger = get_child_logger(parent_logger, self.__class__.__name__)
+        self.__name: str = name
+        self.__failure_threshold: int = failure_threshold
+        self.__heartbeat_failure_threshold: int = heartbeat_failure_threshold
+        self.__failures: int = 0
+        self.__heartbeat_failures: int = 0
+        self.__open: bool = False
+        # The calls of many threads and the heartbeat update the counters
+        self.__lock: threading.Lock = threading.Lock()
+
+    def is_open(self) -> bool:
+        return self.__open
+
+    def check(self) -> None:
+        if self.__open:
+            raise CircuitOpenException('Host unreachable: %s' % self.__name)
+
+    def record_success(self) -> None:
+        with self.__lock:
+            self.__failures = 0
+            self.__heartbeat_failures = 0
+            closed: bool = self.__open
+            self.__open = False
+        if closed:
+            self.__logger.info('Host reachable again: %s', self.__name)
+
+    def record_failure(self) -> None:
+        with self.__lock:
+            self.__failures += 1
+            tripped: bool = self.__failures >= self.__failure_threshold and self.__trip()
+        if tripped:
+            self.__logger.warning('Host unreachable: %s', self.__name)
+
+    def record_heartbeat_failure(self) -> None:
+        with self.__lock:
+            self.__heartbeat_failures += 1
+            tripped: bool = self.__heartbeat_failures >= self.__heartbeat_failure_threshold and self.__trip()
+        if tripped:
+            self.__logger.warning('Host unreachable: %s', self.__name)
+
+    def trip(self) -> None:
+        with self.__lock:
+            tripped: bool = self.__trip()
+        if tripped:
+            self.__logger.warning('Host unreachable: %s', self.__name)
+
+    def __trip(self) -> bool:
+        # Called holding the lock, return true if the breaker was closed
+        if self.__open:
+            return False
+        self.__open = True
+        return True
+
+
+class HeartbeatMonitor(object):
+    """
+    Single thread probing the registered hosts.
+    The probe of a host pings its connections and reconnects its registry if needed, it raises an exception on failure.
+    """
+
+    def __init__(self, parent_logger: logging.Logger, interval: float=HEARTBEAT_INTERVAL):
+        self.__logger: logging.Logger = get_child_logger(parent_logger, self.__class__.__name__)
+        self.__interval: float = interval
+        self.__probes: Dict[str, tuple] = dict()
+        self.__condition: threading.Condition = threading.Condition()
+        self.__thread: threading.Thread = None
+        self.__active: bool = False
+
+    def add(self, name: str, breaker: CircuitBreaker, probe: Callable[[], None]) -> None:
+        with self.__condition:
+            self.__probes[name] = (breaker, probe)
+            if self.__interval > 0 and (self.__thread is None or not self.__thread.is_alive()):
+                self.__active = True
+                self.__thread = threading.Thread(target=self.__run, name=self.__class__.__name__, daemon=True)
+                self.__thread.start()
+
+    def remove(self, name: str) -> None:
+        with self.__condition:
+            self.__probes.pop(name, None)
+
+    def probe(self, name: str) -> bool:
+        """Probe the given host immediately, return true if reachable, the breaker opens after consecutive failures"""
+        breaker, probe = self.__probes[name]
+        try:
+            probe()
+            breaker.record_success()
+            return True
+        except Exception as ex:
+            self.__logger.debug('Probe of %s failed: %s', name, ex)
+            breaker.record_heartbeat_failure()
+            return False
+
+    def __run(self) -> None:
+        while True:
+            with self.__condition:
+                self.__condition.wait(self.__interval)
+                if not self.__active:
+                    return
+                names: list = list(self.__probes.keys())
+            for name in names:
+                if name in self.__probes:
+                    self.probe(name)
+
+    def stop(self) -> None:
+        with self.__condition:
+            self.__active = False
+            self.__probes.clear()
+            self.__condition.notify_all()
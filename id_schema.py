@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+# Declarative schemas of the methods of the providers
+# The abstract provider declares the arguments of its methods in _SCHEMAS: method name -> tuple of Arg, and its
+# services refer to the same declaration. From it:
+# - the abstract methods of the provider are generated, their signatures using the names of the arguments, see
+#   make_abstract_method
+# - the exposed methods of the services are wrapped by a validator checking the arguments before the call, local and
+#   remote calls alike, so the methods no longer code their checks
+# - the arguments declared using many() are sequences (tuple or packed, see id_buffer_utils) validated in a single pass
+#   and passed to the method as an array.array, a single value is repeated to the length of the other sequences
+# - a batch variant <method>_many is generated for each method without sequence arguments, each argument being either
+#   a sequence having one value per call or a single value used by all the calls. The calls are validated once per
+#   batch and their results are returned as a tuple, see apply_schemas
+# - the client stubs declare the batch variants, see FunctionProviderStub
+import array
+import inspect
+from typing import Any, Callable, Dict
+from id_buffer_utils import as_array, check_range, is_buffer, is_netref
+from id_tracing import span
+
+MANY_SUFFIX: str = '_many'
+_COUNT_ERROR_MSG: str = 'Method %s expects %s arguments, got %s.'
+_LENGTH_ERROR_MSG: str = 'Sequences of arguments of %s must have the same length.'
+_NO_SEQUENCE_ERROR_MSG: str = 'At least one argument of %s must be a sequence.'
+_BOOL_ERROR_MSG: str = 'Argument %s must be a boolean.'
+# Marker of the validated methods so that an inherited method is not wrapped twice
+_SCHEMA_ATTR: str = '_schema'
+
+
+def _typecode(minimum: float, maximum: float) -> str:
+    if minimum is not None and minimum >= 0:
+        if maximum is not None and maximum <= 0xFF:
+            return 'B'
+        if maximum is not None and maximum <= 0xFFFF:
+            return 'H'
+    return 'q'
+
+
+class Arg(object):
+    """Declaration of an argument: its type, its range and the message of the error raised for an invalid value"""
+    __slots__ = ('name', 'typecode', 'minimum', 'maximum', 'message', 'is_many', 'convert')
+
+    def __init__(self, name: str, typecode: str=None, minimum: float=None, maximum: float=None, message: str=None, convert: Callable=None):
+        """
+        :param name: the name of the argument
+        :param typecode: the type code of the values in an array, None if the values are not checked
+        :param minimum: the minimum value, inclusive
+        :param maximum: the maximum value, inclusive
+        :param message: the message of the error
+        :param convert: the function converting a single value before its comparison, int or float
+        """
+        self.name: str = name
+        self.typecode: str = typecode
+        self.minimum: float = minimum
+        self.maximum: float = maximum
+        self.message: str = message
+        self.convert: Callable = convert
+        self.is_many: bool = False
+
+    def many(self, name: str=None) -> 'Arg':
+        """Return the declaration of a sequence of this argument"""
+        result: Arg = Arg(name or self.name, self.typecode, self.minimum, self.maximum, self.message, self.convert)
+        result.is_many = True
+        return result
+
+    def check(self, value: Any) -> None:
+        convert: Callable = self.convert
+        if convert is None:
+            return
+        if value is None:
+            raise ValueError(self.message)
+        try:
+            value = convert(value)
+        except (TypeError, ValueError):
+            raise ValueError(self.message)
+        if (self.minimum is not None and value < self.minimum) or (self.maximum is not None and value > self.maximum):
+            raise ValueError(self.message)
+
+    def is_sequence(self, value: Any) -> bool:
+        # A remote reference is a single value such as a callback when not checked, isinstance() would request its
+        # remote class. Otherwise it is rejected by check_all with the message explaining how to pass the sequence.
+        if is_netref(value):
+            return self.typecode is not None
+        # Lists are only received from the local calls, a remote list is a reference
+        return isinstance(value, (tuple, list)) or (self.typecode is not None and is_buffer(value))
+
+    def check_all(self, value: Any) -> Any:
+        """Validate a sequence in a single pass, return an array or the tuple of the values when not checked"""
+        if self.typecode is None:
+            if self.convert is not None:
+                for item in value:
+                    self.check(item)
+            return value
+        values: array.array = as_array(value, self.name, self.message, self.typecode)
+        if self.minimum is not None or self.maximum is not None:
+            check_range(values, self.minimum if self.minimum is not None else float('-inf'),
+                        self.maximum if self.maximum is not None else float('inf'), self.message)
+        return values
+
+    def repeat(self, value: Any, count: int) -> Any:
+        """Return a sequence having the given value count times"""
+        if self.typecode is None:
+            return (value,) * count
+        self.check(value)
+        try:
+            return array.array(self.typecode, (value,)) * count
+        except (OverflowError, TypeError):
+            raise ValueError(self.message)
+
+
+def Int(name: str, minimum: int=None, maximum: int=None, message: str=None) -> Arg:
+    return Arg(name, _typecode(minimum, maximum), minimum, maximum, message, int)
+
+
+def Float(name: str, minimum: float=None, maximum: float=None, message: str=None) -> Arg:
+    return Arg(name, 'd', minimum, maximum, message, float)
+
+
+def Bool(name: str) -> Arg:
+    return Arg(name, 'B', message=_BOOL_ERROR_MSG % name)
+
+
+def Choice(name: str, values: tuple, message: str=None) -> Arg:
+    """Argument having one of the given values"""
+
+    def convert(value: Any) -> Any:
+        if value not in values:
+            raise ValueError(message)
+        return value
+
+    return Arg(name, message=message, convert=convert)
+
+
+def Value(name: str) -> Arg:
+    """Argument passed as is, a tuple is a sequence of values in a batch"""
+    return Arg(name)
+
+
+def _annotation(arg: Arg) -> Any:
+    if arg.is_many:
+        return Any
+    if arg.convert is int or arg.convert is float:
+        return arg.convert
+    # Bool() is checked using its array of booleans only
+    if arg.typecode == 'B' and arg.convert is None:
+        return bool
+    return Any
+
+
+def make_abstract_method(name: str, schema: tuple) -> Callable:
+    """Return the declaration of a method of an abstract provider, its signature being generated from its schema"""
+
+    def method(self, *args, **kwargs):
+        pass
+
+    parameters: list = [inspect.Parameter('self', inspect.Parameter.POSITIONAL_OR_KEYWORD)]
+    parameters.extend(inspect.Parameter(a.name, inspect.Parameter.POSITIONAL_OR_KEYWORD, annotation=_annotation(a))
+                      for a in schema)
+    method.__name__ = name
+    method.__signature__ = inspect.Signature(parameters)
+    return method
+
+
+def _check_sequences(method_name: str, schema: tuple, args: tuple, all_many: bool) -> list:
+    """
+    Validate the arguments of a call, the sequences are decoded and the single values of sequences are repeated.
+    :param method_name: the name of the method used in the error messages
+    :param schema: the declarations of the arguments
+    :param args: the arguments
+    :param all_many: true if all the arguments can be sequences (batch variant)
+    :return: the arguments
+    """
+    result: list = list(args)
+    count: int = -1
+    singles: list = list()
+    for i, arg in enumerate(schema[:len(args)]):
+        value: Any = args[i]
+        if not (all_many or arg.is_many):
+            arg.check(value)
+            continue
+        if not arg.is_sequence(value):
+            singles.append(i)
+            continue
+        value = arg.check_all(value)
+        if count < 0:
+            count = len(value)
+        elif len(value) != count:
+            raise ValueError(_LENGTH_ERROR_MSG % method_name)
+        result[i] = value
+    if singles:
+        if count < 0:
+            if all_many:
+                raise ValueError(_NO_SEQUENCE_ERROR_MSG % method_name)
+            count = 1
+        for i in singles:
+            result[i] = schema[i].repeat(args[i], count)
+    return result
+
+
+def _make_validated(name: str, method: Callable, schema: tuple) -> Callable:
+    if any(a.is_many for a in schema):
+
+        def validated(self, *args, **kwargs):
+            args = _bind(name, schema, args, kwargs)
+            if len(args) > len(schema):
+                raise ValueError(_COUNT_ERROR_MSG % (name, len(schema), len(args)))
+            with span('validation'):
+                args = _check_sequences(name, schema, args, False)
+            return method(self, *args, **kwargs)
+
+    else:
+        checks: tuple = tuple(a.check for a in schema if a.convert is not None)
+        indexes: tuple = tuple(i for i, a in enumerate(schema) if a.convert is not None)
+
+        def validated(self, *args, **kwargs):
+            args = _bind(name, schema, args, kwargs)
+            if len(args) > len(schema):
+                raise ValueError(_COUNT_ERROR_MSG % (name, len(schema), len(args)))
+            for check, i in zip(checks, indexes):
+                if i < len(args):
+                    check(args[i])
+            return method(self, *args, **kwargs)
+
+    validated.__name__ = method.__name__
+    validated.__doc__ = method.__doc__
+    validated.__wrapped__ = method
+    setattr(validated, _SCHEMA_ATTR, schema)
+    return validated
+
+
+def _make_many(name: str, attribute: str, schema: tuple) -> Callable:
+    many_name: str = name + MANY_SUFFIX
+
+    def many(self, *args) -> tuple:
+        if len(args) != len(schema):
+            raise ValueError(_COUNT_ERROR_MSG % (many_name, len(schema), len(args)))
+        with span('validation'):
+            columns: list = _check_sequences(many_name, schema, args, True)
+        # The method of the class of the service without its validator, it may be overridden by a subclass
+        method: Callable = getattr(type(self), attribute)
+        method = getattr(method, '__wrapped__', method)
+        with span('backend'):
+            return tuple(method(self, *call) for call in zip(*columns))
+
+    many.__name__ = 'exposed_' + many_name
+    many.__doc__ = 'Batch variant of %s, each argument is a sequence having one value per call or a single value for all the calls' % name
+    setattr(many, _SCHEMA_ATTR, schema)
+    return many
+
+
+def has_batch(schema: tuple) -> bool:
+    """Return true if a batch variant is generated, the methods having sequences are already bulk methods"""
+    return bool(schema) and not any(a.is_many for a in schema)
+
+
+def _bind(name: str, schema: tuple, args: tuple, kwargs: dict) -> tuple:
+    """Return the positional arguments including the keyword arguments declared by the schema"""
+    if not kwargs:
+        return args
+    result: list = list(args)
+    for arg in schema[len(args):]:
+        if arg.name not in kwargs:
+            break
+        result.append(kwargs.pop(arg.name))
+    return tuple(result)
+
+
+def apply_schemas(cls: type, schemas: Dict[str, tuple], prefix: str='exposed_') -> None:
+    """
+    Wrap the exposed methods of the given service class by their validators and add their batch variants.
+    :param cls: the class of the service
+    :param schemas: the schemas by method name
+    :param prefix: the prefix of the exposed methods
+    """
+    for name, schema in schemas.items():
+        attribute: str = prefix + name
+        method: Callable = cls.__dict__.get(attribute)
+        if method is None or getattr(method, _SCHEMA_ATTR, None) is not None:
+            continue
+        setattr(cls, attribute, _make_validated(name, method, schema))
+        if has_batch(schema) and prefix + name + MANY_SUFFIX not in cls.__dict__:
+            setattr(cls, prefix + name + MANY_SUFFIX, _make_many(name, attribute, schema))
+
+
+def add_batch_session_methods(session_methods: dict, schemas: Dict[str, tuple]) -> None:
+    """Record the batch variants of the methods defining the state of a session as calls of the methods, see id_session"""
+    for name in schemas:
+        spec: tuple = session_methods.get(name)
+        # The state of the methods without key arguments is defined by their last call only
+        if spec is not None and spec[1] > 0 and spec[2] is None and has_batch(schemas[name]) and name + MANY_SUFFIX not in session_methods:
+            session_methods[name + MANY_SUFFIX] = (spec[0], spec[1], name)
+
+
+def get_batch_names(schemas: Dict[str, tuple]) -> tuple:
+    return tuple(n + MANY_SUFFIX for n, s in schemas.items() if has_batch(s))
@@ -0,0 +1,479 @@
+# -*- coding: utf-8 -*-
+# Restricted scripts executed by the server next to the hardware
+# A script is a subset of Python parsed using ast and interpreted node by node, it is never compiled so it cannot
+# reach any object of the server. The script can use:
+# - the literals, the variables (names not starting with '_'), the arithmetic, bitwise, boolean and comparison
+#   operators, the tuples, lists and subscripts
+# - the statements: assignment, if, while, for, break, continue, pass and return (the result of the script)
+# - the calls of the providers as <alias>.<method>(...), the alias is the name of the provider class without the
+#   FunctionProvider suffix in lower case (wiringpi.digitalRead(3))
+# - the functions of BUILTINS: sleep(seconds), emit(*values) streaming an event to the client, elapsed() returning the
+#   seconds since the start, and len, range, abs, min, max, int, float, bool, round, str, tuple, list, sum, any, all
+# Imports, function definitions, attributes, keyword arguments and comprehensions are rejected by parse().
+# Each script has a budget: a maximum number of evaluated nodes (ID_SCRIPT_MAX_STEPS) and a maximum duration
+# including its sleeps (ID_SCRIPT_MAX_DURATION). The integers, strings and sequences are bound so that a single
+# operation cannot exhaust the memory or the CPU. As a sequence can contain the same sequence many times, the
+# operations visiting the nested elements (comparisons, emitted events, result and functions such as max) consume a
+# step per visited element, up to MAX_SIZE elements per value. A script can be cancelled at any step, a sleep is
+# interrupted.
+import ast
+import operator
+import os
+import threading
+import time
+from typing import Any, Callable, Dict
+from id_buffer_utils import is_netref
+
+MAX_STEPS: int = int(os.environ.get('ID_SCRIPT_MAX_STEPS', '1000000'))
+MAX_DURATION: float = float(os.environ.get('ID_SCRIPT_MAX_DURATION', '60'))
+MAX_SOURCE_LENGTH: int = 16384
+# Maximum length of the strings and sequences and number of bits of the integers
+MAX_LENGTH: int = 4096
+MAX_INT_BITS: int = 256
+# Maximum number of elements of a value including its nested elements
+MAX_SIZE: int = 65536
+# Maximum depth of the sequences passed to and returned by the scripts
+MAX_DEPTH: int = 4
+PENDING: str = 'pending'
+RUNNING: str = 'running'
+DONE: str = 'done'
+FAILED: str = 'failed'
+CANCELLED: str = 'cancelled'
+BUILTINS: tuple = ('sleep', 'emit', 'elapsed', 'len', 'range', 'abs', 'min', 'max', 'int', 'float', 'bool', 'round',
+                   'str', 'tuple', 'list', 'sum', 'any', 'all')
+_VALUE_TYPES: tuple = (bool, int, float, str, bytes, type(None))
+_SEQUENCE_TYPES: tuple = (str, bytes, tuple, list)
+_ITERABLE_TYPES: tuple = (str, bytes, tuple, list, range)
+_BIN_OPS: dict = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod, ast.Pow: operator.pow, ast.LShift: operator.lshift,
+    ast.RShift: operator.rshift, ast.BitOr: operator.or_, ast.BitXor: operator.xor, ast.BitAnd: operator.and_
+}
+_UNARY_OPS: dict = {ast.UAdd: operator.pos, ast.USub: operator.neg, ast.Not: operator.not_, ast.Invert: operator.invert}
+_COMPARE_OPS: dict = {
+    ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Lt: operator.lt, ast.LtE: operator.le, ast.Gt: operator.gt,
+    ast.GtE: operator.ge, ast.In: lambda a, b: a in b, ast.NotIn: lambda a, b: a not in b, ast.Is: operator.is_,
+    ast.IsNot: operator.is_not
+}
+_NODES: tuple = (ast.Module, ast.Expr, ast.Assign, ast.AugAssign, ast.If, ast.While, ast.For, ast.Break,
+                 ast.Continue, ast.Pass, ast.Return, ast.BoolOp, ast.And, ast.Or, ast.BinOp, ast.UnaryOp, ast.Compare,
+                 ast.IfExp, ast.Call, ast.Attribute, ast.Name, ast.Constant, ast.Tuple, ast.List, ast.Subscript,
+                 ast.Slice, ast.Load, ast.Store) + tuple(_BIN_OPS) + tuple(_UNARY_OPS) + tuple(_COMPARE_OPS)
+# Subscripts of Python 3.8
+if hasattr(ast, 'Index'):
+    _NODES += (ast.Index,)
+_SYNTAX_ERROR_MSG: str = 'Line %s: %s'
+_NOT_ALLOWED_MSG: str = 'Line %s: %s is not allowed'
+_NAME_ERROR_MSG: str = "Line %s: name '%s' is not defined"
+_METHOD_ERROR_MSG: str = 'Line %s: method %s of %s is not available'
+_SOURCE_ERROR_MSG: str = 'Script must be a string of at most %s characters.' % MAX_SOURCE_LENGTH
+_VARIABLE_ERROR_MSG: str = 'Invalid variable: %s'
+_VALUE_ERROR_MSG: str = 'Values must be numbers, strings, bytes, booleans, None or sequences of at most %s elements and depth %s.' % (MAX_LENGTH, MAX_DEPTH)
+_SIZE_ERROR_MSG: str = 'value of more than %s elements including the nested ones' % MAX_SIZE
+
+
+class ScriptError(RuntimeError):
+    """Error of a script, its message gives the line of the failing statement"""
+    pass
+
+
+class ScriptCancelled(ScriptError):
+    pass
+
+
+class _Break(Exception):
+    pass
+
+
+class _Continue(Exception):
+    pass
+
+
+class _Return(Exception):
+
+    def __init__(self, value: Any):
+        super().__init__()
+        self.value: Any = value
+
+
+def export_value(value: Any) -> Any:
+    """
+    Return the given value as passed to or returned by a script, the lists are converted to tuples so that they are
+    passed by value, ValueError is raised for the other types and the values of more than MAX_SIZE elements.
+    """
+    return _export(value, 0, [0])
+
+
+def _export(value: Any, depth: int, size: list) -> Any:
+    size[0] += 1
+    if size[0] > MAX_SIZE:
+        raise ValueError(_SIZE_ERROR_MSG)
+    if isinstance(value, _VALUE_TYPES) and not is_netref(value):
+        if isinstance(value, (str, bytes)) and len(value) > MAX_LENGTH:
+            raise ValueError(_VALUE_ERROR_MSG)
+        return value
+    if not is_netref(value) and isinstance(value, (tuple, list)) and depth < MAX_DEPTH and len(value) <= MAX_LENGTH:
+        return tuple(_export(v, depth + 1, size) for v in value)
+    raise ValueError(_VALUE_ERROR_MSG)
+
+
+def _get_size(value: Any) -> int:
+    """Return the number of elements of the given value including the nested ones, ScriptError is raised above MAX_SIZE"""
+    result: int = 0
+    # Iterative walk as the depth of the sequences of a script is not bound
+    pending: list = [value]
+    while pending:
+        current: Any = pending.pop()
+        result += 1
+        if result > MAX_SIZE:
+            raise ScriptError(_SIZE_ERROR_MSG)
+        if isinstance(current, (tuple, list)):
+            pending.extend(current)
+    return result
+
+
+def _check_node(node: ast.AST, calls: set, providers: Dict[str, frozenset]) -> None:
+    line: int = getattr(node, 'lineno', '?')
+    if not isinstance(node, _NODES):
+        raise ValueError(_NOT_ALLOWED_MSG % (line, node.__class__.__name__))
+    if isinstance(node, ast.Name):
+        if node.id.startswith('_'):
+            raise ValueError(_NOT_ALLOWED_MSG % (line, node.id))
+        if (node.id in BUILTINS or node.id in providers) and id(node) not in calls:
+            raise ValueError(_NOT_ALLOWED_MSG % (line, 'use of %s as a value' % node.id))
+    elif isinstance(node, ast.Attribute):
+        if id(node) not in calls or not isinstance(node.value, ast.Name) or node.value.id not in providers:
+            raise ValueError(_NOT_ALLOWED_MSG % (line, 'attribute ' + node.attr))
+        if node.attr not in providers[node.value.id]:
+            raise ValueError(_METHOD_ERROR_MSG % (line, node.attr, node.value.id))
+    elif isinstance(node, ast.Call):
+        if node.keywords:
+            raise ValueError(_NOT_ALLOWED_MSG % (line, 'keyword argument'))
+        if isinstance(node.func, ast.Name):
+            if node.func.id not in BUILTINS:
+                raise ValueError(_NAME_ERROR_MSG % (line, node.func.id))
+        elif not isinstance(node.func, ast.Attribute):
+            raise ValueError(_NOT_ALLOWED_MSG % (line, 'call of an expression'))
+        calls.add(id(node.func))
+        calls.add(id(getattr(node.func, 'value', None)))
+    elif isinstance(node, ast.Constant):
+        if not isinstance(node.value, _VALUE_TYPES) or (isinstance(node.value, (str, bytes)) and len(node.value) > MAX_LENGTH):
+            raise ValueError(_NOT_ALLOWED_MSG % (line, 'constant %r' % (node.value,)))
+    elif isinstance(node, (ast.Assign, ast.For)):
+        for target in (node.targets if isinstance(node, ast.Assign) else (node.target,)):
+            names: list = target.elts if isinstance(target, (ast.Tuple, ast.List)) else [target]
+            if not all(isinstance(n, ast.Name) or (isinstance(n, ast.Subscript) and isinstance(node, ast.Assign)) for n in names):
+                raise ValueError(_NOT_ALLOWED_MSG % (line, 'assignment target'))
+            for n in names:
+                if isinstance(n, ast.Name) and (n.id in BUILTINS or n.id in providers):
+                    raise ValueError(_NOT_ALLOWED_MSG % (line, 'assignment of ' + n.id))
+    elif isinstance(node, ast.AugAssign) and not isinstance(node.target, ast.Name):
+        raise ValueError(_NOT_ALLOWED_MSG % (line, 'assignment target'))
+
+
+def parse(source: str, providers: Dict[str, frozenset]) -> ast.Module:
+    """
+    Parse and validate a script.
+    :param source: the source of the script
+    :param providers: the names of the methods allowed by alias of provider
+    :return: the tree of the script
+    """
+    if not isinstance(source, str) or len(source) > MAX_SOURCE_LENGTH:
+        raise ValueError(_SOURCE_ERROR_MSG)
+    try:
+        tree: ast.Module = ast.parse(source, '<script>')
+    except SyntaxError as ex:
+        raise ValueError(_SYNTAX_ERROR_MSG % (ex.lineno, ex.msg))
+    # Names and attributes are only allowed as the functions of the calls, the parents are checked before the children
+    calls: set = set()
+    for node in _walk(tree):
+        _check_node(node, calls, providers)
+    return tree
+
+
+def _walk(node: ast.AST):
+    """Breadth first walk of the tree, unlike ast.walk the fields are visited in order"""
+    pending: list = [node]
+    while pending:
+        current: ast.AST = pending.pop(0)
+        yield current
+        pending.extend(ast.iter_child_nodes(current))
+
+
+def _check_value(value: Any) -> Any:
+    if isinstance(value, int) and value.bit_length() > MAX_INT_BITS:
+        raise ScriptError('integer too large')
+    if isinstance(value, _SEQUENCE_TYPES) and len(value) > MAX_LENGTH:
+        raise ScriptError('sequence too long')
+    return value
+
+
+class Script(object):
+
+    def __init__(self, source: str, providers: Dict[str, frozenset], invoke: Callable[[str, str, tuple], Any],
+                 emit: Callable[[tuple], None], variables: Dict[str, Any]=None, max_steps: int=MAX_STEPS,
+                 max_duration: float=MAX_DURATION):
+        """
+        :param source: the source of the script
+        :param providers: the names of the methods allowed by alias of provider
+        :param invoke: the function invoked with (alias, method, args) for the calls of the providers
+        :param emit: the function invoked with the tuple of values of each event
+        :param variables: the initial variables
+        :param max_steps: the maximum number of evaluated nodes
+        :param max_duration: the maximum duration in seconds
+        """
+        self.__tree: ast.Module = parse(source, providers)
+        self.__providers: Dict[str, frozenset] = providers
+        self.__invoke: Callable[[str, str, tuple], Any] = invoke
+        self.__emit: Callable[[tuple], None] = emit
+        self.__variables: Dict[str, Any] = dict()
+        for name, value in (variables or dict()).items():
+            if not isinstance(name, str) or not name.isidentifier() or name.startswith('_') or name in BUILTINS or name in providers:
+                raise ValueError(_VARIABLE_ERROR_MSG % (name,))
+            self.__variables[name] = export_value(value)
+        self.__max_steps: int = max_steps
+        self.__max_duration: float = max_duration
+        self.__deadline: float = 0
+        self.__start: float = 0
+        self.__line: int = 0
+        self.__cancelled: threading.Event = threading.Event()
+        self.__builtins: Dict[str, Callable] = {
+            'sleep': self.__sleep, 'emit': self.__emit_event, 'elapsed': self.get_elapsed, 'len': len,
+            'range': range, 'abs': abs, 'min': self.__bounded(min), 'max': self.__bounded(max), 'int': int,
+            'float': float, 'bool': bool, 'round': round, 'str': self.__str, 'tuple': self.__bounded(tuple),
+            'list': self.__bounded(list), 'sum': self.__bounded(sum), 'any': self.__bounded(any),
+            'all': self.__bounded(all)
+        }
+        self.state: str = PENDING
+        self.steps: int = 0
+        self.calls: int = 0
+        self.events: int = 0
+
+    def run(self) -> Any:
+        """Execute the script in the calling thread and return its result, ScriptError is raised if it fails"""
+        self.__start = time.monotonic()
+        self.__deadline = self.__start + self.__max_duration
+        self.state = RUNNING
+        try:
+            self.__exec_block(self.__tree.body)
+            result: Any = None
+        except _Return as ex:
+            result = ex.value
+        except ScriptCancelled:
+            self.state = CANCELLED
+            raise
+        except ScriptError as ex:
+            self.state = FAILED
+            raise ScriptError(_SYNTAX_ERROR_MSG % (self.__line, ex))
+        except (_Break, _Continue):
+            self.state = FAILED
+            raise ScriptError(_SYNTAX_ERROR_MSG % (self.__line, 'break or continue outside of a loop'))
+        except Exception as ex:
+            self.state = FAILED
+            raise ScriptError(_SYNTAX_ERROR_MSG % (self.__line, '%s: %s' % (ex.__class__.__name__, ex)))
+        try:
+            self.__consume(_get_size(result))
+            result = export_value(result)
+        except (ScriptError, ValueError) as ex:
+            self.state = FAILED
+            raise ScriptError(str(ex))
+        self.state = DONE
+        return result
+
+    def cancel(self) -> None:
+        self.__cancelled.set()
+
+    def get_elapsed(self) -> float:
+        return time.monotonic() - self.__start if self.__start else 0.0
+
+    def __step(self, node: ast.AST) -> None:
+        self.steps += 1
+        line: int = getattr(node, 'lineno', None)
+        if line:
+            self.__line = line
+        if self.__cancelled.is_set():
+            raise ScriptCancelled('cancelled')
+        if self.steps > self.__max_steps:
+            raise ScriptError('budget of %s steps exceeded' % self.__max_steps)
+        if not self.steps & 0xFF and time.monotonic() > self.__deadline:
+            raise ScriptError('budget of %s seconds exceeded' % self.__max_duration)
+
+    def __consume(self, count: int) -> None:
+        """Consume a step per element visited by an operation"""
+        self.steps += count
+        if self.steps > self.__max_steps:
+            raise ScriptError('budget of %s steps exceeded' % self.__max_steps)
+        if time.monotonic() > self.__deadline:
+            raise ScriptError('budget of %s seconds exceeded' % self.__max_duration)
+
+    def __exec_block(self, body: list) -> None:
+        for statement in body:
+            self.__exec(statement)
+
+    def __exec(self, node: ast.AST) -> None:
+        self.__step(node)
+        kind: type = type(node)
+        if kind is ast.Expr:
+            self.__eval(node.value)
+        elif kind is ast.Assign:
+            value: Any = self.__eval(node.value)
+            for target in node.targets:
+                self.__assign(target, value)
+        elif kind is ast.AugAssign:
+            name: str = node.target.id
+            if name not in self.__variables:
+                raise ScriptError("name '%s' is not defined" % name)
+            self.__variables[name] = self.__binary(node.op, self.__variables[name], self.__eval(node.value))
+        elif kind is ast.If:
+            self.__exec_block(node.body if self.__eval(node.test) else node.orelse)
+        elif kind is ast.While:
+            while self.__eval(node.test):
+                try:
+                    self.__exec_block(node.body)
+                except _Break:
+                    break
+                except _Continue:
+                    continue
+            else:
+                self.__exec_block(node.orelse)
+        elif kind is ast.For:
+            iterable: Any = self.__eval(node.iter)
+            if not isinstance(iterable, _ITERABLE_TYPES):
+                raise ScriptError('%s is not iterable' % iterable.__class__.__name__)
+            for item in iterable:
+                self.__assign(node.target, item)
+                try:
+                    self.__exec_block(node.body)
+                except _Break:
+                    break
+                except _Continue:
+                    continue
+            else:
+                self.__exec_block(node.orelse)
+        elif kind is ast.Break:
+            raise _Break()
+        elif kind is ast.Continue:
+            raise _Continue()
+        elif kind is ast.Return:
+            raise _Return(None if node.value is None else self.__eval(node.value))
+
+    def __assign(self, target: ast.AST, value: Any) -> None:
+        if isinstance(target, ast.Name):
+            self.__variables[target.id] = value
+        elif isinstance(target, ast.Subscript):
+            container: Any = self.__eval(target.value)
+            if not isinstance(container, list):
+                raise ScriptError('only the elements of a list can be assigned')
+            container[self.__eval(target.slice)] = value
+            _check_value(container)
+        else:
+            values: tuple = tuple(value) if isinstance(value, _ITERABLE_TYPES) else None
+            if values is None or len(values) != len(target.elts):
+                raise ScriptError('cannot unpack %s values' % len(target.elts))
+            for element, item in zip(target.elts, values):
+                self.__assign(element, item)
+
+    def __eval(self, node: ast.AST) -> Any:
+        self.__step(node)
+        kind: type = type(node)
+        if kind is ast.Constant:
+            return node.value
+        if kind is ast.Name:
+            try:
+                return self.__variables[node.id]
+            except KeyError:
+                raise ScriptError("name '%s' is not defined" % node.id)
+        if kind is ast.BinOp:
+            return self.__binary(node.op, self.__eval(node.left), self.__eval(node.right))
+        if kind is ast.UnaryOp:
+            return _check_value(_UNARY_OPS[type(node.op)](self.__eval(node.operand)))
+        if kind is ast.BoolOp:
+            is_and: bool = isinstance(node.op, ast.And)
+            value: Any = None
+            for operand in node.values:
+                value = self.__eval(operand)
+                if bool(value) != is_and:
+                    return value
+            return value
+        if kind is ast.Compare:
+            left: Any = self.__eval(node.left)
+            for op, comparator in zip(node.ops, node.comparators):
+                right: Any = self.__eval(comparator)
+                if isinstance(left, (tuple, list)) or isinstance(right, (tuple, list)):
+                    self.__consume(_get_size(left) + _get_size(right))
+                if not _COMPARE_OPS[type(op)](left, right):
+                    return False
+                left = right
+            return True
+        if kind is ast.IfExp:
+            return self.__eval(node.body) if self.__eval(node.test) else self.__eval(node.orelse)
+        if kind is ast.Tuple:
+            return _check_value(tuple(self.__eval(e) for e in node.elts))
+        if kind is ast.List:
+            return _check_value([self.__eval(e) for e in node.elts])
+        if kind is ast.Subscript:
+            return self.__eval(node.value)[self.__eval(node.slice)]
+        if kind is ast.Slice:
+            return slice(*(None if v is None else self.__eval(v) for v in (node.lower, node.upper, node.step)))
+        if kind is ast.Call:
+            args: tuple = tuple(self.__eval(a) for a in node.args)
+            func: ast.AST = node.func
+            if isinstance(func, ast.Attribute):
+                self.calls += 1
+                return self.__invoke(func.value.id, func.attr, args)
+            return _check_value(self.__builtins[func.id](*args))
+        # Index of Python 3.8
+        return self.__eval(node.value)
+
+    def __binary(self, op: ast.AST, left: Any, right: Any) -> Any:
+        kind: type = type(op)
+        if kind is ast.Pow and isinstance(left, int) and isinstance(right, int) and left not in (-1, 0, 1) and right > MAX_INT_BITS:
+            raise ScriptError('integer too large')
+        if kind is ast.LShift and isinstance(right, int) and right > MAX_INT_BITS:
+            raise ScriptError('integer too large')
+        # The width of a format is not bounded
+        if kind is ast.Mod and isinstance(left, (str, bytes)):
+            raise ScriptError('string formatting is not allowed')
+        if kind is ast.Mult:
+            sequence: Any = left if isinstance(left, _SEQUENCE_TYPES) else right
+            count: Any = right if sequence is left else left
+            if isinstance(sequence, _SEQUENCE_TYPES) and isinstance(count, int) and len(sequence) * count > MAX_LENGTH:
+                raise ScriptError('sequence too long')
+        return _check_value(_BIN_OPS[kind](left, right))
+
+    def __bounded(self, function: Callable) -> Callable:
+        """Return the given function consuming a step per element of its sequence arguments"""
+
+        def bounded(*args) -> Any:
+            for arg in args:
+                if isinstance(arg, _ITERABLE_TYPES):
+                    if len(arg) > MAX_LENGTH:
+                        raise ScriptError('sequence too long')
+                    # The nested sequences are compared by min and max
+                    self.__consume(_get_size(arg) if isinstance(arg, (tuple, list)) else len(arg))
+            return function(*args)
+
+        return bounded
+
+    def __str(self, value: Any) -> str:
+        if not isinstance(value, _VALUE_TYPES):
+            raise ScriptError('str() of a %s' % value.__class__.__name__)
+        return str(value)
+
+    def __sleep(self, seconds: float) -> None:
+        if not isinstance(seconds, (int, float)) or seconds < 0:
+            raise ScriptError('sleep() expects a positive number of seconds')
+        remaining: float = self.__deadline - time.monotonic()
+        if self.__cancelled.wait(min(seconds, max(0.0, remaining))):
+            raise ScriptCancelled('cancelled')
+        if seconds > remaining:
+            raise ScriptError('budget of %s seconds exceeded' % self.__max_duration)
+
+    def __emit_event(self, *values) -> None:
+        self.__consume(_get_size(values))
+        try:
+            event: tuple = export_value(values)
+        except ValueError as ex:
+            raise ScriptError(str(ex))
+        self.events += 1
+        self.__emit(event)
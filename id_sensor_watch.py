@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+# Conditions evaluated by the server on the samples of a sensor, the clients are notified when they fire
+# The watcher samples the sensor every SAMPLE_INTERVAL seconds while watches are registered and invokes the callback of
+# each watch with (quantity, event, value) when its condition fires, the remote callbacks without waiting.
+# - ThresholdWatch: ABOVE when the value reaches the threshold, BELOW when it falls under threshold - hysteresis
+# - RateWatch: RISING or FALLING when the change since the previous sample reaches the rate, per minute
+# - DeltaWatch: CHANGED when the difference with the last reported value reaches the delta
+# The first sample reports the side of the threshold and the reference value of the delta.
+# A watch is identified by its connection and its arguments, so the same watch registered twice is replaced and
+# registering it without callback removes it.
+import logging
+import os
+import threading
+import time
+import rpyc
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List
+from id_buffer_utils import is_netref
+from id_logging_utils import TRACE, get_child_logger
+
+SAMPLE_INTERVAL: float = float(os.environ.get('ID_WATCH_SAMPLE_INTERVAL', '5'))
+ABOVE: str = 'above'
+BELOW: str = 'below'
+RISING: str = 'rising'
+FALLING: str = 'falling'
+CHANGED: str = 'changed'
+_RATE_ERROR_MSG: str = 'Rate must be a valid number greater than 0.'
+
+
+class Watch(ABC):
+    """Condition on the samples of a quantity"""
+
+    def __init__(self, quantity: str, callback: Any):
+        """
+        :param quantity: the name of the sampled quantity
+        :param callback: the function invoked with (quantity, event, value)
+        """
+        self.quantity: str = quantity
+        self.callback: Any = callback
+        # Remote callbacks are invoked without waiting for their completion
+        self.invoker: Callable = rpyc.async_(callback) if is_netref(callback) else callback
+
+    @abstractmethod
+    def evaluate(self, timestamp: float, value: float) -> str:
+        """Return the event fired by the given sample, None if the condition does not fire"""
+        pass
+
+
+class ThresholdWatch(Watch):
+
+    def __init__(self, quantity: str, callback: Any, threshold: float, hysteresis: float):
+        super().__init__(quantity, callback)
+        self.__threshold: float = threshold
+        self.__hysteresis: float = hysteresis
+        self.__state: str = None
+
+    def evaluate(self, timestamp: float, value: float) -> str:
+        if value >= self.__threshold:
+            state: str = ABOVE
+        elif value < self.__threshold - self.__hysteresis or self.__state is None:
+            state = BELOW
+        else:
+            return None
+        if state == self.__state:
+            return None
+        self.__state = state
+        return state
+
+
+class RateWatch(Watch):
+
+    def __init__(self, quantity: str, callback: Any, rate: float):
+        super().__init__(quantity, callback)
+        if rate <= 0:
+            raise ValueError(_RATE_ERROR_MSG)
+        self.__rate: float = rate
+        self.__previous: tuple = None
+
+    def evaluate(self, timestamp: float, value: float) -> str:
+        previous: tuple = self.__previous
+        self.__previous = (timestamp, value)
+        if previous is None or timestamp <= previous[0]:
+            return None
+        rate: float = (value - previous[1]) * 60 / (timestamp - previous[0])
+        if rate >= self.__rate:
+            return RISING
+        if rate <= -self.__rate:
+            return FALLING
+        return None
+
+
+class DeltaWatch(Watch):
+
+    def __init__(self, quantity: str, callback: Any, delta: float):
+        super().__init__(quantity, callback)
+        self.__delta: float = delta
+        self.__reported: float = None
+
+    def evaluate(self, timestamp: float, value: float) -> str:
+        if self.__reported is not None and (value == self.__reported or abs(value - self.__reported) < self.__delta):
+            return None
+        self.__reported = value
+        return CHANGED
+
+
+class SensorWatcher(object):
+
+    def __init__(self, parent_logger: logging.Logger, sample: Callable[[], Dict[str, float]], interval: float=SAMPLE_INTERVAL):
+        """
+        :param parent_logger: the logger of the provider
+        :param sample: the function returning the values by quantity, a value is None when not available
+        :param interval: the delay in seconds between the samples
+        """
+        self.__logger: logging.Logger = get_child_logger(parent_logger, self.__class__.__name__)
+        self.__sample: Callable[[], Dict[str, float]] = sample
+        self.__interval: float = interval
+        # Watches by (connection, identifying arguments)
+        self.__watches: Dict[tuple, Watch] = dict()
+        self.__condition: threading.Condition = threading.Condition()
+        self.__thread: threading.Thread = None
+        self.__active: bool = True
+        self.samples: int = 0
+        self.notifications: int = 0
+
+    def register(self, connection: Any, key: tuple, watch: Watch) -> None:
+        """
+        Register the watch of the given connection, replacing the one having the same key.
+        :param connection: the connection of the client, None for the local calls
+        :param key: the arguments identifying the watch
+        :param watch: the watch, None to unregister it
+        """
+        with self.__condition:
+            if watch is None:
+                self.__watches.pop((connection, key), None)
+                return
+            if not self.__active:
+                return
+            self.__watches[(connection, key)] = watch
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__run, name=self.__class__.__name__, daemon=True)
+                self.__thread.start()
+            # The first sample of the watch is taken without waiting for the interval
+            self.__condition.notify()
+
+    def unregister_connection(self, connection: Any) -> None:
+        """Unregister the watches of the given client connection"""
+        with self.__condition:
+            for key in [k for k in self.__watches if k[0] is connection]:
+                self.__logger.debug('Disconnecting watch: %s', key[1])
+                del self.__watches[key]
+
+    def get_count(self) -> int:
+        return len(self.__watches)
+
+    def stop(self) -> None:
+        with self.__condition:
+            self.__active = False
+            self.__watches.clear()
+            self.__condition.notify()
+            thread: threading.Thread = self.__thread
+            self.__thread = None
+        if thread is not None:
+            thread.join()
+
+    def __run(self) -> None:
+        with self.__condition:
+            while self.__active:
+                if not self.__watches:
+                    self.__condition.wait()
+                    continue
+                self.__condition.release()
+                try:
+                    self.__evaluate()
+                finally:
+                    self.__condition.acquire()
+                if self.__active:
+                    self.__condition.wait(self.__interval)
+
+    def __evaluate(self) -> None:
+        try:
+            values: Dict[str, float] = self.__sample()
+        except Exception as ex:
+            self.__logger.error('Sample failed: %s', ex)
+            return
+        timestamp: float = time.monotonic()
+        self.samples += 1
+        notifications: List[tuple] = list()
+        with self.__condition:
+            for watch in self.__watches.values():
+                value: float = values.get(watch.quantity)
+                if value is None:
+                    continue
+                event: str = watch.evaluate(timestamp, value)
+                if event is not None:
+                    notifications.append((watch, event, value))
+        for watch, event, value in notifications:
+            if TRACE:
+                self.__logger.debug('Notifying %s %s: %s', watch.quantity, event, value)
+            self.notifications += 1
+            try:
+                watch.invoker(watch.quantity, event, value)
+            except Exception as ex:
+                # The client is gone, its watches are removed when the disconnection is handled
+                self.__logger.warning('Notification %s %s not delivered: %s', watch.quantity, event, ex)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+# Journal of the state defined by a client on a provider, replayed in a single request after a reconnection
+# The abstract provider classes declare the methods defining the state of a session:
+#   _SESSION_METHODS: method name -> (group, number of leading arguments identifying the state, singular method)
+#     The singular method is specified for the bulk methods, their leading arguments are sequences and each
+#     element is recorded as a call of the singular method. The other arguments passed as sequences are split the
+#     same way (one value per key), the other ones are passed to each call.
+#   _SESSION_RESETS: method name -> groups discarded when the method is called
+# Only the last call for each state is kept, the calls are replayed in the order of their last update.
+import os
+import threading
+from typing import Any, Dict, List
+from id_buffer_utils import as_array
+
+# Set to 0 to disable the journal of the clients
+SESSION_JOURNAL: bool = os.environ.get('ID_SESSION_JOURNAL', '1') != '0'
+_KEY_ERROR_MSG: str = 'Invalid key argument of %s'
+
+ListOfCalls = List[tuple]
+
+
+def _is_sequence(value: Any) -> bool:
+    return isinstance(value, (tuple, bytes, bytearray))
+
+
+def _pack_keys(values: list) -> Any:
+    return bytes(values) if max(values) < 256 and min(values) >= 0 else tuple(values)
+
+
+class SessionJournal(object):
+
+    def __init__(self, provider_class: type):
+        self.__methods: Dict[str, tuple] = getattr(provider_class, '_SESSION_METHODS', dict())
+        self.__resets: Dict[str, tuple] = getattr(provider_class, '_SESSION_RESETS', dict())
+        # Bulk method and number of key arguments by singular method, used to compact the replay
+        self.__bulk: Dict[str, tuple] = dict()
+        for name, (_, key_count, singular) in self.__methods.items():
+            if singular:
+                # The first bulk method declared is preferred to the batch variants, see id_schema
+                self.__bulk.setdefault(singular, (name, key_count))
+        # Entries (sequence, method, args) by key, by group
+        self.__groups: Dict[str, dict] = dict()
+        self.__sequence: int = 0
+        self.__lock: threading.Lock = threading.Lock()
+
+    def is_recorded(self, name: str) -> bool:
+        return name in self.__methods or name in self.__resets
+
+    def record(self, name: str, args: list) -> None:
+        """
+        Record a successful call.
+        :param name: the name of the method
+        :param args: the packed arguments
+        """
+        with self.__lock:
+            for group in self.__resets.get(name, ()):
+                self.__groups.pop(group, None)
+            spec: tuple = self.__methods.get(name)
+            if spec is None:
+                return
+            group, key_count, singular = spec
+            entries: dict = self.__groups.get(group)
+            if entries is None:
+                entries = dict()
+                self.__groups[group] = entries
+            if singular:
+                keys: list = [as_array(a, str(i), _KEY_ERROR_MSG % name) if _is_sequence(a) else None for i, a in enumerate(args[:key_count])]
+                values: tuple = tuple(args[key_count:])
+                columns: list = [tuple(v) if _is_sequence(v) else None for v in values]
+                # A single key is used by all the calls of a batch
+                count: int = max([len(k) for k in keys if k is not None] + [len(c) for c in columns if c is not None] + [1])
+                keys = [k if k is not None else (a,) * count for k, a in zip(keys, args)]
+                split: bool = any(c is not None for c in columns)
+                sequence: int = self.__sequence
+                for index, key in enumerate(zip(*keys)):
+                    sequence += 1
+                    if split:
+                        values = tuple(v if c is None else c[index] for v, c in zip(args[key_count:], columns))
+                    # Removal then insertion keeps the entries ordered by their last update
+                    entries.pop(key, None)
+                    entries[key] = (sequence, singular, key + values)
+                self.__sequence = sequence
+            else:
+                key: tuple = tuple(args[:key_count])
+                self.__sequence += 1
+                entries.pop(key, None)
+                entries[key] = (self.__sequence, name, tuple(args))
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__groups.clear()
+
+    def is_empty(self) -> bool:
+        return not any(self.__groups.values())
+
+    def get_calls(self) -> ListOfCalls:
+        """
+        Return the calls restoring the state, the consecutive calls of a singular method with the same values are merged
+        in a call of its bulk method.
+        :return: the tuples (method, args)
+        """
+        with self.__lock:
+            ordered: list = sorted(e for entries in self.__groups.values() for e in entries.values())
+        result: ListOfCalls = list()
+        i: int = 0
+        while i < len(ordered):
+            _, name, args = ordered[i]
+            bulk: tuple = self.__bulk.get(name)
+            if bulk is None:
+                result.append((name, args))
+                i += 1
+                continue
+            bulk_name, key_count = bulk
+            values: tuple = args[key_count:]
+            keys: list = [list() for _ in range(key_count)]
+            while i < len(ordered) and ordered[i][1] == name and ordered[i][2][key_count:] == values:
+                for k in range(key_count):
+                    keys[k].append(ordered[i][2][k])
+                i += 1
+            if len(keys[0]) == 1:
+                result.append((name, tuple(k[0] for k in keys) + values))
+            else:
+                result.append((bulk_name, tuple(_pack_keys(k) for k in keys) + values))
+        return result
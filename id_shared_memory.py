@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+# Shared memory transport of the bulk payloads for the clients running on the same host as the server
+# The client writes the payload in a ring buffer and only sends a reference ('shm:<name>:<offset>:<length>')
+# which is accepted by the bulk methods of the providers in place of the packed sequence.
+# References are only resolved for the clients connected using a unix domain socket, which run on the same host, or
+# when they designate a segment created by this process.
+import array
+import socket
+import threading
+from multiprocessing import shared_memory
+from typing import Any, Dict
+
+SHM_PREFIX: str = 'shm:'
+DEFAULT_RING_SIZE: int = 1024 * 1024
+_SIZE_ERROR_MSG: str = 'Payload of %s bytes exceeds the size of the ring buffer: %s'
+_REFERENCE_ERROR_MSG: str = 'Invalid shared memory reference: %s'
+_NOT_LOCAL_ERROR_MSG: str = 'Shared memory reference %s is only accepted from a client connected using a unix domain socket'
+
+# Segments created by this process by name
+__registered: Dict[str, shared_memory.SharedMemory] = dict()
+__registered_lock: threading.Lock = threading.Lock()
+# Each connection is served by its own thread of the server
+__local: threading.local = threading.local()
+
+
+def is_shared_reference(value: Any) -> bool:
+    return isinstance(value, str) and value.startswith(SHM_PREFIX)
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13, the segment is registered and would be destroyed when this process exits
+        from multiprocessing import resource_tracker
+        segment: shared_memory.SharedMemory = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(getattr(segment, '_name'), 'shared_memory')
+        return segment
+
+
+def is_unix_connection(conn: Any) -> bool:
+    try:
+        return conn._channel.stream.sock.family == socket.AF_UNIX
+    except (AttributeError, OSError):
+        return False
+
+
+def bind_connection(conn: Any) -> None:
+    """
+    Record the connection served by the current thread, its references are resolved if it uses a unix domain socket.
+    :param conn: the connection
+    """
+    __local.trusted = is_unix_connection(conn)
+
+
+def register_segment(segment: shared_memory.SharedMemory) -> None:
+    with __registered_lock:
+        __registered[segment.name] = segment
+
+
+def unregister_segment(segment: shared_memory.SharedMemory) -> None:
+    with __registered_lock:
+        __registered.pop(segment.name, None)
+
+
+def check_shared_reference(reference: str) -> str:
+    """
+    Check that the given reference can be resolved for the client served by the current thread.
+    :param reference: the reference
+    :return: the name of the segment
+    """
+    name: str = reference.split(':')[1] if reference.count(':') == 3 else None
+    if name is None:
+        raise ValueError(_REFERENCE_ERROR_MSG % reference)
+    if not getattr(__local, 'trusted', False):
+        with __registered_lock:
+            if name not in __registered:
+                raise ValueError(_NOT_LOCAL_ERROR_MSG % reference)
+    return name
+
+
+def resolve_shared_reference(reference: str) -> bytes:
+    """
+    Return a copy of the payload designated by the given reference, the segment is detached once copied.
+    :param reference: the reference
+    :return: the payload
+    """
+    name: str = check_shared_reference(reference)
+    try:
+        _, _, offset, length = reference.split(':')
+        offset = int(offset)
+        length = int(length)
+    except ValueError:
+        raise ValueError(_REFERENCE_ERROR_MSG % reference)
+    with __registered_lock:
+        segment: shared_memory.SharedMemory = __registered.get(name)
+    owned: bool = segment is not None
+    if not owned:
+        try:
+            segment = _attach(name)
+        except (FileNotFoundError, ValueError):
+            raise ValueError(_REFERENCE_ERROR_MSG % reference)
+    try:
+        if offset < 0 or length < 0 or offset + length > segment.size:
+            raise ValueError(_REFERENCE_ERROR_MSG % reference)
+        view: memoryview = segment.buf[offset:offset + length]
+        try:
+            return bytes(view)
+        finally:
+            view.release()
+    finally:
+        if not owned:
+            segment.close()
+
+
+class SharedMemoryRing(object):
+    """
+    Ring buffer written by a client, the payloads are reused in a circular way so a reference must be
+    consumed (a synchronous call) before the ring wraps around.
+    """
+
+    def __init__(self, size: int=DEFAULT_RING_SIZE):
+        self.__segment: shared_memory.SharedMemory = shared_memory.SharedMemory(create=True, size=size)
+        register_segment(self.__segment)
+        self.__size: int = size
+        self.__offset: int = 0
+        self.__lock: threading.Lock = threading.Lock()
+
+    def get_name(self) -> str:
+        return self.__segment.name
+
+    def put(self, data) -> str:
+        """
+        Copy the given payload in the ring.
+        :param data: the bytes-like payload
+        :return: the reference to pass to the provider
+        """
+        view: memoryview = memoryview(data).cast('B')
+        length: int = len(view)
+        if length > self.__size:
+            raise ValueError(_SIZE_ERROR_MSG % (length, self.__size))
+        with self.__lock:
+            if self.__offset + length > self.__size:
+                self.__offset = 0
+            offset: int = self.__offset
+            self.__segment.buf[offset:offset + length] = view
+            self.__offset = offset + length
+        return '%s%s:%s:%s' % (SHM_PREFIX, self.__segment.name, offset, length)
+
+    def pack(self, values, typecode: str='B') -> str:
+        """
+        Pack the given values in the ring.
+        :param values: the values
+        :param typecode: the type code used to pack the values
+        :return: the reference to pass to the provider
+        """
+        if not isinstance(values, array.array) or values.typecode != typecode:
+            values = array.array(typecode, values)
+        return self.put(values)
+
+    def close(self) -> None:
+        unregister_segment(self.__segment)
+        self.__segment.close()
+        try:
+            self.__segment.unlink()
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
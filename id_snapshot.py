@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# Binary snapshots of the state of the providers, returned by snapshot() and applied by restore()
+# A snapshot is made of a header: MAGIC, VERSION (1 byte), length of the name of the provider (1 byte) and the name,
+# followed by sections: tag (1 byte), length of the payload (4 bytes, little endian) and payload. Each provider
+# defines its tags and the encoding of their payloads, restore() ignores the tags it does not know.
+# A snapshot is passed by value, a remote reference is rejected as it would be read one byte per request.
+import struct
+from typing import Any, Dict
+from id_buffer_utils import is_netref
+
+MAGIC: bytes = b'IDS'
+VERSION: int = 1
+# Value of the unknown states in the payloads using one byte per state
+UNKNOWN: int = 0xFF
+_SECTION: struct.Struct = struct.Struct('<BI')
+_NETREF_ERROR_MSG: str = 'Snapshot is a remote reference, pass bytes instead.'
+_FORMAT_ERROR_MSG: str = 'Invalid snapshot: %s'
+_PROVIDER_ERROR_MSG: str = 'Snapshot of provider %s cannot be restored by %s.'
+
+
+def pack_snapshot(provider: str, sections: Dict[int, bytes]) -> bytes:
+    """
+    Encode a snapshot.
+    :param provider: the name of the provider
+    :param sections: the payloads by tag, the None payloads are skipped
+    :return: the snapshot
+    """
+    name: bytes = provider.encode('utf-8')
+    result: bytearray = bytearray(MAGIC)
+    result.append(VERSION)
+    result.append(len(name))
+    result += name
+    for tag, payload in sections.items():
+        if payload is None:
+            continue
+        result += _SECTION.pack(tag, len(payload))
+        result += payload
+    return bytes(result)
+
+
+def unpack_snapshot(provider: str, snapshot: Any) -> Dict[int, bytes]:
+    """
+    Decode a snapshot.
+    :param provider: the name of the provider restoring the snapshot
+    :param snapshot: the snapshot as bytes, bytearray or memoryview
+    :return: the payloads by tag
+    """
+    if is_netref(snapshot):
+        raise TypeError(_NETREF_ERROR_MSG)
+    try:
+        data: bytes = bytes(snapshot)
+    except TypeError:
+        raise ValueError(_FORMAT_ERROR_MSG % 'bytes expected')
+    if len(data) < len(MAGIC) + 2 or not data.startswith(MAGIC):
+        raise ValueError(_FORMAT_ERROR_MSG % 'bad header')
+    offset: int = len(MAGIC)
+    if data[offset] != VERSION:
+        raise ValueError(_FORMAT_ERROR_MSG % ('unsupported version %s' % data[offset]))
+    length: int = data[offset + 1]
+    offset += 2
+    name: str = data[offset:offset + length].decode('utf-8', 'replace')
+    if name != provider:
+        raise ValueError(_PROVIDER_ERROR_MSG % (name, provider))
+    offset += length
+    result: Dict[int, bytes] = dict()
+    while offset < len(data):
+        if offset + _SECTION.size > len(data):
+            raise ValueError(_FORMAT_ERROR_MSG % 'truncated section')
+        tag, length = _SECTION.unpack_from(data, offset)
+        offset += _SECTION.size
+        if offset + length > len(data):
+            raise ValueError(_FORMAT_ERROR_MSG % ('truncated section %s' % tag))
+        result[tag] = data[offset:offset + length]
+        offset += length
+    return result
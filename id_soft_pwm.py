@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+# Software PWM driving any number of pins from a single timing thread of the server
+# Each channel writes a high level during duty / DUTY_RANGE of its period and a low level during the rest of it.
+# The next edge of each channel is kept in a heap ordered by time, the thread sleeps until the earliest edge or until
+# a channel is updated. A channel having a duty of 0 or DUTY_RANGE is written once and has no pending edge.
+# A duty update is applied from the next cycle so the clients can change the duties at any rate without glitches.
+# When the thread is late by more than a period, the cycle restarts from the current time instead of writing the
+# missed edges.
+# The edges are computed under the lock of the channels and the pins are written outside of it, so a slow write does
+# not block the updates of the clients. The writes are serialized by their own lock and the writes of a channel
+# removed or restarted meanwhile are skipped.
+import heapq
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List
+from id_logging_utils import TRACE, get_child_logger
+
+DUTY_RANGE: int = 255
+# Frequency in Hz of the channels created by a duty update
+DEFAULT_FREQUENCY: float = float(os.environ.get('ID_SOFT_PWM_FREQUENCY', '100'))
+MAX_FREQUENCY: float = float(os.environ.get('ID_SOFT_PWM_MAX_FREQUENCY', '1000'))
+HIGH: int = 1
+LOW: int = 0
+_FREQUENCY_ERROR_MSG: str = 'Frequency must be a valid number in range 0 (excluded) to %s.' % MAX_FREQUENCY
+_DUTY_ERROR_MSG: str = 'Duty must be a valid number in range 0 to %s.' % DUTY_RANGE
+
+
+def check_duty(duty: int) -> int:
+    if duty is None or int(duty) < 0 or int(duty) > DUTY_RANGE:
+        raise ValueError(_DUTY_ERROR_MSG)
+    return int(duty)
+
+
+def check_frequency(frequency: float) -> float:
+    if frequency is None or float(frequency) <= 0 or float(frequency) > MAX_FREQUENCY:
+        raise ValueError(_FREQUENCY_ERROR_MSG)
+    return float(frequency)
+
+
+class _Channel(object):
+    __slots__ = ('period', 'duty', 'generation', 'start', 'modulated')
+
+    def __init__(self, frequency: float, duty: int):
+        self.period: float = 1.0 / frequency
+        self.duty: int = duty
+        # Changed to cancel the pending edge
+        self.generation: int = 0
+        # Start of the current cycle
+        self.start: float = 0
+        self.modulated: bool = False
+
+
+class SoftPwmEngine(object):
+
+    def __init__(self, parent_logger: logging.Logger, write: Callable[[int, int], None]):
+        """
+        :param parent_logger: the logger of the provider
+        :param write: the function writing the level of a pin
+        """
+        self.__logger: logging.Logger = get_child_logger(parent_logger, self.__class__.__name__)
+        self.__write: Callable[[int, int], None] = write
+        self.__channels: Dict[int, _Channel] = dict()
+        # Edges (time, sequence, pin, generation, level)
+        self.__edges: List[tuple] = list()
+        self.__sequence: int = 0
+        self.__condition: threading.Condition = threading.Condition()
+        self.__write_lock: threading.Lock = threading.Lock()
+        self.__thread: threading.Thread = None
+        self.__active: bool = True
+        # Number of cycles restarted because the thread was late
+        self.late_cycles: int = 0
+
+    def set(self, pin: int, frequency: float, duty: int) -> None:
+        """Create or reconfigure the channel of a pin, a new cycle starts immediately"""
+        frequency = check_frequency(frequency)
+        duty = check_duty(duty)
+        with self.__condition:
+            channel: _Channel = self.__channels.get(pin)
+            if channel is None:
+                channel = _Channel(frequency, duty)
+                self.__channels[pin] = channel
+            else:
+                channel.period = 1.0 / frequency
+                channel.duty = duty
+            self.__restart(pin, channel)
+
+    def set_duties(self, pins: Iterable[int], duties: Iterable[int]) -> None:
+        """Update the duties of the given pins in a single step, the missing channels use DEFAULT_FREQUENCY"""
+        updates: list = [(pin, check_duty(duty)) for pin, duty in zip(pins, duties)]
+        with self.__condition:
+            for pin, duty in updates:
+                channel: _Channel = self.__channels.get(pin)
+                if channel is None:
+                    channel = _Channel(DEFAULT_FREQUENCY, duty)
+                    self.__channels[pin] = channel
+                    self.__restart(pin, channel)
+                    continue
+                channel.duty = duty
+                # A modulated channel applies the duty at its next rising edge
+                if not channel.modulated or duty == 0 or duty == DUTY_RANGE:
+                    self.__restart(pin, channel)
+
+    def remove(self, pin: int) -> bool:
+        """Remove the channel of a pin and write a low level, return false if the pin has no channel"""
+        with self.__condition:
+            channel: _Channel = self.__channels.pop(pin, None)
+            if channel is None:
+                return False
+        with self.__write_lock:
+            self.__write(pin, LOW)
+        return True
+
+    def is_driven(self, pin: int) -> bool:
+        return pin in self.__channels
+
+    def get_channels(self) -> tuple:
+        """Return the tuples (pin, frequency, duty) of the channels"""
+        with self.__condition:
+            return tuple((p, 1.0 / c.period, c.duty) for p, c in sorted(self.__channels.items()))
+
+    def stop(self) -> None:
+        """Remove all the channels, their pins are written low"""
+        with self.__condition:
+            self.__active = False
+            pins: list = list(self.__channels.keys())
+            self.__channels.clear()
+            self.__edges.clear()
+            self.__condition.notify()
+            thread: threading.Thread = self.__thread
+            self.__thread = None
+        if thread is not None:
+            thread.join()
+        with self.__write_lock:
+            for pin in pins:
+                self.__write(pin, LOW)
+
+    def __restart(self, pin: int, channel: _Channel) -> None:
+        if not self.__active:
+            return
+        # Unique across the channels so the edges of a removed channel are never applied to a new one
+        self.__sequence += 1
+        channel.generation = self.__sequence
+        self.__push(time.monotonic(), pin, channel, HIGH)
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.__run, name=self.__class__.__name__, daemon=True)
+            self.__thread.start()
+        self.__condition.notify()
+
+    def __push(self, when: float, pin: int, channel: _Channel, level: int) -> None:
+        self.__sequence += 1
+        heapq.heappush(self.__edges, (when, self.__sequence, pin, channel.generation, level))
+
+    def __run(self) -> None:
+        edges: List[tuple] = self.__edges
+        while True:
+            # Writes (pin, channel, generation, level) of the due edges
+            writes: list = list()
+            with self.__condition:
+                if not self.__active:
+                    return
+                if not edges:
+                    self.__condition.wait()
+                    continue
+                now: float = time.monotonic()
+                if edges[0][0] > now:
+                    self.__condition.wait(edges[0][0] - now)
+                    continue
+                while edges and edges[0][0] <= now:
+                    when, _, pin, generation, level = heapq.heappop(edges)
+                    channel: _Channel = self.__channels.get(pin)
+                    if channel is not None and channel.generation == generation:
+                        writes.append((pin, channel, generation, self.__apply(now, when, pin, channel, level)))
+            with self.__write_lock:
+                for pin, channel, generation, level in writes:
+                    if self.__channels.get(pin) is not channel or channel.generation != generation:
+                        continue
+                    try:
+                        self.__write(pin, level)
+                    except Exception as ex:
+                        # The channel is dropped so a failing pin does not stop the others
+                        with self.__condition:
+                            if self.__channels.get(pin) is channel:
+                                del self.__channels[pin]
+                        self.__logger.error('Software PWM stopped on pin %s: %s', pin, ex)
+
+    def __apply(self, now: float, when: float, pin: int, channel: _Channel, level: int) -> int:
+        """Schedule the next edge of the channel and return the level to write"""
+        if level == HIGH:
+            if now - when > channel.period:
+                self.late_cycles += 1
+                when = now
+            channel.start = when
+            if channel.duty == 0 or channel.duty == DUTY_RANGE:
+                channel.modulated = False
+                if TRACE:
+                    self.__logger.debug('Constant level on pin %s: %s', pin, channel.duty)
+                return HIGH if channel.duty else LOW
+            channel.modulated = True
+            self.__push(when + channel.period * channel.duty / DUTY_RANGE, pin, channel, LOW)
+            return HIGH
+        self.__push(channel.start + channel.period, pin, channel, HIGH)
+        return LOW
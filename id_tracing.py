@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+# Tracing of the calls across the client and the server
+# The client starts a trace for a sampled call of a stub, the trace context (trace id, span id, send time) is passed
+# to the server with the call (see FunctionProviderService.exposed_traced) and the server records its spans in
+# the same trace: the method, the queue (waiting of the call before its execution) and the spans of the providers
+# such as validation and backend. The server returns the duration of its dispatch with the result, the client exports
+# the transport span (encoding, network and scheduling of the serving thread) as its round trip measured with a
+# monotonic clock minus this duration, so the clocks of the hosts do not need to be synchronized.
+# A call made while serving a traced call (a gateway) is traced too.
+# The spans are kept in a ring buffer of each process (see get_spans and the registry) and can also be appended to
+# a file, one span per line: trace_id span_id parent_id start_ns duration_ns name (ids in hexadecimal).
+import atexit
+import collections
+import os
+import random
+import threading
+import time
+from typing import Any, Deque
+
+# Ratio of the calls starting a trace on the client, 0 to disable the tracing
+SAMPLE_RATE: float = float(os.environ.get('ID_TRACE_SAMPLE_RATE', '0'))
+# Path of the file receiving the spans
+TRACE_FILE: str = os.environ.get('ID_TRACE_FILE')
+RING_SIZE: int = int(os.environ.get('ID_TRACE_RING_SIZE', '4096'))
+TRANSPORT_SPAN: str = 'transport'
+QUEUE_SPAN: str = 'queue'
+
+_local: threading.local = threading.local()
+_ring: Deque[tuple] = collections.deque(maxlen=RING_SIZE)
+_file_lock: threading.Lock = threading.Lock()
+_file: Any = None
+
+
+def new_id() -> int:
+    return random.getrandbits(63) + 1
+
+
+def set_sample_rate(rate: float) -> None:
+    global SAMPLE_RATE
+    SAMPLE_RATE = rate
+
+
+def export(span: tuple) -> None:
+    """Export a span (trace_id, span_id, parent_id, start_ns, duration_ns, name)"""
+    global _file
+    _ring.append(span)
+    if TRACE_FILE:
+        with _file_lock:
+            if _file is None:
+                _file = open(TRACE_FILE, 'a', buffering=64 * 1024)
+            _file.write('%016x %016x %016x %d %d %s\n' % span)
+
+
+def get_spans(clear: bool=False) -> tuple:
+    """Return the spans of the ring buffer of this process"""
+    result: tuple = tuple(_ring)
+    if clear:
+        _ring.clear()
+    return result
+
+
+def close() -> None:
+    global _file
+    with _file_lock:
+        if _file is not None:
+            _file.close()
+            _file = None
+
+
+class Span(object):
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'start')
+
+    def __init__(self, name: str, trace_id: int, parent_id: int):
+        self.trace_id: int = trace_id
+        self.span_id: int = new_id()
+        self.parent_id: int = parent_id
+        self.name: str = name
+        self.start: int = 0
+
+    def get_context(self) -> tuple:
+        return self.trace_id, self.span_id
+
+    def __enter__(self):
+        stack: list = getattr(_local, 'spans', None)
+        if stack is None:
+            stack = list()
+            _local.spans = stack
+        stack.append(self)
+        self.start = time.time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        end: int = time.time_ns()
+        _local.spans.pop()
+        export((self.trace_id, self.span_id, self.parent_id, self.start, end - self.start, self.name))
+
+
+class _NoSpan(object):
+    """Span of a call which is not traced"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+NO_SPAN: _NoSpan = _NoSpan()
+
+
+def get_current() -> Span:
+    stack: list = getattr(_local, 'spans', None)
+    return stack[-1] if stack else None
+
+
+def span(name: str) -> Any:
+    """
+    Return a span child of the current one, or NO_SPAN if the current call is not traced.
+    Usage: with span('validation'): ...
+    """
+    stack: list = getattr(_local, 'spans', None)
+    if not stack:
+        return NO_SPAN
+    parent: Span = stack[-1]
+    return Span(name, parent.trace_id, parent.span_id)
+
+
+def start_span(name: str) -> Any:
+    """Return a span child of the current one, the root span of a new trace if the call is sampled, or NO_SPAN"""
+    stack: list = getattr(_local, 'spans', None)
+    if stack:
+        parent: Span = stack[-1]
+        return Span(name, parent.trace_id, parent.span_id)
+    if SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE:
+        return Span(name, new_id(), 0)
+    return NO_SPAN
+
+
+def continue_trace(name: str, context: tuple) -> Span:
+    """
+    Return the span of a call received with the given context.
+    :param name: the name of the span
+    :param context: the trace id, the span id of the caller and the time of the sending in nanoseconds
+    :return: the span
+    """
+    trace_id, parent_id, _ = context
+    return Span(name, trace_id, parent_id)
+
+
+def get_context(current: Span) -> tuple:
+    """Return the context passed with a traced call made in the given span"""
+    return current.trace_id, current.span_id, time.time_ns()
+
+
+def end_traced_call(context: tuple, started: int, reply: tuple) -> Any:
+    """
+    Export the transport span of a traced call and return its result.
+    :param context: the context passed with the call, see get_context
+    :param started: the value of time.monotonic_ns() before the call
+    :param reply: the result of the call and the duration of its dispatch in nanoseconds on the server
+    :return: the result
+    """
+    round_trip: int = time.monotonic_ns() - started
+    result, dispatch = reply
+    trace_id, parent_id, sent = context
+    export((trace_id, new_id(), parent_id, sent, round_trip - dispatch, TRANSPORT_SPAN))
+    return result
+
+
+atexit.register(close)
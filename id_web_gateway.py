@@ -0,0 +1,653 @@
+# -*- coding: utf-8 -*-
+# Gateway streaming the states of the providers to the browsers over HTTP and WebSocket (RFC 6455)
+# The gateway is a client of a server or of a gateway of devices (see id_gateway) and exposes a topic per provider
+# of each device having a describe_snapshot() function in its module: '<alias of the device>/<provider alias>', the
+# provider alias being the name of the class without the FunctionProvider suffix in lower case ('kitchen/wiringpi').
+# - the state of a topic is the description of the snapshot of the provider (see id_snapshot), polled by the gateway
+#   at the interval of the provider while the topic has subscribers or was requested by HTTP during IDLE_TIMEOUT,
+#   so the load of the devices does not depend on the number of viewers. The providers notifying their changes
+#   (WATCH_METHODS) are also polled on notification, their watches are removed when the topic becomes idle and
+#   registered again by the next poll
+# - a message is published when the state changes, its frame is encoded once and shared by the subscribers
+# - each WebSocket client receives at most CLIENT_RATE messages per second after a burst of CLIENT_BURST messages,
+#   when it is limited or slow only the last message of each topic is kept for it
+# Routes:
+# - GET / : a minimal dashboard
+# - GET /topics : the topics as JSON
+# - GET /state/<topic> : the last message of the topic
+# - GET /stats : the statistics of the gateway
+# - GET /ws?topics=<topic>,<topic> : the WebSocket, the client sends {"subscribe": [topics]} or {"unsubscribe": [topics]}
+#   and receives the messages {"topic": name, "version": number, "time": seconds since epoch, "state": state} and
+#   {"error": message}, the bytes of the states are encoded in base64
+import asyncio
+import base64
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import struct
+import sys
+import time
+import urllib.parse
+from typing import Any, Callable, Dict, List, Set
+from id_classes_utils import subclasses_of
+from id_function_invokers import NAMESPACE_SEPARATOR, FunctionInvokers, FunctionProvider
+from id_logging_utils import TRACE, get_child_logger
+
+DEFAULT_WEB_PORT: int = 8080
+# Interval in seconds between the polls of the providers
+POLL_INTERVAL: float = float(os.environ.get('ID_WEB_POLL_INTERVAL', '1'))
+POLL_INTERVALS: Dict[str, float] = {
+    'Am2302FunctionProvider': 5.0,
+    'GfxHatFunctionProvider': 0.5,
+    'WiringPiFunctionProvider': 0.2
+}
+# Methods notifying the changes of a provider by provider, with their arguments, the callback being the last one
+WATCH_METHODS: Dict[str, tuple] = {
+    'Am2302FunctionProvider': (('watch_delta', 'humidity', 0), ('watch_delta', 'temperature', 0))
+}
+# Maximum number of messages per second and burst of each client
+CLIENT_RATE: float = float(os.environ.get('ID_WEB_CLIENT_RATE', '20'))
+CLIENT_BURST: int = int(os.environ.get('ID_WEB_CLIENT_BURST', '10'))
+MAX_CLIENTS: int = int(os.environ.get('ID_WEB_MAX_CLIENTS', '256'))
+# Delay in seconds during which a topic requested by HTTP is polled without subscribers
+IDLE_TIMEOUT: float = float(os.environ.get('ID_WEB_IDLE_TIMEOUT', '30'))
+# Delay in seconds between the pings of the idle clients
+PING_INTERVAL: float = float(os.environ.get('ID_WEB_PING_INTERVAL', '30'))
+# Maximum delay in seconds of the handshake, of the first state of a topic requested by HTTP and of a send
+REQUEST_TIMEOUT: float = 10
+MAX_HEADER_SIZE: int = 8192
+MAX_MESSAGE_SIZE: int = 65536
+MAX_POLL_WORKERS: int = 16
+# Opcodes and close codes, see RFC 6455
+CONTINUATION: int = 0x0
+TEXT: int = 0x1
+BINARY: int = 0x2
+CLOSE: int = 0x8
+PING: int = 0x9
+PONG: int = 0xA
+NORMAL_CLOSURE: int = 1000
+GOING_AWAY: int = 1001
+PROTOCOL_ERROR: int = 1002
+UNSUPPORTED_DATA: int = 1003
+INVALID_DATA: int = 1007
+MESSAGE_TOO_BIG: int = 1009
+_GUID: bytes = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+_SUFFIX: str = 'FunctionProvider'
+_TOPIC_SEPARATOR: str = '/'
+_STATUS: Dict[int, str] = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                           426: 'Upgrade Required', 503: 'Service Unavailable'}
+_UNKNOWN_TOPICS_MSG: str = 'Unknown topics: %s'
+_COMMAND_ERROR_MSG: str = 'Expected {"subscribe": [topics]} or {"unsubscribe": [topics]}'
+_DASHBOARD: str = '''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Devices</title>
+<style>body{font-family:sans-serif}section{display:inline-block;vertical-align:top;margin:8px;padding:8px;border:1px solid #ccc}
+canvas{image-rendering:pixelated;width:256px;background:#000}pre{font-size:12px;max-width:480px;white-space:pre-wrap}</style>
+</head><body><div id="topics"></div><script>
+const root = document.getElementById('topics'), views = {};
+function view(name) {
+  if (!views[name]) {
+    const s = document.createElement('section');
+    s.innerHTML = '<h3></h3><canvas hidden></canvas><pre></pre>';
+    s.querySelector('h3').textContent = name;
+    root.appendChild(s);
+    views[name] = s;
+  }
+  return views[name];
+}
+function draw(canvas, lcd) {
+  const bits = atob(lcd.pixels), c = canvas.getContext('2d'), image = c.createImageData(lcd.width, lcd.height);
+  canvas.width = lcd.width; canvas.height = lcd.height; canvas.hidden = false;
+  for (let i = 0; i < lcd.width * lcd.height; i++) {
+    const on = (bits.charCodeAt(i >> 3) >> (7 - (i & 7))) & 1;
+    image.data.set(on ? [255, 255, 255, 255] : [0, 0, 0, 255], i * 4);
+  }
+  c.putImageData(image, 0, 0);
+  lcd.pixels = '...';
+}
+fetch('topics').then(r => r.json()).then(topics => {
+  const url = location.href.replace(/^http/, 'ws').replace(/\\/[^\\/]*$/, '/ws?topics=') + topics.map(t => t.name).join(',');
+  const ws = new WebSocket(url);
+  ws.onmessage = e => {
+    const m = JSON.parse(e.data);
+    if (!m.topic) return;
+    const s = view(m.topic);
+    if (m.state.lcd) draw(s.querySelector('canvas'), m.state.lcd);
+    s.querySelector('pre').textContent = JSON.stringify(m.state, null, 1);
+  };
+});
+</script></body></html>
+'''
+
+
+class WebSocketError(Exception):
+    """Error closing the WebSocket with the given code"""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code: int = code
+
+
+def get_accept_key(key: str) -> str:
+    """Return the value of the Sec-WebSocket-Accept header for the given Sec-WebSocket-Key"""
+    return base64.b64encode(hashlib.sha1(key.encode('ascii') + _GUID).digest()).decode('ascii')
+
+
+def encode_frame(opcode: int, payload: bytes) -> bytes:
+    """Return the unmasked final frame of the given payload, as sent by a server"""
+    length: int = len(payload)
+    if length < 126:
+        header: bytes = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 0x10000:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+def _unmask(payload: bytes, mask: bytes) -> bytes:
+    length: int = len(payload)
+    if not length:
+        return payload
+    # The payload is unmasked as a single integer instead of byte per byte
+    key: int = int.from_bytes((mask * (length // 4 + 1))[:length], 'big')
+    return (int.from_bytes(payload, 'big') ^ key).to_bytes(length, 'big')
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode('ascii')
+    raise TypeError('%s is not serializable' % value.__class__.__name__)
+
+
+def _parse_request(data: bytes) -> tuple:
+    """Return the method, the target and the headers having lower case names of the given HTTP request"""
+    lines: List[str] = data.decode('iso-8859-1').split('\r\n')
+    parts: List[str] = lines[0].split(' ')
+    if len(parts) != 3 or not parts[2].startswith('HTTP/1.'):
+        raise ValueError('Invalid request line: %s' % lines[0])
+    headers: Dict[str, str] = dict()
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, separator, value = line.partition(':')
+        if not separator:
+            raise ValueError('Invalid header: %s' % line)
+        headers[name.strip().lower()] = value.strip()
+    return parts[0], parts[1], headers
+
+
+class WebSocket(object):
+    """Server side of a WebSocket, the frames are sent by a single writer at a time"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, max_size: int=MAX_MESSAGE_SIZE):
+        self.__reader: asyncio.StreamReader = reader
+        self.__writer: asyncio.StreamWriter = writer
+        self.__max_size: int = max_size
+        self.__lock: asyncio.Lock = asyncio.Lock()
+        self.closed: bool = False
+
+    async def send(self, frame: bytes) -> None:
+        """Send an encoded frame, see encode_frame, asyncio.TimeoutError is raised if the client does not read it"""
+        async with self.__lock:
+            self.__writer.write(frame)
+            await asyncio.wait_for(self.__writer.drain(), REQUEST_TIMEOUT)
+
+    async def send_text(self, text: str) -> None:
+        await self.send(encode_frame(TEXT, text.encode('utf-8')))
+
+    async def receive(self) -> str:
+        """Return the next text message, None when the WebSocket is closed, the control frames are handled"""
+        fragments: List[bytes] = list()
+        size: int = 0
+        message_opcode: int = None
+        while True:
+            try:
+                head: bytes = await self.__reader.readexactly(2)
+                opcode: int = head[0] & 0x0F
+                length: int = head[1] & 0x7F
+                if head[0] & 0x70:
+                    raise WebSocketError(PROTOCOL_ERROR, 'Reserved bits set')
+                if not head[1] & 0x80:
+                    raise WebSocketError(PROTOCOL_ERROR, 'Frame of the client not masked')
+                if length == 126:
+                    length = struct.unpack('!H', await self.__reader.readexactly(2))[0]
+                elif length == 127:
+                    length = struct.unpack('!Q', await self.__reader.readexactly(8))[0]
+                if opcode >= CLOSE:
+                    if not head[0] & 0x80 or length > 125:
+                        raise WebSocketError(PROTOCOL_ERROR, 'Invalid control frame')
+                elif size + length > self.__max_size:
+                    raise WebSocketError(MESSAGE_TOO_BIG, 'Message larger than %s bytes' % self.__max_size)
+                mask: bytes = await self.__reader.readexactly(4)
+                payload: bytes = _unmask(await self.__reader.readexactly(length), mask)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                self.closed = True
+                return None
+            if opcode == CLOSE:
+                code: int = struct.unpack('!H', payload[:2])[0] if len(payload) >= 2 else NORMAL_CLOSURE
+                await self.close(code if 1000 <= code < 5000 else PROTOCOL_ERROR)
+                return None
+            if opcode == PING:
+                await self.send(encode_frame(PONG, payload))
+                continue
+            if opcode == PONG:
+                continue
+            if opcode == CONTINUATION:
+                if message_opcode is None:
+                    raise WebSocketError(PROTOCOL_ERROR, 'Unexpected continuation frame')
+            elif opcode in (TEXT, BINARY) and message_opcode is None:
+                message_opcode = opcode
+            else:
+                raise WebSocketError(PROTOCOL_ERROR, 'Unexpected opcode %s' % opcode)
+            fragments.append(payload)
+            size += length
+            if head[0] & 0x80:
+                if message_opcode == BINARY:
+                    raise WebSocketError(UNSUPPORTED_DATA, 'Binary messages are not supported')
+                try:
+                    return b''.join(fragments).decode('utf-8')
+                except UnicodeDecodeError:
+                    raise WebSocketError(INVALID_DATA, 'Invalid UTF-8 text')
+
+    def abort(self) -> None:
+        """Close the connection without the closing handshake, used for the clients not reading their frames"""
+        self.closed = True
+        self.__writer.transport.abort()
+
+    async def close(self, code: int=NORMAL_CLOSURE, reason: str='') -> None:
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            await self.send(encode_frame(CLOSE, struct.pack('!H', code) + reason.encode('utf-8')[:123]))
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            self.__writer.close()
+
+
+class _Topic(object):
+    """State of a provider of a device and its subscribers"""
+
+    def __init__(self, name: str, namespace: str, provider_class: type, describe: Callable[[bytes], dict], interval: float):
+        self.name: str = name
+        self.namespace: str = namespace
+        self.provider_class: type = provider_class
+        self.describe: Callable[[bytes], dict] = describe
+        self.interval: float = interval
+        self.clients: Set[_Client] = set()
+        # Set to poll the provider without waiting for the interval
+        self.wakeup: asyncio.Event = asyncio.Event()
+        # Set when the first message is published
+        self.published: asyncio.Event = asyncio.Event()
+        self.state: str = None
+        self.message: str = None
+        self.frame: bytes = None
+        self.version: int = 0
+        self.requested: float = 0
+        self.watching: bool = False
+        self.error: str = None
+        self.polls: int = 0
+
+    def is_active(self) -> bool:
+        return bool(self.clients) or time.monotonic() - self.requested < IDLE_TIMEOUT
+
+    def describe_topic(self) -> dict:
+        return {'name': self.name, 'namespace': self.namespace, 'provider': self.provider_class.__name__,
+                'interval': self.interval, 'version': self.version, 'subscribers': len(self.clients),
+                'polls': self.polls, 'error': self.error}
+
+
+class _Client(object):
+    """WebSocket client receiving the messages of its topics at a limited rate"""
+
+    def __init__(self, websocket: WebSocket, rate: float, burst: int):
+        self.websocket: WebSocket = websocket
+        self.topics: Set[str] = set()
+        self.__rate: float = rate
+        self.__burst: int = burst
+        self.__tokens: float = burst
+        self.__stamp: float = time.monotonic()
+        # Last frame not sent yet by topic
+        self.__pending: Dict[str, bytes] = dict()
+        self.__event: asyncio.Event = asyncio.Event()
+        self.sent: int = 0
+        self.conflated: int = 0
+
+    def offer(self, topic: str, frame: bytes) -> None:
+        if topic in self.__pending:
+            self.conflated += 1
+        self.__pending[topic] = frame
+        self.__event.set()
+
+    def discard(self, topic: str) -> None:
+        self.__pending.pop(topic, None)
+
+    async def run(self) -> None:
+        """Send the pending frames until the WebSocket is closed, a client not reading its frames is disconnected"""
+        try:
+            await self.__send_pending()
+        except (asyncio.TimeoutError, ConnectionError):
+            self.websocket.abort()
+
+    async def __send_pending(self) -> None:
+        while not self.websocket.closed:
+            try:
+                await asyncio.wait_for(self.__event.wait(), PING_INTERVAL)
+            except asyncio.TimeoutError:
+                await self.websocket.send(encode_frame(PING, b''))
+                continue
+            self.__event.clear()
+            while self.__pending and not self.websocket.closed:
+                now: float = time.monotonic()
+                self.__tokens = min(self.__burst, self.__tokens + (now - self.__stamp) * self.__rate)
+                self.__stamp = now
+                if self.__tokens < 1:
+                    # The frames offered meanwhile replace the pending ones of their topics
+                    await asyncio.sleep((1 - self.__tokens) / self.__rate)
+                    continue
+                self.__tokens -= 1
+                topic: str = next(iter(self.__pending))
+                frame: bytes = self.__pending.pop(topic)
+                await self.websocket.send(frame)
+                self.sent += 1
+
+
+class WebGateway(object):
+
+    def __init__(self, parent_logger: logging.Logger, host: str='0.0.0.0', port: int=DEFAULT_WEB_PORT,
+                 rate: float=CLIENT_RATE, burst: int=CLIENT_BURST, max_clients: int=MAX_CLIENTS):
+        """
+        The invokers must be initialized as a client of the server or of the gateway of devices.
+        :param parent_logger: the logger
+        :param host: the listening address
+        :param port: the listening port
+        :param rate: the maximum number of messages per second of each client
+        :param burst: the maximum number of messages sent at once to each client
+        :param max_clients: the maximum number of WebSocket clients
+        """
+        self.__logger: logging.Logger = get_child_logger(parent_logger, self.__class__.__name__)
+        self.__host: str = host
+        self.__port: int = port
+        self.__rate: float = rate
+        self.__burst: int = burst
+        self.__max_clients: int = max_clients
+        self.__topics: Dict[str, _Topic] = dict()
+        self.__clients: Set[_Client] = set()
+        self.__loop: asyncio.AbstractEventLoop = None
+        self.__stopping: asyncio.Event = None
+        self.__executor: concurrent.futures.ThreadPoolExecutor = None
+        self.__started: float = 0
+        self.published: int = 0
+
+    def get_topic_names(self) -> tuple:
+        return tuple(self.__topics.keys())
+
+    def get_stats(self) -> dict:
+        return {
+            'uptime': round(time.monotonic() - self.__started, 3) if self.__started else 0,
+            'clients': len(self.__clients),
+            'published': self.published,
+            'polls': sum(t.polls for t in self.__topics.values()),
+            'sent': sum(c.sent for c in self.__clients),
+            'conflated': sum(c.conflated for c in self.__clients)
+        }
+
+    def stop(self) -> None:
+        """Stop the gateway, can be invoked from any thread"""
+        if self.__loop is not None:
+            self.__loop.call_soon_threadsafe(self.__stopping.set)
+
+    async def serve(self) -> None:
+        """Serve the clients until the gateway is stopped"""
+        self.__loop = asyncio.get_running_loop()
+        self.__stopping = asyncio.Event()
+        self.__started = time.monotonic()
+        self.__executor = concurrent.futures.ThreadPoolExecutor(MAX_POLL_WORKERS, thread_name_prefix='WebGatewayPoll')
+        try:
+            names: tuple = await self.__loop.run_in_executor(self.__executor, FunctionInvokers.get_service_names)
+            self.__create_topics(names)
+            server: asyncio.AbstractServer = await asyncio.start_server(self.__handle, self.__host, self.__port, limit=MAX_HEADER_SIZE)
+            self.__logger.info('Serving %s topics at %s:%s', len(self.__topics), self.__host, self.__port)
+            pollers: List[asyncio.Task] = [asyncio.ensure_future(self.__poll_topic(t)) for t in self.__topics.values()]
+            try:
+                await self.__stopping.wait()
+            finally:
+                self.__logger.info('Stopping')
+                server.close()
+                for client in list(self.__clients):
+                    await client.websocket.close(GOING_AWAY)
+                for poller in pollers:
+                    poller.cancel()
+                await asyncio.gather(*pollers, return_exceptions=True)
+                await server.wait_closed()
+        finally:
+            self.__executor.shutdown(wait=False)
+            self.__loop = None
+
+    def __create_topics(self, names: tuple) -> None:
+        classes: Dict[str, type] = {c.__name__: c for c in subclasses_of(FunctionProvider)}
+        for name in names:
+            namespace, _, provider_name = name.rpartition(NAMESPACE_SEPARATOR)
+            provider_class: type = classes.get(provider_name)
+            describe: Callable[[bytes], dict] = None
+            if provider_class is not None and provider_name.endswith(_SUFFIX):
+                describe = getattr(sys.modules[provider_class.__module__], 'describe_snapshot', None)
+            if describe is None:
+                self.__logger.debug('No state for service: %s', name)
+                continue
+            alias: str = provider_name[:-len(_SUFFIX)].lower()
+            topic_name: str = namespace + _TOPIC_SEPARATOR + alias if namespace else alias
+            interval: float = POLL_INTERVALS.get(provider_name, POLL_INTERVAL)
+            self.__topics[topic_name] = _Topic(topic_name, namespace or None, provider_class, describe, interval)
+
+    async def __poll_topic(self, topic: _Topic) -> None:
+        while True:
+            topic.wakeup.clear()
+            timeout: float = None
+            if topic.is_active():
+                timeout = topic.interval
+                try:
+                    state: dict = await self.__loop.run_in_executor(self.__executor, self.__poll, topic)
+                    topic.error = None
+                    self.__publish(topic, state)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as ex:
+                    # Logged once per distinct error, the poll is retried at the interval
+                    if str(ex) != topic.error:
+                        self.__logger.warning('Poll of %s failed: %s', topic.name, ex)
+                    topic.error = str(ex)
+            elif topic.watching:
+                try:
+                    await self.__loop.run_in_executor(self.__executor, self.__unwatch, topic)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as ex:
+                    # The watches of the connection are removed by the server when it is closed
+                    self.__logger.warning('Watches of %s not removed: %s', topic.name, ex)
+            try:
+                await asyncio.wait_for(topic.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def __poll(self, topic: _Topic) -> dict:
+        # Executed by a thread of the executor as the calls of the providers are blocking
+        provider = FunctionInvokers.get_provider(topic.provider_class, topic.namespace)
+        if provider is None:
+            raise LookupError('Provider not available')
+        topic.polls += 1
+        if not topic.watching:
+            loop: asyncio.AbstractEventLoop = self.__loop
+
+            def notify(*args) -> None:
+                try:
+                    loop.call_soon_threadsafe(topic.wakeup.set)
+                except RuntimeError:
+                    # The gateway is stopped
+                    pass
+
+            for method, *args in WATCH_METHODS.get(topic.provider_class.__name__, ()):
+                getattr(provider, method)(*args, notify)
+            topic.watching = True
+        return topic.describe(provider.snapshot())
+
+    def __unwatch(self, topic: _Topic) -> None:
+        # Executed by a thread of the executor, the provider stops sampling when it has no watches
+        topic.watching = False
+        provider = FunctionInvokers.get_provider(topic.provider_class, topic.namespace)
+        if provider is None:
+            return
+        if TRACE:
+            self.__logger.debug('Removing the watches of idle topic %s', topic.name)
+        for method, *args in WATCH_METHODS.get(topic.provider_class.__name__, ()):
+            getattr(provider, method)(*args, None)
+
+    def __publish(self, topic: _Topic, state: dict) -> None:
+        data: str = json.dumps(state, default=_encode_value, sort_keys=True, separators=(',', ':'))
+        if data == topic.state:
+            return
+        topic.state = data
+        topic.version += 1
+        # The state is encoded once for all the subscribers
+        topic.message = '{"topic":%s,"version":%s,"time":%.3f,"state":%s}' % (json.dumps(topic.name), topic.version, time.time(), data)
+        topic.frame = encode_frame(TEXT, topic.message.encode('utf-8'))
+        topic.published.set()
+        self.published += 1
+        if TRACE:
+            self.__logger.debug('Publishing %s version %s to %s clients', topic.name, topic.version, len(topic.clients))
+        for client in topic.clients:
+            client.offer(topic.name, topic.frame)
+
+    async def __handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request: bytes = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), REQUEST_TIMEOUT)
+            method, target, headers = _parse_request(request)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError, ValueError) as ex:
+            self.__logger.debug('Invalid request: %s', ex)
+            await self.__respond(writer, 400, 'text/plain', b'Bad request')
+            return
+        if method != 'GET':
+            await self.__respond(writer, 405, 'text/plain', b'Only GET is supported', {'Allow': 'GET'})
+            return
+        url: urllib.parse.SplitResult = urllib.parse.urlsplit(target)
+        path: str = urllib.parse.unquote(url.path)
+        if path == '/ws':
+            await self.__serve_websocket(reader, writer, headers, urllib.parse.parse_qs(url.query))
+        elif path == '/':
+            await self.__respond(writer, 200, 'text/html; charset=utf-8', _DASHBOARD.encode('utf-8'))
+        elif path == '/topics':
+            await self.__respond_json(writer, [t.describe_topic() for t in self.__topics.values()])
+        elif path == '/stats':
+            await self.__respond_json(writer, self.get_stats())
+        elif path.startswith('/state/') and path[len('/state/'):] in self.__topics:
+            topic: _Topic = self.__topics[path[len('/state/'):]]
+            active: bool = topic.is_active()
+            topic.requested = time.monotonic()
+            # An active topic is already polled at its interval, whatever the number of requests
+            if not active:
+                topic.wakeup.set()
+            try:
+                await asyncio.wait_for(topic.published.wait(), REQUEST_TIMEOUT)
+            except asyncio.TimeoutError:
+                await self.__respond(writer, 503, 'text/plain', (topic.error or 'No state').encode('utf-8'))
+                return
+            await self.__respond(writer, 200, 'application/json', topic.message.encode('utf-8'))
+        else:
+            await self.__respond(writer, 404, 'text/plain', b'Not found')
+
+    async def __respond(self, writer: asyncio.StreamWriter, status: int, content_type: str, body: bytes, headers: dict=None) -> None:
+        lines: List[str] = ['HTTP/1.1 %s %s' % (status, _STATUS[status]), 'Content-Type: ' + content_type,
+                            'Content-Length: %s' % len(body), 'Cache-Control: no-store', 'Connection: close']
+        lines.extend('%s: %s' % h for h in (headers or dict()).items())
+        try:
+            writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('iso-8859-1') + body)
+            await asyncio.wait_for(writer.drain(), REQUEST_TIMEOUT)
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def __respond_json(self, writer: asyncio.StreamWriter, value: Any) -> None:
+        await self.__respond(writer, 200, 'application/json', json.dumps(value).encode('utf-8'))
+
+    async def __serve_websocket(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, headers: Dict[str, str], query: dict) -> None:
+        key: str = headers.get('sec-websocket-key', '')
+        try:
+            valid_key: bool = len(base64.b64decode(key, validate=True)) == 16
+        except ValueError:
+            valid_key = False
+        if headers.get('upgrade', '').lower() != 'websocket' or 'upgrade' not in headers.get('connection', '').lower() or not valid_key:
+            await self.__respond(writer, 400, 'text/plain', b'WebSocket handshake expected')
+            return
+        if headers.get('sec-websocket-version') != '13':
+            await self.__respond(writer, 426, 'text/plain', b'WebSocket version 13 expected', {'Sec-WebSocket-Version': '13'})
+            return
+        if len(self.__clients) >= self.__max_clients:
+            await self.__respond(writer, 503, 'text/plain', b'Too many clients')
+            return
+        writer.write(('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                      'Sec-WebSocket-Accept: %s\r\n\r\n' % get_accept_key(key)).encode('ascii'))
+        client: _Client = _Client(WebSocket(reader, writer), self.__rate, self.__burst)
+        self.__clients.add(client)
+        self.__logger.debug('WebSocket client connected: %s', writer.get_extra_info('peername'))
+        sender: asyncio.Task = asyncio.ensure_future(client.run())
+        try:
+            topics: List[str] = [t for v in query.get('topics', ()) for t in v.split(',') if t]
+            if topics:
+                await self.__subscribe(client, topics)
+            while not client.websocket.closed and not sender.done():
+                text: str = await client.websocket.receive()
+                if text is None:
+                    break
+                await self.__execute(client, text)
+        except WebSocketError as ex:
+            self.__logger.debug('WebSocket closed: %s', ex)
+            await client.websocket.close(ex.code, str(ex))
+        except (asyncio.TimeoutError, ConnectionError) as ex:
+            self.__logger.debug('WebSocket client lost: %s', ex)
+        finally:
+            self.__clients.discard(client)
+            for name in client.topics:
+                self.__topics[name].clients.discard(client)
+            sender.cancel()
+            await asyncio.gather(sender, return_exceptions=True)
+            if not client.websocket.closed:
+                await client.websocket.close(GOING_AWAY)
+            self.__logger.debug('WebSocket client disconnected: %s', writer.get_extra_info('peername'))
+
+    async def __execute(self, client: _Client, text: str) -> None:
+        try:
+            command: Any = json.loads(text)
+        except ValueError:
+            command = None
+        if not isinstance(command, dict) or not all(k in ('subscribe', 'unsubscribe') and isinstance(v, list) and all(isinstance(n, str) for n in v)
+                                                    for k, v in command.items()):
+            await client.websocket.send_text(json.dumps({'error': _COMMAND_ERROR_MSG}))
+            return
+        for name in command.get('unsubscribe', ()):
+            topic: _Topic = self.__topics.get(name)
+            if topic is not None:
+                topic.clients.discard(client)
+                client.topics.discard(name)
+                client.discard(name)
+        await self.__subscribe(client, command.get('subscribe', ()))
+
+    async def __subscribe(self, client: _Client, names: list) -> None:
+        unknown: list = [n for n in names if n not in self.__topics]
+        if unknown:
+            await client.websocket.send_text(json.dumps({'error': _UNKNOWN_TOPICS_MSG % ', '.join(str(n) for n in unknown)}))
+        for name in names:
+            topic: _Topic = self.__topics.get(name)
+            if topic is None or client in topic.clients:
+                continue
+            active: bool = topic.is_active()
+            topic.clients.add(client)
+            client.topics.add(name)
+            # The last state is sent at once, only an idle topic is polled again
+            if topic.frame is not None:
+                client.offer(name, topic.frame)
+            if not active:
+                topic.wakeup.set()
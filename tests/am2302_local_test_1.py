@@ -6,6 +6,7 @@ import pathlib
 import time
 from logging.handlers import RotatingFileHandler
 from id_function_invokers import FunctionInvokers
+from id_logging_utils import start_async_logging
 from function_providers.am2302_provider import Am2302FunctionProvider
 
 PIN_1: int = 23
@@ -37,6 +38,7 @@ def create_rotating_log() -> logging.Logger:
 
 
 logger: logging.Logger = create_rotating_log()
+start_async_logging(logger)
 
 FunctionInvokers.initialize(logger)
 provider: Am2302FunctionProvider = FunctionInvokers.get_provider(Am2302FunctionProvider)
@@ -0,0 +1,165 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+# Benchmark of the local and remote invocation paths using the mock modules
+# Usage: benchmark.py [--mode local|remote|all] [--iterations N] [--mock-profile none|pi] [--output results.json]
+import argparse
+import contextlib
+import datetime
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+# Headless rendering for the LCD mock
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('ID_MOCK_LCD_HEADLESS', '1')
+from id_benchmark_utils import LOOPBACK, count_requests, find_free_port, start_loopback_server, stop_loopback_server, summarize
+from id_function_invokers import FunctionInvokers, VERSION
+from function_providers.am2302_provider import Am2302FunctionProvider
+from function_providers.gfxhat_provider import GfxHatFunctionProvider
+from function_providers.wiringpi_provider import WiringPiFunctionProvider
+
+MODES: tuple = ('local', 'remote')
+PIN: int = 0
+DHT_PIN: int = 23
+LCD_WIDTH: int = 128
+LCD_HEIGHT: int = 64
+
+ListOfResults = List[Dict[str, Any]]
+
+
+def measure(function: Callable, iterations: int, warmup: int) -> Dict[str, float]:
+    for _ in range(warmup):
+        function()
+    clock = time.perf_counter
+    samples: list = list()
+    start: float = clock()
+    for _ in range(iterations):
+        t: float = clock()
+        function()
+        samples.append(clock() - t)
+    return summarize(samples, clock() - start)
+
+
+def run_mode(logger: logging.Logger, mode: str, iterations: int, warmup: int, port: int) -> ListOfResults:
+    results: ListOfResults = list()
+    server = None
+    if mode == 'remote':
+        if not port:
+            port = find_free_port()
+        server = start_loopback_server(port)
+        FunctionInvokers.initialize(parent_logger=logger, host=LOOPBACK, port=port)
+    else:
+        FunctionInvokers.initialize(parent_logger=logger)
+
+    def add(case: str, stats: Dict[str, float], requests_per_call: float=None) -> None:
+        entry: Dict[str, Any] = {'mode': mode, 'case': case}
+        entry.update(stats)
+        if requests_per_call is not None:
+            entry['requests_per_call'] = requests_per_call
+        results.append(entry)
+        logger.warning('%-8s %-28s %12.1f calls/s  p50 %10.1f us  p99 %10.1f us', mode, case, stats['calls_per_sec'], stats['p50_us'], stats['p99_us'])
+
+    try:
+        # The first retrieval of each provider establishes its connection in remote mode
+        cold: list = list()
+        for provider_class in (WiringPiFunctionProvider, GfxHatFunctionProvider, Am2302FunctionProvider):
+            t: float = time.perf_counter()
+            FunctionInvokers.get_provider(provider_class)
+            cold.append(time.perf_counter() - t)
+        add('get_provider_cold', summarize(cold))
+        add('get_provider_warm', measure(lambda: FunctionInvokers.get_provider(WiringPiFunctionProvider), iterations, warmup))
+        wiringpi: WiringPiFunctionProvider = FunctionInvokers.get_provider(WiringPiFunctionProvider)
+        gfxhat: GfxHatFunctionProvider = FunctionInvokers.get_provider(GfxHatFunctionProvider)
+        am2302: Am2302FunctionProvider = FunctionInvokers.get_provider(Am2302FunctionProvider)
+        wiringpi.wiringPiSetup()
+        wiringpi.pinMode(PIN, 1)
+        am2302.setup(DHT_PIN)
+        all_pins: tuple = tuple(range(32))
+        frame_x: tuple = tuple(x for x in range(LCD_WIDTH) for _ in range(LCD_HEIGHT))
+        frame_y: tuple = tuple(y for _ in range(LCD_WIDTH) for y in range(LCD_HEIGHT))
+        packed_pins: bytes = bytes(all_pins)
+        packed_frame_x: bytes = bytes(frame_x)
+        packed_frame_y: bytes = bytes(frame_y)
+        # The mocks print their state, their output is not part of the results
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            add('digitalWrite', measure(lambda: wiringpi.digitalWrite(PIN, 1), iterations, warmup))
+            add('digitalReads_32', measure(lambda: wiringpi.digitalReads(all_pins), iterations, warmup))
+            add('digitalReads_32_packed', measure(lambda: wiringpi.digitalReads(packed_pins), iterations, warmup))
+            add('lcd_set_pixels_frame', measure(lambda: gfxhat.lcd_set_pixels(frame_x, frame_y, True), max(5, iterations // 100), 1))
+            add('lcd_set_pixels_frame_packed', measure(lambda: gfxhat.lcd_set_pixels(packed_frame_x, packed_frame_y, True), max(5, iterations // 100), 1))
+            add('backlight_set_pixel', measure(lambda: gfxhat.backlight_set_pixel(0, 255, 0, 0), iterations, warmup))
+            add('temperature', measure(am2302.temperature, iterations, warmup))
+            if mode == 'remote':
+                # Stubs resolve the remote methods once, the raw proxy resolves them on each call
+                connection = wiringpi._get_connection().get_connection()
+                raw = connection.root
+                stub_call = lambda: wiringpi.digitalWrite(PIN, 1)
+                raw_call = lambda: raw.digitalWrite(PIN, 1)
+                add('digitalWrite_stub', measure(stub_call, iterations, warmup), count_requests(connection, stub_call, 100))
+                add('digitalWrite_netref', measure(raw_call, iterations, warmup), count_requests(connection, raw_call, 100))
+    finally:
+        FunctionInvokers.stop()
+        if server:
+            stop_loopback_server(server)
+    return results
+
+
+def run_child(mode: str, args: argparse.Namespace) -> ListOfResults:
+    # The invokers are configured once per process, each mode runs in its own process
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+        path: str = f.name
+    try:
+        command: list = [sys.executable, __file__, '--mode', mode, '--iterations', str(args.iterations), '--warmup', str(args.warmup), '--output', path]
+        subprocess.run(command, check=True)
+        with open(path) as f:
+            return json.load(f)['results']
+    finally:
+        os.remove(path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark of the local and remote invocation paths')
+    parser.add_argument('--mode', choices=MODES + ('all',), default='all')
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--warmup', type=int, default=50)
+    parser.add_argument('--port', type=int, default=0, help='Port of the loopback registry, a free one if not specified')
+    parser.add_argument('--mock-profile', help='Timing model of the mock modules (none or pi), see id_mock_timing')
+    parser.add_argument('--output', help='Path of the JSON results, standard output if not specified')
+    args = parser.parse_args()
+    if args.mock_profile:
+        # Read when the mock modules are imported, the child processes and the loopback server inherit it
+        os.environ['ID_MOCK_PROFILE'] = args.mock_profile
+    logger: logging.Logger = logging.getLogger('Benchmark')
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.WARNING)
+    if args.mode == 'all':
+        results: ListOfResults = list()
+        for mode in MODES:
+            results.extend(run_child(mode, args))
+    else:
+        results = run_mode(logger, args.mode, args.iterations, args.warmup, args.port)
+    document: dict = {
+        'version': VERSION,
+        'timestamp': datetime.datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'platform': platform.platform(),
+        'iterations': args.iterations,
+        'mock_profile': os.environ.get('ID_MOCK_PROFILE', 'none'),
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(document, f, indent=2)
+    else:
+        print(json.dumps(document, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -7,6 +7,7 @@ import signal
 import time
 from logging.handlers import RotatingFileHandler
 from id_function_invokers import FunctionInvokers
+from id_logging_utils import start_async_logging
 from function_providers.gfxhat_provider import GfxHatFunctionProvider
 from PIL import Image, ImageDraw, ImageFont
 
@@ -38,6 +39,7 @@ def create_rotating_log() -> logging.Logger:
 
 
 logger: logging.Logger = create_rotating_log()
+start_async_logging(logger)
 
 FunctionInvokers.initialize(logger)
 provider: GfxHatFunctionProvider = FunctionInvokers.get_provider(GfxHatFunctionProvider)
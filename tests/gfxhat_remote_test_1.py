@@ -7,6 +7,8 @@ import signal
 import time
 from logging.handlers import RotatingFileHandler
 from id_function_invokers import FunctionInvokers
+from id_callback_utils import CallbackDispatcher
+from id_logging_utils import start_async_logging
 from function_providers.gfxhat_provider import GfxHatFunctionProvider
 from PIL import Image, ImageDraw, ImageFont
 
@@ -38,10 +40,13 @@ def create_rotating_log() -> logging.Logger:
 
 
 logger: logging.Logger = create_rotating_log()
+start_async_logging(logger)
 
 # FunctionInvokers.initialize(parent_logger=logger, host='127.0.0.1', server=False)
 FunctionInvokers.initialize(parent_logger=logger, host='192.168.168.65')
 provider: GfxHatFunctionProvider = FunctionInvokers.get_provider(GfxHatFunctionProvider)
+# The handler makes remote calls, it must not run on the thread serving the connection
+dispatcher: CallbackDispatcher = CallbackDispatcher(logger, workers=1)
 
 for x in range(6):
     provider.backlight_set_pixel(x, 0, 0, 0)
@@ -89,7 +94,7 @@ for x in range(6):
 
 for x in range(6):
     #provider.backlight_set_pixel(x, 0, 255, 0)
-    provider.touch_on(x, touch_handler)
+    provider.touch_on_events(x, dispatcher.wrap(touch_handler))
 
 provider.backlight_show()
 
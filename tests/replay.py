@@ -0,0 +1,98 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+# Replay of a recording of provider calls
+# A recording is made by running any client with the ID_RECORD_CALLS environment variable, for example:
+#   ID_RECORD_CALLS=/tmp/wiringpi.rec python3 tests/wiringpi_local_test_1.py
+# Usage: replay.py recording [--mode local|remote] [--host H --port P] [--clients N] [--speed S] [--output results.json]
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import rpyc
+
+# Headless rendering for the LCD mock
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+# The replay must not record itself
+os.environ.pop('ID_RECORD_CALLS', None)
+from id_benchmark_utils import LOOPBACK, find_free_port, start_loopback_server, stop_loopback_server
+from id_call_recorder import CallReplayer, find_provider_class, read_calls
+from id_function_invokers import CLIENT_CONFIG, FunctionInvokers
+
+
+class RemoteProviders(object):
+    """Opens dedicated connections for each simulated client"""
+
+    def __init__(self, host: str, port: int):
+        self.__host: str = host
+        self.__port: int = port
+        self.__connections: list = list()
+        self.__lock: threading.Lock = threading.Lock()
+
+    def get(self, client: int, name: str):
+        registry = rpyc.connect(self.__host, self.__port, config=CLIENT_CONFIG)
+        try:
+            port: int = registry.root.get_service_port(name)
+        finally:
+            registry.close()
+        if port <= 0:
+            raise ValueError('Provider not found: %s' % name)
+        connection = rpyc.connect(self.__host, port, config=CLIENT_CONFIG)
+        with self.__lock:
+            self.__connections.append(connection)
+        return connection.root
+
+    def close(self) -> None:
+        with self.__lock:
+            for connection in self.__connections:
+                connection.close()
+            self.__connections.clear()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Replay of a recording of provider calls')
+    parser.add_argument('recording')
+    parser.add_argument('--mode', choices=('local', 'remote'), default='remote')
+    parser.add_argument('--host', help='Host of the registry, a loopback server using the mocks is started if not specified')
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--clients', type=int, default=1)
+    parser.add_argument('--speed', type=float, default=1.0, help='Speed factor, 0 to replay as fast as possible')
+    parser.add_argument('--output', help='Path of the JSON results, standard output if not specified')
+    args = parser.parse_args()
+    logger: logging.Logger = logging.getLogger('Replay')
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.INFO)
+    calls: list = list(read_calls(args.recording))
+    server = None
+    remote_providers: RemoteProviders = None
+    try:
+        if args.mode == 'remote':
+            host: str = args.host
+            port: int = args.port
+            if not host:
+                host = LOOPBACK
+                port = port or find_free_port()
+                server = start_loopback_server(port)
+            remote_providers = RemoteProviders(host, port)
+            factory = remote_providers.get
+        else:
+            FunctionInvokers.initialize(parent_logger=logger)
+            factory = lambda client, name: FunctionInvokers.get_provider(find_provider_class(name))
+        result: dict = CallReplayer(logger, calls, factory).replay(args.clients, args.speed)
+        result['mode'] = args.mode
+        result['recording'] = args.recording
+    finally:
+        if remote_providers:
+            remote_providers.close()
+        if server:
+            stop_loopback_server(server)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    else:
+        json.dump(result, sys.stdout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
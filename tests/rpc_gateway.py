@@ -0,0 +1,48 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+import logging
+import os
+import pathlib
+import sys
+from logging.handlers import RotatingFileHandler
+from id_function_invokers import FunctionInvokers
+from id_gateway import parse_devices
+from id_logging_utils import start_async_logging
+
+
+def create_rotating_log() -> logging.Logger:
+    # noinspection PyUnresolvedReferences
+    log_file_path: str = '/tmp/rpc_gateway.log'
+    result: logging.Logger = logging.getLogger("RpcGateway")
+    path_obj: pathlib.Path = pathlib.Path(log_file_path)
+    if not os.path.exists(path_obj.parent.absolute()):
+        os.makedirs(path_obj.parent.absolute())
+    if os.path.exists(log_file_path):
+        open(log_file_path, 'w').close()
+    else:
+        path_obj.touch()
+    # noinspection Spellchecker
+    formatter: logging.Formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    console_handler: logging.Handler = logging.StreamHandler()
+    console_handler.setFormatter(formatter)
+    result.addHandler(console_handler)
+    file_handler: logging.Handler = RotatingFileHandler(log_file_path, maxBytes=1024 * 1024 * 5, backupCount=5)
+    # noinspection PyUnresolvedReferences
+    file_handler.setLevel(logging.DEBUG)
+    file_handler.setFormatter(formatter)
+    result.addHandler(file_handler)
+    # noinspection PyUnresolvedReferences
+    result.setLevel(logging.DEBUG)
+    return result
+
+logger: logging.Logger = create_rotating_log()
+start_async_logging(logger)
+
+# Arguments: host and port of the registry of the gateway, then the devices as alias=host[:port]
+# Example: rpc_gateway.py 0.0.0.0 8000 kitchen=192.168.168.65 garage=192.168.168.66:8000
+host: str = sys.argv[1] if len(sys.argv) > 1 else '0.0.0.0'
+port: int = int(sys.argv[2]) if len(sys.argv) > 2 else 8000
+devices: dict = parse_devices(sys.argv[3:])
+FunctionInvokers.initialize(parent_logger=logger, host=host, port=port, server=True, devices=devices)
+FunctionInvokers.start()
+sys.exit(0)
@@ -6,6 +6,7 @@ import pathlib
 import sys
 from logging.handlers import RotatingFileHandler
 from id_function_invokers import FunctionInvokers
+from id_logging_utils import start_async_logging
 
 
 def create_rotating_log() -> logging.Logger:
@@ -34,7 +35,12 @@ def create_rotating_log() -> logging.Logger:
     return result
 
 logger: logging.Logger = create_rotating_log()
+start_async_logging(logger)
 
-FunctionInvokers.initialize(parent_logger=logger, host='0.0.0.0', port=8000, server=True)
+# Optional arguments: host and port of the registry, directory of the unix domain sockets
+host: str = sys.argv[1] if len(sys.argv) > 1 else '0.0.0.0'
+port: int = int(sys.argv[2]) if len(sys.argv) > 2 else 8000
+socket_dir: str = sys.argv[3] if len(sys.argv) > 3 else None
+FunctionInvokers.initialize(parent_logger=logger, host=host, port=port, server=True, socket_dir=socket_dir)
 FunctionInvokers.start()
 sys.exit(0)
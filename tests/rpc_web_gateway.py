@@ -0,0 +1,57 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+import os
+import pathlib
+import signal
+import sys
+from logging.handlers import RotatingFileHandler
+from id_function_invokers import FunctionInvokers
+from id_logging_utils import start_async_logging
+from id_web_gateway import DEFAULT_WEB_PORT, WebGateway
+
+
+def create_rotating_log() -> logging.Logger:
+    # noinspection PyUnresolvedReferences
+    log_file_path: str = '/tmp/rpc_web_gateway.log'
+    result: logging.Logger = logging.getLogger("RpcWebGateway")
+    path_obj: pathlib.Path = pathlib.Path(log_file_path)
+    if not os.path.exists(path_obj.parent.absolute()):
+        os.makedirs(path_obj.parent.absolute())
+    if os.path.exists(log_file_path):
+        open(log_file_path, 'w').close()
+    else:
+        path_obj.touch()
+    # noinspection Spellchecker
+    formatter: logging.Formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    console_handler: logging.Handler = logging.StreamHandler()
+    console_handler.setFormatter(formatter)
+    result.addHandler(console_handler)
+    file_handler: logging.Handler = RotatingFileHandler(log_file_path, maxBytes=1024 * 1024 * 5, backupCount=5)
+    # noinspection PyUnresolvedReferences
+    file_handler.setLevel(logging.DEBUG)
+    file_handler.setFormatter(formatter)
+    result.addHandler(file_handler)
+    # noinspection PyUnresolvedReferences
+    result.setLevel(logging.DEBUG)
+    return result
+
+logger: logging.Logger = create_rotating_log()
+start_async_logging(logger)
+
+# Arguments: host and port of the web gateway, then host and port of the registry of the server or of the gateway of devices
+# Example: rpc_web_gateway.py 0.0.0.0 8080 127.0.0.1 8000
+host: str = sys.argv[1] if len(sys.argv) > 1 else '0.0.0.0'
+port: int = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_WEB_PORT
+registry_host: str = sys.argv[3] if len(sys.argv) > 3 else '127.0.0.1'
+registry_port: int = int(sys.argv[4]) if len(sys.argv) > 4 else 8000
+FunctionInvokers.initialize(parent_logger=logger, host=registry_host, port=registry_port)
+gateway: WebGateway = WebGateway(logger, host, port)
+signal.signal(signal.SIGINT, lambda *args: gateway.stop())
+signal.signal(signal.SIGTERM, lambda *args: gateway.stop())
+try:
+    asyncio.run(gateway.serve())
+finally:
+    FunctionInvokers.stop()
+sys.exit(0)
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import array
+import unittest
+from id_buffer_utils import as_array
+
+ERROR_MSG: str = 'Invalid values'
+
+
+class AsArrayTest(unittest.TestCase):
+
+    def test_packed(self):
+        self.assertEqual(array.array('B', (1, 2, 3)), as_array(b'\x01\x02\x03', 'x', ERROR_MSG))
+        self.assertEqual(array.array('B', (1, 2)), as_array(memoryview(bytearray((1, 2))), 'x', ERROR_MSG))
+        values: array.array = array.array('H', (1, 65535))
+        self.assertEqual(values, as_array(values.tobytes(), 'x', ERROR_MSG, 'H'))
+        self.assertEqual(values, as_array(memoryview(values), 'x', ERROR_MSG, 'H'))
+
+    def test_typed_views(self):
+        # The views over other types are converted value by value
+        self.assertEqual(array.array('B', (1, 2)), as_array(memoryview(array.array('I', (1, 2))), 'x', ERROR_MSG))
+        self.assertEqual(array.array('H', (1, 2)), as_array(memoryview(array.array('h', (1, 2))), 'x', ERROR_MSG, 'H'))
+        self.assertEqual(array.array('B', (1, 2)), as_array(memoryview(array.array('d', (1.5, 2))), 'x', ERROR_MSG))
+        for view, typecode in ((memoryview(array.array('b', (-1,))), 'B'), (memoryview(array.array('h', (-1, 2))), 'H'),
+                               (memoryview(array.array('I', (256,))), 'B')):
+            with self.assertRaises(ValueError, msg=view.format) as context:
+                as_array(view, 'x', ERROR_MSG, typecode)
+            self.assertEqual(ERROR_MSG, str(context.exception))
+
+    def test_invalid(self):
+        for value, typecode in ((b'\x01\x02\x03', 'H'), ((1, 256), 'B'), ((-1,), 'H'), (('a',), 'B')):
+            with self.assertRaises(ValueError, msg=repr(value)) as context:
+                as_array(value, 'x', ERROR_MSG, typecode)
+            self.assertEqual(ERROR_MSG, str(context.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
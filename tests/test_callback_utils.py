@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+import time
+import unittest
+import rpyc
+from rpyc.utils.factory import connect_thread
+from id_callback_utils import DROP_NEWEST, DROP_OLDEST, REPEAT_EVENT, CallbackDispatcher, EventBatcher
+
+INTERVAL: float = 0.05
+TIMEOUT: float = 5.0
+
+
+def wait_for(condition) -> bool:
+    deadline: float = time.monotonic() + TIMEOUT
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+class _ClientService(rpyc.Service):
+    """Service of a client receiving the events of the batcher"""
+
+    def __init__(self, events: list):
+        super().__init__()
+        self.__events: list = events
+
+    def exposed_callback(self, channel, event) -> None:
+        self.__events.append((channel, event))
+
+
+class EventBatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.batcher: EventBatcher = EventBatcher(logging.getLogger('CallbackTest'), INTERVAL)
+        self.events: list = list()
+
+    def tearDown(self):
+        self.batcher.stop()
+
+    def test_events(self):
+        self.batcher.register('a', lambda channel, event: self.events.append((channel, event)))
+        self.batcher.add('a', 1, 'press')
+        self.batcher.add('a', 1, 'release')
+        # The events of the keys without callback are ignored
+        self.batcher.add('b', 1, 'press')
+        self.assertTrue(wait_for(lambda: len(self.events) == 2))
+        self.assertEqual([(1, 'press'), (1, 'release')], self.events)
+        self.batcher.register('a', None)
+        self.batcher.add('a', 1, 'press')
+        time.sleep(INTERVAL * 2)
+        self.assertEqual(2, len(self.events))
+
+    def test_batches_and_merged_repeats(self):
+        self.batcher.register('a', self.events.append, True)
+        for channel, event in ((1, 'press'), (1, REPEAT_EVENT), (2, REPEAT_EVENT), (1, REPEAT_EVENT), (1, REPEAT_EVENT)):
+            self.batcher.add('a', channel, event)
+        self.assertTrue(wait_for(lambda: self.events))
+        time.sleep(INTERVAL * 2)
+        # A single batch of (timestamp, channel, event), the pending repeat event of a channel is replaced
+        self.assertEqual(1, len(self.events))
+        self.assertEqual([(1, 'press'), (1, REPEAT_EVENT), (2, REPEAT_EVENT)], [e[1:] for e in self.events[0]])
+        # A repeat event following another event is kept
+        self.batcher.add('a', 1, 'release')
+        self.batcher.add('a', 1, REPEAT_EVENT)
+        self.assertTrue(wait_for(lambda: len(self.events) == 2))
+        self.assertEqual([(1, 'release'), (1, REPEAT_EVENT)], [e[1:] for e in self.events[1]])
+
+    def test_unregister_connection(self):
+        connections: list = [connect_thread(remote_service=_ClientService(self.events)) for _ in range(2)]
+        try:
+            for connection in connections:
+                self.batcher.register((connection, 0), connection.root.callback)
+            self.batcher.unregister_connection(connections[0])
+            for index, connection in enumerate(connections):
+                self.batcher.add((connection, 0), index, 'press')
+            self.assertTrue(wait_for(lambda: self.events))
+            time.sleep(INTERVAL * 2)
+            # Only the callback of the other connection is invoked
+            self.assertEqual([(1, 'press')], self.events)
+        finally:
+            for connection in connections:
+                connection.close()
+
+
+class CallbackDispatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.handled: list = list()
+        self.started: threading.Event = threading.Event()
+        self.released: threading.Event = threading.Event()
+        self.dispatchers: list = list()
+
+    def tearDown(self):
+        self.released.set()
+        for dispatcher in self.dispatchers:
+            dispatcher.close()
+
+    def handler(self, channel, event) -> None:
+        if event == 'block':
+            self.started.set()
+            self.released.wait(TIMEOUT)
+        self.handled.append((channel, event))
+
+    def create_blocked(self, **kwargs) -> tuple:
+        """Return a dispatcher having a single worker blocked by a first event and the callback to register"""
+        dispatcher: CallbackDispatcher = CallbackDispatcher(logging.getLogger('CallbackTest'), workers=1, **kwargs)
+        self.dispatchers.append(dispatcher)
+        callback = dispatcher.wrap(self.handler)
+        callback(0, 'block')
+        self.assertTrue(self.started.wait(TIMEOUT))
+        return dispatcher, callback
+
+    def release(self, dispatcher: CallbackDispatcher, count: int) -> None:
+        self.released.set()
+        self.assertTrue(wait_for(lambda: len(self.handled) == count))
+        self.assertEqual(0, dispatcher.get_pending())
+
+    def test_invalid_policy(self):
+        with self.assertRaises(ValueError):
+            CallbackDispatcher(logging.getLogger('CallbackTest'), policy='drop_all')
+
+    def test_drop_oldest(self):
+        dispatcher, callback = self.create_blocked(queue_size=2, policy=DROP_OLDEST)
+        for channel in range(1, 4):
+            callback(channel, 'press')
+        self.assertEqual(1, dispatcher.dropped)
+        self.release(dispatcher, 3)
+        self.assertEqual([(0, 'block'), (2, 'press'), (3, 'press')], self.handled)
+
+    def test_drop_newest(self):
+        dispatcher, callback = self.create_blocked(queue_size=2, policy=DROP_NEWEST)
+        # A batch is queued event by event
+        callback(((0, 1, 'press'), (0, 2, 'press'), (0, 3, 'press')))
+        self.assertEqual(1, dispatcher.dropped)
+        self.release(dispatcher, 3)
+        self.assertEqual([(0, 'block'), (1, 'press'), (2, 'press')], self.handled)
+
+    def test_merged_repeats(self):
+        dispatcher, callback = self.create_blocked()
+        for channel, event in ((1, 'press'), (1, REPEAT_EVENT), (2, REPEAT_EVENT), (1, REPEAT_EVENT), (2, 'release')):
+            callback(channel, event)
+        # The repeat events of the handlers are not merged with the ones of another handler
+        other = dispatcher.wrap(lambda channel, event: self.handled.append(('other', event)))
+        other(1, REPEAT_EVENT)
+        self.assertEqual(1, dispatcher.merged)
+        self.release(dispatcher, 6)
+        self.assertEqual([(0, 'block'), (1, 'press'), (1, REPEAT_EVENT), (2, REPEAT_EVENT), (2, 'release'), ('other', REPEAT_EVENT)],
+                         self.handled)
+
+    def test_repeats_kept(self):
+        dispatcher, callback = self.create_blocked(merge_repeats=False)
+        for _ in range(3):
+            callback(1, REPEAT_EVENT)
+        self.assertEqual(0, dispatcher.merged)
+        self.release(dispatcher, 4)
+
+    def test_close(self):
+        dispatcher, callback = self.create_blocked()
+        callback(1, 'press')
+        dispatcher.close(0)
+        self.assertEqual(0, dispatcher.get_pending())
+        callback(2, 'press')
+        self.assertEqual(0, dispatcher.get_pending())
+        self.released.set()
+        time.sleep(INTERVAL)
+        self.assertEqual([(0, 'block')], self.handled)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+import unittest
+from id_coalescing import SingleFlight
+
+THREADS: int = 8
+TIMEOUT: float = 5.0
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def setUp(self):
+        self.flights: SingleFlight = SingleFlight({'read': 0, 'cached': 60.0})
+        self.release: threading.Event = threading.Event()
+        self.executions: int = 0
+
+    def blocking_read(self) -> int:
+        self.executions += 1
+        if not self.release.wait(TIMEOUT):
+            raise TimeoutError('Read not released')
+        return 42
+
+    def start_calls(self, name: str, args: tuple, function) -> tuple:
+        """Start the concurrent calls and return the threads and the list of their outcomes"""
+        outcomes: list = list()
+        lock: threading.Lock = threading.Lock()
+
+        def target() -> None:
+            try:
+                result = self.flights.call(name, args, function)
+            except Exception as ex:
+                result = ex
+            with lock:
+                outcomes.append(result)
+
+        threads: list = [threading.Thread(target=target) for _ in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        # The calls following the first one wait for it before it is released
+        deadline: float = time.monotonic() + TIMEOUT
+        while self.flights.shared < THREADS - 1 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        self.assertEqual(THREADS - 1, self.flights.shared)
+        return threads, outcomes
+
+    def join(self, threads: list) -> None:
+        for thread in threads:
+            thread.join(TIMEOUT)
+            self.assertFalse(thread.is_alive())
+
+    def test_concurrent_reads_collapse(self):
+        threads, outcomes = self.start_calls('read', (1,), self.blocking_read)
+        self.release.set()
+        self.join(threads)
+        self.assertEqual([42] * THREADS, outcomes)
+        self.assertEqual(1, self.executions)
+        self.assertEqual(1, self.flights.executed)
+        # The time to live is 0, the next call is executed
+        self.assertEqual(42, self.flights.call('read', (1,), self.blocking_read))
+        self.assertEqual(2, self.executions)
+
+    def test_error_is_shared(self):
+
+        def failing_read() -> int:
+            self.executions += 1
+            self.release.wait(TIMEOUT)
+            raise ValueError('Sensor not ready')
+
+        threads, outcomes = self.start_calls('read', (), failing_read)
+        self.release.set()
+        self.join(threads)
+        self.assertEqual(THREADS, len(outcomes))
+        self.assertTrue(all(isinstance(o, ValueError) for o in outcomes))
+        self.assertEqual(1, self.executions)
+
+    def test_different_arguments_are_not_shared(self):
+        self.release.set()
+        self.assertEqual(42, self.flights.call('read', (1,), self.blocking_read))
+        self.assertEqual(42, self.flights.call('read', (2,), self.blocking_read))
+        self.assertEqual(2, self.flights.executed)
+        self.assertEqual(0, self.flights.shared)
+
+    def test_result_kept_until_invalidated(self):
+        self.release.set()
+        self.assertEqual(42, self.flights.call('cached', (), self.blocking_read))
+        self.assertEqual(42, self.flights.call('cached', (), self.blocking_read))
+        self.assertEqual(1, self.executions)
+        self.assertEqual(1, self.flights.hits)
+        self.flights.invalidate(('cached',))
+        self.assertEqual(42, self.flights.call('cached', (), self.blocking_read))
+        self.assertEqual(2, self.executions)
+
+    def test_invalidation_stops_sharing(self):
+        threads, outcomes = self.start_calls('read', (), self.blocking_read)
+        self.flights.invalidate(('read',))
+        # A call started after the invalidation does not share the call in progress
+        call: threading.Thread = threading.Thread(target=lambda: outcomes.append(self.flights.call('read', (), self.blocking_read)))
+        call.start()
+        deadline: float = time.monotonic() + TIMEOUT
+        while self.executions < 2 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        self.release.set()
+        self.join(threads + [call])
+        self.assertEqual(2, self.executions)
+        self.assertEqual([42] * (THREADS + 1), outcomes)
+
+
+if __name__ == '__main__':
+    unittest.main()
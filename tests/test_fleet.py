@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import time
+import unittest
+from function_providers.wiringpi_provider import WiringPiFunctionProvider
+from id_benchmark_utils import LOOPBACK, find_free_port, start_loopback_server, stop_loopback_server
+from id_fleet import FleetClient, FleetResult
+
+# Duration of each call of the GPIO functions on the slow host, the operations have a shorter deadline
+SLOW_LATENCY: float = 0.6
+DEADLINE: float = 0.3
+
+
+class FleetClientTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.processes: list = list()
+        cls.fast: str = cls.start_server(None)
+        cls.slow: str = cls.start_server(SLOW_LATENCY)
+        # Nothing listens on the port of the dead host
+        cls.dead: str = '%s:%s' % (LOOPBACK, find_free_port())
+
+    @classmethod
+    def start_server(cls, latency: float) -> str:
+        port: int = find_free_port()
+        previous: str = os.environ.get('ID_MOCK_GPIO_LATENCY')
+        if latency is not None:
+            os.environ['ID_MOCK_GPIO_LATENCY'] = str(latency)
+        try:
+            cls.processes.append(start_loopback_server(port))
+        finally:
+            if previous is None:
+                os.environ.pop('ID_MOCK_GPIO_LATENCY', None)
+            else:
+                os.environ['ID_MOCK_GPIO_LATENCY'] = previous
+        return '%s:%s' % (LOOPBACK, port)
+
+    @classmethod
+    def tearDownClass(cls):
+        for process in cls.processes:
+            stop_loopback_server(process)
+
+    def setUp(self):
+        self.client: FleetClient = FleetClient(logging.getLogger('FleetTest'), (self.fast, self.slow, self.dead))
+
+    def tearDown(self):
+        self.client.close()
+
+    def assert_partial(self, result: FleetResult, value) -> None:
+        self.assertEqual({self.fast: value}, result.values)
+        self.assertEqual({self.slow}, result.get_timed_out())
+        self.assertIsInstance(result.errors[self.dead], ConnectionError)
+        self.assertFalse(result.is_complete())
+
+    def run_bounded(self, operation) -> FleetResult:
+        started: float = time.monotonic()
+        result: FleetResult = operation()
+        # The slow host does not delay the operation beyond its deadline
+        self.assertLess(time.monotonic() - started, SLOW_LATENCY)
+        return result
+
+    def test_broadcast(self):
+        result: FleetResult = self.run_bounded(lambda: self.client.broadcast(WiringPiFunctionProvider, 'wiringPiSetup', timeout=DEADLINE))
+        self.assert_partial(result, True)
+
+    def test_gather(self):
+        self.client.broadcast(WiringPiFunctionProvider, 'wiringPiSetup', hosts=(self.fast,))
+        self.client.broadcast(WiringPiFunctionProvider, 'pinMode', 3, 1, hosts=(self.fast,))
+        self.client.broadcast(WiringPiFunctionProvider, 'digitalWrite', 3, 1, hosts=(self.fast,))
+        result: FleetResult = self.run_bounded(lambda: self.client.gather(WiringPiFunctionProvider, 'digitalRead', 3, timeout=DEADLINE))
+        self.assert_partial(result, 1)
+
+    def test_scatter(self):
+        self.client.broadcast(WiringPiFunctionProvider, 'wiringPiSetup', hosts=(self.fast,))
+        self.client.scatter(WiringPiFunctionProvider, 'pinMode', {self.fast: (4, 1)})
+        self.client.scatter(WiringPiFunctionProvider, 'pinMode', {self.fast: (5, 1)})
+        args: dict = {self.fast: ((4, 5), 1), self.slow: ((4,), 1), self.dead: ((4,), 1)}
+        result: FleetResult = self.run_bounded(lambda: self.client.scatter(WiringPiFunctionProvider, 'digitalWrites', args, timeout=DEADLINE))
+        self.assert_partial(result, True)
+        self.assertEqual({self.fast: (1, 1)}, self.client.gather(WiringPiFunctionProvider, 'digitalReads', (4, 5), hosts=(self.fast,)).values)
+
+
+if __name__ == '__main__':
+    unittest.main()
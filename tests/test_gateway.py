@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+import time
+import unittest
+from typing import Any
+from function_providers.gfxhat_provider import GfxHatFunctionProvider
+from function_providers.wiringpi_provider import WiringPiFunctionProvider
+from id_gateway import GatewayProviderService
+from id_schema import MANY_SUFFIX
+
+TIMEOUT: float = 5.0
+
+
+class DeviceStub(object):
+    """Provider of a device counting the calls forwarded by the gateway, the reads return the last written value"""
+
+    def __init__(self):
+        self.calls: list = list()
+        self.value: int = 0
+        self.read_started: threading.Event = threading.Event()
+        self.read_released: threading.Event = threading.Event()
+        self.read_released.set()
+
+    def digitalRead(self, pin: int) -> int:
+        value: int = self.value
+        self.calls.append('digitalRead')
+        self.read_started.set()
+        self.read_released.wait(TIMEOUT)
+        return value
+
+    def digitalWrite(self, pin: int, value: int) -> bool:
+        self.calls.append('digitalWrite')
+        self.value = value
+        return True
+
+    def __getattr__(self, name: str) -> Any:
+        return lambda *args: self.calls.append(name) or (128, 64)
+
+
+class GatewayCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stub: DeviceStub = DeviceStub()
+        self.services: list = list()
+
+    def tearDown(self):
+        for service in self.services:
+            service.finalize()
+
+    def create_service(self, provider_class: type) -> GatewayProviderService:
+        service: GatewayProviderService = GatewayProviderService(logging.getLogger('GatewayTest'), provider_class, lambda: self.stub)
+        self.services.append(service)
+        return service
+
+    def test_cached_until_invalidated(self):
+        service: GatewayProviderService = self.create_service(GfxHatFunctionProvider)
+        # The time to live is the one declared by the provider
+        for _ in range(3):
+            self.assertEqual((128, 64), service._rpyc_getattr('lcd_dimensions')())
+        # The calls not invalidating the read keep its result
+        service._rpyc_getattr('lcd_set_pixel')(1, 2, True)
+        service._rpyc_getattr('lcd_dimensions')()
+        self.assertEqual(['lcd_dimensions', 'lcd_set_pixel'], self.stub.calls)
+
+    def test_invalidation(self):
+        service: GatewayProviderService = self.create_service(WiringPiFunctionProvider)
+        read = service._rpyc_getattr('digitalRead')
+        self.assertEqual(0, read(3))
+        service._rpyc_getattr('digitalWrite')(3, 1)
+        self.assertEqual(1, read(3))
+        # The batch variants invalidate the same reads
+        service._rpyc_getattr('digitalWrite' + MANY_SUFFIX)(((3, 0),))
+        read(3)
+        self.assertEqual(['digitalRead', 'digitalWrite', 'digitalRead', 'digitalWrite' + MANY_SUFFIX, 'digitalRead'], self.stub.calls)
+
+    def test_read_started_before_write_not_cached(self):
+        service: GatewayProviderService = self.create_service(WiringPiFunctionProvider)
+        read = service._rpyc_getattr('digitalRead')
+        self.stub.read_released.clear()
+        results: list = list()
+        thread: threading.Thread = threading.Thread(target=lambda: results.append(read(3)))
+        thread.start()
+        self.assertTrue(self.stub.read_started.wait(TIMEOUT))
+        service._rpyc_getattr('digitalWrite')(3, 1)
+        self.stub.read_released.set()
+        thread.join(TIMEOUT)
+        self.assertEqual([0], results)
+        # The stale value is not kept, the next read is forwarded
+        self.assertEqual(1, read(3))
+        self.assertEqual(2, self.stub.calls.count('digitalRead'))
+
+    def test_concurrent_reads_shared(self):
+        service: GatewayProviderService = self.create_service(WiringPiFunctionProvider)
+        read = service._rpyc_getattr('digitalRead')
+        self.stub.read_released.clear()
+        threads: list = [threading.Thread(target=read, args=(3,)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        self.assertTrue(self.stub.read_started.wait(TIMEOUT))
+        time.sleep(0.05)
+        self.stub.read_released.set()
+        for thread in threads:
+            thread.join(TIMEOUT)
+        self.assertEqual(['digitalRead'], self.stub.calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
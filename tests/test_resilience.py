@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+import time
+import unittest
+from id_resilience import CallTimeoutException, CircuitBreaker, CircuitOpenException, HeartbeatMonitor, deadline, get_call_timeout
+
+THREADS: int = 8
+TIMEOUT: float = 5.0
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.breaker: CircuitBreaker = CircuitBreaker(logging.getLogger('ResilienceTest'), 'host', 3, 2)
+
+    def test_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        # A success resets the consecutive failures
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.assertFalse(self.breaker.is_open())
+        self.breaker.check()
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.is_open())
+        with self.assertRaises(CircuitOpenException):
+            self.breaker.check()
+        self.breaker.record_success()
+        self.assertFalse(self.breaker.is_open())
+
+    def test_heartbeat_failures(self):
+        self.breaker.record_heartbeat_failure()
+        self.breaker.record_failure()
+        self.assertFalse(self.breaker.is_open())
+        self.breaker.record_heartbeat_failure()
+        self.assertTrue(self.breaker.is_open())
+        self.breaker.trip()
+        self.breaker.record_success()
+        self.assertFalse(self.breaker.is_open())
+        self.breaker.trip()
+        self.assertTrue(self.breaker.is_open())
+
+    def test_concurrent_failures(self):
+        count: int = 2000
+        breaker: CircuitBreaker = CircuitBreaker(logging.getLogger('ResilienceTest'), 'host', THREADS * count)
+
+        def fail() -> None:
+            for _ in range(count):
+                breaker.record_failure()
+
+        threads: list = [threading.Thread(target=fail) for _ in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(TIMEOUT)
+        # No failure is lost
+        self.assertTrue(breaker.is_open())
+
+
+class DeadlineTest(unittest.TestCase):
+
+    def test_timeout(self):
+        self.assertIsNone(get_call_timeout())
+        self.assertEqual(2.0, get_call_timeout(2.0))
+        with deadline(0.5):
+            self.assertLessEqual(get_call_timeout(), 0.5)
+            self.assertEqual(0.1, get_call_timeout(0.1))
+            # A nested deadline cannot extend the enclosing one
+            with deadline(10):
+                self.assertLessEqual(get_call_timeout(), 0.5)
+            with deadline(0.01):
+                time.sleep(0.02)
+                with self.assertRaises(CallTimeoutException):
+                    get_call_timeout(2.0)
+            self.assertGreater(get_call_timeout(), 0.01)
+        self.assertIsNone(get_call_timeout())
+
+    def test_thread_local(self):
+        results: list = list()
+        with deadline(0.5):
+            thread: threading.Thread = threading.Thread(target=lambda: results.append(get_call_timeout()))
+            thread.start()
+            thread.join(TIMEOUT)
+        self.assertEqual([None], results)
+
+
+class HeartbeatMonitorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.logger: logging.Logger = logging.getLogger('ResilienceTest')
+        self.reachable: bool = False
+        self.probes: int = 0
+
+    def probe(self) -> None:
+        self.probes += 1
+        if not self.reachable:
+            raise ConnectionError('No echo')
+
+    def test_probe(self):
+        monitor: HeartbeatMonitor = HeartbeatMonitor(self.logger, 0)
+        breaker: CircuitBreaker = CircuitBreaker(self.logger, 'host', 3, 2)
+        monitor.add('host', breaker, self.probe)
+        self.assertFalse(monitor.probe('host'))
+        self.assertFalse(breaker.is_open())
+        self.assertFalse(monitor.probe('host'))
+        self.assertTrue(breaker.is_open())
+        self.reachable = True
+        self.assertTrue(monitor.probe('host'))
+        self.assertFalse(breaker.is_open())
+        monitor.stop()
+
+    def test_periodic_probes(self):
+        monitor: HeartbeatMonitor = HeartbeatMonitor(self.logger, 0.01)
+        breaker: CircuitBreaker = CircuitBreaker(self.logger, 'host', 3, 2)
+        monitor.add('host', breaker, self.probe)
+        try:
+            started: float = time.monotonic()
+            while not breaker.is_open() and time.monotonic() - started < TIMEOUT:
+                time.sleep(0.01)
+            self.assertTrue(breaker.is_open())
+            # The probes continue and close the breaker once the host answers
+            self.reachable = True
+            while breaker.is_open() and time.monotonic() - started < TIMEOUT:
+                time.sleep(0.01)
+            self.assertFalse(breaker.is_open())
+        finally:
+            monitor.stop()
+        probes: int = self.probes
+        time.sleep(0.05)
+        self.assertLessEqual(self.probes, probes + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+import inspect
+import unittest
+from typing import Any
+from id_function_invokers import FunctionProviderStub
+from id_schema import MANY_SUFFIX
+from function_providers.gfxhat_provider import GfxHatFunctionProvider
+from function_providers.wiringpi_provider import WiringPiFunctionProvider
+
+
+class SchemaDeclarationTest(unittest.TestCase):
+
+    def test_generated_methods(self):
+        # The methods declared by the schemas are generated using the names of their arguments
+        signature: inspect.Signature = inspect.signature(GfxHatFunctionProvider.lcd_set_pixel)
+        self.assertEqual(['self', 'x', 'y', 'state'], list(signature.parameters))
+        self.assertEqual(int, signature.parameters['x'].annotation)
+        self.assertEqual(bool, signature.parameters['state'].annotation)
+        signature = inspect.signature(WiringPiFunctionProvider.softPwmWrites)
+        self.assertEqual(['self', 'pins_tuple', 'duties_tuple'], list(signature.parameters))
+        self.assertEqual(Any, signature.parameters['pins_tuple'].annotation)
+        # The methods without schema are declared by the class
+        self.assertIn('values are returned using the same form', WiringPiFunctionProvider.digitalReads.__doc__)
+
+    def test_stub(self):
+        stub_class: type = FunctionProviderStub._create_stub_class(WiringPiFunctionProvider)
+        for name in ('softPwmSet', 'softPwmWrites', 'digitalReads', 'digitalWrite' + MANY_SUFFIX):
+            self.assertTrue(callable(stub_class.__dict__.get(name)), name)
+        self.assertNotIn('softPwmWrites' + MANY_SUFFIX, stub_class.__dict__)
+        self.assertEqual([3, 100, 128], stub_class._bind('softPwmSet', (3,), {'duty': 128, 'frequency': 100}))
+        with self.assertRaises(TypeError):
+            stub_class._bind('softPwmSet', (3,), {'level': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import threading
+import time
+import unittest
+from typing import Any
+from function_providers.script_provider import ScriptFunctionProvider, ScriptFunctionProviderServiceMock
+from id_script import CANCELLED, DONE, FAILED, MAX_INT_BITS, Script, ScriptCancelled, ScriptError
+
+PROVIDERS: dict = {'wiringpi': frozenset(('digitalRead', 'digitalWrite'))}
+
+
+class ScriptSandboxTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calls: list = list()
+        self.events: list = list()
+
+    def invoke(self, alias: str, method: str, args: tuple) -> Any:
+        self.calls.append((alias, method, args))
+        return 1
+
+    def create(self, source: str, **kwargs) -> Script:
+        return Script(source, PROVIDERS, self.invoke, self.events.append, **kwargs)
+
+    def run_script(self, source: str, **kwargs) -> Any:
+        return self.create(source, **kwargs).run()
+
+    def test_allowed(self):
+        source: str = '\n'.join((
+            'total = 0',
+            'for pin in range(3):',
+            '    wiringpi.digitalWrite(pin, 1)',
+            '    total += wiringpi.digitalRead(pin)',
+            'emit(total, str(total))',
+            'return total'
+        ))
+        self.assertEqual(3, self.run_script(source))
+        self.assertEqual(6, len(self.calls))
+        self.assertEqual([(3, '3')], self.events)
+
+    def test_rejected_imports(self):
+        for source in ('import os', 'from os import path', '__import__("os")', 'exec("1")', 'eval("1")', 'open("x")'):
+            with self.assertRaises(ValueError, msg=source):
+                self.create(source)
+
+    def test_rejected_attributes(self):
+        for source in ('x = ().__class__', 'x = (1).real', 'x = wiringpi.__dict__', 'wiringpi.pinMode(1, 1)',
+                       'x = wiringpi', 'x = len', '__builtins__', 'x = _private', 'f = emit.__self__',
+                       'x = "a".join(("b",))', 'x = getattr(wiringpi, "digitalRead")', 'x = [1].append',
+                       'len = 3', 'wiringpi.digitalRead(pin=3)'):
+            with self.assertRaises(ValueError, msg=source):
+                self.create(source)
+
+    def test_rejected_comprehensions(self):
+        for source in ('x = [i for i in range(3)]', 'x = (i for i in range(3))', 'x = {i: i for i in range(3)}',
+                       'x = {i for i in range(3)}', 'f = lambda: 1', 'def f():\n    pass', 'class A:\n    pass',
+                       'with x:\n    pass', 'try:\n    pass\nexcept:\n    pass', 'x = {}', 'global x',
+                       'x = f"{1}"', 'x = yield 1'):
+            with self.assertRaises(ValueError, msg=source):
+                self.create(source)
+
+    def test_step_budget(self):
+        script: Script = self.create('while True:\n    pass', max_steps=1000)
+        with self.assertRaises(ScriptError) as context:
+            script.run()
+        self.assertIn('budget of 1000 steps exceeded', str(context.exception))
+        self.assertEqual(FAILED, script.state)
+        # The functions iterating over a sequence consume a step per element
+        with self.assertRaises(ScriptError):
+            self.run_script('x = sum(range(4000))\nreturn x', max_steps=1000)
+
+    def test_huge_integers(self):
+        for source in ('return 10 ** 1000000', 'return 1 << 100000', 'x = 2 ** %s\nreturn x * x' % MAX_INT_BITS,
+                       'x = 3\nwhile True:\n    x = x * x', 'return int("9" * 4000)', 'return "a" * 100000',
+                       'return "%s" % 1', 'x = [0]\nwhile True:\n    x = x + x'):
+            with self.assertRaises(ScriptError, msg=source):
+                self.run_script(source, max_steps=100000)
+        self.assertEqual(2 ** 200, self.run_script('return 2 ** 200'))
+
+    def test_nested_aliases(self):
+        # A sequence containing the same sequence many times is small to build but large to visit
+        nested: str = 'a = [1] * 4096\nb = [a] * 4096\n'
+        for source in (nested + 'emit(b)', nested + 'c = [b] * 4096\nemit(c)', nested + 'return b',
+                       nested + 'd = [list(a)] * 4096\nreturn b == d', nested + 'return a in b', nested + 'return max(b)',
+                       'a = [0]\na[0] = a\nreturn a == a'):
+            started: float = time.monotonic()
+            with self.assertRaises(ScriptError, msg=source):
+                self.run_script(source, max_duration=0.5)
+            self.assertLess(time.monotonic() - started, 0.5, source)
+        self.assertEqual([], self.events)
+        # The comparisons consume a step per visited element
+        with self.assertRaises(ScriptError) as context:
+            self.run_script('a = [1] * 4096\nreturn a == a', max_steps=4096)
+        self.assertIn('steps exceeded', str(context.exception))
+        self.assertTrue(self.run_script('a = [(1, 2)] * 100\nreturn (1, 2) in a and [1, 2] == [1, 2]'))
+
+    def test_duration_budget(self):
+        script: Script = self.create('sleep(10)', max_duration=0.2)
+        started: float = time.monotonic()
+        with self.assertRaises(ScriptError) as context:
+            script.run()
+        self.assertLess(time.monotonic() - started, 2.0)
+        self.assertIn('budget of 0.2 seconds exceeded', str(context.exception))
+        # A busy loop is stopped by the duration too
+        with self.assertRaises(ScriptError) as context:
+            self.run_script('while True:\n    x = 1', max_duration=0.2, max_steps=10 ** 9)
+        self.assertIn('seconds exceeded', str(context.exception))
+
+    def test_cancel(self):
+        script: Script = self.create('sleep(10)')
+        threading.Timer(0.1, script.cancel).start()
+        with self.assertRaises(ScriptCancelled):
+            script.run()
+        self.assertEqual(CANCELLED, script.state)
+
+    def test_variables(self):
+        script: Script = self.create('return (pin, label)', variables={'pin': 3, 'label': 'led'})
+        self.assertEqual((3, 'led'), script.run())
+        self.assertEqual(DONE, script.state)
+        for variables in ({'_pin': 1}, {'len': 1}, {'wiringpi': 1}, {'pin': object()}):
+            with self.assertRaises(ValueError, msg=repr(variables)):
+                self.create('pass', variables=variables)
+
+
+class ScriptProviderTest(unittest.TestCase):
+
+    def test_disabled_by_default(self):
+        self.assertEqual(os.environ.get('ID_SCRIPTS', '0') != '0', ScriptFunctionProvider._ENABLED)
+
+    def test_execute(self):
+        service: ScriptFunctionProviderServiceMock = ScriptFunctionProviderServiceMock(logging.getLogger('ScriptTest'))
+        try:
+            self.assertEqual((6, ((1,), (2,))), service.exposed_execute('emit(1)\nemit(x)\nreturn x * 3', (('x', 2),)))
+            with self.assertRaises(ValueError):
+                service.exposed_validate('import os')
+            self.assertEqual((), service.exposed_scripts())
+        finally:
+            service.finalize()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import logging
+import unittest
+from function_providers import gfxhat_provider
+from function_providers.gfxhat_provider import GfxHatFunctionProvider, GfxHatFunctionProviderServiceMock
+from function_providers.wiringpi_provider import WiringPiFunctionProvider, WiringPiFunctionProviderServiceMock, describe_snapshot
+from id_session import SessionJournal
+
+
+class SessionJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.journal: SessionJournal = SessionJournal(WiringPiFunctionProvider)
+
+    def test_last_call_kept(self):
+        self.assertTrue(self.journal.is_empty())
+        self.journal.record('wiringPiSetup', [])
+        self.journal.record('digitalWrite', [3, 1])
+        self.journal.record('pinMode', [3, 1])
+        self.journal.record('digitalWrite', [3, 0])
+        # The calls are replayed in the order of their last update
+        self.assertEqual([('wiringPiSetup', ()), ('pinMode', (3, 1)), ('digitalWrite', (3, 0))], self.journal.get_calls())
+        self.assertFalse(self.journal.is_recorded('digitalRead'))
+        self.journal.record('digitalRead', [3])
+        self.assertEqual(3, len(self.journal.get_calls()))
+
+    def test_bulk_merge(self):
+        self.journal.record('digitalWrites', [b'\x01\x02\x03', 1])
+        self.assertEqual([('digitalWrites', (b'\x01\x02\x03', 1))], self.journal.get_calls())
+        # The update of a single pin splits the bulk call
+        self.journal.record('digitalWrite', [2, 0])
+        self.assertEqual([('digitalWrites', (b'\x01\x03', 1)), ('digitalWrite', (2, 0))], self.journal.get_calls())
+        self.journal.record('digitalWrite', [4, 0])
+        self.assertEqual([('digitalWrites', (b'\x01\x03', 1)), ('digitalWrites', (b'\x02\x04', 0))], self.journal.get_calls())
+
+    def test_columns_split(self):
+        # A sequence of values is split by key, the calls with different values are not merged
+        self.journal.record('softPwmWrites', [(5, 6), (10, 20)])
+        self.assertEqual([('softPwmWrite', (5, 10)), ('softPwmWrite', (6, 20))], self.journal.get_calls())
+        self.journal.record('softPwmWrites', [(5, 6), 30])
+        self.assertEqual([('softPwmWrites', (b'\x05\x06', 30))], self.journal.get_calls())
+
+    def test_resets(self):
+        self.journal.record('pinMode', [3, 1])
+        self.journal.record('digitalWrite', [3, 1])
+        self.journal.record('restore', [b'snapshot'])
+        self.assertEqual([('restore', (b'snapshot',))], self.journal.get_calls())
+        self.journal.clear()
+        self.assertTrue(self.journal.is_empty())
+
+    def test_coordinates(self):
+        journal: SessionJournal = SessionJournal(GfxHatFunctionProvider)
+        journal.record('lcd_set_pixels', [b'\x00\x01\x02', 5, True])
+        journal.record('lcd_set_pixel', [1, 5, False])
+        journal.record('lcd_show', [])
+        self.assertEqual([('lcd_set_pixels', (b'\x00\x02', b'\x05\x05', True)), ('lcd_set_pixel', (1, 5, False)), ('lcd_show', ())],
+                         journal.get_calls())
+        journal.record('lcd_clear', [])
+        self.assertEqual([('lcd_show', ())], journal.get_calls())
+        with self.assertRaises(ValueError):
+            journal.record('lcd_set_pixels', [(0, 256), 5, True])
+
+
+class SessionReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.logger: logging.Logger = logging.getLogger('SessionTest')
+        self.services: list = list()
+
+    def tearDown(self):
+        for service in self.services:
+            service.finalize()
+
+    def create_service(self, service_class: type):
+        service = service_class(self.logger)
+        self.services.append(service)
+        return service
+
+    def test_replay(self):
+        journal: SessionJournal = SessionJournal(WiringPiFunctionProvider)
+        source: WiringPiFunctionProviderServiceMock = self.create_service(WiringPiFunctionProviderServiceMock)
+        calls: tuple = (('wiringPiSetup', []), ('pinMode', [3, 1]), ('digitalWrites', [(3, 7), 1]), ('pullUpDnControl', [4, 2]),
+                        ('softPwmSet', [5, 100, 128]), ('digitalWrite', [7, 0]))
+        for name, args in calls:
+            source._rpyc_getattr(name)(*args)
+            journal.record(name, args)
+        target: WiringPiFunctionProviderServiceMock = self.create_service(WiringPiFunctionProviderServiceMock)
+        self.assertEqual(len(journal.get_calls()), target.exposed_restore_session(tuple(journal.get_calls())))
+        expected: dict = describe_snapshot(source.exposed_snapshot())
+        restored: dict = describe_snapshot(target.exposed_snapshot())
+        for key in ('setup', 'modes', 'pulls', 'levels', 'soft_pwm'):
+            self.assertEqual(expected[key], restored[key], key)
+
+    def test_previous_connection_released(self):
+        service: GfxHatFunctionProviderServiceMock = self.create_service(GfxHatFunctionProviderServiceMock)
+        previous: object = object()
+        service.on_connect(previous)
+        token: str = service.exposed_open_session()
+        service._rpyc_getattr('touch_set_led')(0, True)
+        service._rpyc_getattr('lcd_set_pixel')(0, 0, True)
+        service._rpyc_getattr('lcd_show')()
+        # The client reconnects before the disconnection of its previous connection is handled
+        current: object = object()
+        service.on_connect(current)
+        service.exposed_restore_session((('lcd_set_pixel', (1, 0, True)), ('lcd_show', ())), token)
+        sections: dict = gfxhat_provider.unpack_snapshot(GfxHatFunctionProvider.__name__, service.exposed_snapshot())
+        # The layer of the previous connection is not composed under the replayed one
+        self.assertEqual(0x40, sections[gfxhat_provider._LCD_SECTION][0])
+        # The LED set by the previous connection belongs to the session
+        self.assertTrue(sections[gfxhat_provider._LEDS_SECTION][0])
+        service._reset_owned(current)
+        sections = gfxhat_provider.unpack_snapshot(GfxHatFunctionProvider.__name__, service.exposed_snapshot())
+        self.assertFalse(sections[gfxhat_provider._LEDS_SECTION][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import logging
+import struct
+import unittest
+from function_providers.gfxhat_provider import GfxHatFunctionProvider
+from function_providers.wiringpi_provider import WiringPiFunctionProvider, WiringPiFunctionProviderServiceMock, describe_snapshot
+from id_snapshot import MAGIC, VERSION, pack_snapshot, unpack_snapshot
+
+PROVIDER: str = WiringPiFunctionProvider.__name__
+# Sections of the snapshots of the WiringPi provider
+MODES_SECTION: int = 2
+PWM_VALUES_SECTION: int = 6
+
+
+class SnapshotFormatTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        sections: dict = {1: b'\x01', 2: b'', 9: bytes(range(256))}
+        snapshot: bytes = pack_snapshot(PROVIDER, {**sections, 3: None})
+        self.assertTrue(snapshot.startswith(MAGIC))
+        self.assertEqual(sections, unpack_snapshot(PROVIDER, snapshot))
+        self.assertEqual(sections, unpack_snapshot(PROVIDER, memoryview(bytearray(snapshot))))
+
+    def test_malformed(self):
+        snapshot: bytes = pack_snapshot(PROVIDER, {1: b'\x01\x02\x03'})
+        header: bytes = MAGIC + bytes((VERSION, len(PROVIDER))) + PROVIDER.encode('utf-8')
+        for value in (b'', MAGIC, b'XYZ' + snapshot[3:], MAGIC + bytes((VERSION + 1,)) + snapshot[4:], snapshot[:-1],
+                      header + b'\x01\x00', object()):
+            with self.assertRaises(ValueError, msg=repr(value)):
+                unpack_snapshot(PROVIDER, value)
+
+    def test_foreign(self):
+        snapshot: bytes = pack_snapshot(GfxHatFunctionProvider.__name__, {1: b'\x00'})
+        with self.assertRaises(ValueError):
+            unpack_snapshot(PROVIDER, snapshot)
+
+
+class WiringPiSnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.logger: logging.Logger = logging.getLogger('SnapshotTest')
+        self.services: list = list()
+
+    def tearDown(self):
+        for service in self.services:
+            service.finalize()
+
+    def create_service(self) -> WiringPiFunctionProviderServiceMock:
+        service: WiringPiFunctionProviderServiceMock = WiringPiFunctionProviderServiceMock(self.logger)
+        self.services.append(service)
+        return service
+
+    def test_round_trip(self):
+        source: WiringPiFunctionProviderServiceMock = self.create_service()
+        source.exposed_wiringPiSetup()
+        source.exposed_pinMode(3, 1)
+        source.exposed_digitalWrite(3, 1)
+        source.exposed_pullUpDnControl(4, 2)
+        source.exposed_softPwmSet(5, 100, 128)
+        snapshot: bytes = source.exposed_snapshot()
+        source.finalize()
+        self.services.remove(source)
+        target: WiringPiFunctionProviderServiceMock = self.create_service()
+        self.assertTrue(target.exposed_restore(snapshot))
+        expected: dict = describe_snapshot(snapshot)
+        restored: dict = describe_snapshot(target.exposed_snapshot())
+        for key in ('setup', 'modes', 'pulls', 'pwm', 'pwm_values', 'soft_pwm'):
+            self.assertEqual(expected[key], restored[key], key)
+        self.assertEqual(1, restored['levels'][3])
+        self.assertEqual(((5, 100.0, 128),), target.exposed_softPwmChannels())
+
+    def test_rejected_before_changes(self):
+        service: WiringPiFunctionProviderServiceMock = self.create_service()
+        service.exposed_wiringPiSetup()
+        before: bytes = service.exposed_snapshot()
+        invalid: tuple = (
+            # Foreign provider
+            pack_snapshot(GfxHatFunctionProvider.__name__, {}),
+            # Odd length of the pairs of the modes
+            pack_snapshot(PROVIDER, {MODES_SECTION: b'\x03\x01\x04'}),
+            # Pin out of range
+            pack_snapshot(PROVIDER, {MODES_SECTION: b'\x03\x01\x20\x01'}),
+            # PWM value out of range
+            pack_snapshot(PROVIDER, {PWM_VALUES_SECTION: struct.pack('<BH', 1, 4096)}),
+            b'not a snapshot'
+        )
+        for snapshot in invalid:
+            with self.assertRaises(ValueError, msg=repr(snapshot)):
+                service.exposed_restore(snapshot)
+        self.assertEqual(describe_snapshot(before)['modes'], describe_snapshot(service.exposed_snapshot())['modes'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+import time
+import unittest
+from function_providers.wiringpi_provider import WiringPiFunctionProviderServiceMock
+from id_soft_pwm import DUTY_RANGE, HIGH, LOW, MAX_FREQUENCY, SoftPwmEngine, check_duty, check_frequency
+
+PINS: tuple = (0, 2, 3, 12)
+TIMEOUT: float = 2.0
+
+
+def wait_for(condition) -> bool:
+    deadline: float = time.monotonic() + TIMEOUT
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+class SoftPwmRangeTest(unittest.TestCase):
+
+    def test_duty(self):
+        self.assertEqual(0, check_duty(0))
+        self.assertEqual(DUTY_RANGE, check_duty(DUTY_RANGE))
+        for duty in (None, -1, DUTY_RANGE + 1):
+            with self.assertRaises(ValueError):
+                check_duty(duty)
+
+    def test_frequency(self):
+        self.assertEqual(MAX_FREQUENCY, check_frequency(MAX_FREQUENCY))
+        for frequency in (None, 0, -1, MAX_FREQUENCY + 1):
+            with self.assertRaises(ValueError):
+                check_frequency(frequency)
+
+    def test_engine(self):
+        engine: SoftPwmEngine = SoftPwmEngine(logging.getLogger('SoftPwmTest'), lambda pin, level: None)
+        try:
+            with self.assertRaises(ValueError):
+                engine.set(PINS[0], 100, DUTY_RANGE + 1)
+            with self.assertRaises(ValueError):
+                engine.set(PINS[0], MAX_FREQUENCY + 1, 0)
+            self.assertFalse(engine.is_driven(PINS[0]))
+        finally:
+            engine.stop()
+
+
+class SoftPwmEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.levels: dict = dict()
+        self.lock: threading.Lock = threading.Lock()
+        self.engine: SoftPwmEngine = SoftPwmEngine(logging.getLogger('SoftPwmTest'), self.write)
+
+    def tearDown(self):
+        self.engine.stop()
+
+    def write(self, pin: int, level: int) -> None:
+        with self.lock:
+            self.levels[pin] = level
+
+    def test_broadcast(self):
+        self.engine.set_duties(PINS, (DUTY_RANGE,) * len(PINS))
+        self.assertTrue(wait_for(lambda: all(self.levels.get(p) == HIGH for p in PINS)))
+        self.engine.set_duties(PINS, (0,) * len(PINS))
+        self.assertTrue(wait_for(lambda: all(self.levels.get(p) == LOW for p in PINS)))
+        self.assertEqual(len(PINS), len(self.engine.get_channels()))
+
+    def test_remove_and_stop(self):
+        self.engine.set_duties(PINS, (DUTY_RANGE,) * len(PINS))
+        self.assertTrue(wait_for(lambda: all(self.levels.get(p) == HIGH for p in PINS)))
+        self.assertTrue(self.engine.remove(PINS[0]))
+        self.assertFalse(self.engine.remove(PINS[0]))
+        self.assertEqual(LOW, self.levels[PINS[0]])
+        self.engine.stop()
+        self.assertTrue(all(self.levels[p] == LOW for p in PINS))
+        self.assertEqual((), self.engine.get_channels())
+
+
+class SoftPwmServiceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.service: WiringPiFunctionProviderServiceMock = WiringPiFunctionProviderServiceMock(logging.getLogger('SoftPwmTest'))
+        self.service._rpyc_getattr('wiringPiSetup')()
+
+    def tearDown(self):
+        self.service.finalize()
+
+    def read_all(self, level: int) -> bool:
+        read = self.service._rpyc_getattr('digitalRead')
+        return all(read(p) == level for p in PINS)
+
+    def test_broadcast(self):
+        # A single duty is applied to all the pins
+        self.assertTrue(self.service._rpyc_getattr('softPwmWrites')(PINS, DUTY_RANGE))
+        self.assertTrue(wait_for(lambda: self.read_all(HIGH)))
+        self.assertTrue(self.service._rpyc_getattr('softPwmWrites')(PINS, 0))
+        self.assertTrue(wait_for(lambda: self.read_all(LOW)))
+        self.assertEqual(set(PINS), {c[0] for c in self.service._rpyc_getattr('softPwmChannels')()})
+
+    def test_digital_calls_stop(self):
+        # The writes and the mode changes of a driven pin stop its channel, the level written is kept
+        self.assertTrue(self.service._rpyc_getattr('softPwmWrites')(PINS, DUTY_RANGE))
+        self.assertTrue(wait_for(lambda: self.read_all(HIGH)))
+        self.service._rpyc_getattr('digitalWrite')(PINS[0], LOW)
+        self.service._rpyc_getattr('digitalWrites')(PINS[1:3], LOW)
+        self.service._rpyc_getattr('pinMode')(PINS[3], 0)
+        self.assertEqual((), self.service._rpyc_getattr('softPwmChannels')())
+        time.sleep(0.05)
+        self.assertTrue(self.read_all(LOW))
+
+    def test_range_errors(self):
+        writes = self.service._rpyc_getattr('softPwmWrites')
+        with self.assertRaises(ValueError):
+            writes(PINS, DUTY_RANGE + 1)
+        with self.assertRaises(ValueError):
+            writes(PINS, (0, 0, 0, -1))
+        with self.assertRaises(ValueError):
+            writes((0, 32), 0)
+        with self.assertRaises(ValueError):
+            self.service._rpyc_getattr('softPwmSet')(PINS[0], MAX_FREQUENCY + 1, 0)
+        self.assertEqual((), self.service._rpyc_getattr('softPwmChannels')())
+
+
+if __name__ == '__main__':
+    unittest.main()
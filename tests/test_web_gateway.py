@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import base64
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+import unittest
+from function_providers.wiringpi_provider import WiringPiFunctionProvider
+from id_benchmark_utils import LOOPBACK, find_free_port, wait_for_port
+from id_function_invokers import FunctionInvokers
+from id_web_gateway import PING, POLL_INTERVALS, TEXT, WebGateway, get_accept_key
+
+TOPIC: str = 'wiringpi'
+PIN: int = 21
+RATE: float = 2.0
+BURST: int = 1
+TIMEOUT: float = 5.0
+
+
+class WebSocketClient(object):
+    """Minimal blocking client of the gateway"""
+
+    def __init__(self, port: int, query: str=''):
+        self.socket: socket.socket = socket.create_connection((LOOPBACK, port), timeout=TIMEOUT)
+        self.key: str = base64.b64encode(os.urandom(16)).decode('ascii')
+        self.socket.sendall(('GET /ws%s HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                             'Sec-WebSocket-Key: %s\r\nSec-WebSocket-Version: 13\r\n\r\n' % (query, self.key)).encode('ascii'))
+        self.buffer: bytes = b''
+        while b'\r\n\r\n' not in self.buffer:
+            self.buffer += self.__recv()
+        response, _, self.buffer = self.buffer.partition(b'\r\n\r\n')
+        lines: list = response.decode('iso-8859-1').split('\r\n')
+        self.status: int = int(lines[0].split(' ')[1])
+        self.headers: dict = {k.strip().lower(): v.strip() for k, _, v in (line.partition(':') for line in lines[1:])}
+
+    def __recv(self) -> bytes:
+        data: bytes = self.socket.recv(65536)
+        if not data:
+            raise ConnectionError('Connection closed by the gateway')
+        return data
+
+    def __read(self, count: int) -> bytes:
+        while len(self.buffer) < count:
+            self.buffer += self.__recv()
+        result: bytes = self.buffer[:count]
+        self.buffer = self.buffer[count:]
+        return result
+
+    def send(self, value) -> None:
+        payload: bytes = json.dumps(value).encode('utf-8') if not isinstance(value, str) else value.encode('utf-8')
+        mask: bytes = os.urandom(4)
+        self.socket.sendall(bytes((0x80 | TEXT, 0x80 | len(payload))) + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(payload)))
+
+    def receive(self) -> dict:
+        while True:
+            head: bytes = self.__read(2)
+            length: int = head[1] & 0x7F
+            if length == 126:
+                length = struct.unpack('!H', self.__read(2))[0]
+            elif length == 127:
+                length = struct.unpack('!Q', self.__read(8))[0]
+            payload: bytes = self.__read(length)
+            if head[0] & 0x0F != PING:
+                return json.loads(payload.decode('utf-8'))
+
+    def receive_until(self, condition) -> dict:
+        deadline: float = time.monotonic() + TIMEOUT
+        while time.monotonic() < deadline:
+            message: dict = self.receive()
+            if condition(message):
+                return message
+        raise TimeoutError('Message not received')
+
+    def close(self) -> None:
+        self.socket.close()
+
+
+class WebGatewayTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logger: logging.Logger = logging.getLogger('WebGatewayTest')
+        FunctionInvokers.initialize(logger)
+        cls.provider: WiringPiFunctionProvider = FunctionInvokers.get_provider(WiringPiFunctionProvider)
+        cls.provider.wiringPiSetup()
+        cls.provider.pinMode(PIN, 1)
+        cls.port: int = find_free_port()
+        cls.gateway: WebGateway = WebGateway(logger, LOOPBACK, cls.port, rate=RATE, burst=BURST)
+        cls.thread: threading.Thread = threading.Thread(target=lambda: asyncio.run(cls.gateway.serve()), daemon=True)
+        cls.thread.start()
+        wait_for_port(cls.port)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.gateway.stop()
+        cls.thread.join(TIMEOUT)
+
+    def setUp(self):
+        self.clients: list = list()
+
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+
+    def connect(self, query: str='') -> WebSocketClient:
+        client: WebSocketClient = WebSocketClient(self.port, query)
+        self.clients.append(client)
+        return client
+
+    def test_handshake(self):
+        client: WebSocketClient = self.connect()
+        self.assertEqual(101, client.status)
+        self.assertEqual(get_accept_key(client.key), client.headers['sec-websocket-accept'])
+
+    def test_publish_on_change(self):
+        self.provider.digitalWrite(PIN, 0)
+        client: WebSocketClient = self.connect('?topics=' + TOPIC)
+        message: dict = client.receive_until(lambda m: m['state']['levels'][PIN] == 0)
+        self.assertEqual(TOPIC, message['topic'])
+        self.provider.digitalWrite(PIN, 1)
+        changed: dict = client.receive_until(lambda m: m['state']['levels'][PIN] == 1)
+        self.assertGreater(changed['version'], message['version'])
+
+    def test_invalid_commands(self):
+        client: WebSocketClient = self.connect()
+        for command in ({'subscribe': [[1]]}, {'unsubscribe': [None]}, {'subscribe': TOPIC}, {'other': []}, 'not json'):
+            client.send(command)
+            self.assertIn('error', client.receive(), command)
+        client.send({'subscribe': ['unknown', TOPIC]})
+        self.assertIn('unknown', client.receive()['error'])
+        # The client stays connected
+        self.assertEqual(TOPIC, client.receive()['topic'])
+
+    def test_rate_limit(self):
+        client: WebSocketClient = self.connect('?topics=' + TOPIC)
+        client.receive()
+        conflated: int = self.gateway.get_stats()['conflated']
+        # Each poll sees a new level, the states are published faster than the messages sent to the client
+        started: float = time.monotonic()
+        level: int = 0
+        while time.monotonic() - started < 2.0:
+            level ^= 1
+            self.provider.digitalWrite(PIN, level)
+            time.sleep(POLL_INTERVALS[WiringPiFunctionProvider.__name__] * 1.5)
+        received: int = 0
+        client.socket.settimeout(1.0)
+        try:
+            while True:
+                last: dict = client.receive()
+                received += 1
+        except socket.timeout:
+            pass
+        elapsed: float = time.monotonic() - started
+        self.assertLessEqual(received, BURST + RATE * elapsed + 1)
+        self.assertGreater(self.gateway.get_stats()['conflated'], conflated)
+        # The last state is delivered
+        self.assertEqual(level, last['state']['levels'][PIN])
+
+
+if __name__ == '__main__':
+    unittest.main()
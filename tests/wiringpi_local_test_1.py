@@ -6,6 +6,7 @@ import pathlib
 import time
 from logging.handlers import RotatingFileHandler
 from id_function_invokers import FunctionInvokers
+from id_logging_utils import start_async_logging
 from function_providers.wiringpi_provider import WiringPiFunctionProvider
 
 PIN_1: int = 0
@@ -39,6 +40,7 @@ def create_rotating_log() -> logging.Logger:
 
 
 logger: logging.Logger = create_rotating_log()
+start_async_logging(logger)
 FunctionInvokers.initialize(logger)
 provider: WiringPiFunctionProvider = FunctionInvokers.get_provider(WiringPiFunctionProvider)
 
@@ -6,6 +6,7 @@ __status__  = "development"
 __version__ = "0.1"
 __date__    = "2021/11/29"
 from typing import List
+from id_mock_timing import gpio_call
 
 ListOfFloats = List[float]
 ListOfInt = List[int]
@@ -20,11 +21,13 @@ PWM_MS: int = 0
 PWM_BALANCED: int = 0
 
 __pwm_mode: int = PWM_MS
+__pwm_range: int = 1024
+__pwm_clock: int = 32
 __pins: ListOfFloats = list()
 __io_mode: ListOfInt = list()
 __pull_mode: ListOfInt = list()
 
-for i in range(1, 18):
+for i in range(0, 32):
     __pins.append(0)
     __io_mode.append(INPUT_MODE)
     __pull_mode.append(NO_PULL_DOWN_UP)
@@ -35,41 +38,58 @@ def __log_pins() -> None:
 
 
 def wiringPiSetup() -> None:
-    pass
+    gpio_call()
 
 
 def wiringPiSetupSys() -> None:
-    pass
+    gpio_call()
 
 
 def wiringPiSetupGpio() -> None:
-    pass
+    gpio_call()
 
 
 def pwmSetMode(mode: int) -> None:
-    pwm_mode = mode
+    gpio_call()
+    globals()['__pwm_mode'] = mode
+
+
+def pwmSetRange(value: int) -> None:
+    gpio_call()
+    globals()['__pwm_range'] = value
+
+
+def pwmSetClock(divisor: int) -> None:
+    gpio_call()
+    globals()['__pwm_clock'] = divisor
 
 
 def pinMode(pin: int, mode: int) -> None:
+    gpio_call()
     __io_mode[pin] = mode
 
 
 def pullUpDnControl(pin: int, mode: int) -> None:
+    gpio_call()
     __pull_mode[pin] = mode
 
 
 def digitalWrite(pin: int, value: float) -> None:
+    gpio_call()
     if __io_mode[pin] == OUTPUT_MODE:
         __pins[pin] = value
         __log_pins()
 
 
 def digitalRead(pin: int) -> float:
-    if __io_mode[pin] == INPUT_MODE:
+    gpio_call()
+    # Like the hardware, an output pin reads the level it was written
+    if __io_mode[pin] in (INPUT_MODE, OUTPUT_MODE):
         return __pins[pin]
 
 
 def pwmWrite(pin: int, value: int) -> None:
+    gpio_call()
     if __io_mode[pin] == PWM_MODE:
         __pins[pin] = value
         __log_pins()